@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Walk-forward Backtest
+- Tarih aralığındaki her koşu günü o güne kadarki geçmişle eğitilmiş modelle skorlanır;
+  model her --retrain-every günde bir yeniden eğitilir, aradaki günlerde aynı (sıcak) model kullanılır
+- HorseRacingPredictor'a simüle edilen gün as-of olarak verilir: 'bugün', dışlanan
+  tarihler ve tazelik hesapları o güne göredir
+- Point-in-time feature'lar: her tarihin satırları bir kez, sadece o tarihe kadarki geçmişe
+  karşı (tahmin modunda) featurize edilir. İlk eğitim gününün training feature'ları da bir kez
+  hesaplanır; sonraki yeniden eğitimlerin training seti bu çerçeveye aradaki günlerin
+  feature'ları eklenerek kurulur (tüm geçmiş her gün yeniden featurize edilmez)
+- Feature'lar backtests/cache altında (veri + feature kodu özetiyle) saklanır
+- Günlerin featurize edilmesi ve eğitim blokları ayrı süreçlerde paralel çalışır (--workers)
+- Metrikler prediction_metrics ile: top-1 / top-3 isabet, logloss, favoriye 1 birim ganyan ROI
+- Ortak geçmiş store'u (EntityHistoryStore) kapalıdır: feature cache anahtarı sadece bu hipodromun
+  satırlarını kapsar (store as-of gününe göre kesilse de diğer şehirlerin verisi anahtarda yoktur)
+
+Kullanım:
+    python3 backtest.py ISTANBUL [BURSA ...] --start=01/11/2025 --end=14/11/2025
+                        [--retrain-every=7] [--workers=4] [--no-cache] [--verbose]
+                        [--out=backtests/sonuc.json]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import inspect
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout, nullcontext
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from benchmark import git_revision, parse_args
+from horse_racing_predictor import HorseRacingPredictor, StageProfiler, parse_race_columns
+from prediction_metrics import PredictionMetricsStore
+from race_clock import as_of_clock, DATE_FORMAT
+
+BACKTEST_DIR = Path("backtests")
+CACHE_DIR = BACKTEST_DIR / "cache"
+
+# Kaynağı değişince feature cache'ini geçersiz kılan fonksiyonlar
+FEATURE_FUNCTIONS = (
+    parse_race_columns,
+    HorseRacingPredictor.create_advanced_features,
+    HorseRacingPredictor.featurize_targets,
+    HorseRacingPredictor.featurize,
+)
+
+# Süreçler arası paylaşılan durum (fork ile çocuk süreçlere kopyalanır)
+_STATE = {}
+
+
+def make_predictor(hipodrom, day):
+    """Backtest için sessiz (rapor yazmayan), ortak store'u kapalı predictor"""
+    predictor = HorseRacingPredictor(hipodrom, as_of=day.strftime(DATE_FORMAT))
+    predictor.use_history_store = False
+    predictor.profiler = StageProfiler()
+    return predictor
+
+
+def feature_code_signature():
+    """Feature fonksiyonlarının kaynak kodu özeti"""
+    digest = hashlib.sha1()
+    for func in FEATURE_FUNCTIONS:
+        digest.update(inspect.getsource(func).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+class FeatureCache:
+    """Point-in-time feature çerçeveleri için disk cache'i (joblib)
+
+    Anahtar: hipodrom, tür, gün ve kesim gününe kadarki satırların özeti +
+    feature kodu özeti. Geçmiş veya feature kodu değişince eski dosyalar
+    kullanılmaz.
+    """
+
+    def __init__(self, df, hipodrom, cache_dir=CACHE_DIR, enabled=True):
+        self.hipodrom = hipodrom
+        self.cache_dir = Path(cache_dir)
+        self.enabled = enabled
+        self.code_sig = feature_code_signature()
+        # Satır özetleri bir kez; kesim gününe kadarki toplam sıradan bağımsız bir veri özetidir
+        self.dates = df['tarih_dt'].to_numpy()
+        self.row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+    def key(self, kind, day, inclusive):
+        mask = self.dates <= day.to_datetime64() if inclusive else self.dates < day.to_datetime64()
+        data_sig = f"{int(mask.sum())}_{int(self.row_hashes[mask].sum(dtype=np.uint64)):016x}"
+        sig = hashlib.sha1(f"{data_sig}_{self.code_sig}".encode('utf-8')).hexdigest()[:16]
+        return f"{self.hipodrom}_{kind}_{day.strftime('%Y%m%d')}_{sig}"
+
+    def get(self, kind, day, inclusive, compute):
+        """Cache'te varsa oku, yoksa compute() ile hesapla ve yaz"""
+        if not self.enabled:
+            return compute()
+        path = self.cache_dir / f"{self.key(kind, day, inclusive)}.joblib"
+        if path.exists():
+            try:
+                return joblib.load(path)
+            except Exception as e:
+                print(f"⚠️ Bozuk cache dosyası yeniden hesaplanacak ({path.name}): {e}")
+        value = compute()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix('.tmp')
+        joblib.dump(value, tmp)
+        os.replace(tmp, path)
+        return value
+
+
+def quiet():
+    """Predictor çıktısını (--verbose değilse) bastır"""
+    return nullcontext() if _STATE.get('verbose') else redirect_stdout(io.StringIO())
+
+
+def featurize_initial(cutoff):
+    """İlk eğitim gününden önceki sonuçlu satırların training feature'ları"""
+    df, hipodrom = _STATE['df'], _STATE['hipodrom']
+
+    def compute():
+        history = df[df['tarih_dt'] < cutoff]
+        train = history[history['sonuc'].notna()]
+        with quiet():
+            return make_predictor(hipodrom, cutoff).featurize(train, history=history)
+
+    return _STATE['cache'].get('train', cutoff, False, compute)
+
+
+def featurize_day(day):
+    """Bir tarihin satırları, o güne kadarki geçmişe karşı (tahmin modu)
+
+    Returns:
+        (day, row_index, features): Satırların df'deki indeksleri ve aynı sıradaki feature'lar
+    """
+    df, hipodrom = _STATE['df'], _STATE['hipodrom']
+    rows = df[df['tarih_dt'] == day]
+
+    def compute():
+        history = df[df['tarih_dt'] <= day]
+        with quiet():
+            return make_predictor(hipodrom, day).featurize(rows, history=history)
+
+    return day, rows.index.to_numpy(), _STATE['cache'].get('day', day, True, compute)
+
+
+def training_frame(cutoff):
+    """Kesim gününden önceki tüm point-in-time feature'lar (gerçek sonuçlarıyla)"""
+    df = _STATE['df']
+    frames = [_STATE['initial']]
+    for day, (row_index, features) in sorted(_STATE['day_features'].items()):
+        if day >= cutoff:
+            break
+        sonuc = df.loc[row_index, 'sonuc'].to_numpy()
+        known = ~pd.isna(sonuc)
+        if known.any():
+            frames.append(features[known].assign(sonuc=sonuc[known]))
+    return pd.concat(frames, ignore_index=True)
+
+
+def card_rows(day):
+    """Günün bu hipodromdaki kart satırları ve feature'ları"""
+    df, hipodrom = _STATE['df'], _STATE['hipodrom']
+    row_index, features = _STATE['day_features'][day]
+    rows = df.loc[row_index]
+    mask = np.ones(len(rows), dtype=bool)
+    if 'hipodrom_key' in rows.columns:
+        mask = rows['hipodrom_key'].astype(str).str.upper().to_numpy() == hipodrom
+    return rows[mask].reset_index(drop=True), features[mask].reset_index(drop=True)
+
+
+def run_block(block):
+    """Bir eğitim bloğu: kesim gününe kadarki veriyle eğit, bloğun günlerini skorla
+
+    Returns:
+        Blok özeti ve gün bazında skorlanmış satırlar (DataFrame)
+    """
+    df, hipodrom = _STATE['df'], _STATE['hipodrom']
+    cutoff, days = block['cutoff'], block['days']
+    t0 = time.perf_counter()
+    train = training_frame(cutoff)
+    with quiet():
+        predictor = make_predictor(hipodrom, cutoff)
+        X, y, groups, cat_cols, num_cols = predictor.feature_matrix(train)
+        predictor.train_model(X, y, groups, cat_cols, num_cols, history=df)
+    train_s = time.perf_counter() - t0
+
+    scored = []
+    for day in days:
+        card, features = card_rows(day)
+        if len(card) == 0:
+            continue
+        predictor.clock = as_of_clock(day.strftime(DATE_FORMAT))
+        # Kart sonuçlar belli olmadan skorlanır
+        truth = card[['sonuc', 'ganyan']].copy() if 'ganyan' in card.columns else card[['sonuc']].assign(ganyan=np.nan)
+        card = card.assign(sonuc=np.nan)
+        with quiet():
+            card, proba = predictor.score_card(card, history=df[df['tarih_dt'] <= day], predict_features=features)
+        name_col = 'at_key' if 'at_key' in card.columns else 'at_adi'
+        scored.append(pd.DataFrame({
+            'tarih': day.strftime('%d/%m/%Y'),
+            'yaris_kosu_key': card['yaris_kosu_key'].astype(str).to_numpy(),
+            'at_key': card[name_col].astype(str).to_numpy(),
+            'at_adi': card['at_adi'].astype(str).to_numpy() if 'at_adi' in card.columns else '',
+            'win_proba': proba,
+            'sonuc': pd.to_numeric(truth['sonuc'], errors='coerce').to_numpy(),
+            'ganyan': pd.to_numeric(truth['ganyan'].astype(str).str.replace(',', '.'), errors='coerce').to_numpy(),
+        }))
+
+    summary = {
+        'cutoff': cutoff.strftime('%d/%m/%Y'),
+        'days': [d.strftime('%d/%m/%Y') for d in days],
+        'train_rows': len(train),
+        'train_races': int(pd.Series(groups).nunique()) if groups is not None else 0,
+        'train_s': round(train_s, 2),
+        'total_s': round(time.perf_counter() - t0, 2),
+    }
+    return summary, (pd.concat(scored, ignore_index=True) if scored else None)
+
+
+def retrain_blocks(card_days, retrain_every):
+    """Kart günlerini retrain_every takvim günlük eğitim bloklarına ayır"""
+    blocks = []
+    for day in card_days:
+        if blocks and day < blocks[-1]['cutoff'] + timedelta(days=retrain_every):
+            blocks[-1]['days'].append(day)
+        else:
+            blocks.append({'cutoff': day, 'days': [day]})
+    return blocks
+
+
+def run_parallel(func, items, workers):
+    """func'ı items üzerinde çalıştır (workers > 1 ise fork'lanmış süreç havuzunda)"""
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=min(workers, len(items)), mp_context=context) as pool:
+        return list(pool.map(func, items))
+
+
+def backtest_hipodrom(hipodrom, start, end, retrain_every=7, workers=1, use_cache=True, verbose=False):
+    """Tek hipodrom için walk-forward backtest
+
+    Returns:
+        Sonuç sözlüğü (bloklar, günlük ve toplam metrikler) ve skorlanmış satırlar
+    """
+    _STATE.clear()
+    _STATE['verbose'] = verbose
+    with quiet():
+        df = make_predictor(hipodrom, end).load_data()
+    if df is None or 'tarih_dt' not in df.columns:
+        print(f"❌ {hipodrom}: veri yok")
+        return None, None
+
+    in_range = (df['tarih_dt'] >= start) & (df['tarih_dt'] <= end)
+    on_card = in_range
+    if 'hipodrom_key' in df.columns:
+        on_card = in_range & (df['hipodrom_key'].astype(str).str.upper() == hipodrom)
+    card_days = sorted(pd.Timestamp(d) for d in df.loc[on_card, 'tarih_dt'].dropna().unique())
+    if not card_days:
+        print(f"⚠️ {hipodrom}: {start:%d/%m/%Y}-{end:%d/%m/%Y} arasında koşu günü yok")
+        return None, None
+    # Eğitime eklenecek ve skorlanacak tüm günler (diğer hipodromlardaki geçmiş satırlar dahil)
+    feature_days = sorted(pd.Timestamp(d) for d in df.loc[
+        (df['tarih_dt'] >= card_days[0]) & (df['tarih_dt'] <= card_days[-1]), 'tarih_dt'].dropna().unique())
+
+    _STATE.update(df=df, hipodrom=hipodrom, cache=FeatureCache(df, hipodrom, enabled=use_cache))
+    t0 = time.perf_counter()
+
+    print(f"🧮 {hipodrom}: ilk eğitim feature'ları ({card_days[0]:%d/%m/%Y} öncesi)...")
+    _STATE['initial'] = featurize_initial(card_days[0])
+    print(f"🧮 {hipodrom}: {len(feature_days)} günün point-in-time feature'ları...")
+    _STATE['day_features'] = {day: (row_index, features)
+                              for day, row_index, features in run_parallel(featurize_day, feature_days, workers)}
+    features_s = time.perf_counter() - t0
+
+    blocks = retrain_blocks(card_days, retrain_every)
+    print(f"🏋️ {hipodrom}: {len(blocks)} eğitim bloğu, {len(card_days)} kart günü...")
+    results = run_parallel(run_block, blocks, workers)
+
+    # Metrikler (bellekte, gün sırasıyla)
+    store = PredictionMetricsStore(':memory:')
+    scored = pd.concat([s for _, s in results if s is not None], ignore_index=True)
+    for tarih, day_rows in scored.groupby('tarih', sort=False):
+        store.record_predictions(day_rows['yaris_kosu_key'], day_rows['at_key'], day_rows['win_proba'], tarih=tarih)
+        store.ingest_results(day_rows['yaris_kosu_key'], day_rows['at_key'], day_rows['sonuc'],
+                             day_rows['ganyan'], tarih=tarih, ts=0.0)
+    result = {
+        'hipodrom': hipodrom,
+        'start': start.strftime('%d/%m/%Y'),
+        'end': end.strftime('%d/%m/%Y'),
+        'retrain_every': retrain_every,
+        'card_days': len(card_days),
+        'feature_days': len(feature_days),
+        'features_s': round(features_s, 2),
+        'total_s': round(time.perf_counter() - t0, 2),
+        'blocks': [summary for summary, _ in results],
+        'daily': store.daily(),
+        'metrics': store.rolling(),
+    }
+    store.close()
+    _STATE.clear()
+    return result, scored
+
+
+def main():
+    """Ana fonksiyon"""
+    args, opts = parse_args(sys.argv[1:])
+    if not args or 'start' not in opts:
+        print(__doc__)
+        sys.exit(1)
+    start = pd.Timestamp(datetime.strptime(opts['start'], '%d/%m/%Y'))
+    end = pd.Timestamp(datetime.strptime(opts.get('end', opts['start']), '%d/%m/%Y'))
+    retrain_every = max(1, int(opts.get('retrain-every', 7)))
+    workers = max(1, int(opts.get('workers', 1)))
+
+    print("=" * 60)
+    print(f"🔁 Backtest: {', '.join(a.upper() for a in args)} | {start:%d/%m/%Y} - {end:%d/%m/%Y} | "
+          f"{retrain_every} günde bir eğitim | {workers} süreç")
+    print("=" * 60)
+
+    results = []
+    for hipodrom in (a.upper() for a in args):
+        result, scored = backtest_hipodrom(hipodrom, start, end, retrain_every=retrain_every, workers=workers,
+                                           use_cache='no-cache' not in opts, verbose='verbose' in opts)
+        if result is None:
+            continue
+        results.append(result)
+        m = result['metrics']
+        if m['races']:
+            print(f"   ✅ {hipodrom}: {m['races']} koşu | top-1 %{m['top1_rate']*100:.1f} | "
+                  f"top-3 %{m['top3_rate']*100:.1f} | logloss {m['logloss']:.3f} | ROI {m['roi']:+.3f} | "
+                  f"{result['total_s']:.1f} sn")
+        else:
+            print(f"   ⚠️ {hipodrom}: sonucu belli koşu yok ({result['total_s']:.1f} sn)")
+        if scored is not None:
+            BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+            scored.to_csv(BACKTEST_DIR / f"{hipodrom}_backtest_predictions.csv", index=False)
+
+    out = Path(opts.get('out') or BACKTEST_DIR / f"backtest_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'results': results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Sonuçlar kaydedildi: {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Toplu Tahmin (Batch Inference)
+- Bugün koşu olan tüm hipodromları bulur
+- Her hipodrom için kayıtlı modeli (models/{HIPODROM}_model.joblib) yükler
+  (--retrain: veriyi indirip modeli yeniden eğitir; --train-missing: sadece modeli olmayanları eğitir)
+- Her kart kendi hipodromunun geçmişine (+ ortak store satırlarına) karşı featurize edilir:
+  model hangi bağlamla eğitildiyse tahminde de aynı bağlam kullanılır (train/serve farkı yok)
+- Hipodromlar tek süreçte sırayla işlenir; ortak geçmiş store'u bir kez yüklenip paylaşılır
+- Her hipodromun çıktıları o hipodrom biter bitmez yazılır; bir hipodromun hatası diğerlerini etkilemez
+"""
+
+import sys
+import time
+from pathlib import Path
+
+from horse_racing_predictor import HorseRacingPredictor
+from race_calendar import get_cities_with_races_today
+from race_clock import as_of_clock, as_of_arg
+
+# Proje dizini
+BASE_DIR = Path(__file__).parent
+
+
+def predict_hipodrom(hipodrom, train_missing=False, profile_mode=None, clock=None, retrain=False):
+    """Tek hipodromu kayıtlı modelle skorla; --retrain veya model yoksa (isteğe bağlı) tam pipeline"""
+    predictor = HorseRacingPredictor(hipodrom, clock=clock)
+    if profile_mode:
+        predictor.profiler.profile_mode = profile_mode
+    if retrain:
+        print(f"🤖 {hipodrom}: veri indirilip model yeniden eğitiliyor...")
+        return predictor.run_full_pipeline()
+    if not Path(predictor.model_file).exists():
+        if not train_missing:
+            print(f"⚠️ {hipodrom}: kayıtlı model yok, atlanıyor (--train-missing ile eğitilebilir)")
+            return False
+        print(f"🤖 {hipodrom}: kayıtlı model yok, tam pipeline çalıştırılıyor...")
+        return predictor.run_full_pipeline()
+    return predictor.run_saved_model_pipeline()
+
+
+def run_batch(hipodromlar=None, train_missing=False, profile_mode=None, clock=None, retrain=False):
+    """Verilen (veya bugün koşu olan) hipodromları sırayla skorla
+
+    Tüm hipodromlar aynı as-of saatiyle (clock) skorlanır.
+    """
+    clock = clock or as_of_clock()
+    if not hipodromlar:
+        hipodromlar = get_cities_with_races_today(clock())
+    if not hipodromlar:
+        print("\n⚠️ Bugün hiçbir şehirde koşu bulunamadı!")
+        return {}
+
+    print(f"\n🎯 {len(hipodromlar)} hipodrom toplu skorlanıyor: {', '.join(hipodromlar)}")
+    results = {}
+    for hipodrom in hipodromlar:
+        start = time.time()
+        try:
+            ok = predict_hipodrom(hipodrom, train_missing=train_missing, profile_mode=profile_mode,
+                                  clock=clock, retrain=retrain)
+        except Exception as e:
+            print(f"❌ {hipodrom} skorlanırken hata: {e}")
+            ok = False
+        results[hipodrom] = {'ok': bool(ok), 'seconds': round(time.time() - start, 2)}
+        print(f"{'✅' if ok else '❌'} {hipodrom}: {results[hipodrom]['seconds']} sn")
+    return results
+
+
+def main():
+    """Ana fonksiyon"""
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    train_missing = '--train-missing' in sys.argv
+    retrain = '--retrain' in sys.argv
+    # --profile (cProfile) veya --profile=pyinstrument
+    profile_mode = next((a.split('=', 1)[1] if '=' in a else 'cprofile'
+                         for a in sys.argv[1:] if a.startswith('--profile')), None)
+    # --as-of=gg/aa/yyyy[ SS:DD] (veya GALOPCU_AS_OF): tüm hipodromlar o günün kartıyla skorlanır
+    clock = as_of_clock(as_of_arg(sys.argv[1:]))
+    print("=" * 60)
+    print("⚡ Toplu tahmin (kayıtlı modeller) başlatılıyor...")
+    print("=" * 60)
+
+    results = run_batch([a.upper() for a in args], train_missing=train_missing, profile_mode=profile_mode,
+                        clock=clock, retrain=retrain)
+
+    ok_count = sum(1 for r in results.values() if r['ok'])
+    print("\n" + "=" * 60)
+    print(f"✅ Toplu tahmin tamamlandı: {ok_count}/{len(results)} hipodrom")
+    print("=" * 60)
+    # Alt süreç olarak çalıştırıldığında (daily_update) başarısızlık çıkış koduna yansır
+    if results and ok_count < len(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
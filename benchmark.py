@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Performans Benchmark'ı
+- data/{HIPODROM}_races.csv dosyaları üzerinde sabitlenmiş "bugün" tarihiyle tam pipeline
+- Aşama süreleri (load, feature blokları, train, predict, generate_smart_labels)
+  HorseRacingPredictor.profiler (StageProfiler) raporundan alınır
+- web_app: parse_tahmin_dosyasi ve /api/tahminler (Flask test client, soğuk/sıcak cache)
+- Sentetik ölçekleme (--scale=1,2,5,10): geçmiş koşular tarihte geriye kaydırılıp
+  çoğaltılır; aynı atların geçmişi uzar, süper-lineer bloklar ortaya çıkar
+- --synthetic=20000,100000: synthetic_races ile üretilen SENTETIK hipodromu
+  (satır sayısı oranı ölçek olarak raporlanır)
+- Her senaryo ayrı süreçte, geçici bir çalışma klasöründe çalışır (bellek ölçümü temiz kalır)
+- Sonuçlar JSON olarak yazılır; --compare=önceki.json ile regresyonlar raporlanır
+
+Kullanım:
+    python3 benchmark.py [HİPODROM ...] [--scale=1,2,5] [--date=14/11/2025]
+                         [--repeat=5] [--out=benchmarks/sonuc.json] [--compare=önceki.json]
+    python3 benchmark.py --synthetic=20000,100000 [--date=14/11/2025]
+"""
+
+import io
+import os
+import sys
+import json
+import math
+import shutil
+import platform
+import tempfile
+import subprocess
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from horse_racing_predictor import sniff_encoding
+from race_clock import AS_OF_ENV, DATE_FORMAT, as_of_clock
+from synthetic_races import write_races_csv
+
+# Proje dizini
+BASE_DIR = Path(__file__).resolve().parent
+BENCH_DIR = BASE_DIR / "benchmarks"
+SYNTHETIC_HIPODROM = 'SENTETIK'
+
+# Bu oranın üzerindeki yavaşlamalar regresyon sayılır (--compare)
+REGRESSION_THRESHOLD = 0.20
+# Ölçek üssü (log(t_k/t_1) / log(k)) bu değerin üzerindeyse blok süper-lineer sayılır
+SUPERLINEAR_EXPONENT = 1.2
+# Bu süreden kısa aşamalar karşılaştırmada gürültü sayılır (sn)
+MIN_STAGE_SECONDS = 0.05
+
+
+def read_raw_csv(csv_path):
+    """CSV'yi ham metin kolonlarıyla (dönüşümsüz) oku; encoding byte örneğinden tespit edilir"""
+    with open(csv_path, 'rb') as f:
+        data = f.read()
+    encoding = sniff_encoding(data[:65536])
+    return pd.read_csv(io.BytesIO(data), encoding=encoding, dtype=str, keep_default_na=False)
+
+
+def latest_race_date(csv_path):
+    """CSV'deki en son koşu tarihi (dd/mm/YYYY)"""
+    dates = pd.to_datetime(read_raw_csv(csv_path)['tarih'], format='%d/%m/%Y', errors='coerce')
+    return dates.max().strftime('%d/%m/%Y')
+
+
+def scale_history(df, factor, as_of):
+    """Geçmiş koşuları (as_of öncesi) factor katına çıkar
+
+    Her kopya, verinin tarih aralığı kadar geriye kaydırılır; koşu anahtarları
+    kopya numarasıyla ayrılır. At/jokey/antrenör kimlikleri korunur.
+    """
+    if factor <= 1:
+        return df
+    dates = pd.to_datetime(df['tarih'], format='%d/%m/%Y', errors='coerce')
+    past = df[dates < pd.Timestamp(datetime.strptime(as_of, '%d/%m/%Y'))]
+    past_dates = dates[past.index]
+    span = (past_dates.max() - past_dates.min()) + timedelta(days=1)
+    copies = [df]
+    for i in range(1, factor):
+        rep = past.copy()
+        rep['tarih'] = (past_dates - i * span).dt.strftime('%d/%m/%Y')
+        for col in ('yaris_kosu_key', 'yaris_key', 'kosu_kodu'):
+            if col in rep.columns:
+                rep[col] = rep[col].astype(str) + f"_s{i}"
+        copies.append(rep)
+    return pd.concat(copies, ignore_index=True)
+
+
+def prepare_workdir(hipodrom, factor, as_of, workdir, synthetic_rows=None):
+    """data/ klasörünü geçici çalışma klasörüne kopyala, hedef CSV'yi ölçekle
+
+    synthetic_rows verilirse sadece üretilmiş hipodrom CSV'si yazılır.
+    """
+    data_dir = Path(workdir) / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    (Path(workdir) / "output").mkdir(exist_ok=True)
+    target = data_dir / f"{hipodrom}_races.csv"
+    if synthetic_rows:
+        write_races_csv(str(target), synthetic_rows, hipodrom=hipodrom, end_date=as_of)
+        return target
+    for src in (BASE_DIR / "data").glob("*"):
+        if src.is_file() and not src.name.startswith('.') and src.suffix in ('.csv', '.json'):
+            shutil.copy2(src, data_dir / src.name)
+    if factor > 1:
+        df = read_raw_csv(target)
+        scale_history(df, factor, as_of).to_csv(target, index=False, encoding='utf-8')
+    return target
+
+
+def time_calls(func, repeat):
+    """func'ı repeat kez çalıştır; (medyan, min) süre ve son sonuç"""
+    times, result = [], None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            result = func()
+        times.append(time.perf_counter() - start)
+    return {'median_s': round(float(np.median(times)), 5), 'min_s': round(min(times), 5), 'n': len(times)}, result
+
+
+def bench_web(hipodrom, repeat):
+    """parse_tahmin_dosyasi ve /api/tahminler/<hipodrom> sürelerini ölç"""
+    os.environ['GALOPCU_DISABLE_SCHEDULER'] = '1'
+    try:
+        import web_app
+    except Exception as e:
+        return {'skipped': f"web_app yüklenemedi: {type(e).__name__}: {e}"}
+    txt_file = f'output/{hipodrom}_tahminler.txt'
+    if not os.path.exists(txt_file):
+        return {'skipped': f"{txt_file} yok"}
+
+    results = {}
+    results['parse_tahmin_dosyasi'], _ = time_calls(lambda: web_app.parse_tahmin_dosyasi(txt_file), repeat)
+
+    client = web_app.app.test_client()
+
+    def cold():
+        web_app._race_card_cache.clear()
+        web_app._race_index_cache.clear()
+        return client.get(f'/api/tahminler/{hipodrom}')
+
+    results['api_tahminler_cold'], resp = time_calls(cold, repeat)
+    results['api_tahminler_cold']['status'] = resp.status_code
+    results['api_tahminler_warm'], resp = time_calls(lambda: client.get(f'/api/tahminler/{hipodrom}'), repeat)
+    results['api_tahminler_warm']['status'] = resp.status_code
+    return results
+
+
+def run_case(spec):
+    """Tek senaryo (hipodrom × ölçek): ayrı süreçte, çalışma klasörü içinde çalışır"""
+    sys.path.insert(0, str(BASE_DIR))
+    os.chdir(spec['workdir'])
+    # Pipeline ve web katmanı aynı sabit 'bugün'ü görür (saat 12:00)
+    os.environ[AS_OF_ENV] = spec['date']
+    import horse_racing_predictor as hrp
+
+    predictor = hrp.HorseRacingPredictor(spec['hipodrom'])
+    predictor.download_data = lambda: True  # Benchmark ağ erişimi yapmaz
+    start = time.perf_counter()
+    ok = predictor.run_full_pipeline()
+    total = time.perf_counter() - start
+
+    with open(predictor.profiler.report_file, encoding='utf-8') as f:
+        report = json.load(f)
+    stages = {path: s['seconds'] for path, s in report['summary'].items()}
+    rows = {path: s['rows_in'] for path, s in report['summary'].items()}
+    return {
+        'hipodrom': spec['hipodrom'],
+        'scale': spec['scale'],
+        'date': spec['date'],
+        'synthetic_rows': spec.get('synthetic_rows'),
+        'ok': bool(ok),
+        'csv_rows': int(sum(1 for _ in open(spec['csv'], encoding='utf-8', errors='replace')) - 1),
+        'total_s': round(total, 3),
+        'peak_rss_mb': report['peak_rss_mb'],
+        'stages': stages,
+        'stage_rows': rows,
+        'web': bench_web(spec['hipodrom'], spec['repeat']) if ok else {'skipped': 'pipeline başarısız'},
+    }
+
+
+def run_case_subprocess(hipodrom, scale, date, repeat, synthetic_rows=None):
+    """Senaryoyu geçici klasörde ayrı bir Python sürecinde çalıştır"""
+    workdir = tempfile.mkdtemp(prefix=f"galopcu_bench_{hipodrom}_{scale}x_")
+    try:
+        csv = prepare_workdir(hipodrom, scale, date, workdir, synthetic_rows=synthetic_rows)
+        spec = {'hipodrom': hipodrom, 'scale': scale, 'date': date, 'repeat': repeat,
+                'workdir': workdir, 'csv': str(csv), 'synthetic_rows': synthetic_rows}
+        out_file = os.path.join(workdir, 'case_result.json')
+        cmd = [sys.executable, str(Path(__file__).resolve()), f'--case={json.dumps(spec)}', f'--case-out={out_file}']
+        log_file = os.path.join(workdir, 'case.log')
+        with open(log_file, 'w', encoding='utf-8') as log:
+            proc = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT)
+        if proc.returncode != 0 or not os.path.exists(out_file):
+            with open(log_file, encoding='utf-8', errors='replace') as f:
+                tail = f.read()[-2000:]
+            return {'hipodrom': hipodrom, 'scale': scale, 'date': date, 'ok': False,
+                    'error': f"çıkış kodu {proc.returncode}", 'log_tail': tail}
+        with open(out_file, encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def scaling_exponents(cases):
+    """Her (hipodrom, aşama) için ölçek üssü: log(t_k / t_1) / log(k)"""
+    base = {c['hipodrom']: c for c in cases if c.get('ok') and c['scale'] == 1}
+    out = {}
+    for c in cases:
+        b = base.get(c['hipodrom'])
+        if b is None or not c.get('ok') or c['scale'] <= 1:
+            continue
+        for path, t in c['stages'].items():
+            t1 = b['stages'].get(path)
+            if t1 is None or t1 < MIN_STAGE_SECONDS:
+                continue
+            exp = math.log(max(t, 1e-9) / t1) / math.log(c['scale'])
+            out.setdefault(c['hipodrom'], {}).setdefault(path, {})[f"{c['scale']}x"] = round(exp, 3)
+    return out
+
+
+def compare_results(current, baseline_file, threshold=REGRESSION_THRESHOLD):
+    """Önceki JSON sonucuyla aşama bazında karşılaştır; regresyon listesini döndür"""
+    with open(baseline_file, encoding='utf-8') as f:
+        baseline = json.load(f)
+    old = {(c['hipodrom'], c['scale']): c for c in baseline.get('cases', []) if c.get('ok')}
+    regressions = []
+    for c in current['cases']:
+        o = old.get((c['hipodrom'], c['scale']))
+        if o is None or not c.get('ok'):
+            continue
+        pairs = [(p, o['stages'].get(p), t) for p, t in c['stages'].items()]
+        pairs.append(('total', o.get('total_s'), c.get('total_s')))
+        for name, section in (c.get('web') or {}).items():
+            if isinstance(section, dict) and 'median_s' in section:
+                pairs.append((f"web/{name}", (o.get('web') or {}).get(name, {}).get('median_s'), section['median_s']))
+        for path, t_old, t_new in pairs:
+            if t_old is None or t_new is None or max(t_old, t_new) < MIN_STAGE_SECONDS:
+                continue
+            change = (t_new - t_old) / t_old if t_old > 0 else float('inf')
+            if change > threshold:
+                regressions.append({'hipodrom': c['hipodrom'], 'scale': c['scale'], 'stage': path,
+                                    'old_s': t_old, 'new_s': t_new, 'change': round(change, 3)})
+    return sorted(regressions, key=lambda r: -r['change'])
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def parse_args(argv):
+    args = [a for a in argv if not a.startswith('--')]
+    opts = dict(a[2:].split('=', 1) if '=' in a else (a[2:], '1') for a in argv if a.startswith('--'))
+    return args, opts
+
+
+def main():
+    """Ana fonksiyon"""
+    args, opts = parse_args(sys.argv[1:])
+    if 'case' in opts:
+        result = run_case(json.loads(opts['case']))
+        with open(opts['case-out'], 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        return
+
+    scales = sorted({int(s) for s in opts.get('scale', '1').split(',')} | {1})
+    repeat = int(opts.get('repeat', 5))
+
+    # Senaryolar: (hipodrom, ölçek, bugün, sentetik satır sayısı)
+    jobs = []
+    if 'synthetic' in opts:
+        sizes = sorted({int(float(s)) for s in opts['synthetic'].split(',')})
+        date = opts.get('date') or as_of_clock()().strftime(DATE_FORMAT)
+        jobs += [(SYNTHETIC_HIPODROM, max(1, rows // sizes[0]), date, rows) for rows in sizes]
+    if args or 'synthetic' not in opts:
+        hipodromlar = [a.upper() for a in args] or sorted(
+            p.name[:-len('_races.csv')] for p in (BASE_DIR / "data").glob("*_races.csv"))
+        for hipodrom in hipodromlar:
+            csv = BASE_DIR / "data" / f"{hipodrom}_races.csv"
+            if not csv.exists():
+                print(f"⚠️ {hipodrom}: {csv} yok, atlanıyor")
+                continue
+            date = opts.get('date') or latest_race_date(csv)
+            jobs += [(hipodrom, scale, date, None) for scale in scales]
+
+    print("=" * 60)
+    print(f"⏱️ Benchmark: {len(jobs)} senaryo ({', '.join(sorted({j[0] for j in jobs}))})")
+    print("=" * 60)
+
+    cases = []
+    for hipodrom, scale, date, synthetic_rows in jobs:
+        label = f"{synthetic_rows:,} satır" if synthetic_rows else f"{scale}x"
+        print(f"🏇 {hipodrom} {label} (bugün={date}) çalışıyor...")
+        case = run_case_subprocess(hipodrom, scale, date, repeat, synthetic_rows=synthetic_rows)
+        cases.append(case)
+        if case.get('ok'):
+            top = sorted(case['stages'].items(), key=lambda kv: -kv[1])[:3]
+            print(f"   ✅ {case['total_s']:.1f} sn, tepe bellek {case['peak_rss_mb']:.0f} MB | "
+                  + ", ".join(f"{p} {t:.1f}s" for p, t in top))
+        else:
+            print(f"   ❌ {case.get('error', 'pipeline başarısız')}")
+
+    results = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scales': scales,
+        'repeat': repeat,
+        'cases': cases,
+        'scaling_exponents': scaling_exponents(cases),
+    }
+
+    superlinear = [(h, p, e) for h, stages in results['scaling_exponents'].items()
+                   for p, exps in stages.items() for e in exps.values() if e > SUPERLINEAR_EXPONENT]
+    if superlinear:
+        print("\n📈 Süper-lineer bloklar (ölçek üssü > %.1f):" % SUPERLINEAR_EXPONENT)
+        for h, p, e in sorted(superlinear, key=lambda x: -x[2])[:15]:
+            print(f"   {h} {p}: {e:.2f}")
+
+    if 'compare' in opts:
+        results['compared_to'] = opts['compare']
+        results['regressions'] = compare_results(results, opts['compare'])
+        if results['regressions']:
+            print(f"\n🐢 {len(results['regressions'])} regresyon (>%{REGRESSION_THRESHOLD*100:.0f}):")
+            for r in results['regressions'][:20]:
+                print(f"   {r['hipodrom']} {r['scale']}x {r['stage']}: {r['old_s']:.3f}s → {r['new_s']:.3f}s "
+                      f"(+%{r['change']*100:.0f})")
+        else:
+            print("\n✅ Regresyon yok")
+
+    out = Path(opts.get('out') or BENCH_DIR / f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Sonuçlar kaydedildi: {out}")
+
+
+if __name__ == '__main__':
+    main()
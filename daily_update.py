@@ -8,44 +8,22 @@ Günlük Otomatik Güncelleme Scripti
 
 import os
 import sys
-import pandas as pd
-from datetime import datetime
-from pathlib import Path
 import subprocess
+from pathlib import Path
+
+from race_clock import as_of_clock, as_of_arg
+from race_calendar import get_cities_with_races_today
 
 # Proje dizini
 BASE_DIR = Path(__file__).parent
 
-def get_cities_with_races_today():
-    """Bugün koşu olan şehirleri tespit et"""
-    data_dir = BASE_DIR / 'data'
-    today = datetime.now().strftime('%d/%m/%Y')
-    
-    cities_with_races = []
-    
-    # Tüm CSV dosyalarını kontrol et
-    for csv_file in data_dir.glob('*_races.csv'):
-        try:
-            # Şehir adını dosya adından çıkar (örn: ISTANBUL_races.csv -> ISTANBUL)
-            city_name = csv_file.stem.replace('_races', '').upper()
-            
-            # CSV'yi oku
-            df = pd.read_csv(csv_file, encoding='utf-8')
-            
-            # Bugün koşu var mı kontrol et
-            if 'tarih' in df.columns:
-                today_races = df[df['tarih'] == today]
-                if len(today_races) > 0:
-                    cities_with_races.append(city_name)
-                    print(f"✅ {city_name}: Bugün {len(today_races)} at var")
-        except Exception as e:
-            print(f"⚠️ {csv_file.name} okunurken hata: {e}")
-            continue
-    
-    return sorted(cities_with_races)
+def run_predictions_for_cities(cities, as_of):
+    """Belirtilen şehirler için tahmin çalıştır (tüm şehirler aynı as-of anıyla)
 
-def run_predictions_for_cities(cities):
-    """Belirtilen şehirler için tahmin çalıştır"""
+    Her şehir kendi batch_predict.py --retrain alt sürecinde işlenir (veri indirme,
+    yeniden eğitim, kayıtlı bundle ile skorlama): bir şehrin hatası veya zaman aşımı
+    diğerlerini etkilemez, biten şehrin çıktıları hemen yazılmış olur.
+    """
     print(f"\n🎯 {len(cities)} şehir için tahmin çalıştırılıyor...")
     
     for city in cities:
@@ -55,7 +33,8 @@ def run_predictions_for_cities(cities):
         
         try:
             result = subprocess.run(
-                ['python3', 'predict.py', city],
+                ['python3', 'batch_predict.py', city, '--retrain',
+                 f"--as-of={as_of.strftime('%d/%m/%Y %H:%M')}"],
                 cwd=BASE_DIR,
                 capture_output=True,
                 text=True,
@@ -74,13 +53,15 @@ def run_predictions_for_cities(cities):
 
 def main():
     """Ana fonksiyon"""
+    # --as-of=gg/aa/yyyy[ SS:DD] (veya GALOPCU_AS_OF): geçmiş/gelecek bir gün için çalıştır
+    as_of = as_of_clock(as_of_arg(sys.argv[1:]))()
     print("="*60)
     print("🔄 Günlük Otomatik Güncelleme Başlatılıyor...")
-    print(f"📅 Tarih: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+    print(f"📅 Tarih: {as_of.strftime('%d/%m/%Y %H:%M:%S')}")
     print("="*60)
     
     # Bugün koşu olan şehirleri bul
-    cities_with_races = get_cities_with_races_today()
+    cities_with_races = get_cities_with_races_today(as_of)
     
     if not cities_with_races:
         print("\n⚠️ Bugün hiçbir şehirde koşu bulunamadı!")
@@ -89,7 +70,7 @@ def main():
     print(f"\n📊 Bugün koşu olan şehirler: {', '.join(cities_with_races)}")
     
     # Tahminleri çalıştır
-    run_predictions_for_cities(cities_with_races)
+    run_predictions_for_cities(cities_with_races, as_of)
     
     print("\n" + "="*60)
     print("✅ Günlük otomatik güncelleme tamamlandı!")
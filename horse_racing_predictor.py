@@ -1,12 +1,20 @@
 import pandas as pd
 import numpy as np
 import os
+import io
+import json
+import codecs
+import glob
+import hashlib
+import time
+import functools
 import requests
-from datetime import datetime
+import joblib
+from contextlib import contextmanager
 
 from sklearn.model_selection import GroupKFold
 from sklearn.compose import ColumnTransformer
-from sklearn.preprocessing import OneHotEncoder, LabelEncoder
+from sklearn.preprocessing import OneHotEncoder
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
 from sklearn.linear_model import LogisticRegression
@@ -16,11 +24,1486 @@ from sklearn.metrics import roc_auc_score, log_loss
 import xgboost as xgb
 from xgboost import XGBRanker
 
+from prediction_report import PredictionReport
+from race_clock import as_of_clock, as_of_arg, turkey_time, DATE_FORMAT
+
+
+def _race_segments(qid):
+    """Sıralı qid dizisi için koşu başlangıç indeksleri, boyutları ve satır→koşu haritası"""
+    qid = np.asarray(qid)
+    if len(qid) == 0:
+        empty = np.array([], dtype=int)
+        return empty, empty, empty
+    starts = np.r_[0, np.flatnonzero(np.diff(qid)) + 1]
+    sizes = np.diff(np.r_[starts, len(qid)])
+    seg = np.repeat(np.arange(len(starts)), sizes)
+    return starts, sizes, seg
+
+
+def race_ranking_metrics(y, scores, groups):
+    """Koşu bazında NDCG ve Top-1 isabeti (vektörel)
+
+    Sadece en az bir kazananı olan koşular değerlendirilir.
+
+    Returns:
+        {'NDCG': ortalama NDCG, 'Top1': en yüksek skorlu atın kazanma oranı, 'n_races': koşu sayısı}
+    """
+    g = pd.factorize(pd.Series(np.asarray(groups)).astype(str))[0]
+    y = np.asarray(y, dtype=float)
+    s = np.asarray(scores, dtype=float)
+    if len(g) == 0:
+        return {'NDCG': float('nan'), 'Top1': float('nan'), 'n_races': 0}
+
+    # Koşu içinde skora göre (azalan) ve ideal sıraya göre (etikete göre azalan) diz
+    order = np.lexsort((-s, g))
+    ideal = np.lexsort((-y, g))
+    starts, sizes, _ = _race_segments(g[order])
+    pos = np.arange(len(g)) - np.repeat(starts, sizes)
+    disc = 1.0 / np.log2(pos + 2.0)
+
+    dcg = np.add.reduceat(y[order] * disc, starts)
+    idcg = np.add.reduceat(y[ideal] * disc, starts)
+    has_pos = idcg > 0
+    if not has_pos.any():
+        return {'NDCG': float('nan'), 'Top1': float('nan'), 'n_races': 0}
+
+    ndcg = dcg[has_pos] / idcg[has_pos]
+    top1 = (y[order][starts] > 0)[has_pos]
+    return {'NDCG': float(ndcg.mean()), 'Top1': float(top1.mean()), 'n_races': int(has_pos.sum())}
+
+
+class ListwiseSoftmaxRanker:
+    """Koşu içi softmax (listwise) hedefli XGBoost sıralayıcı
+
+    Her koşu tek bir liste olarak ele alınır ve kazananın koşu içi softmax
+    olasılığı maksimize edilir (ListNet top-1). XGBRanker ile aynı
+    fit(X, y, qid=...) / predict(X) arayüzünü sunar.
+    """
+
+    def __init__(self, n_estimators=300, max_depth=6, learning_rate=0.1,
+                 subsample=1.0, colsample_bytree=1.0, random_state=42):
+        self.n_estimators = n_estimators
+        self.max_depth = max_depth
+        self.learning_rate = learning_rate
+        self.subsample = subsample
+        self.colsample_bytree = colsample_bytree
+        self.random_state = random_state
+        self.booster_ = None
+
+    def fit(self, X, y, qid):
+        """qid'e göre sıralı (bitişik) satırlarla eğit"""
+        y = np.asarray(y, dtype=float)
+        starts, sizes, seg = _race_segments(qid)
+        y_sum = np.add.reduceat(y, starts)
+        active = (y_sum > 0)[seg]
+        target = np.where(active, y / np.where(y_sum[seg] > 0, y_sum[seg], 1.0), 0.0)
+
+        def _softmax_obj(preds, dtrain):
+            m = np.maximum.reduceat(preds, starts)
+            e = np.exp(preds - m[seg])
+            p = e / np.add.reduceat(e, starts)[seg]
+            # Kazananı olmayan koşular gradyana katkı vermez
+            grad = np.where(active, p - target, 0.0)
+            hess = np.where(active, np.maximum(p * (1.0 - p), 1e-6), 1e-6)
+            return grad, hess
+
+        dtrain = xgb.DMatrix(X, label=y)
+        dtrain.set_group(sizes)
+        params = {
+            'max_depth': self.max_depth,
+            'eta': self.learning_rate,
+            'subsample': self.subsample,
+            'colsample_bytree': self.colsample_bytree,
+            'seed': self.random_state,
+        }
+        self.booster_ = xgb.train(params, dtrain, num_boost_round=self.n_estimators, obj=_softmax_obj)
+        return self
+
+    def predict(self, X):
+        return self.booster_.predict(xgb.DMatrix(X), output_margin=True)
+
+
+def group_softmax(values, codes):
+    """Koşu (grup) bazında softmax - tek matris işlemi, Python döngüsü yok
+
+    Args:
+        values: Satır bazında skor/utility dizisi
+        codes: Satır bazında grup kodu (0..G-1, pd.factorize çıktısı)
+    """
+    values = np.asarray(values, dtype=float)
+    codes = np.asarray(codes)
+    if len(values) == 0:
+        return values
+    n_groups = int(codes.max()) + 1
+    m = np.full(n_groups, -np.inf)
+    np.maximum.at(m, codes, values)
+    e = np.exp(values - m[codes])
+    z = np.bincount(codes, weights=e, minlength=n_groups)
+    return e / z[codes]
+
+
+def h2h_zscore(values):
+    """Bir koşudaki H2H skorlarının z-skoru (sabit skorlar 0)"""
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0 or np.allclose(values.max(), values.min()):
+        return np.zeros_like(values)
+    return (values - values.mean()) / (values.std() + 1e-6)
+
+
+def group_minmax_norm(values, codes):
+    """Grup bazında [0, 1] min-max normalizasyonu (NaN'lar korunur)
+
+    Sabit, sonsuz veya tamamen eksik gruplar 0 döner.
+    """
+    values = np.asarray(values, dtype=float)
+    grouped = pd.Series(values).groupby(np.asarray(codes))
+    mn = grouped.transform('min').to_numpy()
+    mx = grouped.transform('max').to_numpy()
+    with np.errstate(invalid='ignore'):
+        ok = np.isfinite(mn) & np.isfinite(mx) & (mx - mn >= 1e-9)
+        return np.where(ok, (values - mn) / np.where(ok, mx - mn, 1.0), 0.0)
+
+
+class ConditionalLogitCalibrator:
+    """Koşu bazlı koşullu logit (conditional logit) olasılık katmanı
+
+    Model skorlarından (n_samples, n_models) doğrusal bir utility öğrenir ve
+    her koşu içinde softmax uygular; böylece bir koşudaki olasılıkların
+    toplamı 1 olur. OOF skorları üzerinde, tüm koşular için toplu (batched)
+    NumPy gradyanı ile çözülür.
+    """
+
+    def __init__(self, temperature=1.0, l2=1e-3, n_iter=500, learning_rate=0.1, input_names=None):
+        self.temperature = temperature
+        self.l2 = l2
+        self.n_iter = n_iter
+        self.learning_rate = learning_rate
+        # Girdi kolonlarının düzeni (tahminde aynı sırayla kurulur; eski paketlerde None)
+        self.input_names = input_names
+        self.coef_ = None
+        self.mean_ = None
+        self.scale_ = None
+
+    def _standardize(self, scores):
+        return (np.asarray(scores, dtype=float) - self.mean_) / self.scale_
+
+    def fit(self, scores, groups, y):
+        """Kazananın koşu içi log-olasılığını maksimize et (Adam, tam batch)"""
+        S = np.asarray(scores, dtype=float)
+        self.mean_ = S.mean(axis=0)
+        std = S.std(axis=0)
+        self.scale_ = np.where(std > 1e-12, std, 1.0)
+        Z = self._standardize(S)
+
+        codes = pd.factorize(pd.Series(np.asarray(groups)).astype(str))[0]
+        y = np.asarray(y, dtype=float)
+        # Kazananı olmayan koşular olasılığa bilgi taşımaz
+        wins = np.bincount(codes, weights=y, minlength=codes.max() + 1)
+        active = wins[codes] > 0
+        Z, codes, y = Z[active], codes[active], y[active]
+        codes = pd.factorize(codes)[0]
+        target = y / np.bincount(codes, weights=y)[codes]
+        n_races = max(1, int(codes.max()) + 1) if len(codes) else 1
+
+        w = np.zeros(Z.shape[1])
+        m_t = np.zeros_like(w)
+        v_t = np.zeros_like(w)
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+        for t in range(1, self.n_iter + 1):
+            if len(codes) == 0:
+                break
+            p = group_softmax(Z @ w, codes)
+            grad = Z.T @ (p - target) / n_races + self.l2 * w
+            m_t = beta1 * m_t + (1 - beta1) * grad
+            v_t = beta2 * v_t + (1 - beta2) * grad ** 2
+            w -= self.learning_rate * (m_t / (1 - beta1 ** t)) / (np.sqrt(v_t / (1 - beta2 ** t)) + eps)
+        self.coef_ = w
+        return self
+
+    def utility(self, scores):
+        """Satır bazında utility (logit) değerleri"""
+        return self._standardize(scores) @ self.coef_
+
+    def predict_proba(self, scores, groups, offset=None, temperature=None):
+        """Koşu bazında normalize olasılıklar
+
+        Args:
+            offset: Utility'ye eklenecek ek logit (örn. H2H boost)
+            temperature: Verilmezse self.temperature kullanılır
+        """
+        t = max(1e-3, float(temperature if temperature is not None else self.temperature))
+        u = self.utility(scores)
+        if offset is not None:
+            u = u + np.asarray(offset, dtype=float)
+        codes = pd.factorize(pd.Series(np.asarray(groups)).astype(str))[0]
+        return group_softmax(u / t, codes)
+
+
+def race_class_weight(cins):
+    """Koşu sınıfı (cins_detay) → H2H sınıf ağırlığı"""
+    s = str(cins).upper()
+    if 'G 1' in s or 'G1' in s:
+        return 1.4
+    if 'G 2' in s or 'G2' in s:
+        return 1.2
+    if 'G 3' in s or 'G3' in s:
+        return 1.0
+    if 'KV' in s:
+        return 0.8
+    if 'ŞARTLI' in s or 'SARTLI' in s:
+        return 0.5
+    if 'HANDIKAP' in s or 'HANDİKAP' in s:
+        return 0.45
+    if 'MAIDEN' in s:
+        return 0.35
+    if 'SATIŞ' in s or 'SATIS' in s:
+        return 0.3
+    return 0.4
+
+
+def normalize_pist_tur(p):
+    """Pist metni → pist türü (çim/kum/sentetik/unknown)"""
+    pl = str(p).lower()
+    if 'çim' in pl or 'cim' in pl:
+        return 'çim'
+    if 'kum' in pl:
+        return 'kum'
+    if 'sentetik' in pl or 'sintetik' in pl:
+        return 'sentetik'
+    return 'unknown'
+
+
+def normalize_race_text(s):
+    """Büyük harf + Türkçe karakterleri ASCII'ye indir (bazı encoding bozulmaları dahil)"""
+    if not isinstance(s, str):
+        s = str(s)
+    s = s.upper()
+    repl = {
+        'İ': 'I', 'I': 'I', 'Ş': 'S', 'Ğ': 'G', 'Ü': 'U', 'Ö': 'O', 'Ç': 'C',
+        'Â': 'A', 'Ê': 'E', 'Ô': 'O'
+    }
+    for k, v in repl.items():
+        s = s.replace(k, v)
+    s = s.replace('Å', 'S').replace('Ä°', 'I').replace('Ã', 'O').replace('Ã', 'U').replace('Ã', 'C').replace('Ä', 'G')
+    return s
+
+
+def detect_tur_kategori(x):
+    """Koşu sınıfı (cins_detay) → yarış türü kategorisi (G1>G2>G3>KV>Şartlı>Handikap>Maiden)"""
+    ux = normalize_race_text(x)
+    if 'G1' in ux or ' G 1' in ux:
+        return 'G1'
+    if 'G2' in ux or ' G 2' in ux:
+        return 'G2'
+    if 'G3' in ux or ' G 3' in ux:
+        return 'G3'
+    if 'KV' in ux or 'KISA VADE' in ux:
+        return 'KV'
+    if 'MAID' in ux or 'MAIDEN' in ux:
+        return 'MAIDEN'
+    if 'HAND' in ux:
+        return 'HANDIKAP'
+    if 'SART' in ux or 'SARTLI' in ux or 'ŞART' in ux:
+        return 'SARTLI'
+    return 'DIGER'
+
+
+TUR_KATEGORI_WEIGHTS = {
+    'G1': 10, 'G2': 9, 'G3': 8, 'KV': 7, 'SARTLI': 5, 'HANDIKAP': 4, 'MAIDEN': 3, 'DIGER': 2,
+}
+
+
+def grup_seviye_score(grup):
+    """Grup seviyesi skoru: 4 ve Yukarı=5, diğer=4, 3 Yaşlı=3, 2 Yaşlı=1"""
+    grup_str = str(grup).upper()
+    if '4 VE YUKARI' in grup_str or '4 VE YUKAR' in grup_str:
+        return 5
+    elif '3 YAŞLI' in grup_str or '3 YAŞL' in grup_str:
+        return 3
+    elif '2 YAŞLI' in grup_str or '2 YAŞL' in grup_str:
+        return 1
+    else:
+        return 4
+
+
+SON6_SURFACES = np.frombuffer(b'CKS', dtype=np.uint8)
+
+
+def decode_son6(son6, n_pos=6):
+    """son6 form kolonunu sabit genişlikli byte görünümüyle çöz (örn. "C1C6K7C6C4C5")
+
+    Her farklı değer bir kez (n × genişlik) uint8 matrisine yazılır; pist harfi
+    (C/K/S) + rakam çiftleri tek NumPy geçişiyle bulunur ve satırlara yayılır.
+
+    Returns:
+        surface: (n, n_pos) object dizi - 'C' çim / 'K' kum / 'S' sentetik, '' = yok
+        rank: (n, n_pos) float dizi - derece 1..10 (0 → 10.+), NaN = yok
+        (sütunlar string'deki sıradadır; n_pos'tan uzun formlarda dizi genişler)
+    """
+    codes, uniques = pd.factorize(pd.Series(son6, dtype=object))
+    uniq = pd.Series(uniques, dtype=object)
+    uniq = uniq.where(uniq.map(lambda v: isinstance(v, str)), '')
+    raw = uniq.str.encode('ascii', errors='replace').to_numpy(dtype=bytes)
+    width = max(2, raw.dtype.itemsize)
+    b = np.frombuffer(raw.astype(f'S{width}').tobytes(), dtype=np.uint8).reshape(len(raw), width)
+
+    # i. karakter pist harfi ve (i+1). karakter rakam ise bir koşu
+    digit = b[:, 1:] - ord('0')
+    hit = np.isin(b[:, :-1], SON6_SURFACES) & (b[:, 1:] >= ord('0')) & (b[:, 1:] <= ord('9'))
+    row, col = np.nonzero(hit)
+    pos = (np.cumsum(hit, axis=1) - 1)[row, col]
+    n_cols = max(n_pos, int(pos.max()) + 1 if len(pos) else 0)
+
+    surface_u = np.full((len(uniq), n_cols), '', dtype=object)
+    rank_u = np.full((len(uniq), n_cols), np.nan)
+    surface_u[row, pos] = b[row, col].view('S1').astype(str)
+    d = digit[row, col]
+    rank_u[row, pos] = np.where(d == 0, 10, d)
+
+    surface = np.full((len(codes), n_cols), '', dtype=object)
+    rank = np.full((len(codes), n_cols), np.nan)
+    known = codes >= 0
+    surface[known] = surface_u[codes[known]]
+    rank[known] = rank_u[codes[known]]
+    return surface, rank
+
+
+def son6_form_stats(surface, rank):
+    """decode_son6 dizilerinden (form_puan, kazanma_sayisi)
+
+    Çim/kum koşuları sayılır; 1. = 10 puan ... 10. = 1 puan ortalaması, form yoksa 0.
+    """
+    form_rank = np.where(np.isin(surface, ('C', 'K')), rank, np.nan)
+    n = (~np.isnan(form_rank)).sum(axis=1)
+    points = np.nansum(np.maximum(0, 11 - form_rank), axis=1)
+    form_puan = np.where(n > 0, points / np.maximum(n, 1), 0.0)
+    kazanma_sayisi = (form_rank == 1).sum(axis=1)
+    return form_puan, kazanma_sayisi
+
+
+def parse_race_columns(df):
+    """Metin kolonlarını bir kez parse et (her farklı değer için bir kez, sonra kodlarla yay)
+
+    Eklenen kolonlar (zaten varsa atlanır): race_class_weight, race_is_high_class,
+    tur_kategori, tur_agirlik, pist_tur, grup_seviye_score, at_son6_form_puan,
+    at_son6_kazanma_sayisi. Satır bazlı yardımcılar bu kolonları okur.
+    """
+    if 'cins_detay' in df.columns:
+        if 'race_class_weight' not in df.columns:
+            df['race_class_weight'] = map_unique(df['cins_detay'], race_class_weight)
+            df['race_is_high_class'] = (df['race_class_weight'] >= 0.8).astype(int)
+        if 'tur_kategori' not in df.columns:
+            df['tur_kategori'] = map_unique(df['cins_detay'], detect_tur_kategori)
+            df['tur_agirlik'] = df['tur_kategori'].map(TUR_KATEGORI_WEIGHTS).astype(int)
+    if 'pist' in df.columns and 'pist_tur' not in df.columns:
+        df['pist_tur'] = map_unique(df['pist'], normalize_pist_tur)
+    if 'grup' in df.columns and 'grup_seviye_score' not in df.columns:
+        df['grup_seviye_score'] = map_unique(df['grup'], grup_seviye_score)
+    if 'son6' in df.columns and 'at_son6_form_puan' not in df.columns:
+        df['at_son6_form_puan'], df['at_son6_kazanma_sayisi'] = son6_form_stats(*decode_son6(df['son6']))
+    return df
+
+
+class PairwiseHistoryTable:
+    """Geçmiş koşulardan önceden hesaplanmış at×at karşılaşma tablosu
+
+    Her geçmiş koşu için birlikte koşan atların tüm sıralı çiftleri
+    (a, b, koşu) ve a'nın b'yi geçip geçmediği (+1/-1/0) bir kez çıkarılır;
+    koşu bazlı sınıf ağırlığı, tazelik (recency), mesafe ve pist bilgisi
+    koşu tablosunda tutulur. At adları bir kez tamsayı koda çevrilir ve
+    çiftler a'nın koduna göre CSR düzeninde (offsets) saklanır: bir koşunun
+    H2H skoru sadece o koşudaki atların çift dilimlerine dokunur.
+    """
+
+    SANDS = ('kum', 'sentetik')
+
+    def __init__(self, hist, now=None):
+        now = pd.Timestamp(turkey_time()) if now is None else pd.Timestamp(now)
+        hist = hist[hist['yaris_kosu_key'].notna()] if 'yaris_kosu_key' in hist.columns else hist.iloc[0:0]
+
+        # Koşu bazlı bilgiler (koşunun ilk satırından)
+        races = hist.drop_duplicates('yaris_kosu_key')
+        self.race_keys = pd.Index(races['yaris_kosu_key'].to_numpy())
+        n_races = len(races)
+        if 'race_class_weight' in races.columns:
+            self.race_cw = races['race_class_weight'].to_numpy(dtype=float)
+        elif 'cins_detay' in races.columns:
+            self.race_cw = map_unique(races['cins_detay'], race_class_weight).to_numpy(dtype=float)
+        else:
+            self.race_cw = np.full(n_races, 0.4)
+        if 'tarih_dt' in races.columns:
+            self.race_dt = pd.to_datetime(races['tarih_dt']).to_numpy(dtype='datetime64[ns]')
+        else:
+            self.race_dt = np.full(n_races, np.datetime64('NaT'), dtype='datetime64[ns]')
+        self.race_rec = self.recency(now, self.race_dt)
+        if 'mesafe' in races.columns:
+            self.race_mesafe = pd.to_numeric(races['mesafe'], errors='coerce').to_numpy(dtype=float)
+        else:
+            self.race_mesafe = np.full(n_races, np.nan)
+        if 'pist' in races.columns:
+            pist = races['pist']
+            # Boş pist bilgisi → nötr benzerlik (0.5)
+            self.race_pist_missing = np.array([p is None or (isinstance(p, str) and p == '') for p in pist], dtype=bool)
+            self.race_pist = pist.astype(str).str.lower().to_numpy()
+        else:
+            self.race_pist_missing = np.ones(n_races, dtype=bool)
+            self.race_pist = np.full(n_races, '', dtype=object)
+
+        # Çift tablosu: aynı koşuda sıralaması bilinen atlar (at başına ilk satır)
+        runs = hist.drop_duplicates(['yaris_kosu_key', 'at_adi'])
+        runs = runs[runs['rank_num'].notna()] if 'rank_num' in runs.columns else runs.iloc[0:0]
+        horse_codes, self.horse_index = pd.factorize(np.asarray(runs['at_adi'], dtype=object))
+        self.horse_index = pd.Index(self.horse_index)
+        runs = pd.DataFrame({
+            'race': self.race_keys.get_indexer(runs['yaris_kosu_key']),
+            'at': horse_codes,
+            'rank': runs['rank_num'].to_numpy(dtype=float),
+        })
+        runs = runs[runs['at'] >= 0]
+        pairs = runs.merge(runs, on='race', suffixes=('_a', '_b'))
+        pairs = pairs[pairs['at_a'] != pairs['at_b']].sort_values('at_a', kind='mergesort')
+        self.pair_a = pairs['at_a'].to_numpy()
+        self.pair_b = pairs['at_b'].to_numpy()
+        self.pair_race = pairs['race'].to_numpy()
+        # a, b'yi geçtiyse +1, geride kaldıysa -1
+        self.pair_better = np.sign(pairs['rank_b'].to_numpy() - pairs['rank_a'].to_numpy())
+        # CSR: at kodu h'nin çiftleri pair_*[offsets[h]:offsets[h + 1]]
+        self.offsets = np.r_[0, np.cumsum(np.bincount(self.pair_a, minlength=len(self.horse_index)))]
+        self._positions = np.arange(len(self.pair_a))
+
+    def runner_pairs(self, horses):
+        """Verilen atların kendi aralarındaki çiftleri (sadece bu atların CSR dilimleri okunur)
+
+        Returns:
+            (çift pozisyonları, a'nın horses içindeki indeksi, b'nin horses içindeki indeksi)
+        """
+        codes = self.horse_index.get_indexer(np.asarray(horses, dtype=object))
+        known = np.flatnonzero(codes >= 0)
+        lo, hi = self.offsets[codes[known]], self.offsets[codes[known] + 1]
+        # take_ranges dilimleri known sırasıyla art arda verir: a'nın yeri tekrarla bulunur
+        pos = take_ranges(self._positions, lo, hi)
+        ia = np.repeat(known, hi - lo)
+        if len(pos) == 0:
+            return pos, ia, ia
+        # b'nin koşudaki yeri: koşudaki kodlar sıralanıp searchsorted ile eşlenir
+        order = np.argsort(codes[known], kind='mergesort')
+        sorted_codes = codes[known][order]
+        loc = np.clip(np.searchsorted(sorted_codes, self.pair_b[pos]), 0, len(sorted_codes) - 1)
+        in_race = sorted_codes[loc] == self.pair_b[pos]
+        return pos[in_race], ia[in_race], known[order][loc[in_race]]
+
+    @staticmethod
+    def recency(now, race_dt):
+        """Tazelik ağırlığı: exp(-gün / 90); tarihi bilinmeyen koşular 1.0"""
+        days = (np.datetime64(pd.Timestamp(now), 'ns') - race_dt) / np.timedelta64(1, 'D')
+        days = np.floor(np.asarray(days, dtype=float))
+        return np.where(np.isnan(days), 1.0, np.exp(-np.maximum(0, days) / 90.0))
+
+    @staticmethod
+    def mesafe_similarity(cur_m, r_mesafe):
+        """Mesafe benzerliği - ±200m içinde tam benzer, sonra azalan (vektörel)"""
+        diff = np.abs(r_mesafe - cur_m)
+        sim = np.select([diff <= 200, diff <= 400, diff <= 600, diff <= 1000], [1.0, 0.85, 0.7, 0.5], 0.3)
+        return np.where(np.isnan(diff), 0.5, sim)
+
+    def pist_similarity(self, cur_p, r_pist, r_missing):
+        """Pist türü benzerliği (aynı pist 1.0, kum/sentetik 0.7, diğer 0.5)"""
+        sands = np.isin(r_pist, self.SANDS) & (cur_p in self.SANDS)
+        sim = np.where(r_pist == cur_p, 1.0, np.where(sands, 0.7, 0.5))
+        return np.where(r_missing, 0.5, sim)
+
+    def race_scores(self, horses, cur_m=np.nan, cur_p='', before=None):
+        """Bir koşudaki atlar için ağırlıklı H2H üstünlük skorları
+
+        Args:
+            horses: Koşudaki at adları (sıra korunur)
+            cur_m: Mevcut koşunun mesafesi
+            cur_p: Mevcut koşunun pisti (küçük harf)
+            before: Verilirse sadece bu tarihten önceki koşular sayılır ve tazelik
+                bu tarihe göre hesaplanır (eğitim koşuları için zaman-noktası skor)
+        """
+        horse_index = pd.Index(pd.unique(np.asarray(horses, dtype=object)))
+        sel, ia, _ = self.runner_pairs(horse_index)
+        race = self.pair_race[sel]
+        if before is not None:
+            past = self.race_dt[race] < np.datetime64(pd.Timestamp(before), 'ns')
+            sel, ia, race = sel[past], ia[past], race[past]
+        scores = np.zeros(len(horse_index))
+        if len(sel) > 0:
+            rec = self.race_rec[race] if before is None else self.recency(before, self.race_dt[race])
+            try:
+                cur_m = float(cur_m)
+            except (TypeError, ValueError):
+                cur_m = np.nan
+            db = self.mesafe_similarity(cur_m, self.race_mesafe[race])
+            ps = self.pist_similarity(cur_p, self.race_pist[race], self.race_pist_missing[race])
+            # Benzer koşulda geçme durumu çok daha önemli
+            similarity_boost = np.select(
+                [(db >= 0.85) & (ps >= 0.85), (db >= 0.7) & (ps >= 0.7), (db >= 0.5) | (ps >= 0.7)],
+                [2.5, 1.8, 1.3], 1.0
+            )
+            w = self.race_cw[race] * rec * db * ps * similarity_boost
+            scores = np.bincount(ia, weights=self.pair_better[sel] * w, minlength=len(horse_index))
+        return scores[horse_index.get_indexer(np.asarray(horses, dtype=object))]
+
+    def beat_matrix(self, horses):
+        """horses[i] en az bir ortak geçmiş koşuda horses[j]'yi geçtiyse M[i, j] = True
+
+        Args:
+            horses: Tekrarsız at adları
+        """
+        horse_index = pd.Index(np.asarray(horses, dtype=object))
+        pos, ia, ib = self.runner_pairs(horse_index)
+        won = self.pair_better[pos] > 0
+        beat = np.zeros((len(horse_index), len(horse_index)), dtype=bool)
+        beat[ia[won], ib[won]] = True
+        return beat
+
+
+# Bellekte categorical tutulan, filtre/gruplama anahtarı olarak kullanılan tekrar eden
+# metin kolonları. Neredeyse her satırda farklı olan kolonlar (son6, derece, koşu
+# anahtarları, tarih/saat) kazanç sağlamaz; nadiren okunan kısa kolonlar ise her
+# extension kolonu satır seçimini (df[mask]) yavaşlattığı için object kalır.
+RACE_CATEGORY_COLS = (
+    'at_adi', 'jokey_adi', 'antrenor_adi', 'sahip_adi', 'yetistirici_adi',
+    'pist', 'cins_detay', 'grup',
+)
+
+
+def compact_race_frame(df):
+    """Yarış verisini kompakt tiplere çevir (yerinde değil, yeni DataFrame döner)
+
+    - Tekrar eden metin kolonları → category (tek sözlük; tüm kopyalar/dilimler
+      aynı kategorileri paylaşır, eşitlik filtreleri int kod karşılaştırmasıdır)
+    - int64 → int32, float64 → float32
+    - tarih → tarih_dt (bir kez parse edilir)
+    """
+    df = df.copy()
+    for col in RACE_CATEGORY_COLS:
+        if col in df.columns and df[col].dtype == object:
+            df[col] = df[col].astype('category')
+    for col in df.columns:
+        if df[col].dtype == np.int64:
+            df[col] = df[col].astype(np.int32)
+        elif df[col].dtype == np.float64:
+            df[col] = df[col].astype(np.float32)
+    if 'tarih' in df.columns and 'tarih_dt' not in df.columns:
+        df['tarih_dt'] = pd.to_datetime(df['tarih'], format='%d/%m/%Y', errors='coerce')
+    return df
+
+
+def map_unique(series, func):
+    """func'ı sadece farklı değerlere uygula ve sonucu satırlara yay
+
+    Categorical kolonlarda Series.apply kategori tipinde sonuç döndürebildiği
+    için sonuç her zaman düz (object/numeric) bir Series'tir.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    mapped = pd.Series([func(u) for u in uniques], dtype=object).infer_objects().to_numpy()
+    return pd.Series(mapped[codes], index=series.index)
+
+
+def keyed_sums(past_keys, target_keys, values):
+    """Geçmiş satırlarda (anahtar1, anahtar2, ...) grupları için values toplamı, hedef satırlara hizalı
+
+    Eşleşme pandas eşitliğiyle aynıdır (1400 == 1400.0); boş (NaN) anahtarlı
+    satırlar hiçbir grupla eşleşmez ve hedefte 0 döner.
+
+    Args:
+        past_keys: Geçmiş satırların anahtar kolonları (aynı uzunlukta diziler)
+        target_keys: Hedef satırların aynı sıradaki anahtar kolonları
+        values: Geçmiş satır başına toplanacak değerler
+    """
+    n_past, n_target = len(values), len(target_keys[0])
+    if n_past == 0 or n_target == 0:
+        return np.zeros(n_target)
+    combined = None
+    valid = None
+    for past, target in zip(past_keys, target_keys):
+        codes, _ = pd.factorize(np.concatenate([np.asarray(past, dtype=object), np.asarray(target, dtype=object)]))
+        valid = codes >= 0 if valid is None else valid & (codes >= 0)
+        combined = codes if combined is None else combined * (codes.max() + 1) + codes
+    combined, uniques = pd.factorize(np.where(valid, combined, -1))
+    sums = np.bincount(combined[:n_past], weights=np.asarray(values, dtype=float), minlength=len(uniques))
+    target_codes = combined[n_past:]
+    return np.where(valid[n_past:], sums[target_codes], 0.0)
+
+
+# cp1254'te Türkçe harflerin (ğ Ğ ı İ ş Ş ç Ç ö Ö ü Ü) tek byte kodları
+CP1254_TURKISH_BYTES = np.frombuffer(b'\xf0\xd0\xfd\xdd\xfe\xde\xe7\xc7\xf6\xd6\xfc\xdc', dtype=np.uint8)
+
+# UTF-8 metnin latin-1/cp1254 ile çift kodlanmasından oluşan bozuk karakterler
+MOJIBAKE_MARKERS = ('Ã', 'Ä', 'Å')
+
+
+def sniff_encoding(sample):
+    """Byte örneğinden encoding tespiti: BOM → UTF-8 geçerliliği → cp1254 sezgisi
+
+    UTF-8 olarak çözülemeyen örnekte 0x80 üstü byte'ların en az yarısı cp1254
+    Türkçe harf kodlarıysa cp1254, değilse latin-1 döner.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # Örneğin sonunda yarım kalan çok byte'lı karakter hata sayılmaz
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    raw = np.frombuffer(sample, dtype=np.uint8)
+    high = raw[raw >= 0x80]
+    turkish = int(np.isin(high, CP1254_TURKISH_BYTES).sum())
+    return 'cp1254' if 2 * turkish >= len(high) else 'latin-1'
+
+
+def content_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def load_encoding_cache(cache_file):
+    if not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_encoding(cache_file, key, digest, encoding, stamp=None):
+    """Encoding kararını cache_file'a yaz (güncel dosya okunup atomik değiştirilir)
+
+    Aynı dosyayı paylaşan süreçler (gunicorn worker'ları) yarım yazılmış JSON görmez.
+    """
+    cache = load_encoding_cache(cache_file)
+    cache[key] = {'hash': digest, 'encoding': encoding}
+    if stamp is not None:
+        cache[key]['stamp'] = list(stamp)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+
+
+def detect_encoding(data, key, cache_file, sample_size=65536, stamp=None):
+    """Dosya içeriğinin encoding'i; karar dosya hash'i ile cache_file'da saklanır
+
+    stamp (boyut, mtime_ns) cache'tekiyle aynıysa içerik yeniden hash'lenmez.
+
+    Returns:
+        (encoding, cache'den mi geldi)
+    """
+    entry = load_encoding_cache(cache_file).get(key)
+    if not isinstance(entry, dict) or not entry.get('encoding'):
+        entry = None
+    if entry and stamp is not None and entry.get('stamp') == list(stamp):
+        return entry['encoding'], True
+
+    digest = content_digest(data)
+    if entry and entry.get('hash') == digest:
+        if stamp is not None:
+            save_encoding(cache_file, key, digest, entry['encoding'], stamp)
+        return entry['encoding'], True
+
+    encoding = sniff_encoding(data[:sample_size])
+    save_encoding(cache_file, key, digest, encoding, stamp)
+    return encoding, False
+
+
+def read_race_csv(path):
+    """Yarış CSV'sini oku: encoding tespiti (cache'li) + tek C-engine okuma, sonuc numeric
+
+    Returns:
+        (df, encoding, encoding cache'den mi geldi)
+    """
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        raw = f.read()
+    stamp = (st.st_size, st.st_mtime_ns)
+    cache_file = os.path.join(os.path.dirname(path) or '.', '.encoding_cache.json')
+    encoding, cached = detect_encoding(raw, os.path.basename(path), cache_file, stamp=stamp)
+    try:
+        df = pd.read_csv(io.BytesIO(raw), encoding=encoding, float_precision='round_trip')
+    except UnicodeDecodeError:
+        # Örnekten sonra çözülemeyen byte: encoding'i tüm içerikten yeniden tespit et
+        full_encoding = sniff_encoding(raw)
+        # latin-1 her byte'ı çözer: son çare olarak byte kaybetmeden okunur
+        for fallback in dict.fromkeys([full_encoding, 'latin-1']):
+            if fallback == encoding:
+                continue
+            print(f"⚠️ {os.path.basename(path)}: {encoding} tüm dosyayı çözemedi, {fallback} deneniyor...")
+            try:
+                df = pd.read_csv(io.BytesIO(raw), encoding=fallback, float_precision='round_trip')
+            except UnicodeDecodeError:
+                continue
+            encoding, cached = fallback, False
+            save_encoding(cache_file, os.path.basename(path), content_digest(raw), encoding, stamp)
+            break
+    if 'sonuc' in df.columns:
+        df['sonuc'] = pd.to_numeric(df['sonuc'], errors='coerce')
+    return df, encoding, cached
+
+
+class EntityHistoryStore:
+    """Tüm hipodromların CSV'lerinden birleşik, tarih sıralı koşu geçmişi
+
+    data/*_races.csv dosyaları hash'leriyle izlenir; sadece değişen/yeni
+    dosyalar yeniden okunur (artımlı) ve kaynak bazında store dosyasında
+    saklanır. Aynı koşu satırı (yaris_kosu_key, at_key) birden fazla şehrin
+    dosyasında olabilir, birleşik görünümde bir kez tutulur. Satır indeksleri
+    at_key / jokey_kodu / antrenor_kodu / yaris_kosu_key bazındadır (her
+    varlığın satırları tarih sırasında); jokey/antrenör başarı sayımları tüm
+    şehirler için bir kez hesaplanıp cache'lenir.
+    """
+
+    INDEX_KEYS = ('at_key', 'jokey_kodu', 'antrenor_kodu', 'yaris_kosu_key')
+    _instances = {}
+
+    def __init__(self, data_dir='data', store_file=None):
+        self.data_dir = data_dir
+        self.store_file = store_file or os.path.join(data_dir, 'history_store.joblib')
+        self.sources = {}  # dosya adı → {'hash', 'rows'}
+        self.raw = {}      # dosya adı → o dosyanın (kompakt) satırları
+        self.frame = None
+        self._index = {}
+        self._counts = {}
+
+    @classmethod
+    def shared(cls, data_dir='data'):
+        """Süreç içinde paylaşılan (toplu tahminde şehirler arası tekrar kullanılan) güncel store"""
+        store = cls._instances.get(data_dir)
+        if store is None:
+            store = cls._instances[data_dir] = cls(data_dir)
+        store.update()
+        return store
+
+    def update(self):
+        """Değişen/yeni CSV'leri oku, silinenleri çıkar; değişiklik varsa birleşik görünümü kur
+
+        Returns:
+            Değişiklik olup olmadığı
+        """
+        if not self.raw and os.path.exists(self.store_file):
+            try:
+                saved = joblib.load(self.store_file)
+                self.sources, self.raw = saved['sources'], saved['raw']
+            except Exception as e:
+                print(f"⚠️ Geçmiş store'u okunamadı, yeniden kurulacak: {e}")
+                self.sources, self.raw = {}, {}
+
+        changed = False
+        stamps_changed = False
+        names = set()
+        for path in sorted(glob.glob(os.path.join(self.data_dir, '*_races.csv'))):
+            name = os.path.basename(path)
+            names.add(name)
+            # (boyut, mtime_ns) aynıysa dosya okunmaz/hash'lenmez; değiştiyse içerik hash'i karar verir
+            st = os.stat(path)
+            stamp = [st.st_size, st.st_mtime_ns]
+            source = self.sources.get(name, {})
+            if name in self.raw and source.get('stamp') == stamp:
+                continue
+            with open(path, 'rb') as f:
+                digest = content_digest(f.read())
+            if name in self.raw and source.get('hash') == digest:
+                source['stamp'] = stamp
+                stamps_changed = True
+                continue
+            df, _, _ = read_race_csv(path)
+            self.raw[name] = compact_race_frame(df)
+            self.sources[name] = {'hash': digest, 'stamp': stamp, 'rows': len(df)}
+            changed = True
+        for name in set(self.raw) - names:
+            del self.raw[name]
+            self.sources.pop(name, None)
+            changed = True
+
+        if changed or self.frame is None:
+            self._build()
+        if changed or stamps_changed:
+            # Süreç bazlı geçici dosya: gunicorn worker'ları ve pipeline alt süreçleri aynı anda yazabilir
+            tmp_file = f"{self.store_file}.{os.getpid()}.tmp"
+            try:
+                joblib.dump({'sources': self.sources, 'raw': self.raw}, tmp_file)
+                os.replace(tmp_file, self.store_file)
+            except OSError as e:
+                print(f"⚠️ Geçmiş store'u kaydedilemedi: {e}")
+                try:
+                    os.remove(tmp_file)
+                except OSError:
+                    pass
+        return changed
+
+    def _build(self):
+        """Kaynakları birleştir, tekrar eden koşu satırlarını at, tarihe göre sırala ve indeksle"""
+        frames = [f.assign(_source=name.replace('_races.csv', '')) for name, f in sorted(self.raw.items())]
+        if not frames:
+            self.frame, self._index, self._counts = pd.DataFrame(), {}, {}
+            return
+        frame = pd.concat(frames, ignore_index=True)
+        if {'yaris_kosu_key', 'at_key'}.issubset(frame.columns):
+            frame = frame.drop_duplicates(['yaris_kosu_key', 'at_key'], keep='last')
+        sort_cols = [c for c in ('tarih_dt', 'yaris_kosu_key', 'at_adi') if c in frame.columns]
+        if sort_cols:
+            frame = frame.sort_values(sort_cols, kind='mergesort')
+        self.frame = compact_race_frame(frame.reset_index(drop=True))
+        self._index = {
+            k: self.frame.groupby(k, observed=True, sort=False).indices
+            for k in self.INDEX_KEYS if k in self.frame.columns
+        }
+        self._counts = {}
+
+    def rows_for(self, before=None, **keys):
+        """Verilen varlıklardan herhangi birine ait tüm satırlar (tarih sıralı)
+
+        Örn. rows_for(at_key=[...], yaris_kosu_key=[...])
+        before verilirse sadece o tarihten önceki satırlar (as-of sonrası sızmaz).
+        """
+        parts = []
+        for col, values in keys.items():
+            index = self._index.get(col, {})
+            parts += [index[v] for v in pd.unique(np.asarray(values, dtype=object)) if v in index]
+        pos = np.unique(np.concatenate(parts)) if parts else np.array([], dtype=int)
+        rows = self.frame.iloc[pos]
+        if before is not None and 'tarih_dt' in rows.columns:
+            rows = rows[(rows['tarih_dt'] < before).to_numpy()]
+        return rows
+
+    def entity_rates(self, keys, exclude_dates=(), before=None):
+        """Varlık bazında (örn. ('jokey_kodu',) veya ('jokey_kodu', 'mesafe')) kazanma oranı
+
+        (varlık × tarih) başlangıç/kazanma sayımları bir kez hesaplanır; her
+        çağrıda sadece exclude_dates'teki ve (verilirse) before ve sonrasındaki
+        tarihler çıkarılıp toplanır.
+
+        Returns:
+            keys kolonları + 'rate' DataFrame'i
+        """
+        keys = list(keys)
+        counts = self._counts.get(tuple(keys))
+        if counts is None:
+            done = self.frame[self.frame['sonuc'].notna()]
+            counts = (done.assign(_win=(done['sonuc'] == 1).astype(int))
+                      .groupby(keys + ['tarih'], observed=True)['_win'].agg(['size', 'sum'])
+                      .reset_index())
+            counts['tarih_dt'] = pd.to_datetime(counts['tarih'].astype(str), format=DATE_FORMAT, errors='coerce')
+            self._counts[tuple(keys)] = counts
+        if len(exclude_dates) > 0:
+            counts = counts[~counts['tarih'].isin(list(exclude_dates))]
+        if before is not None:
+            counts = counts[(counts['tarih_dt'] < before).to_numpy()]
+        totals = counts.groupby(keys, observed=True)[['size', 'sum']].sum()
+        return (totals['sum'] / totals['size']).rename('rate').reset_index()
+
+
+def take_ranges(order, lo, hi):
+    """order[lo[i]:hi[i]] dilimlerinin birleşimi (vektörel, Python döngüsü yok)"""
+    lengths = np.maximum(np.asarray(hi) - np.asarray(lo), 0)
+    total = int(lengths.sum())
+    if total == 0:
+        return np.array([], dtype=np.int64)
+    offsets = np.repeat(np.asarray(lo) - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+    return order[offsets + np.arange(total)]
+
+
+class FeatureContextIndex:
+    """Chunk'lı featurize için bağlam (geçmiş + hedef) satırlarının salt okunur indeksleri
+
+    create_advanced_features'ın satır bazlı feature'ları bir hedef satır için
+    sadece şu satırları okur: atın kendi satırları, atın koştuğu koşuların tüm
+    satırları (H2H / geçilen rakip), son 6 koşusundaki rakiplerin o koşudan
+    önceki son 6 sonuçlu koşusu (rakip kalitesi: rakibin sınıf-ağırlıklı formu)
+    ve jokey/antrenörün son 60 gündeki sonuçlu satırları. Bir günün bağlamı bu
+    indekslerden seçilir; tüm çerçeveye bağlı değerler (medyanlar, jokey/antrenör
+    başarı oranları, üst düzey penceresinin son tarihi) global_stats() ile bir
+    kez hesaplanır. Böylece chunk'ların sonucu tek parça hesaplamayla aynıdır.
+    """
+
+    RECENT_N = 6
+    RECENT_DAYS = 60
+    # Bir bağlam satırının create_advanced_features içindeki yaklaşık belleği, satırın kendi
+    # boyutunun katı olarak (df kopyaları, blok başına df_with_result, eklenen feature kolonları)
+    COPY_FACTOR = 4
+    MEDIAN_COLS = ('handikap', 'kilo', 'start', 'mesafe', 'kgs', 'yas', 'en_iyi_derece', 'son20')
+    RATE_KEYS = {
+        'jokey_genel_basari': ('jokey_adi',),
+        'jokey_mesafe_basari': ('jokey_adi', 'mesafe'),
+        'antrenor_genel_basari': ('antrenor_adi',),
+        'antrenor_mesafe_basari': ('antrenor_adi', 'mesafe'),
+    }
+
+    def __init__(self, frame, exclude_dates):
+        self.frame = frame
+        self.exclude_dates = list(exclude_dates)
+        n = len(frame)
+        if 'tarih_dt' in frame.columns:
+            dates = pd.to_datetime(frame['tarih_dt'], errors='coerce')
+        elif 'tarih' in frame.columns:
+            dates = pd.to_datetime(frame['tarih'], format='%d/%m/%Y', errors='coerce')
+        else:
+            dates = pd.Series(pd.NaT, index=frame.index)
+        self.dates = dates.to_numpy(dtype='datetime64[ns]')
+        # Tarihlerin sıra numarası: tarih karşılaştırmaları int anahtarlarla yapılır
+        self.day_values = np.unique(self.dates[~np.isnat(self.dates)])
+        self.day_rank = np.searchsorted(self.day_values, self.dates)
+
+        has_result = frame['sonuc'].notna().to_numpy() if 'sonuc' in frame.columns else np.zeros(n, dtype=bool)
+        # create_advanced_features'daki filter_exclude_dates ile aynı (tarih metni veya tarih_dt)
+        excluded = np.zeros(n, dtype=bool)
+        if self.exclude_dates and 'tarih' in frame.columns:
+            excluded |= frame['tarih'].isin(self.exclude_dates).to_numpy()
+            exclude_dt = pd.to_datetime(pd.Series(self.exclude_dates), format='%d/%m/%Y', errors='coerce').dropna()
+            excluded |= np.isin(self.dates, exclude_dt.to_numpy(dtype='datetime64[ns]'))
+        self.result = has_result & ~excluded
+        dated = ~np.isnat(self.dates)
+
+        self.codes = {}
+        for col in ('at_adi', 'yaris_kosu_key', 'jokey_adi', 'antrenor_adi'):
+            if col in frame.columns:
+                self.codes[col] = pd.factorize(frame[col])[0]
+        # Varlık → satırlar (kod sırası, kendi içinde satır sırası)
+        self.rows = {col: self._group(codes, codes >= 0) for col, codes in self.codes.items()}
+        # At → tarihli sonuçlu satırlar (tarih sırası): rakibin son 6 koşusu
+        if 'at_adi' in self.codes:
+            self.horse_results = self._group(self.codes['at_adi'], self.result & dated, by_day=True)
+        # Jokey/antrenör → tarihli sonuçlu satırlar (son 60 gün formu exclude_dates'e bakmaz)
+        self.recent = {
+            col: self._group(self.codes[col], has_result & dated, by_day=True)
+            for col in ('jokey_adi', 'antrenor_adi') if col in self.codes
+        }
+
+    def _group(self, codes, mask, by_day=False):
+        """mask'teki satırları (kod[, tarih], pozisyon) sırasında dizip (pozisyonlar, sıralama anahtarları)"""
+        pos = np.flatnonzero(mask & (codes >= 0))
+        if by_day:
+            keys = codes[pos].astype(np.int64) * (len(self.day_values) + 1) + self.day_rank[pos]
+        else:
+            keys = codes[pos].astype(np.int64)
+        order = np.argsort(keys, kind='stable')
+        return pos[order], keys[order]
+
+    def _entity_rows(self, col, codes):
+        pos, keys = self.rows[col]
+        codes = np.unique(codes[codes >= 0]).astype(np.int64)
+        return take_ranges(pos, np.searchsorted(keys, codes, 'left'), np.searchsorted(keys, codes, 'right'))
+
+    def _day_keys(self, codes, days):
+        return codes.astype(np.int64) * (len(self.day_values) + 1) + days
+
+    def context_rows(self, targets):
+        """Hedef satır pozisyonlarının feature'ları için gereken bağlam satırları (sıralı pozisyonlar)"""
+        parts = [targets]
+        if 'at_adi' in self.codes:
+            horse_rows = self._entity_rows('at_adi', self.codes['at_adi'][targets])
+            parts.append(horse_rows)
+            if 'yaris_kosu_key' in self.codes:
+                races = self.codes['yaris_kosu_key']
+                parts.append(self._entity_rows('yaris_kosu_key', races[horse_rows]))
+                # Rakip kalitesi: hedefin son 6 koşusundaki rakiplerin o koşu öncesi son 6 koşusu
+                peer_rows = self._entity_rows('yaris_kosu_key', races[self._recent_results(targets)])
+                parts.append(self._recent_results(peer_rows))
+        for col, (pos, keys) in self.recent.items():
+            codes = self.codes[col][targets]
+            dated = (codes >= 0) & ~np.isnat(self.dates[targets])
+            codes, dates = codes[dated], self.dates[targets][dated]
+            start = np.searchsorted(self.day_values, dates - np.timedelta64(self.RECENT_DAYS, 'D'), 'left')
+            end = np.searchsorted(self.day_values, dates, 'left')
+            parts.append(take_ranges(pos, np.searchsorted(keys, self._day_keys(codes, start), 'left'),
+                                     np.searchsorted(keys, self._day_keys(codes, end), 'left')))
+        return np.unique(np.concatenate(parts))
+
+    def _recent_results(self, rows):
+        """Satırların atlarının o satırın tarihinden önceki son 6 sonuçlu satırı (sınıf-ağırlıklı form)"""
+        codes = self.codes['at_adi'][rows]
+        undated = np.isnat(self.dates[rows])
+        # Tarihsiz satır tarih filtresi uygulamaz: atın tüm satırları
+        parts = [self._entity_rows('at_adi', codes[undated])]
+        keep = ~undated & (codes >= 0)
+        codes, days = codes[keep], self.day_rank[rows[keep]]
+        pos, keys = self.horse_results
+        first = np.searchsorted(keys, self._day_keys(codes, 0), 'left')
+        end = np.searchsorted(keys, self._day_keys(codes, days), 'left')
+        start = np.maximum(first, end - self.RECENT_N)
+        # Aynı tarihli satırlar sınırda bölünmesin
+        has_rows = start < end
+        start[has_rows] = np.searchsorted(keys, keys[start[has_rows]], 'left')
+        parts.append(take_ranges(pos, start, end))
+        return np.concatenate(parts)
+
+    def chunk_rows(self, memory_mb):
+        """memory_mb bütçesine sığan bağlam satırı sayısı (satır boyutu ilk satırlardan tahmin edilir)"""
+        sample = self.frame.head(1000)
+        row_bytes = max(1.0, sample.memory_usage(deep=True).sum() / max(1, len(sample)))
+        return max(1, int(memory_mb * 1e6 / (row_bytes * self.COPY_FACTOR)))
+
+    def iter_chunks(self, targets, max_rows):
+        """Hedef satırları tarih sırasında, bağlamı max_rows'u aşmayan gün gruplarına böl
+
+        Bir gün (o günün tüm koşuları) bölünmez; tek günün bağlamı sınırı aşsa da
+        kendi başına bir chunk olur.
+
+        Yields:
+            (hedef pozisyonları, bağlam pozisyonları)
+        """
+        targets = np.asarray(targets)
+        days = self.day_rank[targets]
+        # Tarihsiz hedefler en sona (aynı gün anahtarı)
+        days = np.where(np.isnat(self.dates[targets]), len(self.day_values), days)
+        order = np.argsort(days, kind='stable')
+        bounds = np.r_[0, np.flatnonzero(np.diff(days[order])) + 1, len(order)]
+        pending, pending_rows, size = [], [], 0
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            day_targets = targets[order[a:b]]
+            rows = self.context_rows(day_targets)
+            if pending and size + len(rows) > max_rows:
+                yield np.concatenate(pending), np.unique(np.concatenate(pending_rows))
+                pending, pending_rows, size = [], [], 0
+            pending.append(day_targets)
+            pending_rows.append(rows)
+            size += len(rows)
+        if pending:
+            yield np.concatenate(pending), np.unique(np.concatenate(pending_rows))
+
+    def global_stats(self):
+        """Tüm bağlama bağlı değerler: {'medians', 'latest_date', 'rates', 'row_columns'}
+
+        row_columns chunk'lar featurize edilirken doldurulur (apply_column_order).
+        """
+        frame = self.frame
+        medians = {
+            f'{col}_numeric': pd.to_numeric(frame[col], errors='coerce').median()
+            for col in self.MEDIAN_COLS if col in frame.columns
+        }
+        stats = {'medians': medians, 'rates': {}, 'row_columns': {}}
+        if 'tarih' in frame.columns:
+            latest = pd.to_datetime(frame['tarih'][self.result], format='%d/%m/%Y', errors='coerce').max()
+            if pd.notna(latest):
+                stats['latest_date'] = latest
+        if 'sonuc' in frame.columns:
+            done = frame[self.result]
+            wins = done['sonuc'] == 1
+            for out_col, keys in self.RATE_KEYS.items():
+                if set(keys).issubset(frame.columns):
+                    stats['rates'][out_col] = (
+                        wins.groupby([done[k] for k in keys], observed=True).mean()
+                        .rename(out_col).reset_index()
+                    )
+        return stats
+
+    @staticmethod
+    def apply_column_order(columns, row_columns):
+        """Chunk'ların birleşik kolon listesini tek parça hesaplamanın sırasına getir
+
+        DataFrame.apply(axis=1) satırlar farklı anahtar sıraları döndürdüğünde
+        kolonları alfabetik sıralar; tek bir chunk bu kararı kendi satırlarından
+        veremez. Her satır bazlı blok için tüm chunk'larda görülen anahtar
+        sıralarından pandas'ın vereceği sıra kurulur ve bloğun ilk kolonunun yerine konur.
+        """
+        columns = list(columns)
+        for orders in row_columns.values():
+            if not orders:
+                continue
+            block = list(next(iter(orders))) if len(orders) == 1 else sorted(set().union(*orders))
+            members = set(block)
+            first = next((i for i, c in enumerate(columns) if c in members), None)
+            if first is None:
+                continue
+            rest = [c for c in columns if c not in members]
+            columns = rest[:first] + [c for c in block if c in columns] + rest[first:]
+        return columns
+
+
+def current_rss_mb():
+    """Sürecin anlık bellek kullanımı (RSS, MB); ölçülemezse en yüksek RSS"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+    except Exception:
+        return float('nan')
+
+
+def frame_rows(obj):
+    """DataFrame/Series/dizi ise satır sayısı, değilse None"""
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return int(len(obj))
+    return None
+
+
+class StageProfiler:
+    """Pipeline aşamaları için hafif zamanlayıcı (süre, tepe bellek, satır sayısı)
+
+    - stage(name, rows=...) context manager'ı bir aşamayı ölçer; iç içe
+      aşamalar 'load_data/...' gibi yol (path) ile raporlanır.
+    - block(name, rows=...) uzun bir metot içindeki ardışık feature
+      bloklarını işaretler: bir sonraki block() çağrısında veya içinde
+      bulunduğu aşama kapanınca otomatik kapanır.
+    - Çalışma (run) boyunca arka planda RSS örneklenir; her aşamanın tepe
+      belleği kendi süresince görülen en yüksek örnektir.
+    - Rapor her üst düzey aşama bittiğinde JSON'a (atomik) yazılır; çalışma
+      zaman aşımıyla öldürülse de o ana kadarki aşamalar dosyada kalır.
+    - profile_mode ('cprofile' / 'pyinstrument') verilirse tüm çalışma
+      profillenir ve profile_file'a dökülür.
+    """
+
+    def __init__(self, report_file=None, profile_mode=None, profile_file=None, sample_interval=0.05):
+        self.report_file = report_file
+        self.profile_mode = profile_mode
+        self.profile_file = profile_file
+        self.sample_interval = sample_interval
+        self.records = []
+        self._stack = []
+        self._run = None
+        self._sampler = None
+        self._stop = None
+        self._profiler = None
+
+    # --- çalışma (run) yaşam döngüsü ---
+    def start_run(self, name, **meta):
+        """Yeni bir ölçüm çalışması başlat (önceki kayıtlar sıfırlanır)"""
+        import threading
+        self.records = []
+        self._stack = []
+        self._run = {
+            'name': name,
+            'started_at': turkey_time().isoformat(timespec='seconds'),
+            't0': time.perf_counter(),
+            'rss_start_mb': current_rss_mb(),
+            'peak_rss_mb': current_rss_mb(),
+            'meta': meta,
+        }
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name='stage-profiler', daemon=True)
+        self._sampler.start()
+        self._start_profiler()
+        self.write_report(status='running')
+
+    def finish_run(self, status='ok'):
+        """Çalışmayı bitir: açık aşamaları kapat, profili ve raporu yaz"""
+        if self._run is None:
+            return None
+        while self._stack:
+            self._close(self._stack[-1])
+        if self._stop is not None:
+            self._stop.set()
+            self._sampler.join(timeout=1.0)
+        self._stop_profiler()
+        path = self.write_report(status=status)
+        if path:
+            print(f"⏱️ Zamanlama raporu: {path} ({time.perf_counter() - self._run['t0']:.1f} sn, "
+                  f"tepe bellek {self._run['peak_rss_mb']:.0f} MB)")
+        self._run = None
+        return path
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.sample_interval):
+            self._observe(current_rss_mb())
+
+    def _observe(self, rss):
+        run = self._run
+        if run is not None and rss > run['peak_rss_mb']:
+            run['peak_rss_mb'] = rss
+        for frame in list(self._stack):
+            if rss > frame['peak_rss_mb']:
+                frame['peak_rss_mb'] = rss
+
+    # --- aşamalar ---
+    def _open(self, name, rows, is_block):
+        rss = current_rss_mb()
+        self._observe(rss)
+        parent = self._stack[-1]['path'] + '/' if self._stack else ''
+        frame = {
+            'name': name,
+            'path': parent + name,
+            'depth': len(self._stack),
+            'is_block': is_block,
+            't0': time.perf_counter(),
+            'rows_in': rows,
+            'rows_out': None,
+            'rss_start_mb': rss,
+            'peak_rss_mb': rss,
+        }
+        self._stack.append(frame)
+        return frame
+
+    def _close(self, frame, error=None):
+        # Aşamanın içinde açık kalan bloklar önce kapanır
+        while self._stack and self._stack[-1] is not frame:
+            self._close(self._stack[-1])
+        if self._stack:
+            self._stack.pop()
+        rss = current_rss_mb()
+        self._observe(rss)
+        record = {
+            'path': frame['path'],
+            'name': frame['name'],
+            'depth': frame['depth'],
+            'kind': 'block' if frame['is_block'] else 'stage',
+            'start_s': round(frame['t0'] - self._run['t0'], 4) if self._run else None,
+            'seconds': round(time.perf_counter() - frame['t0'], 4),
+            'rows_in': frame['rows_in'],
+            'rows_out': frame['rows_out'],
+            'rss_start_mb': round(frame['rss_start_mb'], 1),
+            'rss_end_mb': round(rss, 1),
+            'peak_rss_mb': round(max(frame['peak_rss_mb'], rss), 1),
+        }
+        if error is not None:
+            record['error'] = f"{type(error).__name__}: {error}"
+        self.records.append(record)
+        if frame['depth'] == 0 and self._run is not None:
+            self.write_report(status='running')
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Bir aşamayı ölç; `with ... as st: st['rows_out'] = n` ile çıkış satırı verilebilir"""
+        frame = self._open(name, rows, is_block=False)
+        try:
+            yield frame
+        except BaseException as e:
+            self._close(frame, error=e)
+            raise
+        self._close(frame)
+
+    def block(self, name, rows=None):
+        """Açık feature bloğunu kapat ve yenisini başlat (name=None sadece kapatır)"""
+        if self._stack and self._stack[-1]['is_block']:
+            self._close(self._stack[-1])
+        if name is not None:
+            self._open(name, rows, is_block=True)
+
+    # --- profil (cProfile / pyinstrument) ---
+    def _start_profiler(self):
+        self._profiler = None
+        mode = (self.profile_mode or '').lower()
+        if not mode:
+            return
+        if mode == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+                self._profiler = ('pyinstrument', Profiler())
+                self._profiler[1].start()
+                return
+            except ImportError:
+                print("⚠️ pyinstrument kurulu değil, cProfile kullanılıyor")
+        import cProfile
+        self._profiler = ('cprofile', cProfile.Profile())
+        self._profiler[1].enable()
+
+    def _stop_profiler(self):
+        if self._profiler is None or not self.profile_file:
+            return
+        kind, prof = self._profiler
+        self._profiler = None
+        root, _ = os.path.splitext(self.profile_file)
+        try:
+            if kind == 'pyinstrument':
+                prof.stop()
+                path = root + '.html'
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(prof.output_html())
+            else:
+                prof.disable()
+                path = root + '.prof'
+                prof.dump_stats(path)
+            print(f"🔬 Profil kaydedildi: {path}")
+        except Exception as e:
+            print(f"⚠️ Profil kaydedilemedi: {e}")
+
+    # --- rapor ---
+    def summary(self):
+        """Yol (path) bazında toplam süre, çağrı sayısı ve tepe bellek"""
+        out = {}
+        for r in self.records:
+            s = out.setdefault(r['path'], {'calls': 0, 'seconds': 0.0, 'peak_rss_mb': 0.0, 'rows_in': 0})
+            s['calls'] += 1
+            s['seconds'] = round(s['seconds'] + r['seconds'], 4)
+            s['peak_rss_mb'] = max(s['peak_rss_mb'], r['peak_rss_mb'])
+            s['rows_in'] += r['rows_in'] or 0
+        return dict(sorted(out.items(), key=lambda kv: -kv[1]['seconds']))
+
+    def report(self, status='ok'):
+        """JSON'a yazılacak rapor sözlüğü"""
+        run = self._run or {}
+        now = time.perf_counter()
+        return {
+            'run': run.get('name'),
+            'status': status,
+            'started_at': run.get('started_at'),
+            'elapsed_s': round(now - run['t0'], 4) if run else None,
+            'rss_start_mb': round(run['rss_start_mb'], 1) if run else None,
+            'peak_rss_mb': round(run['peak_rss_mb'], 1) if run else None,
+            'meta': run.get('meta', {}),
+            # Zaman aşımında hangi aşamada kalındığı
+            'open_stages': [f['path'] for f in self._stack],
+            'stages': self.records,
+            'summary': self.summary(),
+        }
+
+    def write_report(self, status='ok'):
+        """Raporu report_file'a atomik olarak yaz"""
+        if not self.report_file:
+            return None
+        try:
+            os.makedirs(os.path.dirname(self.report_file) or '.', exist_ok=True)
+            tmp = self.report_file + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.report(status=status), f, ensure_ascii=False, indent=2, default=str)
+            os.replace(tmp, self.report_file)
+            return self.report_file
+        except Exception as e:
+            print(f"⚠️ Zamanlama raporu yazılamadı: {e}")
+            return None
+
+
+def profiled(name, run=False):
+    """HorseRacingPredictor metodlarını StageProfiler aşaması olarak ölçen decorator
+
+    Girdi satır sayısı ilk DataFrame argümanından, çıkış satır sayısı dönen
+    değerden alınır. run=True: metot tüm çalışmayı (rapor + profil) kapsar.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            profiler = getattr(self, 'profiler', None)
+            if profiler is None:
+                return func(self, *args, **kwargs)
+            if run:
+                profiler.start_run(name, hipodrom=getattr(self, 'hipodrom_key', None))
+                try:
+                    result = func(self, *args, **kwargs)
+                except BaseException as e:
+                    profiler.finish_run(status=f"error: {type(e).__name__}")
+                    raise
+                profiler.finish_run(status='ok' if result else 'failed')
+                return result
+            rows = next((n for n in map(frame_rows, list(args) + list(kwargs.values())) if n is not None), None)
+            with profiler.stage(name, rows=rows) as st:
+                result = func(self, *args, **kwargs)
+                st['rows_out'] = frame_rows(result[0] if isinstance(result, tuple) and result else result)
+            return result
+        return wrapper
+    return decorator
+
+
+class FeaturePreprocessor:
+    """Training'de bir kez fit edilen, tahminde aynen uygulanan ön işleme
+
+    Numeric kolonlar için %1/%99 clip sınırları, log1p bayrakları ve
+    yüksek korelasyon (>0.98) sonrası kalan kolonlar; categorical kolonlar
+    için kategori→kod haritaları (bilinmeyen kategori = sınıf sayısı);
+    eksik değerler için training median/mode değerleri saklanır. Model ile
+    birlikte kaydedilir, böylece train/serve farkı oluşmaz.
+    """
+
+    def __init__(self, clip_quantiles=(0.01, 0.99), corr_threshold=0.98):
+        self.clip_quantiles = clip_quantiles
+        self.corr_threshold = corr_threshold
+        self.clip_bounds = {}
+        self.log_cols = []
+        self.columns = []
+        self.cat_cols = []
+        self.num_cols = []
+        self.category_maps = {}
+        self.category_modes = {}
+        self.medians = {}
+
+    def _clip_log(self, X):
+        for c, (lo, hi) in self.clip_bounds.items():
+            if c in X.columns:
+                X[c] = X[c].clip(lo, hi)
+        for c in self.log_cols:
+            if c in X.columns:
+                X[c] = np.log1p(X[c].clip(lower=0))
+        return X
+
+    def fit(self, X, cat_cols, num_cols):
+        """Sınırları, kolon listesini, kategori haritalarını ve median'ları öğren"""
+        X = X.copy()
+        num_cols = list(num_cols)
+        q_lo, q_hi = self.clip_quantiles
+        self.clip_bounds, self.log_cols = {}, []
+        for c in num_cols:
+            try:
+                q1 = X[c].quantile(q_lo)
+                q99 = X[c].quantile(q_hi)
+                if pd.notna(q1) and pd.notna(q99) and q99 > q1:
+                    X[c] = X[c].clip(q1, q99)
+                    self.clip_bounds[c] = (q1, q99)
+                if X[c].min() >= 0:
+                    X[c] = np.log1p(X[c])
+                    self.log_cols.append(c)
+            except Exception:
+                continue
+        # Yüksek korelasyonlu numeric kolonları düşür
+        try:
+            corr = X[num_cols].corr().abs()
+            upper = corr.where(np.triu(np.ones(corr.shape), k=1).astype(bool))
+            to_drop = [column for column in upper.columns if any(upper[column] > self.corr_threshold)]
+            if to_drop:
+                X = X.drop(columns=[c for c in to_drop if c in X.columns])
+                num_cols = [c for c in num_cols if c not in to_drop]
+                print(f"   ✂️ {len(to_drop)} yüksek korelasyonlu kolon düşürüldü")
+        except Exception:
+            pass
+        self.columns = list(X.columns)
+        self.cat_cols = [c for c in cat_cols if c in self.columns]
+        self.num_cols = [c for c in num_cols if c in self.columns]
+
+        # Kategori → kod (sıralı sınıflar, LabelEncoder ile aynı kodlar)
+        self.category_maps, self.category_modes = {}, {}
+        for c in self.cat_cols:
+            classes = np.unique(X[c].astype(str))
+            self.category_maps[c] = {v: i for i, v in enumerate(classes)}
+            most_common = X[c].mode()
+            self.category_modes[c] = most_common.iloc[0] if len(most_common) > 0 else 0
+        X_enc = self._encode(X)
+        self.medians = {c: X_enc[c].median() for c in self.num_cols}
+        return self
+
+    def _encode(self, X):
+        for c in self.cat_cols:
+            mapping = self.category_maps[c]
+            # Bilinmeyen kategoriler için sınıf sayısı (eğitilmemiş kategori kodu)
+            X[c] = X[c].astype(str).map(mapping).fillna(len(mapping)).astype(int)
+        return X
+
+    def transform(self, X):
+        """Fit edilmiş ön işlemeyi uygula → modele hazır (encode + impute) çerçeve"""
+        X = self._clip_log(X.copy())
+        # Eksik kolonları ekle (tahmin çerçevesinde oluşmayan feature'lar)
+        for c in self.columns:
+            if c not in X.columns:
+                X[c] = self.medians.get(c, 0) if c in self.num_cols else self.category_modes.get(c, 0)
+        X = self._encode(X[self.columns].copy())
+        fill = {c: v for c, v in self.medians.items() if X[c].isna().any()}
+        if fill:
+            X = X.fillna(fill)
+        return X
+
+    def fit_transform(self, X, cat_cols, num_cols):
+        return self.fit(X, cat_cols, num_cols).transform(X)
+
+
 class HorseRacingPredictor:
-    def __init__(self, hipodrom_key):
+    def __init__(self, hipodrom_key, clock=None, as_of=None):
         self.hipodrom_key = hipodrom_key.upper()
+        # Zaman kaynağı ('bugün', dışlanan tarih ve tazelik hesapları): clock verilmezse
+        # as_of (veya GALOPCU_AS_OF) anına sabit saat, o da yoksa İstanbul saati
+        self.clock = clock or as_of_clock(as_of)
         self.data_dir = "data"
         self.output_dir = "output"
+        self.model_dir = "models"
         
         # TUTARLILIK İÇİN: Global random seed'leri ayarla (deterministik sonuçlar için)
         RANDOM_SEED = 42
@@ -47,20 +1530,78 @@ class HorseRacingPredictor:
         self.data_file = os.path.join(self.data_dir, f"{self.hipodrom_key}_races.csv")
         self.output_all = os.path.join(self.output_dir, f"{self.hipodrom_key}_predictions_all.csv")
         self.output_top3 = os.path.join(self.output_dir, f"{self.hipodrom_key}_predictions_top3.csv")
+        self.model_file = os.path.join(self.model_dir, f"{self.hipodrom_key}_model.joblib")
         
         # Model ve encoder'lar
         self.model = None
-        self.label_encoders = {}
+        self.preprocessor = None  # Fit edilmiş FeaturePreprocessor (clip/log/encode/median)
+        # Şehirler arası ortak at/jokey/antrenör geçmişi (EntityHistoryStore)
+        self.use_history_store = True
+        self.history_store = None
+        # Aşama zamanlama raporu ve isteğe bağlı profil (GALOPCU_PROFILE=cprofile|pyinstrument)
+        profile_mode = os.environ.get('GALOPCU_PROFILE', '').strip().lower()
+        self.profiler = StageProfiler(
+            report_file=os.path.join(self.output_dir, f"{self.hipodrom_key}_timing.json"),
+            profile_mode={'1': 'cprofile', 'true': 'cprofile'}.get(profile_mode, profile_mode) or None,
+            profile_file=os.path.join(self.output_dir, f"{self.hipodrom_key}_profile"),
+        )
+        # Featurize bellek bütçesi (MB, GALOPCU_FEATURE_MEMORY_MB): verilirse hedef satırlar
+        # tarih sıralı chunk'larda, her chunk sadece gereken geçmiş satırlarıyla featurize edilir
+        memory_mb = os.environ.get('GALOPCU_FEATURE_MEMORY_MB', '').strip()
+        self.feature_memory_mb = float(memory_mb) if memory_mb else None
         self.feature_names = []
-        self.numeric_medians = {}  # Training median'larını sakla
         # Kalibrasyon ayarları
-        self.use_softmax_calibration = False
-        self.softmax_temperature = 0.6
+        # Koşullu logit (koşu içi softmax) katmanı: koşudaki olasılıkların toplamı 1 olur
+        self.use_softmax_calibration = True
+        self.softmax_temperature = 1.0  # 1.0 = OOF'ta kalibre edilmiş haliyle
         # Meta-learner bağlam (pist/mesafe/sınıf) kullanımı
         self.use_meta_context = False
         # Koşu tipi bazlı sabit ağırlıklar kullanılsın mı?
         self.use_context_weights = True
-        
+        # Koşu tipi bazlı model ağırlıkları (sıra: DT1..DT5, XGB, XGBR)
+        self.context_model_weights = {
+            # Maiden/Şartlı1: form/pist-uyumu (XGB yüksek), Ranker düşük
+            'maiden_s1': [0.06, 0.06, 0.06, 0.06, 0.06, 0.60, 0.10],
+            # Yüksek sınıf: Ranker en yüksek, XGB ikinci; DT'ler minimal
+            'high': [0.03, 0.03, 0.03, 0.03, 0.03, 0.27, 0.60],
+            # Düşük sınıf: DT'ler kısık, XGB daha yüksek, Ranker orta
+            'low': [0.06, 0.06, 0.06, 0.06, 0.06, 0.48, 0.22],
+        }
+        # Koşu içi blend terimleri: (kolon, ağırlık, dönüşüm)
+        # 'minmax': koşu içi min-max, 'inverse': 1/değer sonra min-max (düşük rank daha iyi),
+        # 'consensus': model skorlarının std'si düşükse yüksek anlaşma
+        # Koşullu logit aktifken terimler kalibratöre girdi olarak verilir ve ağırlıkları
+        # OOF'ta öğrenilir; buradaki sabit ağırlıklar sadece eski (kalibratörsüz) yolda kullanılır
+        self.blend_bonus_weights = [
+            ('at_class_weighted_avg_rank_last6', 0.13, 'inverse'),
+            ('at_form_score_weighted', 0.10, 'minmax'),
+            ('at_opponent_quality_last6', 0.06, 'minmax'),
+            ('race_class_weight', 0.08, 'minmax'),
+            ('at_bu_pist_deneyim', 0.06, 'minmax'),
+            ('at_mesafe_basari', 0.05, 'minmax'),
+            ('at_mesafe_band_basari', 0.04, 'minmax'),
+            ('at_pist_tur_basari', 0.04, 'minmax'),
+            ('at_h2h_genel_skor', 0.04, 'minmax'),
+            ('model_score_*', 0.05, 'consensus'),
+        ]
+        # Eski yolda H2H z-skorunun logit ölçeği (kalibratörde H2H ağırlığı öğrenilir)
+        self.h2h_alpha = 1.5
+        # XGBRanker hedefi: 'rank:pairwise', 'rank:ndcg' veya 'listwise' (koşu içi softmax)
+        self.ranker_objective = 'rank:pairwise'
+
+    def now(self):
+        """Pipeline'ın 'şimdi'si (as-of saati)"""
+        return self.clock()
+
+    def as_of_date(self):
+        """Pipeline'ın 'bugün'ü (gg/aa/yyyy)"""
+        return self.now().strftime(DATE_FORMAT)
+
+    def as_of_day(self):
+        """As-of günü (gece yarısı Timestamp): geçmiş bu günden önceki satırlardır"""
+        return pd.Timestamp(self.now()).normalize()
+
+    @profiled('download_data')
     def download_data(self):
         """API'den veri indir"""
         print(f"📡 {self.hipodrom_key} verisi indiriliyor...")
@@ -84,6 +1625,7 @@ class HorseRacingPredictor:
             print(f"❌ Veri indirme hatası: {e}")
             return False
     
+    @profiled('load_data')
     def load_data(self):
         """Veriyi yükle ve hazırla"""
         if not os.path.exists(self.data_file):
@@ -92,40 +1634,33 @@ class HorseRacingPredictor:
         
         print(f"📊 {self.hipodrom_key} verisi yükleniyor...")
         
-        # Farklı encoding'leri dene - Türkçe karakterler için optimize edilmiş
-        encodings_to_try = ['utf-8', 'utf-8-sig', 'windows-1254', 'cp1254', 'latin-1', 'iso-8859-1']
-        df = None
-        best_encoding = None
-        
-        for encoding in encodings_to_try:
-            try:
-                test_df = pd.read_csv(self.data_file, engine="python", encoding=encoding)
-                # Eğer başarılı okunduysa ve at_adi kolonu varsa kontrol et
-                if 'at_adi' in test_df.columns and len(test_df) > 0:
-                    # Türkçe karakter kontrolü - örnek isimleri kontrol et
-                    sample_names = test_df['at_adi'].dropna().head(10).astype(str)
-                    if len(sample_names) > 0:
-                        # Problemli karakterleri kontrol et
-                        problematic_chars = ['Ã', 'Ä', 'Å', 'Ã§', 'Ã¼', 'Ã¶', 'Ä±', 'ÅŸ', 'Ä°', 'ÄŸ']
-                        problematic = any(any(char in str(name) for char in problematic_chars) for name in sample_names)
-                        if not problematic:
-                            df = test_df
-                            best_encoding = encoding
-                            print(f"✅ Encoding bulundu: {encoding}")
-                            break
-            except (UnicodeDecodeError, UnicodeError):
-                continue
-        
-        if df is None:
-            # Son çare olarak errors='ignore' ile oku
-            print("⚠️ Uygun encoding bulunamadı, errors='ignore' ile okunuyor...")
-            df = pd.read_csv(self.data_file, engine="python", encoding='utf-8', errors='ignore')
+        # Encoding'i byte örneğinden tespit et (dosya hash'i ile cache'li), tek C-engine okuma
+        df, encoding, cached = read_race_csv(self.data_file)
+        print(f"✅ Encoding {'(cache)' if cached else 'bulundu'}: {encoding}")
+
+        # As-of gününden sonraki satırlar hiç yüklenmez: geçmiş bir gün yeniden
+        # işlenirken training ve feature'lar gelecekteki sonuçları görmez
+        if 'tarih' in df.columns:
+            dates = pd.to_datetime(df['tarih'].astype(str), format=DATE_FORMAT, errors='coerce')
+            future = (dates > self.as_of_day()).to_numpy()
+            if future.any():
+                print(f"⏳ As-of ({self.as_of_date()}) sonrası {int(future.sum())} satır çıkarıldı")
+                df = df[~future].reset_index(drop=True)
+
+        if 'at_adi' in df.columns:
+            sample_names = df['at_adi'].dropna().head(10).astype(str)
+            if any(m in name for name in sample_names for m in MOJIBAKE_MARKERS):
+                print("⚠️ At isimlerinde bozuk Türkçe karakterler var (çift kodlanmış UTF-8?)")
         
         target_col = "sonuc"
         group_col = "yaris_kosu_key"
         
         # Sonuc sütununu numeric'e çevir (bugünün koşuları için boş olabilir)
         df[target_col] = pd.to_numeric(df[target_col], errors='coerce')
+
+        # Şehirler arası ortak geçmiş: bu şehrin atlarının/koşularının diğer dosyalardaki satırları
+        if self.use_history_store:
+            df = self.attach_shared_history(df)
         
         # TUTARLILIK İÇİN: Data'yı deterministik sırala (aynı veri her zaman aynı sırada)
         # Sıralama: tarih -> yaris_kosu_key -> at_adi (veya mevcut sütunlar)
@@ -141,7 +1676,13 @@ class HorseRacingPredictor:
         
         if sort_cols:
             df = df.sort_values(by=sort_cols, kind='mergesort').reset_index(drop=True)
-        
+
+        # Kompakt tipler: categorical isimler, int32/float32, önceden parse edilmiş tarih_dt
+        mem_before = df.memory_usage(deep=True).sum() / 1024 ** 2
+        df = compact_race_frame(df)
+        mem_after = df.memory_usage(deep=True).sum() / 1024 ** 2
+        print(f"💾 Bellek: {mem_before:.1f} MB → {mem_after:.1f} MB")
+
         # SADECE geçmiş verileri kontrol et (bugünkü koşuları kaybetme)
         print(f"📊 Toplam veri: {len(df)} satır")
         if df[target_col].notna().sum() > 0:
@@ -149,13 +1690,47 @@ class HorseRacingPredictor:
         
         return df
     
+    @profiled('attach_shared_history')
+    def attach_shared_history(self, df):
+        """Ortak store'dan bu şehrin atlarına ve koşularına ait, dosyada olmayan sonuçlu satırları ekle
+
+        Eklenen satırlar _shared=True ile işaretlenir: sadece feature bağlamıdır,
+        training/tahmin satırı olmaz.
+        """
+        try:
+            self.history_store = EntityHistoryStore.shared(os.path.dirname(self.data_file) or '.')
+        except Exception as e:
+            print(f"⚠️ Ortak geçmiş store'u kullanılamadı: {e}")
+            self.history_store = None
+            return df
+        keys = {k: df[k].dropna().unique() for k in ('at_key', 'yaris_kosu_key') if k in df.columns}
+        extra = self.history_store.rows_for(before=self.as_of_day(), **keys)
+        if len(extra) > 0 and {'yaris_kosu_key', 'at_key', 'sonuc'}.issubset(extra.columns):
+            own_keys = pd.MultiIndex.from_frame(df[['yaris_kosu_key', 'at_key']].astype(str))
+            extra_keys = pd.MultiIndex.from_frame(extra[['yaris_kosu_key', 'at_key']].astype(str))
+            extra = extra[extra['sonuc'].notna().to_numpy() & ~extra_keys.isin(own_keys)]
+        else:
+            extra = extra.iloc[0:0]
+        print(f"🔗 Ortak geçmişten {len(extra)} satır eklendi ({len(self.history_store.frame)} satırlık store)")
+        if len(extra) == 0:
+            return df.assign(_shared=False)
+        extra = extra[[c for c in df.columns if c in extra.columns]].astype(
+            {c: object for c in extra.columns if isinstance(extra[c].dtype, pd.CategoricalDtype)}
+        )
+        return pd.concat([df.assign(_shared=False), extra.assign(_shared=True)], ignore_index=True)
+
+    @profiled('split_train_predict')
     def split_train_predict(self, df):
         """Training ve prediction verilerini ayır"""
         print(f"📅 Training ve prediction verileri ayrılıyor...")
         
         # Bugünün tarihi
-        today = datetime.now().strftime('%d/%m/%Y')
+        today = self.as_of_date()
         
+        # Ortak geçmişten eklenen satırlar sadece bağlamdır (training/tahmin satırı değil)
+        if '_shared' in df.columns:
+            df = df[~df['_shared'].to_numpy(dtype=bool)]
+
         # Tarih sütunu varsa ayır
         if 'tarih' in df.columns:
             # Bugünün koşularını ara
@@ -186,49 +1761,32 @@ class HorseRacingPredictor:
             print(f"⚠️ 'tarih' sütunu bulunamadı.")
             return df, None
     
-    def create_advanced_features(self, df, skip_future_features=False, exclude_dates=None):
+    @profiled('create_advanced_features')
+    def create_advanced_features(self, df, skip_future_features=False, exclude_dates=None, global_stats=None):
         """Gelişmiş feature'lar oluştur (iyileştirilmiş - mantıksız feature'lar çıkarıldı, önemli feature'lar eklendi)
         
         Args:
             df: Veri çerçevesi
             skip_future_features: Gelecekteki feature'ları (ganyan, agf1, agf2) atla
             exclude_dates: Feature hesaplamasından çıkarılacak tarihler listesi (bugünün tarihi gibi)
+            global_stats: df bağlamın bir parçasıysa (chunk) tüm bağlamdan hesaplanmış
+                medyanlar, jokey/antrenör oranları ve son tarih (FeatureContextIndex.global_stats)
         """
         print(f"🔧 Gelişmiş feature'lar oluşturuluyor...")
         
         df = df.copy()
 
-        # Sınıf ağırlığı yardımcı fonksiyonu (global kullanılacak)
-        def _class_weight(c):
-            s = str(c).upper()
-            if 'G 1' in s or 'G1' in s:
-                return 1.4
-            if 'G 2' in s or 'G2' in s:
-                return 1.2
-            if 'G 3' in s or 'G3' in s:
-                return 1.0
-            if 'KV' in s:
-                return 0.8
-            if 'ŞARTLI' in s or 'SARTLI' in s:
-                return 0.5
-            if 'HANDIKAP' in s or 'HANDİKAP' in s:
-                return 0.45
-            if 'MAIDEN' in s:
-                return 0.35
-            if 'SATIŞ' in s or 'SATIS' in s:
-                return 0.3
-            return 0.4
-
-        # Yarış sınıf bilgisini numerik olarak ekle (meta-learner bağlamı için de kullanılacak)
-        if 'cins_detay' in df.columns and 'race_class_weight' not in df.columns:
-            df['race_class_weight'] = df['cins_detay'].apply(_class_weight)
-            df['race_is_high_class'] = (df['race_class_weight'] >= 0.8).astype(int)
+        self.profiler.block('parse_race_columns', rows=len(df))
+        # Parsing aşaması: sınıf ağırlığı, yarış türü, pist türü, grup skoru ve son6
+        # istatistikleri farklı değerler üzerinden bir kez hesaplanıp kolon olarak eklenir
+        df = parse_race_columns(df)
         
+        self.profiler.block('exclude_dates', rows=len(df))
         # Bugünün tarihini tespit et - exclude edilecek
         if exclude_dates is None:
             exclude_dates = []
             # Bugünün tarihini ekle (string formatında)
-            today = datetime.now().strftime('%d/%m/%Y')
+            today = self.as_of_date()
             exclude_dates.append(today)
         
         if len(exclude_dates) > 0:
@@ -270,39 +1828,95 @@ class HorseRacingPredictor:
             if original_len != len(df_subset):
                 print(f"   ✅ Toplam {original_len - len(df_subset)} satır exclude edildi")
             return df_subset
+
+        # Ortak geçmiş store'u varsa jokey/antrenör oranları tüm şehirlerin geçmişinden
+        # (varlık × tarih sayımları store'da bir kez hesaplanır, burada sadece toplanır)
+        store = self.history_store if self.use_history_store else None
+        if store is not None and (store.frame is None or 'sonuc' not in store.frame.columns):
+            store = None
+
+        def merge_store_rates(frame, keys, out_col):
+            rates = store.entity_rates(keys, exclude_dates, before=self.as_of_day()).rename(columns={'rate': out_col})
+            frame = frame.merge(rates, on=keys, how='left')
+            frame[out_col] = frame[out_col].fillna(0)
+            return frame
+
+        # Chunk'lı featurize: çerçeve genelindeki değerler tüm bağlamdan bir kez hesaplanmış gelir
+        global_stats = global_stats or {}
+        shared_medians = global_stats.get('medians', {})
+        shared_rates = global_stats.get('rates', {})
+
+        def column_median(col):
+            return shared_medians[col] if col in shared_medians else df[col].median()
+
+        def merge_shared_rates(frame, out_col):
+            keys = list(FeatureContextIndex.RATE_KEYS[out_col])
+            frame = frame.merge(shared_rates[out_col], on=keys, how='left')
+            frame[out_col] = frame[out_col].fillna(0)
+            return frame
+
+        # Series döndüren satır fonksiyonlarının anahtar sıraları chunk'lar boyunca toplanır
+        # (apply'ın kolon sırası buna bağlı; bkz. FeatureContextIndex.apply_column_order)
+        row_columns = global_stats.get('row_columns')
+
+        def record_columns(func):
+            seen = row_columns.setdefault(func.__name__, set())
+
+            def recorded(row):
+                result = func(row)
+                if isinstance(result, pd.Series):
+                    seen.add(tuple(result.index))
+                return result
+            return recorded
+
+        # Satır bazlı (atın geçmişini tarayan) hesaplamalar: '_target' kolonu varsa
+        # (featurize_targets) sadece hedef satırlar hesaplanır, diğerleri NaN kalır
+        def apply_rows(frame, func, rows=None):
+            kwargs = {} if isinstance(frame, pd.Series) else {'axis': 1}
+            if row_columns is not None:
+                func = record_columns(func)
+            if isinstance(frame, pd.Series) and isinstance(frame.dtype, pd.CategoricalDtype):
+                # Categorical.apply kategori tipinde sonuç döndürebilir
+                frame = frame.astype(object)
+            if rows is None:
+                if '_target' not in df.columns:
+                    return frame.apply(func, **kwargs)
+                rows = df['_target'].to_numpy(dtype=bool)
+            return frame[rows].apply(func, **kwargs).reindex(frame.index)
         
+        self.profiler.block('temel_numeric', rows=len(df))
         # === TEMEL NUMERIC FEATURE'LAR ===
         # 1. Handikap (ne kadar yüksekse at o kadar güçlü)
         if 'handikap' in df.columns:
             df['handikap_numeric'] = pd.to_numeric(df['handikap'], errors='coerce')
-            df['handikap_numeric'] = df['handikap_numeric'].fillna(df['handikap_numeric'].median())
+            df['handikap_numeric'] = df['handikap_numeric'].fillna(column_median('handikap_numeric'))
         
         # 2. Kilo (handikap dengelensin diye eklenen ağırlık)
         if 'kilo' in df.columns:
             df['kilo_numeric'] = pd.to_numeric(df['kilo'], errors='coerce')
-            df['kilo_numeric'] = df['kilo_numeric'].fillna(df['kilo_numeric'].median())
+            df['kilo_numeric'] = df['kilo_numeric'].fillna(column_median('kilo_numeric'))
         
         # 3. Start pozisyonu (kulvar/başlangıç pozisyonu)
         if 'start' in df.columns:
             df['start_numeric'] = pd.to_numeric(df['start'], errors='coerce')
-            df['start_numeric'] = df['start_numeric'].fillna(df['start_numeric'].median())
+            df['start_numeric'] = df['start_numeric'].fillna(column_median('start_numeric'))
         
         # 4. Mesafe (metre cinsinden)
         if 'mesafe' in df.columns:
             df['mesafe_numeric'] = pd.to_numeric(df['mesafe'], errors='coerce')
-            df['mesafe_numeric'] = df['mesafe_numeric'].fillna(df['mesafe_numeric'].median())
+            df['mesafe_numeric'] = df['mesafe_numeric'].fillna(column_median('mesafe_numeric'))
         
         # 5. KGS analizi (ideal 15 gün)
         if 'kgs' in df.columns:
             df['kgs_numeric'] = pd.to_numeric(df['kgs'], errors='coerce')
-            df['kgs_numeric'] = df['kgs_numeric'].fillna(df['kgs_numeric'].median())
+            df['kgs_numeric'] = df['kgs_numeric'].fillna(column_median('kgs_numeric'))
             # İdeal KGS'den uzaklık (ne kadar uzaksa o kadar kötü)
             df['kgs_ideal_fark'] = abs(df['kgs_numeric'] - 15)
         
         # 6. At yaşı
         if 'yas' in df.columns:
             df['yas_numeric'] = pd.to_numeric(df['yas'], errors='coerce')
-            df['yas_numeric'] = df['yas_numeric'].fillna(df['yas_numeric'].median())
+            df['yas_numeric'] = df['yas_numeric'].fillna(column_median('yas_numeric'))
         
         # 7. Ganyan oranı - KALDIRILDI (model eğitimi ve tahminde kullanılmıyor)
         # if not skip_future_features and 'ganyan' in df.columns:
@@ -321,51 +1935,20 @@ class HorseRacingPredictor:
         # 9. En iyi derece analizi
         if 'en_iyi_derece' in df.columns:
             df['en_iyi_derece_numeric'] = pd.to_numeric(df['en_iyi_derece'], errors='coerce')
-            df['en_iyi_derece_numeric'] = df['en_iyi_derece_numeric'].fillna(df['en_iyi_derece_numeric'].median())
+            df['en_iyi_derece_numeric'] = df['en_iyi_derece_numeric'].fillna(column_median('en_iyi_derece_numeric'))
         
         # 10. Son20 performans analizi
         if 'son20' in df.columns:
             df['son20_numeric'] = pd.to_numeric(df['son20'], errors='coerce')
-            df['son20_numeric'] = df['son20_numeric'].fillna(df['son20_numeric'].median())
-        
-        # === SON6 FORM ANALİZİ (YENİ - ÇOK ÖNEMLİ) ===
-        if 'son6' in df.columns and 'at_adi' in df.columns and 'sonuc' in df.columns:
-            def parse_son6(son6_str):
-                """Son6 form'u parse et ve ortalama dereceyi hesapla"""
-                if pd.isna(son6_str) or not isinstance(son6_str, str):
-                    return 0, 0  # form_puan, kazanma_sayisi
-                
-                # Son6 formatı: "C1C6K7C6C4C5" gibi (C=çim, K=kum, sayı=derece)
-                # 0 en kötü (10. veya daha kötü), 1 en iyi (1.)
-                dereceler = []
-                i = 0
-                while i < len(son6_str):
-                    if son6_str[i] in ['C', 'K']:
-                        if i + 1 < len(son6_str):
-                            try:
-                                derece = int(son6_str[i+1])
-                                # 0 = 10. veya daha kötü, diğerleri direkt derece
-                                if derece == 0:
-                                    derece = 10
-                                dereceler.append(derece)
-                            except:
-                                pass
-                    i += 1
-                
-                if len(dereceler) == 0:
-                    return 0, 0
-                
-                # Ortalama form puanı (düşük derece = iyi, yüksek derece = kötü)
-                # 1. = 10 puan, 2. = 9 puan, ..., 10. = 1 puan
-                form_puan = sum(max(0, 11 - d) for d in dereceler) / len(dereceler)
-                kazanma_sayisi = sum(1 for d in dereceler if d == 1)
-                
-                return form_puan, kazanma_sayisi
-            
-            son6_features = df['son6'].apply(parse_son6)
-            df['at_son6_form_puan'] = son6_features.apply(lambda x: x[0])
-            df['at_son6_kazanma_sayisi'] = son6_features.apply(lambda x: x[1])
+            df['son20_numeric'] = df['son20_numeric'].fillna(column_median('son20_numeric'))
+        
+        # === SON6 FORM ANALİZİ: parse_race_columns'ta (at_son6_form_puan, at_son6_kazanma_sayisi) ===
+        # Kolonlar buraya taşınır: model girdisinin kolon sırası (ve RF/XGB sonuçları) korunur
+        for col in ('at_son6_form_puan', 'at_son6_kazanma_sayisi'):
+            if col in df.columns:
+                df[col] = df.pop(col)
         
+        self.profiler.block('at_basari', rows=len(df))
         # === AT BAŞARI FEATURE'LARI ===
         # 11. At-Pist-Mesafe kombinasyonu (en önemli kombinasyon)
         if 'pist' in df.columns and 'at_adi' in df.columns and 'mesafe' in df.columns and 'sonuc' in df.columns:
@@ -374,7 +1957,7 @@ class HorseRacingPredictor:
             # Bugünün tarihlerini çıkar
             df_with_result = filter_exclude_dates(df_with_result)
             if len(df_with_result) > 0:
-                at_pist_mesafe_basari = df_with_result.groupby(['at_adi', 'pist', 'mesafe'])['sonuc'].apply(
+                at_pist_mesafe_basari = df_with_result.groupby(['at_adi', 'pist', 'mesafe'], observed=True)['sonuc'].apply(
                     lambda x: (x == 1).mean() if len(x) > 0 else 0
                 ).reset_index()
                 at_pist_mesafe_basari.columns = ['at_adi', 'pist', 'mesafe', 'at_pist_mesafe_basari']
@@ -474,7 +2057,7 @@ class HorseRacingPredictor:
                 if 'tarih_dt' not in df.columns and 'tarih' in df.columns:
                     df['tarih_dt'] = pd.to_datetime(df['tarih'], format='%d/%m/%Y', errors='coerce')
                 
-                df['at_bu_pist_deneyim'] = df.apply(calculate_pist_deneyim, axis=1)
+                df['at_bu_pist_deneyim'] = apply_rows(df, calculate_pist_deneyim)
         
         # 12. At-Mesafe uygunluğu
         if 'at_adi' in df.columns and 'mesafe' in df.columns and 'sonuc' in df.columns:
@@ -482,7 +2065,7 @@ class HorseRacingPredictor:
             df_with_result = df[df['sonuc'].notna()].copy()
             df_with_result = filter_exclude_dates(df_with_result)
             if len(df_with_result) > 0:
-                at_mesafe_basari = df_with_result.groupby(['at_adi', 'mesafe'])['sonuc'].apply(
+                at_mesafe_basari = df_with_result.groupby(['at_adi', 'mesafe'], observed=True)['sonuc'].apply(
                     lambda x: (x == 1).mean() if len(x) > 0 else 0
                 ).reset_index()
                 at_mesafe_basari.columns = ['at_adi', 'mesafe', 'at_mesafe_basari']
@@ -503,7 +2086,7 @@ class HorseRacingPredictor:
                     if len(band_races) == 0:
                         return 0.0
                     return float((band_races['sonuc'] == 1).mean())
-                df['at_mesafe_band_basari'] = df.apply(calc_mesafe_band_basari, axis=1)
+                df['at_mesafe_band_basari'] = apply_rows(df, calc_mesafe_band_basari)
             else:
                 df['at_mesafe_basari'] = 0
                 df['at_mesafe_band_basari'] = 0.0
@@ -523,27 +2106,16 @@ class HorseRacingPredictor:
             df_with_result = df[df['sonuc'].notna()].copy()
             df_with_result = filter_exclude_dates(df_with_result)
             if len(df_with_result) > 0:
-                at_pist_basari = df_with_result.groupby(['at_adi', 'pist'])['sonuc'].apply(
+                at_pist_basari = df_with_result.groupby(['at_adi', 'pist'], observed=True)['sonuc'].apply(
                     lambda x: (x == 1).mean() if len(x) > 0 else 0
                 ).reset_index()
                 at_pist_basari.columns = ['at_adi', 'pist', 'at_pist_basari']
                 df = df.merge(at_pist_basari, on=['at_adi', 'pist'], how='left')
                 df['at_pist_basari'] = df['at_pist_basari'].fillna(0)
-                # 13.1. Pist türü (çim/kum/sentetik) bazlı başarı
-                def normalize_pist_tur(p):
-                    pl = str(p).lower()
-                    if 'çim' in pl or 'cim' in pl:
-                        return 'çim'
-                    if 'kum' in pl:
-                        return 'kum'
-                    if 'sentetik' in pl or 'sintetik' in pl:
-                        return 'sentetik'
-                    return 'unknown'
-                
-                df_with_result['pist_tur'] = df_with_result['pist'].apply(normalize_pist_tur)
+                # 13.1. Pist türü (çim/kum/sentetik) bazlı başarı (pist_tur parse aşamasından)
                 def calc_pist_tur_basari(row):
                     at = row.get('at_adi')
-                    cur_p_tur = normalize_pist_tur(row.get('pist', ''))
+                    cur_p_tur = row.get('pist_tur', 'unknown')
                     if pd.isna(at) or cur_p_tur == 'unknown':
                         return 0.0
                     at_past = df_with_result[df_with_result['at_adi'] == at].copy()
@@ -554,7 +2126,7 @@ class HorseRacingPredictor:
                     if len(tur_races) == 0:
                         return 0.0
                     return float((tur_races['sonuc'] == 1).mean())
-                df['at_pist_tur_basari'] = df.apply(calc_pist_tur_basari, axis=1)
+                df['at_pist_tur_basari'] = apply_rows(df, calc_pist_tur_basari)
             else:
                 df['at_pist_basari'] = 0
                 df['at_pist_tur_basari'] = 0.0
@@ -565,7 +2137,7 @@ class HorseRacingPredictor:
             df_with_result = df[df['sonuc'].notna()].copy()
             df_with_result = filter_exclude_dates(df_with_result)
             if len(df_with_result) > 0:
-                at_genel_basari = df_with_result.groupby('at_adi')['sonuc'].apply(
+                at_genel_basari = df_with_result.groupby('at_adi', observed=True)['sonuc'].apply(
                     lambda x: (x == 1).mean() if len(x) > 0 else 0
                 ).reset_index()
                 at_genel_basari.columns = ['at_adi', 'at_genel_basari']
@@ -574,6 +2146,7 @@ class HorseRacingPredictor:
             else:
                 df['at_genel_basari'] = 0
         
+        self.profiler.block('badges', rows=len(df))
         # 13.6. Badge tabanlı sayısal feature'lar (jokey-at, mesafe, hipodrom, G1/G2/G3/KV sayıları)
         if 'at_adi' in df.columns and 'sonuc' in df.columns:
             df_badge = df.copy()
@@ -650,7 +2223,7 @@ class HorseRacingPredictor:
                     'at_kv_tecrube_sayisi': kv,
                 })
 
-            badge_feats = df_badge.apply(calc_badges, axis=1)
+            badge_feats = apply_rows(df_badge, calc_badges)
             for col in badge_feats.columns:
                 df[col] = pd.to_numeric(badge_feats[col], errors='coerce').fillna(0)
 
@@ -688,7 +2261,7 @@ class HorseRacingPredictor:
                         beaten_set.add(comp)
                 return int(len(beaten_set))
 
-            df['at_gecilen_rakip_sayisi'] = df_badge.apply(calc_beaten_competitors, axis=1)
+            df['at_gecilen_rakip_sayisi'] = apply_rows(df_badge, calc_beaten_competitors)
 
             # 13.8. Ağırlıklı rozet skoru (öncelik: G1 >> G2 >> G3 >> KV > rakip > mesafe kazanma > hipodrom kazanma)
             # G1/G2/G3 arasındaki farkı büyüt: 1 G1 > 2 G2 > 3 G3 olmalı
@@ -750,6 +2323,7 @@ class HorseRacingPredictor:
             df['ix_g2xhip'] = df['at_g2_weighted'] * df['at_hip_win_log1p']
             df['ix_g3xhip'] = df['at_g3_weighted'] * df['at_hip_win_log1p']
 
+        self.profiler.block('h2h_features', rows=len(df))
         # 13.11. Head-to-Head (H2H) Feature - Kim kimi geçti?
         # Her at için geçmişteki rakiplerine karşı genel üstünlük skoru
         if 'at_adi' in df.columns and 'sonuc' in df.columns and 'yaris_kosu_key' in df.columns:
@@ -757,16 +2331,6 @@ class HorseRacingPredictor:
             df_with_result = filter_exclude_dates(df_with_result)
             
             if len(df_with_result) > 0:
-                def normalize_pist_tur_for_h2h(p):
-                    pl = str(p).lower()
-                    if 'çim' in pl or 'cim' in pl:
-                        return 'çim'
-                    if 'kum' in pl:
-                        return 'kum'
-                    if 'sentetik' in pl or 'sintetik' in pl:
-                        return 'sentetik'
-                    return 'unknown'
-                
                 def calc_h2h_general_score(row):
                     at_adi = row.get('at_adi')
                     if pd.isna(at_adi):
@@ -813,7 +2377,7 @@ class HorseRacingPredictor:
                         rec = 1.0
                         if 'tarih_dt' in race.index and pd.notna(race.get('tarih_dt')):
                             try:
-                                days = (pd.Timestamp.now() - race['tarih_dt']).days
+                                days = (pd.Timestamp(self.now()) - race['tarih_dt']).days
                                 rec = float(np.exp(-max(0, days) / 90.0))
                             except:
                                 pass
@@ -839,12 +2403,13 @@ class HorseRacingPredictor:
                         return float(total_score / total_weight)
                     return 0.0
                 
-                df['at_h2h_genel_skor'] = df.apply(calc_h2h_general_score, axis=1)
+                df['at_h2h_genel_skor'] = apply_rows(df, calc_h2h_general_score)
             else:
                 df['at_h2h_genel_skor'] = 0.0
         else:
             df['at_h2h_genel_skor'] = 0.0
 
+        self.profiler.block('jokey_antrenor', rows=len(df))
         # === JOKEY VE ANTRENÖR FEATURE'LARI ===
         # 14. Jokey-At kombinasyonu (EN ÖNEMLİ - bu jokey bu atla ne kadar başarılı?)
         if 'jokey_adi' in df.columns and 'at_adi' in df.columns and 'sonuc' in df.columns:
@@ -852,7 +2417,7 @@ class HorseRacingPredictor:
             df_with_result = df[df['sonuc'].notna()].copy()
             df_with_result = filter_exclude_dates(df_with_result)
             if len(df_with_result) > 0:
-                jokey_at_basari = df_with_result.groupby(['jokey_adi', 'at_adi'])['sonuc'].apply(
+                jokey_at_basari = df_with_result.groupby(['jokey_adi', 'at_adi'], observed=True)['sonuc'].apply(
                     lambda x: (x == 1).mean() if len(x) > 0 else 0
                 ).reset_index()
                 jokey_at_basari.columns = ['jokey_adi', 'at_adi', 'jokey_at_basari']
@@ -862,12 +2427,16 @@ class HorseRacingPredictor:
                 df['jokey_at_basari'] = 0
         
         # 15. Jokey genel başarı oranı (ayrı ayrı bakmak için)
-        if 'jokey_adi' in df.columns and 'sonuc' in df.columns:
+        if store is not None and 'jokey_kodu' in df.columns:
+            df = merge_store_rates(df, ['jokey_kodu'], 'jokey_genel_basari')
+        elif 'jokey_genel_basari' in shared_rates:
+            df = merge_shared_rates(df, 'jokey_genel_basari')
+        elif 'jokey_adi' in df.columns and 'sonuc' in df.columns:
             # Sadece sonuc bilgisi olan satırları kullan (bugünün koşularını hariç tut)
             df_with_result = df[df['sonuc'].notna()].copy()
             df_with_result = filter_exclude_dates(df_with_result)
             if len(df_with_result) > 0:
-                jokey_basari = df_with_result.groupby('jokey_adi')['sonuc'].apply(
+                jokey_basari = df_with_result.groupby('jokey_adi', observed=True)['sonuc'].apply(
                     lambda x: (x == 1).mean() if len(x) > 0 else 0
                 ).reset_index()
                 jokey_basari.columns = ['jokey_adi', 'jokey_genel_basari']
@@ -877,12 +2446,16 @@ class HorseRacingPredictor:
                 df['jokey_genel_basari'] = 0
         
         # 16. Jokey-Mesafe başarı oranı (bu jokey bu mesafede ne kadar başarılı?)
-        if 'jokey_adi' in df.columns and 'mesafe' in df.columns and 'sonuc' in df.columns:
+        if store is not None and {'jokey_kodu', 'mesafe'}.issubset(df.columns):
+            df = merge_store_rates(df, ['jokey_kodu', 'mesafe'], 'jokey_mesafe_basari')
+        elif 'jokey_mesafe_basari' in shared_rates:
+            df = merge_shared_rates(df, 'jokey_mesafe_basari')
+        elif 'jokey_adi' in df.columns and 'mesafe' in df.columns and 'sonuc' in df.columns:
             # Sadece sonuc bilgisi olan satırları kullan (bugünün koşularını hariç tut)
             df_with_result = df[df['sonuc'].notna()].copy()
             df_with_result = filter_exclude_dates(df_with_result)
             if len(df_with_result) > 0:
-                jokey_mesafe_basari = df_with_result.groupby(['jokey_adi', 'mesafe'])['sonuc'].apply(
+                jokey_mesafe_basari = df_with_result.groupby(['jokey_adi', 'mesafe'], observed=True)['sonuc'].apply(
                     lambda x: (x == 1).mean() if len(x) > 0 else 0
                 ).reset_index()
                 jokey_mesafe_basari.columns = ['jokey_adi', 'mesafe', 'jokey_mesafe_basari']
@@ -892,12 +2465,16 @@ class HorseRacingPredictor:
                 df['jokey_mesafe_basari'] = 0
         
         # 17. Antrenör genel başarı oranı (ayrı ayrı bakmak için)
-        if 'antrenor_adi' in df.columns and 'sonuc' in df.columns:
+        if store is not None and 'antrenor_kodu' in df.columns:
+            df = merge_store_rates(df, ['antrenor_kodu'], 'antrenor_genel_basari')
+        elif 'antrenor_genel_basari' in shared_rates:
+            df = merge_shared_rates(df, 'antrenor_genel_basari')
+        elif 'antrenor_adi' in df.columns and 'sonuc' in df.columns:
             # Sadece sonuc bilgisi olan satırları kullan (bugünün koşularını hariç tut)
             df_with_result = df[df['sonuc'].notna()].copy()
             df_with_result = filter_exclude_dates(df_with_result)
             if len(df_with_result) > 0:
-                antrenor_basari = df_with_result.groupby('antrenor_adi')['sonuc'].apply(
+                antrenor_basari = df_with_result.groupby('antrenor_adi', observed=True)['sonuc'].apply(
                     lambda x: (x == 1).mean() if len(x) > 0 else 0
                 ).reset_index()
                 antrenor_basari.columns = ['antrenor_adi', 'antrenor_genel_basari']
@@ -921,21 +2498,25 @@ class HorseRacingPredictor:
                     if len(hist)==0:
                         return 0.0
                     hist = hist.copy()
-                    hist['cw'] = hist['cins_detay'].apply(lambda s: _class_weight(s))
+                    hist['cw'] = hist['race_class_weight']
                     wins = ((pd.to_numeric(hist['sonuc'], errors='coerce')==1)*hist['cw']).sum()
                     denom = hist['cw'].sum()
                     return float(wins/denom) if denom>0 else 0.0
                 return calc
-            df['jokey_recent60_cls_winrate'] = df.apply(rolling_form('jokey_adi','jokey_recent60_cls_winrate'), axis=1)
-            df['ant_recent60_cls_winrate'] = df.apply(rolling_form('antrenor_adi','ant_recent60_cls_winrate'), axis=1)
+            df['jokey_recent60_cls_winrate'] = apply_rows(df, rolling_form('jokey_adi','jokey_recent60_cls_winrate'))
+            df['ant_recent60_cls_winrate'] = apply_rows(df, rolling_form('antrenor_adi','ant_recent60_cls_winrate'))
         
         # 18. Antrenör-Mesafe başarı oranı (bu antrenör bu mesafede ne kadar başarılı?)
-        if 'antrenor_adi' in df.columns and 'mesafe' in df.columns and 'sonuc' in df.columns:
+        if store is not None and {'antrenor_kodu', 'mesafe'}.issubset(df.columns):
+            df = merge_store_rates(df, ['antrenor_kodu', 'mesafe'], 'antrenor_mesafe_basari')
+        elif 'antrenor_mesafe_basari' in shared_rates:
+            df = merge_shared_rates(df, 'antrenor_mesafe_basari')
+        elif 'antrenor_adi' in df.columns and 'mesafe' in df.columns and 'sonuc' in df.columns:
             # Sadece sonuc bilgisi olan satırları kullan (bugünün koşularını hariç tut)
             df_with_result = df[df['sonuc'].notna()].copy()
             df_with_result = filter_exclude_dates(df_with_result)
             if len(df_with_result) > 0:
-                antrenor_mesafe_basari = df_with_result.groupby(['antrenor_adi', 'mesafe'])['sonuc'].apply(
+                antrenor_mesafe_basari = df_with_result.groupby(['antrenor_adi', 'mesafe'], observed=True)['sonuc'].apply(
                     lambda x: (x == 1).mean() if len(x) > 0 else 0
                 ).reset_index()
                 antrenor_mesafe_basari.columns = ['antrenor_adi', 'mesafe', 'antrenor_mesafe_basari']
@@ -944,13 +2525,14 @@ class HorseRacingPredictor:
             else:
                 df['antrenor_mesafe_basari'] = 0
         
+        self.profiler.block('grup', rows=len(df))
         # 16. At-Grup kombinasyonu analizi
         if 'grup' in df.columns and 'at_adi' in df.columns and 'sonuc' in df.columns:
             # Sadece sonuc bilgisi olan satırları kullan (bugünün koşularını hariç tut)
             df_with_result = df[df['sonuc'].notna()].copy()
             df_with_result = filter_exclude_dates(df_with_result)
             if len(df_with_result) > 0:
-                at_grup_basari = df_with_result.groupby(['at_adi', 'grup'])['sonuc'].apply(
+                at_grup_basari = df_with_result.groupby(['at_adi', 'grup'], observed=True)['sonuc'].apply(
                     lambda x: (x == 1).mean() if len(x) > 0 else 0
                 ).reset_index()
                 at_grup_basari.columns = ['at_adi', 'grup', 'at_grup_basari']
@@ -959,13 +2541,14 @@ class HorseRacingPredictor:
             else:
                 df['at_grup_basari'] = 0
 
+        self.profiler.block('class_weighted_recent', rows=len(df))
         # 16.5. Cins detay sınıf ağırlıklı son performans (G1>G2>G3>KV>Şartlı>Handikap>Maiden>Satış)
         if 'at_adi' in df.columns and 'sonuc' in df.columns and 'cins_detay' in df.columns:
             if 'tarih_dt' not in df.columns and 'tarih' in df.columns:
                 df['tarih_dt'] = pd.to_datetime(df['tarih'], format='%d/%m/%Y', errors='coerce')
 
-            def class_weight(c):
-                return _class_weight(c)
+            # Satır başına filtrelenen ince kaynak (tüm df'yi dilimlemek yerine)
+            class_src = df[[c for c in ('at_adi', 'tarih', 'tarih_dt', 'sonuc', 'race_class_weight') if c in df.columns]]
 
             def compute_class_weighted_recent(row):
                 at = row.get('at_adi')
@@ -976,7 +2559,7 @@ class HorseRacingPredictor:
                         'at_class_weighted_win_rate_last6': 0.0,
                         'at_high_class_start_ratio_last6': 0.0
                     })
-                hist = df[(df['at_adi'] == at) & (df['sonuc'].notna())].copy()
+                hist = class_src[(class_src['at_adi'] == at) & (class_src['sonuc'].notna())].copy()
                 if 'tarih_dt' in hist.columns and pd.notna(cur_dt):
                     hist = hist[hist['tarih_dt'] < cur_dt]
                 # exclude_dates çıkar
@@ -992,7 +2575,7 @@ class HorseRacingPredictor:
                     hist = hist.sort_values('tarih_dt', ascending=False)
                 last6 = hist.head(6).copy()
                 last6['rank'] = pd.to_numeric(last6['sonuc'], errors='coerce')
-                last6['cw'] = last6['cins_detay'].apply(_class_weight)
+                last6['cw'] = last6['race_class_weight']
                 # Sınıf-dengeli ortalama derece (düşük daha iyi)
                 # Not: yüksek sınıfta (cw büyük) kötü dereceyi nispeten affetmek için rank/cw kullanıyoruz
                 if (last6['cw']>0).any() and last6['rank'].notna().any():
@@ -1016,18 +2599,23 @@ class HorseRacingPredictor:
                     'at_high_class_start_ratio_last6': high_ratio
                 })
 
-            class_feats = df.apply(compute_class_weighted_recent, axis=1)
+            peer_rows = None
+            if '_target' in df.columns and 'yaris_kosu_key' in df.columns:
+                # Rakip kalitesi (16.6) hedef atların geçmiş koşularındaki rakiplerin
+                # bu feature'ını da okur → o koşuların satırları da hesaplanır
+                tgt = df['_target'].to_numpy(dtype=bool)
+                target_horses = df.loc[tgt, 'at_adi'].dropna().unique()
+                target_races = df.loc[df['at_adi'].isin(target_horses), 'yaris_kosu_key'].dropna().unique()
+                peer_rows = tgt | df['yaris_kosu_key'].isin(target_races).to_numpy()
+            class_feats = apply_rows(df, compute_class_weighted_recent, rows=peer_rows)
             df = pd.concat([df, class_feats], axis=1)
 
+        self.profiler.block('opponent_quality', rows=len(df))
         # 16.6. Rakip kalite metriği (son 6): yüksek sınıf oranı + rakiplerin sınıf-ağırlıklı form ortalaması
         if {'at_adi','yaris_kosu_key','sonuc','cins_detay'}.issubset(df.columns):
             if 'tarih_dt' not in df.columns and 'tarih' in df.columns:
                 df['tarih_dt'] = pd.to_datetime(df['tarih'], format='%d/%m/%Y', errors='coerce')
 
-            def is_high_class(s):
-                cw = _class_weight(s)
-                return cw >= 0.8
-
             def compute_opponent_quality(row):
                 at = row.get('at_adi')
                 cur_dt = row.get('tarih_dt', pd.NaT)
@@ -1052,7 +2640,7 @@ class HorseRacingPredictor:
                     if len(race_peers) == 0:
                         continue
                     # aynı yarışın cins_detay'ına göre yüksek sınıf kabul et
-                    high_mask = race_peers['cins_detay'].apply(is_high_class)
+                    high_mask = race_peers['race_class_weight'] >= 0.8
                     # kendisini hariç tut
                     if 'at_adi' in race_peers.columns:
                         high_mask = high_mask & (race_peers['at_adi'] != at)
@@ -1069,28 +2657,12 @@ class HorseRacingPredictor:
                 # Bileşik skor: form %70, oran %30
                 return 0.7 * form_mean + 0.3 * ratio_mean
 
-            df['at_opponent_quality_last6'] = df.apply(compute_opponent_quality, axis=1)
+            df['at_opponent_quality_last6'] = apply_rows(df, compute_opponent_quality)
         
+        self.profiler.block('grup_tur_skorlari', rows=len(df))
         # 16.5. Grup seviye skorlaması ve ağırlıklı performans
         if 'grup' in df.columns:
-            def get_grup_seviye_score(grup):
-                """Grup seviyesini skorla"""
-                grup_str = str(grup).upper()
-                
-                # 4 ve Yukarı = en üst seviye (skor: 5)
-                if '4 VE YUKARI' in grup_str or '4 VE YUKAR' in grup_str:
-                    return 5
-                # 3 Yaşlı = orta seviye (skor: 3)
-                elif '3 YAŞLI' in grup_str or '3 YAŞL' in grup_str:
-                    return 3
-                # 2 Yaşlı = alt seviye (skor: 1)
-                elif '2 YAŞLI' in grup_str or '2 YAŞL' in grup_str:
-                    return 1
-                # Diğer (skor: 4)
-                else:
-                    return 4
-            
-            df['grup_seviye_score'] = df['grup'].apply(get_grup_seviye_score)
+            # grup_seviye_score parse aşamasından
             
             # Atın grup seviye bazlı ağırlıklı performansı
             if 'at_adi' in df.columns and 'sonuc' in df.columns:
@@ -1108,7 +2680,7 @@ class HorseRacingPredictor:
                         scores = success * group_df['grup_seviye_score']
                         return scores.mean() if len(scores) > 0 else 0
                     
-                    at_weighted_grup = df_with_result.groupby('at_adi').apply(weighted_grup_performance).reset_index()
+                    at_weighted_grup = df_with_result.groupby('at_adi', observed=True).apply(weighted_grup_performance).reset_index()
                     at_weighted_grup.columns = ['at_adi', 'at_weighted_grup_performance']
                     df = df.merge(at_weighted_grup, on='at_adi', how='left')
                     df['at_weighted_grup_performance'] = df['at_weighted_grup_performance'].fillna(0)
@@ -1117,54 +2689,10 @@ class HorseRacingPredictor:
         
         # 16.6. Yarış türü (cins_detay) bazlı skorlar (G1>G2>G3>KV>Şartlı>Handikap>Maiden)
         if 'cins_detay' in df.columns:
-            def normalize_text(s: str) -> str:
-                if not isinstance(s, str):
-                    s = str(s)
-                s = s.upper()
-                # Türkçe karakter normalize
-                repl = {
-                    'İ': 'I', 'I': 'I', 'Ş': 'S', 'Ğ': 'G', 'Ü': 'U', 'Ö': 'O', 'Ç': 'C',
-                    'Â': 'A', 'Ê': 'E', 'Ô': 'O'
-                }
-                for k, v in repl.items():
-                    s = s.replace(k, v)
-                # Bazı encoding bozulmaları için alternatifler
-                s = s.replace('Å', 'S').replace('Ä°', 'I').replace('Ã', 'O').replace('Ã', 'U').replace('Ã', 'C').replace('Ä', 'G')
-                return s
-
-            def detect_tur_kategori(x: str) -> str:
-                ux = normalize_text(x)
-                if 'G1' in ux or ' G 1' in ux:
-                    return 'G1'
-                if 'G2' in ux or ' G 2' in ux:
-                    return 'G2'
-                if 'G3' in ux or ' G 3' in ux:
-                    return 'G3'
-                if 'KV' in ux or 'KISA VADE' in ux:
-                    return 'KV'
-                if 'MAID' in ux or 'MAIDEN' in ux:
-                    return 'MAIDEN'
-                if 'HAND' in ux:
-                    return 'HANDIKAP'
-                if 'SART' in ux or 'SARTLI' in ux or 'ŞART' in ux:
-                    return 'SARTLI'
-                return 'DIGER'
-
-            def kategori_weight(cat: str) -> int:
-                weights = {
-                    'G1': 10,
-                    'G2': 9,
-                    'G3': 8,
-                    'KV': 7,
-                    'SARTLI': 5,
-                    'HANDIKAP': 4,
-                    'MAIDEN': 3,
-                    'DIGER': 2,
-                }
-                return weights.get(cat, 2)
-
-            df['tur_kategori'] = df['cins_detay'].apply(detect_tur_kategori)
-            df['tur_agirlik'] = df['tur_kategori'].apply(kategori_weight)
+            # tur_kategori / tur_agirlik parse aşamasından (kolon sırası korunur)
+            for col in ('tur_kategori', 'tur_agirlik'):
+                if col in df.columns:
+                    df[col] = df.pop(col)
 
             # At-tür bazlı başarı oranı
             if 'at_adi' in df.columns and 'sonuc' in df.columns:
@@ -1172,7 +2700,7 @@ class HorseRacingPredictor:
                 df_with_result = df[df['sonuc'].notna()].copy()
                 df_with_result = filter_exclude_dates(df_with_result)
                 if len(df_with_result) > 0:
-                    at_tur_basari = df_with_result.groupby(['at_adi', 'tur_kategori'])['sonuc'].apply(
+                    at_tur_basari = df_with_result.groupby(['at_adi', 'tur_kategori'], observed=True)['sonuc'].apply(
                         lambda x: (x == 1).mean() if len(x) > 0 else 0
                     ).reset_index()
                     at_tur_basari.columns = ['at_adi', 'tur_kategori', 'at_tur_basari']
@@ -1193,7 +2721,7 @@ class HorseRacingPredictor:
                         scores = success * group_df['tur_agirlik']
                         return scores.mean() if len(scores) > 0 else 0
 
-                    at_weighted_tur = df_with_result.groupby('at_adi').apply(weighted_tur_performance).reset_index()
+                    at_weighted_tur = df_with_result.groupby('at_adi', observed=True).apply(weighted_tur_performance).reset_index()
                     at_weighted_tur.columns = ['at_adi', 'at_weighted_tur_performance']
                     df = df.merge(at_weighted_tur, on='at_adi', how='left')
                     df['at_weighted_tur_performance'] = df['at_weighted_tur_performance'].fillna(0)
@@ -1224,8 +2752,8 @@ class HorseRacingPredictor:
                     try:
                         past_df['tarih_dt'] = pd.to_datetime(past_df['tarih'], format='%d/%m/%Y', errors='coerce')
                         # En son tarihi bul
-                        if past_df['tarih_dt'].notna().any():
-                            latest_date = past_df['tarih_dt'].max()
+                        latest_date = global_stats.get('latest_date', past_df['tarih_dt'].max())
+                        if pd.notna(latest_date):
                             # Son 1 yıl içindeki koşuları filtrele
                             one_year_ago = latest_date - pd.Timedelta(days=365)
                             past_df = past_df[past_df['tarih_dt'] >= one_year_ago].copy()
@@ -1240,8 +2768,9 @@ class HorseRacingPredictor:
                     
                     return len(at_races)  # Sadece sayı
                 
-                df['at_ust_duzey_deneyim'] = df['at_adi'].apply(calculate_ust_duzey_count)
+                df['at_ust_duzey_deneyim'] = apply_rows(df['at_adi'], calculate_ust_duzey_count)
 
+        self.profiler.block('form', rows=len(df))
         # === GÜÇLENDİRİLMİŞ FORM FEATURE'LARI ===
         # 17. Gelişmiş form durumu ve benzer koşullardaki performans
         if 'at_adi' in df.columns and 'tarih' in df.columns and 'sonuc' in df.columns:
@@ -1331,8 +2860,8 @@ class HorseRacingPredictor:
                 last6 = at_past.head(6).copy()
                 if len(last6) > 0:
                     last6['rank'] = pd.to_numeric(last6['sonuc_numeric'], errors='coerce')
-                    if 'cins_detay' in last6.columns:
-                        last6['cw'] = last6['cins_detay'].apply(lambda s: _class_weight(s) if pd.notna(s) else 0.4)
+                    if 'race_class_weight' in last6.columns:
+                        last6['cw'] = last6['race_class_weight']
                     else:
                         last6['cw'] = 0.4
                     def rank_to_score(r):
@@ -1445,9 +2974,10 @@ class HorseRacingPredictor:
                 })
             
             # Her satır için form feature'larını hesapla
-            form_features = df.apply(calculate_form_features, axis=1)
+            form_features = apply_rows(df, calculate_form_features)
             df = pd.concat([df, form_features], axis=1)
         
+        self.profiler.block('surpriz_balon', rows=len(df))
         # === SÜRPRİZ ve BALON POTANSİYELİ FEATURE'LARI ===
         # 23. Atın sürpriz potansiyeli ve balon potansiyeli (agf1_sira bazlı)
         if 'agf1_sira' in df.columns and 'at_adi' in df.columns and 'sonuc' in df.columns and 'tarih' in df.columns:
@@ -1519,21 +3049,73 @@ class HorseRacingPredictor:
                 })
             
             # Her satır için sürpriz/balon feature'larını hesapla
-            surpriz_balon_features = df.apply(calculate_surpriz_balon, axis=1)
+            surpriz_balon_features = apply_rows(df, calculate_surpriz_balon)
             df = pd.concat([df, surpriz_balon_features], axis=1)
         
         print(f"✅ {len(df.columns)} feature oluşturuldu")
         return df
 
-    def prepare_features(self, df, exclude_dates=None):
+    def featurize_targets(self, history, targets, exclude_dates=None):
+        """Hedef satırların (örn. bugünün koşuları) feature'larını geçmiş bağlamına karşı hesapla
+        
+        Geçmiş veri tekrar yüklenmez; atın geçmişini tarayan satır bazlı feature'lar
+        sadece hedef satırlar (ve rakip kalitesi için gereken geçmiş rakip satırları)
+        için hesaplanır. Dönen çerçeve hedef satırların sırasını korur.
+        
+        Args:
+            history: Önceden yüklenmiş geçmiş koşular (bağlam)
+            targets: Feature'ı hesaplanacak satırlar
+            exclude_dates: Feature hesaplamasından çıkarılacak tarihler listesi
+        """
+        context = pd.concat([history.assign(_target=False), targets.assign(_target=True)], ignore_index=True)
+        if self.feature_memory_mb and len(targets) > 0:
+            return self.featurize_in_chunks(context, exclude_dates=exclude_dates)
+        features = self.create_advanced_features(context, skip_future_features=False, exclude_dates=exclude_dates)
+        features = features[features['_target'].to_numpy(dtype=bool)].drop(columns=['_target'])
+        return features.reset_index(drop=True)
+
+    def featurize_in_chunks(self, context, exclude_dates=None):
+        """'_target' satırlarını bellek bütçesiyle sınırlı, tarih sıralı chunk'larda featurize et
+
+        Bağlam bir kez indekslenir (FeatureContextIndex); her chunk sadece kendi
+        hedeflerinin okuduğu geçmiş satırlarıyla create_advanced_features'a girer,
+        çerçeve genelindeki değerler tüm bağlamdan bir kez hesaplanır. Sonuç tek
+        parça hesaplamayla aynıdır ve hedef satırların sırasını korur.
+        """
+        if exclude_dates is None:
+            exclude_dates = [self.as_of_date()]
+        index = FeatureContextIndex(context, exclude_dates)
+        global_stats = index.global_stats()
+        max_rows = index.chunk_rows(self.feature_memory_mb)
+
+        targets = np.flatnonzero(context['_target'].to_numpy(dtype=bool))
+        parts, positions = [], []
+        for n, (chunk_targets, rows) in enumerate(index.iter_chunks(targets, max_rows), 1):
+            print(f"   🧩 Feature chunk {n}: {len(chunk_targets)} hedef, {len(rows)} bağlam satırı")
+            chunk = context.iloc[rows].assign(_target=np.isin(rows, chunk_targets))
+            features = self.create_advanced_features(chunk, skip_future_features=False,
+                                                     exclude_dates=exclude_dates, global_stats=global_stats)
+            parts.append(features[features['_target'].to_numpy(dtype=bool)].drop(columns=['_target']))
+            positions.append(rows[np.isin(rows, chunk_targets)])
+            del chunk, features
+        features = pd.concat(parts, ignore_index=True)
+        features = features[FeatureContextIndex.apply_column_order(features.columns, global_stats['row_columns'])]
+        return features.iloc[np.argsort(np.concatenate(positions), kind='stable')].reset_index(drop=True)
+
+    def prepare_features(self, df, exclude_dates=None, history=None):
         """Özellikleri hazırla
         
         Args:
             df: Veri çerçevesi
             exclude_dates: Feature hesaplamasından çıkarılacak tarihler listesi (bugünün tarihi gibi)
+            history: Önceden yüklenmiş tüm veri (tahmin modunda load_data tekrar çağrılmaz)
         """
+        return self.feature_matrix(self.featurize(df, exclude_dates=exclude_dates, history=history))
+
+    @profiled('featurize')
+    def featurize(self, df, exclude_dates=None, history=None):
+        """Training veya tahmin satırları için gelişmiş feature çerçevesini oluştur"""
         target_col = "sonuc"
-        group_col = "yaris_kosu_key"
         
         # exclude_dates None ise boş liste yap
         if exclude_dates is None:
@@ -1551,7 +3133,7 @@ class HorseRacingPredictor:
         
         # Bugünün koşuları için üst düzey deneyim hesaplarken geçmiş veriyi de kullan
         # ÖNEMLİ: Bugünün koşularını tarih bazlı kontrol et, sonuc bilgisi olsa bile bugünün koşuları prediction olarak işlenmeli
-        today = datetime.now().strftime('%d/%m/%Y')
+        today = self.as_of_date()
         is_prediction = False
         if 'tarih' in df.columns:
             today_dates = df['tarih'].unique()
@@ -1563,8 +3145,8 @@ class HorseRacingPredictor:
                 is_prediction = target_col not in df.columns or df[target_col].notna().sum() == 0
         if is_prediction and 'tarih' in df.columns:
             try:
-                # Geçmiş veriyi yükle
-                all_data = self.load_data()
+                # Geçmiş veri: verilmişse onu kullan, yoksa yükle
+                all_data = history if history is not None else self.load_data()
                 if 'tarih' in all_data.columns:
                     # Bugünün tarihini al (datetime formatında)
                     today_dates_str = df['tarih'].unique()
@@ -1607,14 +3189,9 @@ class HorseRacingPredictor:
                             if col in df_clean.columns:
                                 df_clean[col] = None
                         
-                        # Geçmiş veriyi de ekleyerek feature'ları oluştur
-                        df_with_past = pd.concat([past_races, df_clean], ignore_index=True)
+                        # Geçmiş bağlamına karşı sadece bugünün satırlarını featurize et
                         # Bugünün tarihlerini exclude et (data leakage önleme)
-                        all_features = self.create_advanced_features(df_with_past, skip_future_features=False, exclude_dates=list(today_dates_str))
-                        
-                        # Bugünün koşuları için gelecekteki feature'ları (ganyan_numeric, agf1_numeric, agf2_numeric)
-                        today_features = all_features[all_features['tarih'].isin(today_dates_str)].copy()
-                        past_features = all_features[~all_features['tarih'].isin(today_dates_str)].copy()
+                        today_features = self.featurize_targets(past_races, df_clean, exclude_dates=list(today_dates_str))
                         
                         # Bugünün koşularındaki SONUC bilgisini de temizle (çünkü create_advanced_features içinde kullanılmış olabilir)
                         if 'sonuc' in today_features.columns:
@@ -1642,7 +3219,7 @@ class HorseRacingPredictor:
             training_exclude_dates = list(exclude_dates) if exclude_dates else []
             
             # Ekstra güvenlik: bugünün tarihini de ekle (eğer zaten yoksa)
-            today = datetime.now().strftime('%d/%m/%Y')
+            today = self.as_of_date()
             if today not in training_exclude_dates:
                 training_exclude_dates.append(today)
             
@@ -1697,7 +3274,25 @@ class HorseRacingPredictor:
             print(f"   📊 Training için {len(df)} satır kullanılacak (exclude_dates: {training_exclude_dates})")
             
             # create_advanced_features'a geçirilen df içinde KESİNLİKLE bugünün verisi olmamalı
-            df = self.create_advanced_features(df, skip_future_features=False, exclude_dates=training_exclude_dates)
+            shared = None
+            if history is not None and '_shared' in history.columns:
+                shared = history[history['_shared'].to_numpy(dtype=bool) & ~history['tarih'].isin(training_exclude_dates).to_numpy()]
+            if shared is not None and len(shared) > 0:
+                # Ortak geçmiş satırları bağlam olarak (tahmin tarafıyla aynı şekilde)
+                shared = shared.drop(columns=['tarih_dt'], errors='ignore')
+                df = self.featurize_targets(shared, df, exclude_dates=training_exclude_dates)
+            elif self.feature_memory_mb:
+                # Bellek bütçesi: tüm training satırları hedef, kendi bağlamlarıyla chunk'larda
+                df = self.featurize_targets(df.iloc[0:0], df, exclude_dates=training_exclude_dates)
+            else:
+                df = self.create_advanced_features(df, skip_future_features=False, exclude_dates=training_exclude_dates)
+        return df
+
+    @profiled('feature_matrix')
+    def feature_matrix(self, df):
+        """Feature çerçevesinden model girdisi (X), hedef (y) ve koşu grupları"""
+        target_col = "sonuc"
+        group_col = "yaris_kosu_key"
         
         # Sonuc sütunu varsa y ve groups oluştur
         if target_col in df.columns and df[target_col].notna().sum() > 0:
@@ -1724,9 +3319,10 @@ class HorseRacingPredictor:
             target_col, group_col,
             "at_key", "sahip_kodu", "antrenor_kodu", "jokey_kodu",
             "derece", "fark", "son800", "gec_cikis_boy", "no",
-            "grup_seviye_score",  # Geçici feature
+            "grup_seviye_score", "pist_tur",  # Geçici feature'lar
             "tarih_dt", "sonuc_numeric",  # Geçici feature'lar
             "tarih",  # Tarih sütunu feature olarak kullanılmaz
+            "_shared",  # Ortak geçmiş bayrağı
             "at_surpriz_potansiyeli", "at_balon_potansiyeli",  # Sadece tahmin çıktısında gösterilecek, modele dahil değil
             "agf1_sira_numeric",  # Geçici feature
             "ganyan_numeric", "agf1_numeric", "agf2_numeric",  # Ganyan ve AGF feature'ları kaldırıldı (model eğitimi ve tahminde kullanılmıyor)
@@ -1739,62 +3335,59 @@ class HorseRacingPredictor:
         cat_cols = [c for c in X.columns if X[c].dtype == "object" or str(X[c].dtype).startswith('category')]
         num_cols = [c for c in X.columns if c not in cat_cols]
         
-        # Feature pruning/normalization: clip ve log1p
-        if len(num_cols) > 0:
-            for c in num_cols:
-                try:
-                    q1 = X[c].quantile(0.01)
-                    q99 = X[c].quantile(0.99)
-                    if pd.notna(q1) and pd.notna(q99) and q99 > q1:
-                        X[c] = X[c].clip(q1, q99)
-                    if X[c].min() >= 0:
-                        X[c] = np.log1p(X[c])
-                except Exception:
-                    continue
-            # Yüksek korelasyonlu numeric kolonları düşür
-            try:
-                corr = X[num_cols].corr().abs()
-                upper = corr.where(np.triu(np.ones(corr.shape), k=1).astype(bool))
-                to_drop = [column for column in upper.columns if any(upper[column] > 0.98)]
-                if to_drop:
-                    X = X.drop(columns=[c for c in to_drop if c in X.columns])
-                    num_cols = [c for c in num_cols if c not in to_drop]
-            except Exception:
-                pass
-        
+        # Clip/log1p/korelasyon budaması FeaturePreprocessor'da (training'de fit edilir)
         print(f"📊 Özellikler: {len(X.columns)} (Numeric: {len(num_cols)}, Categorical: {len(cat_cols)})")
         
         return X, y, groups, cat_cols, num_cols
     
-    def train_ensemble_models(self, X, y, groups, cat_cols, num_cols):
-        """Ensemble modelleri eğit (5 Decision Tree + XGBoost + XGBRanker)"""
+    def _race_order(self, groups):
+        """Satırları koşu (yaris_kosu_key) bazında bitişik olacak şekilde sırala
+
+        Returns:
+            order: Kararlı (mergesort) sıralama indeksleri
+            qid: Sıralanmış satırların koşu kimlikleri (int)
+        """
+        qid_all, _ = pd.factorize(pd.Series(np.asarray(groups)).astype(str), sort=True)
+        order = np.argsort(qid_all, kind='mergesort')
+        return order, qid_all[order]
+
+    def train_race_ranker(self, X, y, groups, params=None, objective=None, n_estimators=300):
+        """Koşu bazlı sıralayıcı eğit (satırlar yaris_kosu_key'e göre sıralanır, qid verilir)
+
+        Args:
+            X, y, groups: Özellikler, hedef (kazandı=1) ve koşu anahtarları
+            params: max_depth/learning_rate/subsample/colsample_bytree
+            objective: 'rank:pairwise', 'rank:ndcg' veya 'listwise' (varsayılan: self.ranker_objective)
+        """
+        objective = objective or self.ranker_objective
+        order, qid = self._race_order(groups)
+        X_sorted = X.iloc[order]
+        y_sorted = np.asarray(y)[order]
+        params = dict(params or {})
+        if objective == 'listwise':
+            model = ListwiseSoftmaxRanker(n_estimators=n_estimators, random_state=42, **params)
+        else:
+            model = XGBRanker(n_estimators=n_estimators, random_state=42, objective=objective, **params)
+        model.fit(X_sorted, y_sorted, qid=qid)
+        return model
+
+    @profiled('train_ensemble_models')
+    def train_ensemble_models(self, X, y, groups, cat_cols, num_cols, history=None):
+        """Ensemble modelleri eğit (5 Decision Tree + XGBoost + XGBRanker)
+
+        Args:
+            history: Eğitim koşularını kapsayan geçmiş (verilirse kalibratöre
+                zaman-noktası H2H z-skoru girdi olarak eklenir)
+        """
         print(f"🤖 {self.hipodrom_key} ensemble modelleri eğitiliyor...")
         
-        # Categorical feature'ları encode et
-        X_enc = X.copy()
-        les = {}
-        for c in cat_cols:
-            le = LabelEncoder()
-            # Fit et ve transform et
-            X_enc[c] = le.fit_transform(X_enc[c].astype(str))
-            les[c] = le
-            # Unseen kategoriler için max+1 değerini sakla (prediction için)
-            if not hasattr(le, 'unknown_value'):
-                le.unknown_value = len(le.classes_)
-        
-        # Numeric feature'ları impute et
-        for c in num_cols:
-            if X_enc[c].isna().any():
-                median_val = X_enc[c].median()
-                X_enc[c] = X_enc[c].fillna(median_val)
-                # Training median'larını sakla
-                self.numeric_medians[c] = median_val
-            else:
-                # NaN yoksa bile median'ı sakla (prediction için)
-                self.numeric_medians[c] = X_enc[c].median()
-        
-        self.label_encoders = les  # Sonraki kullanım için sakla
+        self.profiler.block('preprocess', rows=len(X))
+        # Ön işlemeyi fit et: clip/log1p, korelasyon budaması, kategori kodları, median impute
+        self.preprocessor = FeaturePreprocessor()
+        X_enc = self.preprocessor.fit_transform(X, cat_cols, num_cols)
+        cat_cols, num_cols = self.preprocessor.cat_cols, self.preprocessor.num_cols
         
+        self.profiler.block('dt_grid', rows=len(X))
         # 1. Decision Tree kısa grid araması ve en iyi 5 konfigürasyonu seçme
         print("🌳 Decision Tree kısa grid araması...")
         candidate_dt = [
@@ -1829,6 +3422,7 @@ class HorseRacingPredictor:
             dt_models.append(dt)
             print(f"   ✅ Decision Tree {i+1} eğitildi")
         
+        self.profiler.block('xgb_grid', rows=len(X))
         # 2. XGBoost kısa grid araması
         print("🚀 XGBoost kısa grid araması...")
         xgb_candidates = [
@@ -1857,6 +3451,7 @@ class HorseRacingPredictor:
         xgb_model.fit(X_enc, y)
         print("   ✅ XGBoost eğitildi")
         
+        self.profiler.block('ranker_grid', rows=len(X))
         # 3. XGBRanker Modeli (ranking için)
         print("🏆 XGBRanker kısa grid araması...")
         rank_candidates = [
@@ -1865,66 +3460,53 @@ class HorseRacingPredictor:
             {"max_depth": 10, "learning_rate": 0.06, "subsample": 1.0, "colsample_bytree": 0.8},
         ]
         gkf_rank = GroupKFold(n_splits=min(3, max(2, len(X_enc)//2)))
-        best_r_auc, best_r_cfg = -1.0, None
+        best_r_ndcg, best_r_cfg, best_r_top1 = -1.0, None, float('nan')
         for cfg in rank_candidates:
-            aucs = []
+            ndcgs, top1s = [], []
             for tr, va in gkf_rank.split(X_enc, y, groups):
-                mdl = XGBRanker(n_estimators=300, random_state=42, objective='rank:pairwise', **cfg)
-                # group sizes for train split
-                tr_groups = groups.iloc[tr]
-                tr_counts = tr_groups.value_counts()
-                tr_sizes = [tr_counts[g] for g in tr_groups.unique()]
                 try:
-                    mdl.fit(X_enc.iloc[tr], y.iloc[tr], group=tr_sizes)
+                    # Satırlar koşu bazında sıralanır, her koşu kendi qid'ine sahip
+                    mdl = self.train_race_ranker(X_enc.iloc[tr], y.iloc[tr], groups.iloc[tr], params=cfg)
                     p = mdl.predict(X_enc.iloc[va])
-                    aucs.append(roc_auc_score(y.iloc[va], p))
+                    m = race_ranking_metrics(y.iloc[va], p, groups.iloc[va])
+                    if m['n_races'] > 0:
+                        ndcgs.append(m['NDCG'])
+                        top1s.append(m['Top1'])
                 except Exception:
                     pass
-            mean_auc = np.mean(aucs) if aucs else -1.0
-            if mean_auc > best_r_auc:
-                best_r_auc, best_r_cfg = mean_auc, cfg
-        print(f"   ✅ En iyi XGBRanker: {best_r_cfg} (AUC~{best_r_auc:.4f})")
-        xgb_ranker = XGBRanker(n_estimators=300, random_state=42, objective='rank:pairwise', **best_r_cfg)
-        group_counts = groups.value_counts()
-        group_sizes = [group_counts[g] for g in groups.unique()]
-        xgb_ranker.fit(X_enc, y, group=group_sizes)
+            mean_ndcg = np.mean(ndcgs) if ndcgs else -1.0
+            if mean_ndcg > best_r_ndcg or best_r_cfg is None:
+                best_r_ndcg, best_r_cfg = mean_ndcg, cfg
+                best_r_top1 = np.mean(top1s) if top1s else float('nan')
+        print(f"   ✅ En iyi XGBRanker ({self.ranker_objective}): {best_r_cfg} (NDCG~{best_r_ndcg:.4f}, Top-1~{best_r_top1:.4f})")
+        xgb_ranker = self.train_race_ranker(X_enc, y, groups, params=best_r_cfg)
         print("   ✅ XGBRanker eğitildi")
         
+        self.profiler.block('oof_stacking', rows=len(X))
         # 4. Stacking meta-learner (Logistic Regression) - OOF eğitim
         print("🧱 Stacking meta-learner hazırlanıyor (OOF)...")
         n_splits_meta = min(5, max(2, len(X_enc)//2))
         gkf_meta = GroupKFold(n_splits=n_splits_meta)
         oof_meta = np.zeros((len(X_enc), 7), dtype=float)
+        # Fold modelleri final modellerle aynı konfigürasyonla eğitilir: kalibratörün
+        # OOF'ta öğrendiği ağırlıklar tahmindeki skorlarla aynı ölçeğe uygulanır
         for tr_idx, va_idx in gkf_meta.split(X_enc, y, groups):
             X_tr, X_va = X_enc.iloc[tr_idx], X_enc.iloc[va_idx]
             y_tr = y.iloc[tr_idx]
             # Decision Trees (yeniden fit)
             fold_dt_preds = []
-            for config in [
-                {"max_depth": 10, "min_samples_split": 5, "min_samples_leaf": 2, "random_state": 42},
-                {"max_depth": 15, "min_samples_split": 3, "min_samples_leaf": 1, "random_state": 43},
-                {"max_depth": 8, "min_samples_split": 10, "min_samples_leaf": 5, "random_state": 44},
-                {"max_depth": 12, "min_samples_split": 7, "min_samples_leaf": 3, "random_state": 45},
-                {"max_depth": 20, "min_samples_split": 2, "min_samples_leaf": 1, "random_state": 46}
-            ]:
-                dt_f = DecisionTreeClassifier(**config)
+            for i, config in enumerate(best_dt_configs):
+                dt_f = DecisionTreeClassifier(random_state=42+i, **config)
                 dt_f.fit(X_tr, y_tr)
                 fold_dt_preds.append(dt_f.predict_proba(X_va)[:, 1])
-            oof_meta[va_idx, 0:5] = np.column_stack(fold_dt_preds)
+            oof_meta[va_idx, 0:len(fold_dt_preds)] = np.column_stack(fold_dt_preds)
             # XGB (yeniden fit)
-            xgb_f = xgb.XGBClassifier(
-                n_estimators=200, max_depth=8, learning_rate=0.1, subsample=0.8, colsample_bytree=0.8,
-                random_state=42, eval_metric='logloss'
-            )
+            xgb_f = xgb.XGBClassifier(n_estimators=300, random_state=42, eval_metric='logloss', **best_cfg)
             xgb_f.fit(X_tr, y_tr)
             oof_meta[va_idx, 5] = xgb_f.predict_proba(X_va)[:, 1]
-            # XGBRanker (fallback olarak sınıflandırıcı skoru)
+            # XGBRanker (koşu bazlı qid; hata olursa sınıflandırıcı skoru)
             try:
-                xgbr_f = XGBRanker(
-                    n_estimators=200, max_depth=6, learning_rate=0.1, subsample=0.8, colsample_bytree=0.8,
-                    random_state=42, objective='rank:pairwise'
-                )
-                xgbr_f.fit(X_tr, y_tr, group=np.ones(len(X_tr)))
+                xgbr_f = self.train_race_ranker(X_tr, y_tr, groups.iloc[tr_idx], params=best_r_cfg)
                 oof_meta[va_idx, 6] = xgbr_f.predict(X_va)
             except Exception:
                 oof_meta[va_idx, 6] = xgb_f.predict_proba(X_va)[:, 1]
@@ -1934,14 +3516,29 @@ class HorseRacingPredictor:
         meta.fit(oof_meta, y.values)
         print("   ✅ Meta-learner eğitildi")
 
+        # Koşu bazlı koşullu logit katmanı: OOF skorları + blend terimleri + H2H z-skoru
+        # (sabit blend/H2H ağırlıkları yerine hepsinin ağırlığı birlikte öğrenilir)
+        race_codes = pd.factorize(np.asarray(groups))[0]
+        h2h = self.training_h2h_scores(X, groups, history) if history is not None else None
+        cal_input, cal_names = self.calibrator_inputs(oof_meta, X.reset_index(drop=True), race_codes, h2h=h2h)
+        calibrator = ConditionalLogitCalibrator(temperature=1.0, input_names=cal_names)
+        calibrator.fit(cal_input, groups, y.values)
+        cal_m = race_ranking_metrics(y.values, calibrator.utility(cal_input), groups)
+        print(f"   ✅ Koşullu logit kalibrasyonu eğitildi ({len(cal_names)} girdi, "
+              f"OOF NDCG~{cal_m['NDCG']:.4f}, Top-1~{cal_m['Top1']:.4f})")
+        if 'h2h' in cal_names:
+            print(f"   ⚔️ Öğrenilen H2H ağırlığı: {calibrator.coef_[cal_names.index('h2h')]:.4f}")
+
         # Tüm modelleri sakla
         self.ensemble_models = {
             'decision_trees': dt_models,
             'xgboost': xgb_model,
             'xgb_ranker': xgb_ranker,
-            'meta': meta
+            'meta': meta,
+            'calibrator': calibrator
         }
         
+        self.profiler.block('cv_eval', rows=len(X))
         # Cross-validation ile performans değerlendirme
         print("📊 Cross-validation ile performans değerlendiriliyor...")
         n_samples = len(X_enc)
@@ -1951,6 +3548,7 @@ class HorseRacingPredictor:
         
         gkf = GroupKFold(n_splits=n_splits)
         all_aucs, all_lls, all_hit1 = [], [], []
+        all_rank_ndcg, all_rank_top1 = [], []
         oof_ensemble = np.zeros(len(X_enc))
         
         for tr, va in gkf.split(X_enc, y, groups):
@@ -1964,15 +3562,12 @@ class HorseRacingPredictor:
             xgb_model.fit(X_enc.iloc[tr], y.iloc[tr])
             xgb_pred = xgb_model.predict_proba(X_enc.iloc[va])[:, 1]
             
-            # XGBRanker için group bilgilerini hazırla
-            tr_groups = groups.iloc[tr]
-            tr_group_counts = tr_groups.value_counts()
-            tr_group_sizes = []
-            for group in tr_groups.unique():
-                tr_group_sizes.append(tr_group_counts[group])
-            
-            xgb_ranker.fit(X_enc.iloc[tr], y.iloc[tr], group=tr_group_sizes)
-            xgb_ranker_pred = xgb_ranker.predict(X_enc.iloc[va])
+            # XGBRanker: fold modeli ayrı eğitilir (final sıralayıcı korunur)
+            fold_ranker = self.train_race_ranker(X_enc.iloc[tr], y.iloc[tr], groups.iloc[tr], params=best_r_cfg)
+            xgb_ranker_pred = fold_ranker.predict(X_enc.iloc[va])
+            rank_m = race_ranking_metrics(y.iloc[va], xgb_ranker_pred, groups.iloc[va])
+            all_rank_ndcg.append(rank_m['NDCG'])
+            all_rank_top1.append(rank_m['Top1'])
             
             # Ensemble prediction (tüm modellerin ortalaması)
             ensemble_pred = np.mean(dt_predictions + [xgb_pred, xgb_ranker_pred], axis=0)
@@ -1980,7 +3575,8 @@ class HorseRacingPredictor:
             
             # Metrikleri hesapla
             all_aucs.append(roc_auc_score(y.iloc[va], ensemble_pred))
-            all_lls.append(log_loss(y.iloc[va], ensemble_pred))
+            # Sıralayıcı skorları [0,1] dışında olabilir; log_loss için kırp
+            all_lls.append(log_loss(y.iloc[va], np.clip(ensemble_pred, 1e-6, 1 - 1e-6)))
             
             g = groups.iloc[va].reset_index(drop=True)
             yv = y.iloc[va].reset_index(drop=True)
@@ -1999,6 +3595,8 @@ class HorseRacingPredictor:
             "AUC_std": float(np.nanstd(all_aucs)),
             "LogLoss_mean": float(np.nanmean(all_lls)),
             "Hit@1_mean": float(np.nanmean(all_hit1)),
+            "Ranker_NDCG_mean": float(np.nanmean(all_rank_ndcg)) if all_rank_ndcg else float('nan'),
+            "Ranker_Top1_mean": float(np.nanmean(all_rank_top1)) if all_rank_top1 else float('nan'),
             "n_folds": len(all_aucs)
         }
         
@@ -2006,7 +3604,9 @@ class HorseRacingPredictor:
         print(f"   AUC: {results['AUC_mean']:.4f} ± {results['AUC_std']:.4f}")
         print(f"   Hit@1: {results['Hit@1_mean']:.4f}")
         print(f"   LogLoss: {results['LogLoss_mean']:.4f}")
+        print(f"   XGBRanker NDCG: {results['Ranker_NDCG_mean']:.4f} | Top-1: {results['Ranker_Top1_mean']:.4f}")
         
+        self.profiler.block('final_fit', rows=len(X))
         # Feature importance göster
         try:
             print("\n🔍 Top Feature Importances:")
@@ -2073,335 +3673,435 @@ class HorseRacingPredictor:
         
         return self.ensemble_models, proba_all, results
     
-    def train_model(self, X, y, groups, cat_cols, num_cols):
+    def train_model(self, X, y, groups, cat_cols, num_cols, history=None):
         """Modeli eğit - ensemble modelleri kullan"""
-        return self.train_ensemble_models(X, y, groups, cat_cols, num_cols)
+        return self.train_ensemble_models(X, y, groups, cat_cols, num_cols, history=history)
     
-    def save_predictions(self, df, proba_all):
-        """Tahminleri kaydet"""
-        print(f"💾 {self.hipodrom_key} tahminleri kaydediliyor...")
-        
-        df["win_proba"] = proba_all
+    def context_weight_matrix(self, predict_df):
+        """Satır bazında koşu tipi model ağırlıkları (n_samples, 7)"""
+        cins = predict_df['cins_detay'].astype(str).str.upper()
+        if 'race_class_weight' in predict_df.columns:
+            high = pd.to_numeric(predict_df['race_class_weight'], errors='coerce').to_numpy() >= 0.8
+        else:
+            high = cins.str.contains(r'G1|G 1|G2|G 2|G3|G 3|KV').to_numpy()
+        # Maiden/Şartlı 1 tespiti
+        maiden_s1 = cins.str.contains(r'MAID|ŞARTLI 1|SARTLI 1').to_numpy()
+        weights = {k: np.asarray(v, dtype=float) for k, v in self.context_model_weights.items()}
+        W = np.where(high[:, None], weights['high'], weights['low'])
+        return np.where(maiden_s1[:, None], weights['maiden_s1'], W)
+
+    def blend_terms(self, frame, scores, race_codes, names=None):
+        """blend_bonus_weights terimleri: koşu içi [0, 1] normalize (n_samples, n_terms) matris
+
+        Her kolon koşu bazında groupby-transform ile min-max normalize edilir;
+        sabit, eksik veya çerçevede bulunmayan kolonlar o koşuda 0 verir.
+
+        Args:
+            frame: Feature çerçevesi (satırlar scores/race_codes ile pozisyonel hizalı)
+            scores: Model skorları (n_samples, 7); 'consensus' terimi bunlardan türetilir
+            names: Sadece bu terimler (bu sırayla); verilmezse tüm blend_bonus_weights
+        """
+        kinds = {col: kind for col, _, kind in self.blend_bonus_weights}
+        names = list(kinds) if names is None else list(names)
+        terms = np.zeros((len(frame), len(names)))
+        for j, col in enumerate(names):
+            kind = kinds.get(col, 'minmax')
+            if kind == 'consensus':
+                # Model konsensüsü: skorların std'si düşükse yüksek anlaşma
+                if scores is None:
+                    continue
+                stds = np.nanstd(np.asarray(scores, dtype=float), axis=1)
+                values = 1.0 - group_minmax_norm(stds, race_codes)
+            else:
+                if col not in frame.columns:
+                    continue
+                arr = pd.to_numeric(frame[col], errors='coerce').to_numpy(dtype=float)
+                if kind == 'inverse':
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        arr = 1.0 / np.clip(arr, 1e-6, None)
+                values = group_minmax_norm(arr, race_codes)
+            terms[:, j] = np.nan_to_num(values, nan=0.0)
+        return terms
+
+    def blend_bonus(self, frame, scores, race_codes):
+        """ESKİ YOL: sabit blend_bonus_weights ağırlıklarıyla koşu içi bonus
+
+        Sadece koşullu logit kalibratörü olmayan ölçekleme yollarında (eski
+        model paketleri, use_softmax_calibration=False) kullanılır; kalibratör
+        aktifken aynı terimler calibrator_inputs ile girdi olur.
+        """
+        weights = np.array([weight for _, weight, _ in self.blend_bonus_weights], dtype=float)
+        return self.blend_terms(frame, scores, race_codes) @ weights
+
+    def calibrator_inputs(self, scores, frame, race_codes, h2h=None, names=None):
+        """Koşullu logit girdileri: model skorları + bağlam blendi + blend terimleri + H2H z-skoru
+
+        Eğitimde (names=None) kolon düzeni belirlenip kalibratörde saklanır;
+        tahminde aynı düzen names ile yeniden kurulur.
+
+        Args:
+            scores: Model skorları (n_samples, 7) - eğitimde OOF, tahminde final modeller
+            frame: Feature çerçevesi (satırlar scores ile pozisyonel hizalı)
+            h2h: Satır bazında H2H z-skoru (alpha=1); yoksa kolon eklenmez / 0 olur
+
+        Returns:
+            (girdi matrisi, kolon adları)
+        """
+        scores = np.asarray(scores, dtype=float)
+        model_names = [f'model_score_{k+1}' for k in range(scores.shape[1])]
+        if names is None:
+            names = list(model_names)
+            if self.use_context_weights and 'cins_detay' in frame.columns:
+                names.append('context_blend')
+            names += [col for col, _, _ in self.blend_bonus_weights]
+            if h2h is not None:
+                names.append('h2h')
+        term_names = [n for n in names if n not in model_names and n not in ('context_blend', 'h2h')]
+        terms = dict(zip(term_names, self.blend_terms(frame, scores, race_codes, names=term_names).T))
+        columns = []
+        for name in names:
+            if name in model_names:
+                columns.append(scores[:, model_names.index(name)])
+            elif name == 'context_blend':
+                # Koşu tipi bazlı sabit ağırlıklı model ortalaması (bağlam etkileşimi)
+                if 'cins_detay' in frame.columns:
+                    columns.append(np.einsum('ij,ij->i', scores, self.context_weight_matrix(frame)))
+                else:
+                    columns.append(np.zeros(len(scores)))
+            elif name == 'h2h':
+                columns.append(np.zeros(len(scores)) if h2h is None else np.asarray(h2h, dtype=float))
+            else:
+                columns.append(terms[name])
+        return np.column_stack(columns), list(names)
+
+    @profiled('h2h_boost')
+    def compute_h2h_boosts(self, predict_df, alpha=1.5, history=None):
+        """Bugünün koşuları için H2H (kim kimi geçti) logit boost'ları
+
+        Geçmiş koşulardan çift tablosu bir kez kurulur; her koşuda at×at
+        üstünlük toplamları z-skora çevrilip alpha ile ölçeklenir.
+        """
+        boosts = np.zeros(len(predict_df))
+        # Geçmiş veri (rakip karşılaştırmaları için)
+        hist = self.h2h_history(history if history is not None else self.load_data())
+        if hist is None or 'at_adi' not in predict_df.columns:
+            return boosts
+        # Bugünün verilerini ve bugünkü yarış anahtarlarını açıkça hariç tut
+        if 'tarih' in predict_df.columns:
+            pred_dates = set(predict_df['tarih'].dropna().unique())
+            if pred_dates:
+                hist = hist[~hist['tarih'].isin(pred_dates)]
+        if 'yaris_kosu_key' in hist.columns and 'yaris_kosu_key' in predict_df.columns:
+            cur_keys = set(predict_df['yaris_kosu_key'].dropna().unique())
+            if cur_keys:
+                hist = hist[~hist['yaris_kosu_key'].isin(cur_keys)]
+        table = PairwiseHistoryTable(hist, now=self.now())
+
+        # Grup sütunu: tercihen 'saat' varsa onunla, yoksa 'yaris_kosu_key'
+        group_col = 'saat' if 'saat' in predict_df.columns else ('yaris_kosu_key' if 'yaris_kosu_key' in predict_df.columns else None)
+        groups = {'': np.arange(len(predict_df))} if group_col is None else predict_df.groupby(group_col, observed=True).indices
+        for g_key, pos in groups.items():
+            if len(pos) < 2:
+                continue
+            g_df = predict_df.iloc[pos]
+            # Mevcut yarışın bağlamı
+            cur_m = g_df['mesafe'].iloc[0] if 'mesafe' in g_df.columns else np.nan
+            cur_p = str(g_df['pist'].iloc[0]).lower() if 'pist' in g_df.columns else ''
+            vals = table.race_scores(g_df['at_adi'].astype(str).to_numpy(), cur_m, cur_p)
+            boosts[pos] = alpha * h2h_zscore(vals)
+        return boosts
+
+    def h2h_history(self, history):
+        """H2H tablosu için sonucu belli geçmiş satırlar (rank_num, tarih_dt ile); veri yoksa None"""
+        if 'tarih' not in history.columns or 'sonuc' not in history.columns:
+            return None
+        hist = history[history['sonuc'].notna()].copy()
+        if 'tarih_dt' not in hist.columns:
+            hist['tarih_dt'] = pd.to_datetime(hist['tarih'], format='%d/%m/%Y', errors='coerce')
+        hist['rank_num'] = pd.to_numeric(hist['sonuc'], errors='coerce')
+        return hist
+
+    @profiled('h2h_train')
+    def training_h2h_scores(self, X, groups, history):
+        """Eğitim satırları için zaman-noktası H2H z-skorları (compute_h2h_boosts ile aynı ölçek, alpha=1)
+
+        Her eğitim koşusu sadece kendi tarihinden önceki karşılaşmalarla
+        skorlanır ve tazelik o koşunun tarihine göre hesaplanır; böylece
+        kalibratör H2H ağırlığını sızıntısız OOF skorlarıyla birlikte öğrenir.
+        """
+        h2h = np.zeros(len(X))
+        hist = self.h2h_history(history)
+        if hist is None or 'at_adi' not in X.columns:
+            return h2h
+        table = PairwiseHistoryTable(hist, now=self.now())
+        horses = X['at_adi'].astype(str).to_numpy()
+        race_pos = pd.DataFrame({'g': np.asarray(groups)}).groupby('g', sort=False).indices
+        for key, pos in race_pos.items():
+            r = table.race_keys.get_indexer([key])[0]
+            if len(pos) < 2 or r < 0 or np.isnat(table.race_dt[r]):
+                continue
+            cur_p = '' if table.race_pist_missing[r] else table.race_pist[r]
+            vals = table.race_scores(horses[pos], table.race_mesafe[r], cur_p, before=table.race_dt[r])
+            h2h[pos] = h2h_zscore(vals)
+        return h2h
+
+    @profiled('save_model_bundle')
+    def save_model_bundle(self, path=None):
+        """Eğitilmiş ensemble + encoder/median bilgilerini diske kaydet (batch tahmin için)"""
+        path = path or self.model_file
+        bundle = {
+            'hipodrom_key': self.hipodrom_key,
+            'trained_at': turkey_time().strftime('%d/%m/%Y %H:%M:%S'),
+            'ensemble_models': self.ensemble_models,
+            'preprocessor': self.preprocessor,
+            'feature_names': self.feature_names,
+        }
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            joblib.dump(bundle, path)
+            print(f"💾 Model kaydedildi: {path}")
+            return path
+        except Exception as e:
+            print(f"⚠️ Model kaydedilemedi: {e}")
+            return None
+
+    @profiled('load_model_bundle')
+    def load_model_bundle(self, path=None):
+        """Kaydedilmiş modeli yükle; yoksa False döner"""
+        path = path or self.model_file
+        if not os.path.exists(path):
+            return False
+        try:
+            bundle = joblib.load(path)
+        except Exception as e:
+            print(f"⚠️ Model yüklenemedi ({path}): {e}")
+            return False
+        if bundle.get('preprocessor') is None:
+            print(f"⚠️ Model eski formatta (ön işleme yok), yeniden eğitilmeli: {path}")
+            return False
+        self.ensemble_models = bundle['ensemble_models']
+        self.model = self.ensemble_models
+        self.preprocessor = bundle['preprocessor']
+        self.feature_names = bundle.get('feature_names', [])
+        print(f"📦 Model yüklendi: {path} (eğitim: {bundle.get('trained_at', '?')})")
+        return True
+
+    @profiled('encode_predict_features')
+    def encode_predict_features(self, X_predict):
+        """Tahmin satırlarına training'de fit edilen ön işlemeyi uygula"""
+        return self.preprocessor.transform(X_predict)
+
+    @profiled('predict_ensemble')
+    def predict_ensemble(self, X_predict_enc):
+        """Tüm ensemble modellerini tek batch'te çalıştır → (n_samples, 7) skor matrisi"""
+        ensemble_predictions = []
         
-        # At adı sütununu bul
-        name_col = None
-        for c in ["at_adi", "at_ismi", "at"]:
-            if c in df.columns:
-                name_col = c
-                break
+        # Decision Tree'lerden prediction al
+        for i, dt in enumerate(self.ensemble_models['decision_trees']):
+            dt_pred = dt.predict_proba(X_predict_enc)[:, 1]
+            ensemble_predictions.append(dt_pred)
+            print(f"   ✅ Decision Tree {i+1} prediction tamamlandı")
         
-        # Tüm tahminler
-        group_col = "yaris_kosu_key"
-        target_col = "sonuc"
-        all_keep = [c for c in [group_col, name_col, "win_proba", target_col] if c in df.columns]
-        df[all_keep].to_csv(self.output_all, index=False)
+        # XGBoost'tan prediction al
+        xgb_pred = self.ensemble_models['xgboost'].predict_proba(X_predict_enc)[:, 1]
+        ensemble_predictions.append(xgb_pred)
+        print("   ✅ XGBoost prediction tamamlandı")
         
-        # İlk 3 tahmin
-        ranked = df.sort_values([group_col, "win_proba"], ascending=[True, False])
-        top3 = ranked.groupby(group_col).head(3)
+        # XGBRanker'dan prediction al
+        xgb_ranker_pred = self.ensemble_models['xgb_ranker'].predict(X_predict_enc)
+        ensemble_predictions.append(xgb_ranker_pred)
+        print("   ✅ XGBRanker prediction tamamlandı")
+        return ensemble_predictions
+
+    @profiled('save_predictions')
+    def save_predictions(self, df, proba_all):
+        """Tahminleri CSV olarak kaydet (tüm tahminler ve koşu başına ilk 3)"""
+        print(f"💾 {self.hipodrom_key} tahminleri kaydediliyor...")
         
-        top_keep = [c for c in [group_col, name_col, "win_proba", target_col] if c in df.columns]
-        top3[top_keep].to_csv(self.output_top3, index=False)
+        df["win_proba"] = proba_all
+        PredictionReport(df, self.hipodrom_key, now=self.now()).write_csv(self.output_all, self.output_top3)
         
         print(f"✅ Tahminler kaydedildi:")
         print(f"   📄 {self.output_all}")
         print(f"   📄 {self.output_top3}")
     
+    @profiled('generate_smart_labels')
     def generate_smart_labels(self, df, all_past_data):
-        """Her at için akıllı labellar oluştur (modelden bağımsız, sadece çıktı için)"""
+        """Her at için akıllı labellar oluştur (modelden bağımsız, sadece çıktı için)
+
+        Kart atlarının geçmişi bir kez süzülür: jokey-at, mesafe ve hipodrom
+        sayıları gruplanmış toplamlardan (keyed_sums), grup tecrübeleri
+        cins_detay'ın farklı değerlerinden, "Geçti" rakipleri ise kart atları
+        arasındaki PairwiseHistoryTable geçme matrisinden okunur. Labellar
+        kolon bazında birleştirilir; at başına filtreleme yapılmaz.
+        """
         print(f"🏷️ Akıllı labellar oluşturuluyor...")
-        
-        labels_list = []
-        
-        for idx, row in df.iterrows():
-            at_adi = row.get('at_adi', '')
-            jokey_adi = row.get('jokey_adi', '')
-            mesafe = row.get('mesafe', '')
-            hipodrom_key = row.get('hipodrom_key', self.hipodrom_key)
-            yaris_kosu_key = row.get('yaris_kosu_key', '')
-            gec_cikis_boy = row.get('gec_cikis_boy', '')
-            
-            labels = []
-            
-            # Geçmiş verilerden bu atın geçmiş performansını bul
-            at_past = all_past_data[all_past_data['at_adi'] == at_adi].copy()
-            
-            if len(at_past) == 0:
-                labels_list.append('')
-                continue
-            
-            # Sonuc sütununu numeric'e çevir
-            at_past['sonuc_numeric'] = pd.to_numeric(at_past['sonuc'], errors='coerce')
-            
-            # 1. Geç çıkış potansiyeli
-            if pd.notna(gec_cikis_boy) and gec_cikis_boy != '':
-                try:
-                    gec_cikis_val = float(str(gec_cikis_boy).replace(' Boy', '').replace(' Boyun', '').replace(' Burun', '').strip())
-                    if gec_cikis_val > 0:
-                        labels.append(f"🚦 Geç çıkış potansiyeli")
-                except:
-                    pass
-            
-            # 2. Bu jokey-at ikilisiyle daha önce kaç kez kazandı
-            if jokey_adi:
-                jokey_at_past = at_past[at_past['jokey_adi'] == jokey_adi].copy()
-                jokey_kazanma = (jokey_at_past['sonuc_numeric'] == 1).sum()
-                if jokey_kazanma > 0:
-                    labels.append(f"🏆 Jokey-At: {int(jokey_kazanma)}x kazandı")
-            
-            # 3. Bu jokey-at ikilisiyle daha önce kaç kez tabelaya (ilk 4'e) girdi
-            if jokey_adi:
-                jokey_at_past = at_past[at_past['jokey_adi'] == jokey_adi].copy()
-                jokey_tabela = ((jokey_at_past['sonuc_numeric'] >= 1) & (jokey_at_past['sonuc_numeric'] <= 4)).sum()
-                if jokey_tabela > 0:
-                    labels.append(f"📊 Jokey-At: {int(jokey_tabela)}x tabela")
-            
-            # 4. Bu mesafede daha önce kaç kez kazandı
-            if mesafe:
-                mesafe_past = at_past[at_past['mesafe'] == mesafe].copy()
-                mesafe_kazanma = (mesafe_past['sonuc_numeric'] == 1).sum()
-                if mesafe_kazanma > 0:
-                    labels.append(f"📏 Mesafe: {int(mesafe_kazanma)}x kazandı")
-            
-            # 5. Bu şehirde (hipodrom) daha önce kaç kez kazandı
-            if hipodrom_key:
-                hipodrom_past = at_past[at_past['hipodrom_key'] == hipodrom_key].copy()
-                hipodrom_kazanma = (hipodrom_past['sonuc_numeric'] == 1).sum()
-                if hipodrom_kazanma > 0:
-                    labels.append(f"🏟️ {hipodrom_key}: {int(hipodrom_kazanma)}x kazandı")
-            
-            # 5.5. Üst grup tecrübesi (G1, G2, G3, KV)
-            if 'cins_detay' in df.columns and pd.notna(row.get('cins_detay')):
-                current_race_type = str(row['cins_detay']).upper()
-                
-                # Bugünkü yarış tipini belirle
-                is_kv = 'KV' in current_race_type or 'KV-' in current_race_type
-                is_g3 = 'G 3' in current_race_type or 'G3' in current_race_type or ' G3' in current_race_type
-                is_g2 = 'G 2' in current_race_type or 'G2' in current_race_type or ' G2' in current_race_type
-                is_g1 = 'G 1' in current_race_type or 'G1' in current_race_type or ' G1' in current_race_type
-                
-                # Hangi üst grupları kontrol edeceğiz?
-                groups_to_check = []
-                
-                if is_kv:
-                    # KV ise sadece G1, G2, G3
-                    groups_to_check = ['G1', 'G2', 'G3']
-                elif is_g3:
-                    # G3 ise sadece G1, G2
-                    groups_to_check = ['G1', 'G2']
-                elif is_g2:
-                    # G2 ise sadece G1
-                    groups_to_check = ['G1']
-                elif is_g1:
-                    # G1 ise sadece G1 deneyimini göster (kendisi de üst seviye)
-                    groups_to_check = ['G1']
+        n = len(df)
+        if n == 0 or 'at_adi' not in df.columns:
+            return [''] * n
+
+        def column(frame, col, default=''):
+            if col in frame.columns:
+                return frame[col].reset_index(drop=True)
+            return pd.Series([default] * len(frame), dtype=object)
+
+        def given(series):
+            # Satır bazlı `if value:` karşılığı (boş metin ve 0 atlanır)
+            return map_unique(series, lambda v: bool(pd.notna(v) and v != '' and v != 0)).to_numpy(dtype=bool)
+
+        def label(mask, text):
+            return np.where(mask, np.asarray(text, dtype=object), '')
+
+        def count_text(counts):
+            return pd.Series(counts).astype(int).astype(str).to_numpy(dtype=object)
+
+        def join_labels(parts, sep):
+            joined = pd.Series([''] * n, dtype=object)
+            for part in parts:
+                part = np.asarray(part, dtype=object)
+                joined = joined + np.where(part != '', sep + part, '')
+            return joined.str[len(sep):].to_numpy(dtype=object)
+
+        at_adi = column(df, 'at_adi')
+        names = np.asarray(at_adi, dtype=object)
+        card_horses = pd.unique(at_adi.dropna().to_numpy(dtype=object))
+        past = all_past_data[all_past_data['at_adi'].isin(card_horses)].reset_index(drop=True)
+        past_at = past['at_adi']
+        sonuc_num = pd.to_numeric(past['sonuc'], errors='coerce').to_numpy(dtype=float)
+        wins = (sonuc_num == 1).astype(float)
+        tabela = ((sonuc_num >= 1) & (sonuc_num <= 4)).astype(float)
+
+        def horse_sums(values, key=None, target=None):
+            if key is None:
+                return keyed_sums([past_at], [at_adi], values)
+            if key not in past.columns:
+                return np.zeros(n)
+            return np.where(given(target), keyed_sums([past_at, past[key]], [at_adi, target], values), 0.0)
+
+        has_past = horse_sums(np.ones(len(past))) > 0
+
+        # 1. Geç çıkış potansiyeli
+        def late_start(v):
+            if pd.isna(v) or v == '':
+                return False
+            try:
+                return float(str(v).replace(' Boy', '').replace(' Boyun', '').replace(' Burun', '').strip()) > 0
+            except ValueError:
+                return False
+
+        gec_cikis = map_unique(column(df, 'gec_cikis_boy'), late_start).to_numpy(dtype=bool)
+        parts = [label(gec_cikis, "🚦 Geç çıkış potansiyeli")]
+
+        # 2-3. Jokey-at ikilisinin kazanma ve tabela (ilk 4) sayıları
+        jokey = column(df, 'jokey_adi')
+        jk_win = horse_sums(wins, 'jokey_adi', jokey)
+        jk_tab = horse_sums(tabela, 'jokey_adi', jokey)
+        parts.append(label(jk_win > 0, "🏆 Jokey-At: " + count_text(jk_win) + "x kazandı"))
+        parts.append(label(jk_tab > 0, "📊 Jokey-At: " + count_text(jk_tab) + "x tabela"))
+
+        # 4. Bu mesafede kazanma
+        msf_win = horse_sums(wins, 'mesafe', column(df, 'mesafe'))
+        parts.append(label(msf_win > 0, "📏 Mesafe: " + count_text(msf_win) + "x kazandı"))
+
+        # 5. Bu şehirde (hipodrom) kazanma
+        hipodrom = column(df, 'hipodrom_key', self.hipodrom_key)
+        hip_win = horse_sums(wins, 'hipodrom_key', hipodrom)
+        hip_text = hipodrom.astype(str).to_numpy(dtype=object)
+        parts.append(label(hip_win > 0, "🏟️ " + hip_text + ": " + count_text(hip_win) + "x kazandı"))
+
+        # 5.5. Üst grup tecrübesi (G1, G2, G3, KV) - bugünkü yarış tipine göre üst gruplar
+        if 'cins_detay' in df.columns:
+            def groups_to_check(cins):
+                if pd.isna(cins):
+                    return ()
+                t = str(cins).upper()
+                if 'KV' in t:
+                    return ('G1', 'G2', 'G3')
+                if 'G 3' in t or 'G3' in t:
+                    return ('G1', 'G2')
+                if 'G 2' in t or 'G2' in t or 'G 1' in t or 'G1' in t:
+                    # G2 → sadece G1; G1 → kendi (üst seviye) G1 deneyimi
+                    return ('G1',)
+                # Diğerleri (ŞARTLI, Handikap, Maiden vb) için hepsi
+                return ('G1', 'G2', 'G3', 'KV')
+
+            cur_type = column(df, 'cins_detay')
+            past_type = map_unique(past['cins_detay'], lambda v: str(v).upper()) if 'cins_detay' in past.columns else None
+            group_parts = []
+            for group in ('G1', 'G2', 'G3', 'KV'):
+                check = map_unique(cur_type, lambda v: group in groups_to_check(v)).to_numpy(dtype=bool)
+                if past_type is None:
+                    continue
+                if group == 'KV':
+                    flag = map_unique(past_type, lambda t: 'KV' in t)
                 else:
-                    # Diğerleri (ŞARTLI, Handikap, Maiden vb) için hepsi
-                    groups_to_check = ['G1', 'G2', 'G3', 'KV']
-                
-                # Her grup için tecrübe sayısını hesapla
-                group_experiences = []
-                for group in groups_to_check:
-                    if group == 'KV':
-                        # KV için KV-6, KV-7, KV-8, KV-9 gibi formatları kontrol et
-                        kv_past = at_past[at_past['cins_detay'].astype(str).str.contains('KV', case=False, na=False)].copy()
-                        kv_count = len(kv_past)
-                        if kv_count > 0:
-                            group_experiences.append(f"{kv_count}x KV")
-                    else:
-                        # G1, G2, G3 için - hem "G 1" hem "G1" formatlarını kontrol et
-                        group_pattern = group.replace(' ', '')  # G1, G2, G3
-                        group_space = f"G {group[-1]}"  # G 1, G 2, G 3
-                        group_past = at_past[
-                            (at_past['cins_detay'].astype(str).str.contains(group_pattern, case=False, na=False, regex=False)) |
-                            (at_past['cins_detay'].astype(str).str.contains(group_space, case=False, na=False, regex=False))
-                        ].copy()
-                        group_count = len(group_past)
-                        if group_count > 0:
-                            group_experiences.append(f"{group_count}x {group_pattern}")
-                
-                if group_experiences:
-                    labels.append(f"🏅 {' '.join(group_experiences)}")
-            
-            # 6. Bu koşudaki rakiplerini daha önce geçti
-            if yaris_kosu_key:
-                # Aynı koşudaki diğer atları bul
-                race_competitors = df[df['yaris_kosu_key'] == yaris_kosu_key]['at_adi'].tolist()
-                race_competitors = [c for c in race_competitors if c != at_adi]
-                
-                if len(race_competitors) > 0:
-                    # Bu atın bu rakiplerle karşılaştığı geçmiş koşuları bul
-                    beaten_competitors = []
-                    for competitor in race_competitors:
-                        # Her iki atın da yer aldığı geçmiş koşuları bul
-                        competitor_past = all_past_data[all_past_data['at_adi'] == competitor].copy()
-                        competitor_past['sonuc_numeric'] = pd.to_numeric(competitor_past['sonuc'], errors='coerce')
-                        
-                        # Ortak koşuları bul (yaris_kosu_key'e göre)
-                        at_races = set(at_past['yaris_kosu_key'].unique())
-                        competitor_races = set(competitor_past['yaris_kosu_key'].unique())
-                        common_races = at_races & competitor_races
-                        
-                        if len(common_races) > 0:
-                            # Bu koşularda hangi at daha iyi performans göstermiş?
-                            for race_key in common_races:
-                                at_result = at_past[at_past['yaris_kosu_key'] == race_key]['sonuc_numeric'].values
-                                comp_result = competitor_past[competitor_past['yaris_kosu_key'] == race_key]['sonuc_numeric'].values
-                                
-                                if len(at_result) > 0 and len(comp_result) > 0:
-                                    at_derece = at_result[0]
-                                    comp_derece = comp_result[0]
-                                    
-                                    if pd.notna(at_derece) and pd.notna(comp_derece):
-                                        # Bu at daha iyi derece yaptıysa (daha küçük sayı = daha iyi)
-                                        if at_derece < comp_derece:
-                                            beaten_competitors.append(competitor)
-                                            break
-                    
-                    if len(beaten_competitors) > 0:
-                        # Tüm rakipleri göster (tekrarsız)
-                        uniq_comps = []
-                        seen = set()
-                        for c in beaten_competitors:
-                            if c not in seen:
-                                uniq_comps.append(c)
-                                seen.add(c)
-                        labels.append(f"⚔️ Geçti: {', '.join(uniq_comps)}")
-            
-            labels_list.append(' '.join(labels) if labels else '')
-        
-        return labels_list
+                    flag = map_unique(past_type, lambda t: group in t or f"G {group[-1]}" in t)
+                exp = horse_sums(flag.to_numpy(dtype=float))
+                group_parts.append(label(check & (exp > 0), count_text(exp) + f"x {group}"))
+            group_text = join_labels(group_parts, ' ') if group_parts else np.full(n, '', dtype=object)
+            parts.append(label(group_text != '', "🏅 " + group_text))
+
+        # 6. Bu koşudaki rakiplerini daha önce geçti (kart atları arası geçme matrisi)
+        beat_text = np.full(n, '', dtype=object)
+        race = column(df, 'yaris_kosu_key')
+        if 'yaris_kosu_key' in past.columns and len(card_horses) > 1:
+            table = PairwiseHistoryTable(past.assign(rank_num=sonuc_num))
+            beat = table.beat_matrix(card_horses)
+            horse_idx = pd.Index(card_horses).get_indexer(names)
+            race_codes, _ = pd.factorize(np.where(given(race), np.asarray(race, dtype=object), None))
+            for code, pos in pd.Series(np.arange(n)).groupby(race_codes).indices.items():
+                if code < 0:
+                    continue
+                hi = horse_idx[pos]
+                known = hi >= 0
+                for p, h in zip(pos, hi):
+                    if h < 0:
+                        continue
+                    beaten = names[pos[known & beat[h, np.where(known, hi, 0)]]]
+                    if len(beaten):
+                        # Tüm rakipleri göster (tekrarsız, kart sırasıyla)
+                        beat_text[p] = "⚔️ Geçti: " + ', '.join(dict.fromkeys(beaten))
+        parts.append(beat_text)
+
+        labels = join_labels(parts, ' ')
+        return list(np.where(has_past, labels, ''))
     
+    @profiled('save_txt_predictions')
     def save_txt_predictions(self, df, proba_all, all_past_data=None):
-        """Tahminleri TXT formatında kaydet"""
+        """Tahminleri TXT, CSV ve JSON formatında tek geçişte kaydet
+        
+        Koşular PredictionReport'ta bir kez gruplanıp sıralanır; TXT satırları
+        biriktirilip tek yazmada basılır, CSV ve JSON aynı yapıdan üretilir.
+        """
         print(f"📝 TXT formatında tahminler kaydediliyor...")
         
         # Win probability ekle
         df = df.copy()
         df['win_proba'] = proba_all
         
-        # At adı sütununu bul
-        name_col = None
-        for c in ["at_adi", "at_ismi", "at"]:
-            if c in df.columns:
-                name_col = c
-                break
-        
         # Akıllı labellar oluştur
         if all_past_data is not None:
-            smart_labels = self.generate_smart_labels(df, all_past_data)
-            df['smart_labels'] = smart_labels
+            df['smart_labels'] = self.generate_smart_labels(df, all_past_data)
         else:
             df['smart_labels'] = ''
         
-        # TXT dosyası oluştur
-        txt_file = os.path.join(self.output_dir, f"{self.hipodrom_key}_tahminler.txt")
+        report = PredictionReport(df, self.hipodrom_key, now=self.now())
+        if report.group_col == 'saat':
+            print(f"📊 Saate göre gruplandı: {df['saat'].nunique()} farklı saat")
+        else:
+            print(f"⚠️ Saat sütunu yok, yaris_kosu_key'e göre gruplandı")
         
-        with open(txt_file, 'w', encoding='utf-8') as f:
-            f.write(f"🏇 {self.hipodrom_key} AT YARIŞI TAHMİNLERİ\n")
-            f.write("=" * 60 + "\n")
-            f.write(f"📅 Tarih: {datetime.now().strftime('%d/%m/%Y %H:%M')}\n")
-            f.write(f"📊 Toplam Koşu: {df['yaris_kosu_key'].nunique()}\n")
-            f.write(f"📊 Toplam At: {len(df)}\n")
-            f.write("=" * 60 + "\n\n")
-            
-            # Saate göre grupla (koşu no'ya değil)
-            if 'saat' in df.columns:
-                races = df.groupby('saat')
-                print(f"📊 Saate göre gruplandı: {df['saat'].nunique()} farklı saat")
-            else:
-                # Saat sütunu yoksa yaris_kosu_key'e göre grupla
-                races = df.groupby('yaris_kosu_key')
-                print(f"⚠️ Saat sütunu yok, yaris_kosu_key'e göre gruplandı")
-            
-            race_count = 0
-            for time_key, race_horses in races:
-                race_count += 1
-                
-                # Win probability'ye göre sırala
-                race_horses = race_horses.sort_values('win_proba', ascending=False)
-                
-                # Cins detay bilgisini al (ilk attan)
-                cins_detay = ''
-                if 'cins_detay' in race_horses.columns and len(race_horses) > 0:
-                    first_horse = race_horses.iloc[0]
-                    if pd.notna(first_horse.get('cins_detay')):
-                        cins_detay = str(first_horse['cins_detay'])
-                
-                # Saat bilgisini göster
-                if 'saat' in df.columns:
-                    if cins_detay:
-                        f.write(f"🏁 KOŞU {race_count} - Saat {time_key} - {cins_detay}\n")
-                    else:
-                        f.write(f"🏁 KOŞU {race_count} - Saat {time_key}\n")
-                else:
-                    if cins_detay:
-                        f.write(f"🏁 KOŞU {race_count} - {cins_detay}\n")
-                    else:
-                        f.write(f"🏁 KOŞU {race_count}\n")
-                f.write("-" * 40 + "\n")
-                
-                for i, (_, horse) in enumerate(race_horses.iterrows(), 1):
-                    prob = horse['win_proba']
-                    at_adi = horse[name_col]
-                    
-                    # Probability'ye göre emoji
-                    if prob > 0.7:
-                        emoji = "🔥"
-                    elif prob > 0.5:
-                        emoji = "⭐"
-                    elif prob > 0.3:
-                        emoji = "📈"
-                    else:
-                        emoji = "📉"
-                    
-                    # Sürpriz ve balon potansiyeli etiketleri
-                    surpriz = horse.get('at_surpriz_potansiyeli', 0)
-                    balon = horse.get('at_balon_potansiyeli', 0)
-                    
-                    labels = []
-                    if not pd.isna(surpriz) and surpriz >= 2:
-                        labels.append(f"🎯 Sürpriz:{int(surpriz)}")
-                    if not pd.isna(balon) and balon >= 2:
-                        labels.append(f"⚠️ Balon:{int(balon)}")
-                    
-                    # Akıllı labelları ekle
-                    smart_label = horse.get('smart_labels', '')
-                    if smart_label:
-                        labels.append(smart_label)
-                    
-                    label_str = " " + " ".join(labels) if labels else ""
-                    
-                    f.write(f"{i:2d}. {emoji} {at_adi:25} - {prob*100:5.1f}%{label_str}\n")
-                
-                # En yüksek 3'ü vurgula
-                f.write(f"\n🎯 En Yüksek 3 Tahmin:\n")
-                for i, (_, horse) in enumerate(race_horses.head(3).iterrows(), 1):
-                    prob = horse['win_proba']
-                    at_adi = horse[name_col]
-                    f.write(f"   {i}. {at_adi:25} - {prob*100:5.1f}%\n")
-                
-                f.write("\n" + "=" * 60 + "\n\n")
-            
-            # Özet istatistikler
-            f.write("📊 ÖZET İSTATİSTİKLER\n")
-            f.write("-" * 30 + "\n")
-            
-            # En yüksek probability'li atlar
-            top_horses = df.nlargest(5, 'win_proba')
-            f.write(f"🔥 En Yüksek 5 Kazanma Olasılığı:\n")
-            for i, (_, horse) in enumerate(top_horses.iterrows(), 1):
-                f.write(f"   {i}. {horse[name_col]:25} - {horse['win_proba']*100:5.1f}%\n")
-            
-            # Probability dağılımı
-            f.write(f"\n📈 Probability Dağılımı:\n")
-            f.write(f"   En yüksek: {df['win_proba'].max()*100:.1f}%\n")
-            f.write(f"   En düşük:  {df['win_proba'].min()*100:.1f}%\n")
-            f.write(f"   Ortalama:  {df['win_proba'].mean()*100:.1f}%\n")
+        txt_file = os.path.join(self.output_dir, f"{self.hipodrom_key}_tahminler.txt")
+        report.write_text(txt_file)
+        report.write_csv(self.output_all, self.output_top3)
+        report.write_json(os.path.join(self.output_dir, f"{self.hipodrom_key}_tahminler.json"))
         
         print(f"✅ TXT tahminler kaydedildi: {txt_file}")
+        print(f"   📄 {self.output_all}")
+        print(f"   📄 {self.output_top3}")
         return txt_file
     
+    @profiled('run_full_pipeline', run=True)
     def run_full_pipeline(self):
         """Tam pipeline çalıştır"""
         print(f"🏇 {self.hipodrom_key} At Yarışı Tahmin Sistemi")
@@ -2424,87 +4124,72 @@ class HorseRacingPredictor:
             return False
         
         # 4. Training verisi ile modeli eğit
-        X_train, y_train, groups_train, cat_cols, num_cols = self.prepare_features(train_df)
-        clf, _, results = self.train_model(X_train, y_train, groups_train, cat_cols, num_cols)
+        X_train, y_train, groups_train, cat_cols, num_cols = self.prepare_features(train_df, history=df)
+        clf, _, results = self.train_model(X_train, y_train, groups_train, cat_cols, num_cols, history=df)
+        self.save_model_bundle()
         
         # 5. Bugünün koşuları için tahmin yap
-        print(f"\n🔮 Bugünün koşuları için tahmin yapılıyor...")
-        X_predict, _, _, _, _ = self.prepare_features(predict_df)
-        
-        # Sadece training'de olan kolonları kullan
-        # Eksik kolonları ekle (bugünün koşuları için drop edilen sütunlar)
-        missing_cols = set(X_train.columns) - set(X_predict.columns)
-        if missing_cols:
-            # Eksik kolonları ekle ve geçmiş verilerden median ile doldur
-            for col in missing_cols:
-                if col in num_cols:
-                    # Numeric sütunlar için median kullan
-                    if col in self.numeric_medians:
-                        X_predict[col] = self.numeric_medians[col]
-                    else:
-                        # Eğer median yoksa, training'den median al
-                        if col in X_train.columns:
-                            median_val = X_train[col].median()
-                            X_predict[col] = median_val
-                        else:
-                            X_predict[col] = 0
-                elif col in cat_cols:
-                    # Categorical sütunlar için en sık kullanılan değeri kullan
-                    if col in X_train.columns:
-                        most_common = X_train[col].mode()
-                        if len(most_common) > 0:
-                            X_predict[col] = most_common.iloc[0]
-                        else:
-                            X_predict[col] = 0
-                    else:
-                        X_predict[col] = 0
-                else:
-                    # Bilinmeyen tip için 0 kullan
-                    X_predict[col] = 0
-        
-        X_predict = X_predict[X_train.columns]
-        
-        # Random Forest için categorical feature'ları encode et
-        X_predict_enc = X_predict.copy()
-        for c in cat_cols:
-            if c in X_predict_enc.columns:
-                le = self.label_encoders.get(c)
-                if le is not None:
-                    # Bilinmeyen kategoriler için max+1 değerini kullan (eğitilmemiş kategori)
-                    unknown_val = getattr(le, 'unknown_value', len(le.classes_))
-                    X_predict_enc[c] = X_predict_enc[c].apply(
-                        lambda v: le.transform([v])[0] if v in le.classes_ else unknown_val
-                    )
+        return self.predict_and_save(train_df, predict_df, history=df)
+
+    @profiled('run_saved_model_pipeline', run=True)
+    def run_saved_model_pipeline(self):
+        """Kaydedilmiş modelle (yeniden eğitmeden) bugünün koşularını tahmin et"""
+        if not self.load_model_bundle():
+            print(f"❌ {self.hipodrom_key} için kayıtlı model yok: {self.model_file}")
+            return False
+        df = self.load_data()
+        if df is None:
+            return False
+        train_df, predict_df = self.split_train_predict(df)
+        if predict_df is None:
+            print("❌ Bugünün koşuları bulunamadı!")
+            return False
+        return self.predict_and_save(train_df, predict_df, history=df)
+
+    @profiled('predict_and_save')
+    def predict_and_save(self, train_df, predict_df, history=None):
+        """Eğitilmiş ensemble ile bugünün koşularını skorla ve çıktıları kaydet
         
-        # Numeric feature'ları impute et (training median'larını kullan)
-        for c in num_cols:
-            if c in X_predict_enc.columns:
-                # Training median'ını kullan (prediction verisinin median'ı değil!)
-                median_val = self.numeric_medians.get(c, X_predict_enc[c].median())
-                if X_predict_enc[c].isna().any():
-                    X_predict_enc[c] = X_predict_enc[c].fillna(median_val)
+        Args:
+            history: Önceden yüklenmiş tüm veri (verilmezse load_data ile okunur)
+        """
+        predict_df, proba_all = self.score_card(predict_df, history=history)
         
-        # Ensemble tahmin yap
-        print("🔮 Ensemble prediction yapılıyor...")
-        ensemble_predictions = []
+        # Geçmiş veriyi al (labellar için)
+        all_past_data = train_df.copy()
         
-        # Decision Tree'lerden prediction al
-        for i, dt in enumerate(self.ensemble_models['decision_trees']):
-            dt_pred = dt.predict_proba(X_predict_enc)[:, 1]
-            ensemble_predictions.append(dt_pred)
-            print(f"   ✅ Decision Tree {i+1} prediction tamamlandı")
+        # TXT, CSV ve JSON dosyalarını kaydet
+        txt_file = self.save_txt_predictions(predict_df, proba_all, all_past_data=all_past_data)
         
-        # XGBoost'tan prediction al
-        xgb_pred = self.ensemble_models['xgboost'].predict_proba(X_predict_enc)[:, 1]
-        ensemble_predictions.append(xgb_pred)
-        print("   ✅ XGBoost prediction tamamlandı")
+        print(f"🎉 {self.hipodrom_key} tahmin sistemi tamamlandı!")
+        print(f"📄 TXT dosyası: {txt_file}")
+        return True
+
+    def score_card(self, predict_df, history=None, predict_features=None):
+        """Eğitilmiş ensemble ile koşu kartını skorla (dosya yazmadan)
         
-        # XGBRanker'dan prediction al
-        xgb_ranker_pred = self.ensemble_models['xgb_ranker'].predict(X_predict_enc)
-        ensemble_predictions.append(xgb_ranker_pred)
-        print("   ✅ XGBRanker prediction tamamlandı")
+        Args:
+            history: Önceden yüklenmiş tüm veri (verilmezse load_data ile okunur)
+            predict_features: Kartın önceden hesaplanmış feature'ları (verilmezse featurize edilir)
+        
+        Returns:
+            (predict_df, proba_all): win_proba ve sürpriz/balon kolonları eklenmiş kart ve olasılıklar
+        """
+        print(f"\n🔮 Bugünün koşuları için tahmin yapılıyor...")
+        if history is None:
+            history = self.load_data()
+        if predict_features is None:
+            predict_features = self.featurize(predict_df, history=history)
+        X_predict, _, _, _, _ = self.feature_matrix(predict_features)
+        X_predict_enc = self.encode_predict_features(X_predict)
         
+        # Ensemble tahmin yap
+        print("🔮 Ensemble prediction yapılıyor...")
+        ensemble_predictions = self.predict_ensemble(X_predict_enc)
+        
+        self.profiler.block('meta_blend', rows=len(predict_df))
         # Stacking/meta veya bağlama göre sabit ağırlıklarla birleştir
+        meta_input = None
         try:
             meta_input = np.column_stack(ensemble_predictions)  # (n_samples, 7)
             # Model skorlarını re-rank ve konsensus için df'e ekle
@@ -2516,29 +4201,8 @@ class HorseRacingPredictor:
             if 'meta' in self.ensemble_models:
                 # Bağlam ağırlıkları aktifse sabit ağırlıklı ortalama uygula
                 if self.use_context_weights and 'cins_detay' in predict_df.columns:
-                    proba_raw = np.zeros(meta_input.shape[0])
-                    # Model sırası: DT1..DT5, XGB, XGBR
-                    for i in range(meta_input.shape[0]):
-                        cins = str(predict_df.iloc[i].get('cins_detay','')).upper()
-                        cls_w = predict_df.iloc[i].get('race_class_weight', None)
-                        high = False
-                        if cls_w is not None:
-                            high = cls_w >= 0.8
-                        else:
-                            high = ('G1' in cins) or ('G 1' in cins) or ('G2' in cins) or ('G 2' in cins) or ('G3' in cins) or ('G 3' in cins) or ('KV' in cins)
-                        # Maiden/Şartlı 1 tespiti
-                        maiden_s1 = ('MAID' in cins) or ('ŞARTLI 1' in cins) or ('SARTLI 1' in cins)
-                        # Ağırlık vektörü
-                        if maiden_s1:
-                            # Maiden/Şartlı1: form/pist-uyumu (XGB yüksek), Ranker düşük
-                            w = np.array([0.06,0.06,0.06,0.06,0.06,0.60,0.10])
-                        elif high:
-                            # Yüksek sınıf: Ranker en yüksek, XGB ikinci; DT'ler minimal
-                            w = np.array([0.03,0.03,0.03,0.03,0.03,0.27,0.60])
-                        else:
-                            # Düşük sınıf: DT'ler kısık, XGB daha yüksek, Ranker orta
-                            w = np.array([0.06,0.06,0.06,0.06,0.06,0.48,0.22])
-                        proba_raw[i] = float(np.dot(meta_input[i], w))
+                    W = self.context_weight_matrix(predict_df)
+                    proba_raw = np.einsum('ij,ij->i', meta_input, W)
                     print("   🎯 Koşu tipi bazlı sabit ağırlıklarla birleştirildi")
                 else:
                     proba_raw = self.ensemble_models['meta'].predict_proba(meta_input)[:, 1]
@@ -2550,183 +4214,25 @@ class HorseRacingPredictor:
             proba_raw = np.mean(ensemble_predictions, axis=0)
             print(f"   🎯 {len(ensemble_predictions)} modelin ortalaması alındı")
         
-        # Head-to-Head (kim kimi geçti) boost'u uygula — GEÇİCİ OLARAK DEVRE DIŞI (izolasyon)
+        self.profiler.block(None)
+        # Head-to-Head (kim kimi geçti): koşu içi z-skor; kalibratörde ağırlığı öğrenilmiş
+        # bir girdidir, eski yollarda h2h_alpha ile ölçeklenip logit'e eklenir
+        h2h = np.zeros(len(predict_df))
         try:
-            pass  # H2H aktif
-            def _class_weight_local(c):
-                s = str(c).upper()
-                if 'G 1' in s or 'G1' in s:
-                    return 1.4
-                if 'G 2' in s or 'G2' in s:
-                    return 1.2
-                if 'G 3' in s or 'G3' in s:
-                    return 1.0
-                if 'KV' in s:
-                    return 0.8
-                if 'ŞARTLI' in s or 'SARTLI' in s:
-                    return 0.5
-                if 'HANDIKAP' in s or 'HANDİKAP' in s:
-                    return 0.45
-                if 'MAIDEN' in s:
-                    return 0.35
-                if 'SATIŞ' in s or 'SATIS' in s:
-                    return 0.3
-                return 0.4
-
-            def _bucket(m):
-                try:
-                    m = float(m)
-                except:
-                    return 'mid'
-                if m < 1400:
-                    return 'short'
-                if m <= 2000:
-                    return 'mid'
-                return 'long'
-            
-            def mesafe_similarity(m1, m2):
-                """Mesafe benzerliği - ±200m içinde tam benzer, sonra azalan"""
-                try:
-                    m1 = float(m1)
-                    m2 = float(m2)
-                    diff = abs(m1 - m2)
-                    if diff <= 200:
-                        return 1.0
-                    if diff <= 400:
-                        return 0.85
-                    if diff <= 600:
-                        return 0.7
-                    if diff <= 1000:
-                        return 0.5
-                    return 0.3
-                except:
-                    return 0.5
-
-            # Geçmiş veri (rakip karşılaştırmaları için)
-            hist = self.load_data()
-            if 'tarih' in hist.columns and 'sonuc' in hist.columns:
-                if 'tarih_dt' not in hist.columns:
-                    hist['tarih_dt'] = pd.to_datetime(hist['tarih'], format='%d/%m/%Y', errors='coerce')
-                hist = hist[hist['sonuc'].notna()].copy()
-                hist['rank_num'] = pd.to_numeric(hist['sonuc'], errors='coerce')
-                # Bugünün verilerini ve bugünkü yarış anahtarlarını açıkça hariç tut
-                try:
-                    pred_dates = set(predict_df['tarih'].dropna().unique()) if 'tarih' in predict_df.columns else set()
-                    if pred_dates:
-                        hist = hist[~hist['tarih'].isin(pred_dates)].copy()
-                except Exception:
-                    pass
-                try:
-                    if 'yaris_kosu_key' in hist.columns and 'yaris_kosu_key' in predict_df.columns:
-                        cur_keys = set(predict_df['yaris_kosu_key'].dropna().unique())
-                        if cur_keys:
-                            hist = hist[~hist['yaris_kosu_key'].isin(cur_keys)].copy()
-                except Exception:
-                    pass
-            else:
-                hist = None
-
-            boosts = np.zeros(len(predict_df))
-            # Index -> position haritası
-            idx_to_pos = {idx: pos for pos, idx in enumerate(predict_df.index.tolist())}
-            if hist is not None and {'at_adi'}.issubset(predict_df.columns):
-                # Grup sütunu: tercihen 'saat' varsa onunla, yoksa 'yaris_kosu_key'
-                group_col = 'saat' if 'saat' in predict_df.columns else ('yaris_kosu_key' if 'yaris_kosu_key' in predict_df.columns else None)
-                groups = [('', predict_df)] if group_col is None else predict_df.groupby(group_col)
-                for g_key, g_df in groups:
-                    idxs = g_df.index.tolist()
-                    horses = g_df['at_adi'].astype(str).tolist() if 'at_adi' in g_df.columns else []
-                    if len(horses) < 2:
-                        continue
-                    # Mevcut yarışın bağlamı
-                    cur_m = g_df.get('mesafe', pd.Series(index=g_df.index)).iloc[0] if 'mesafe' in g_df.columns and len(g_df)>0 else np.nan
-                    cur_p = str(g_df.get('pist', pd.Series(index=g_df.index)).iloc[0]).lower() if 'pist' in g_df.columns and len(g_df)>0 else ''
-                    cur_b = _bucket(cur_m)
-                    def pist_sim(p):
-                        pl = str(p).lower()
-                        if pl == cur_p:
-                            return 1.0
-                        sands = {'kum','sentetik'}
-                        return 0.7 if (pl in sands and cur_p in sands) else 0.5
-
-                    # Çiftler için üstünlük matrisi
-                    h2h_score = {h: 0.0 for h in horses}
-                    for i, hi in enumerate(horses):
-                        for j, hj in enumerate(horses):
-                            if i == j:
-                                continue
-                            # İki atın birlikte koştuğu geçmiş yarışlar
-                            mask = hist['at_adi'].isin([hi, hj])
-                            common_keys = hist[mask]['yaris_kosu_key'].dropna().unique() if 'yaris_kosu_key' in hist.columns else []
-                            pair_score = 0.0
-                            for rk in common_keys:
-                                r = hist[hist['yaris_kosu_key'] == rk]
-                                if hi not in set(r['at_adi']) or hj not in set(r['at_adi']):
-                                    continue
-                                ri = r[r['at_adi'] == hi]
-                                rj = r[r['at_adi'] == hj]
-                                if len(ri)==0 or len(rj)==0:
-                                    continue
-                                ri_rank = float(ri['rank_num'].iloc[0]) if pd.notna(ri['rank_num'].iloc[0]) else np.nan
-                                rj_rank = float(rj['rank_num'].iloc[0]) if pd.notna(rj['rank_num'].iloc[0]) else np.nan
-                                if np.isnan(ri_rank) or np.isnan(rj_rank):
-                                    continue
-                                better = 1.0 if ri_rank < rj_rank else (-1.0 if ri_rank > rj_rank else 0.0)
-                                cw = _class_weight_local(r['cins_detay'].iloc[0]) if 'cins_detay' in r.columns and len(r)>0 else 0.4
-                                # Recency ağırlığı
-                                rec = 1.0
-                                if 'tarih_dt' in r.columns and pd.notna(r['tarih_dt'].iloc[0]):
-                                    days = (pd.Timestamp.now() - r['tarih_dt'].iloc[0]).days
-                                    rec = float(np.exp(-max(0, days)/90.0))
-                                # Mesafe/pist benzerliği - benzer koşulda geçme daha önemli
-                                r_mesafe = r['mesafe'].iloc[0] if 'mesafe' in r.columns and len(r)>0 else np.nan
-                                r_pist = r['pist'].iloc[0] if 'pist' in r.columns and len(r)>0 else ''
-                                
-                                # Mesafe benzerliği (±200m içinde tam benzer)
-                                db = mesafe_similarity(cur_m, r_mesafe) if not pd.isna(cur_m) and not pd.isna(r_mesafe) else 0.5
-                                
-                                # Pist türü benzerliği
-                                ps = pist_sim(r_pist) if r_pist else 0.5
-                                
-                                # Benzer koşulda geçme durumu çok daha önemli
-                                # Aynı mesafe/pist türünde geçme durumu 2x ağırlıklandırılır
-                                similarity_boost = 1.0
-                                if db >= 0.85 and ps >= 0.85:  # Çok benzer koşullar
-                                    similarity_boost = 2.5  # Çok daha önemli
-                                elif db >= 0.7 and ps >= 0.7:  # Benzer koşullar
-                                    similarity_boost = 1.8
-                                elif db >= 0.5 or ps >= 0.7:  # Orta benzerlik
-                                    similarity_boost = 1.3
-                                
-                                w = cw * rec * db * ps * similarity_boost
-                                pair_score += better * w
-                            h2h_score[hi] += pair_score
-                    # Normalize ve z-score
-                    vals = np.array([h2h_score[h] for h in horses], dtype=float)
-                    if np.allclose(vals.max(), vals.min()):
-                        z = np.zeros_like(vals)
-                    else:
-                        z = (vals - vals.mean()) / (vals.std() + 1e-6)
-                    # Boost katsayısı - benzer koşullarda geçme durumu daha önemli olduğu için artırıldı
-                    alpha = 1.5  # Daha önce 1.2 idi
-                    for k, row_idx in enumerate(idxs):
-                        pos = idx_to_pos.get(row_idx, None)
-                        if pos is not None and 0 <= pos < len(boosts):
-                            boosts[pos] = alpha * z[k]
+            h2h = self.compute_h2h_boosts(predict_df, alpha=1.0, history=history)
 
             # Probaları logit düzeyinde ayarla
             eps = 1e-5
             clipped = np.clip(proba_raw, eps, 1 - eps)
             logits = np.log(clipped / (1.0 - clipped))
-            logits = logits + boosts
+            logits = logits + self.h2h_alpha * h2h
             proba_raw = 1.0 / (1.0 + np.exp(-logits))
             print("   ⚔️ H2H boost uygulandı")
         except Exception as e:
             print(f"   ⚠️ H2H boost atlandı: {e}")
 
+        self.profiler.block('race_scaling', rows=len(predict_df))
         # Her koşu için ayrı scaling uygula
-        proba_all = np.zeros(len(proba_raw))
-        
         # Koşu bazında grupla ve her grup için ayrı scaling yap (öncelik: saat → yaris_kosu_key → (tarih,kosu_no,hipodrom))
         group_field = None
         if 'yaris_kosu_key' in predict_df.columns:
@@ -2737,157 +4243,64 @@ class HorseRacingPredictor:
             group_field = ['tarih','kosu_no','hipodrom']
 
         if group_field is not None:
-            # Orijinal index → pozisyon haritası
-            idx_to_pos_scale = {idx: pos for pos, idx in enumerate(predict_df.index.tolist())}
-            grouped = predict_df.groupby(group_field)
-            for g_key, group_index_labels in grouped.groups.items():
-                positions = [idx_to_pos_scale[idx] for idx in list(group_index_labels)]
-                group_proba = proba_raw[positions]
-                if self.use_softmax_calibration:
-                    # Softmax (temperature) + eşit skor fallback'ı (rank-based)
-                    n = len(group_proba)
-                    if n == 0:
-                        group_scaled = np.array([])
-                    else:
-                        arr = np.asarray(group_proba, dtype=float)
-                        if np.allclose(arr.max(), arr.min()) or (np.std(arr) < 1e-9):
-                            # Tümü eşit ise rank tabanlı
-                            # Stabil tiebreak: index sırasına göre çok küçük pertürbasyon ekle
-                            tiny = 1e-6 * np.arange(n)[::-1]
-                            order = np.argsort(-(arr + tiny))
-                            ranks = np.empty(n, dtype=int)
-                            ranks[order] = np.arange(n)
-                            weights = (n - ranks).astype(float)
-                            denom = weights.sum()
-                            group_scaled = weights / denom if denom > 0 else np.ones(n) / n
-                        else:
-                            t = max(1e-3, float(getattr(self, 'softmax_temperature', 1.0)))
-                            logits = arr / t
-                            logits = logits - np.max(logits)
-                            exps = np.exp(logits)
-                            denom = exps.sum()
-                            probs = exps / denom if denom > 0 else np.ones(n) / n
-                            group_scaled = probs
-                else:
-                    proba_min = np.min(group_proba)
-                    proba_max = np.max(group_proba)
-                    proba_range = proba_max - proba_min
-                    if proba_range > 0:
-                        proba_normalized = (group_proba - proba_min) / proba_range
-                        group_scaled = 0.1 + 0.8 * proba_normalized
-                    else:
-                        # Uniform yerine rank tabanlı dağıtım
-                        n = len(group_proba)
-                        arr = np.asarray(group_proba, dtype=float)
-                        tiny = 1e-6 * np.arange(n)[::-1]
-                        order = np.argsort(-(arr + tiny))
-                        ranks = np.empty(n, dtype=int)
-                        ranks[order] = np.arange(n)
-                        weights = (n - ranks).astype(float)
-                        denom = weights.sum()
-                        group_scaled = weights / denom if denom > 0 else np.ones(n) / n
-
-                # Son kontrol: hâlâ tüm değerler eşitse rank-based'e zorla
-                if len(group_proba) > 1:
-                    uniq = np.unique(np.round(group_scaled, 6))
-                    if uniq.size == 1:
-                        n = len(group_proba)
-                        arr = np.asarray(group_proba, dtype=float)
-                        tiny = 1e-6 * np.arange(n)[::-1]
-                        order = np.argsort(-(arr + tiny))
-                        ranks = np.empty(n, dtype=int)
-                        ranks[order] = np.arange(n)
-                        weights = (n - ranks).astype(float)
-                        denom = weights.sum()
-                        group_scaled = weights / denom if denom > 0 else np.ones(n) / n
-                
-                # Top-1 re-rank: H2H + sınıf-ağırlıklı rank + form ile küçük bonus ve yeniden normalize
-                try:
-                    def _nz_norm(x):
-                        x = np.asarray(x, dtype=float)
-                        if x.size == 0:
-                            return x
-                        mn, mx = np.nanmin(x), np.nanmax(x)
-                        if not np.isfinite(mn) or not np.isfinite(mx) or mx - mn < 1e-9:
-                            return np.zeros_like(x)
-                        return (x - mn) / (mx - mn)
-
-                    # H2H z skorlarını tekrar üretmeyelim; bonusu mevcut sinyallerden türet
-                    # Kullan: düşük 'at_class_weighted_avg_rank_last6' daha iyi → 1/rank normalize
-                    cls_rank = predict_df.loc[list(group_index_labels)].get('at_class_weighted_avg_rank_last6')
-                    cls_inv = None
-                    if cls_rank is not None and hasattr(cls_rank, 'to_numpy'):
-                        arr = pd.to_numeric(cls_rank, errors='coerce').to_numpy()
-                        with np.errstate(divide='ignore', invalid='ignore'):
-                            inv = 1.0 / np.clip(arr, 1e-6, None)
-                        cls_inv = _nz_norm(inv)
-                    else:
-                        cls_inv = np.zeros(len(positions))
-
-                    form_w = predict_df.loc[list(group_index_labels)].get('at_form_score_weighted')
-                    if form_w is not None and hasattr(form_w, 'to_numpy'):
-                        form_n = _nz_norm(pd.to_numeric(form_w, errors='coerce').to_numpy())
-                    else:
-                        form_n = np.zeros(len(positions))
+            # Koşu kodları ve koşu içi pozisyonlar (tüm koşular için tek seferde)
+            grouped = predict_df.groupby(group_field, sort=True, observed=True)
+            race_codes = grouped.ngroup().to_numpy()
+            valid_race = race_codes >= 0
+            race_codes = np.where(valid_race, race_codes, race_codes.max() + 1)
+            race_sizes = np.bincount(race_codes)
+            pos_in_race = grouped.cumcount().to_numpy()
+            # Blend terimleri kartın feature'larından okunur (kart satırlarıyla pozisyonel hizalı)
+            term_frame = (predict_features if len(predict_features) == len(predict_df) else predict_df).reset_index(drop=True)
+            calibrator = self.ensemble_models.get('calibrator') if hasattr(self, 'ensemble_models') else None
+            calibrated = self.use_softmax_calibration and calibrator is not None and meta_input is not None
+            if calibrated and getattr(calibrator, 'input_names', None):
+                # Koşullu logit: model skorları + blend terimleri + H2H, eğitimdeki kolon düzeniyle
+                cal_input, _ = self.calibrator_inputs(meta_input, term_frame, race_codes, h2h=h2h,
+                                                      names=calibrator.input_names)
+                scaled_all = calibrator.predict_proba(cal_input, race_codes, temperature=self.softmax_temperature)
+                print("   🎲 Koşullu logit ile koşu bazında normalize edildi")
+            elif calibrated:
+                # Eski paket (sadece model skorlarıyla eğitilmiş kalibratör): H2H sabit ölçekli offset
+                scaled_all = calibrator.predict_proba(meta_input, race_codes, offset=self.h2h_alpha * h2h,
+                                                      temperature=self.softmax_temperature)
+                print("   🎲 Koşullu logit (eski paket) ile koşu bazında normalize edildi")
+            elif self.use_softmax_calibration:
+                t = max(1e-3, float(getattr(self, 'softmax_temperature', 1.0)))
+                scaled_all = group_softmax(np.asarray(proba_raw, dtype=float) / t, race_codes)
+            else:
+                raw = pd.Series(np.asarray(proba_raw, dtype=float))
+                g_min = raw.groupby(race_codes).transform('min').to_numpy()
+                g_max = raw.groupby(race_codes).transform('max').to_numpy()
+                g_range = g_max - g_min
+                scaled_all = np.where(
+                    g_range > 0,
+                    0.1 + 0.8 * (raw.to_numpy() - g_min) / np.where(g_range > 0, g_range, 1.0),
+                    np.nan
+                )
 
-                    oppq = predict_df.loc[list(group_index_labels)].get('at_opponent_quality_last6')
-                    if oppq is not None and hasattr(oppq, 'to_numpy'):
-                        opp_n = _nz_norm(pd.to_numeric(oppq, errors='coerce').to_numpy())
-                    else:
-                        opp_n = np.zeros(len(positions))
-
-                    # Per-race prior: sınıf ağırlığı + pist/mesafe uyumu
-                    # Sınıf
-                    rcw = predict_df.loc[list(group_index_labels)].get('race_class_weight')
-                    class_prior = _nz_norm(pd.to_numeric(rcw, errors='coerce').to_numpy()) if rcw is not None else np.zeros(len(positions))
-                    # Pist deneyim ve mesafe başarısı
-                    pist_den = predict_df.loc[list(group_index_labels)].get('at_bu_pist_deneyim')
-                    pist_prior = _nz_norm(pd.to_numeric(pist_den, errors='coerce').to_numpy()) if pist_den is not None else np.zeros(len(positions))
-                    mesafe_bas = predict_df.loc[list(group_index_labels)].get('at_mesafe_basari')
-                    mesafe_prior = _nz_norm(pd.to_numeric(mesafe_bas, errors='coerce').to_numpy()) if mesafe_bas is not None else np.zeros(len(positions))
-                    
-                    # ±200m mesafe band başarısı
-                    mesafe_band = predict_df.loc[list(group_index_labels)].get('at_mesafe_band_basari')
-                    mesafe_band_prior = _nz_norm(pd.to_numeric(mesafe_band, errors='coerce').to_numpy()) if mesafe_band is not None else np.zeros(len(positions))
-                    
-                    # Pist türü başarısı
-                    pist_tur = predict_df.loc[list(group_index_labels)].get('at_pist_tur_basari')
-                    pist_tur_prior = _nz_norm(pd.to_numeric(pist_tur, errors='coerce').to_numpy()) if pist_tur is not None else np.zeros(len(positions))
-                    
-                    # H2H genel skoru - kim kimi geçti
-                    h2h_genel = predict_df.loc[list(group_index_labels)].get('at_h2h_genel_skor')
-                    h2h_prior = _nz_norm(pd.to_numeric(h2h_genel, errors='coerce').to_numpy()) if h2h_genel is not None else np.zeros(len(positions))
+            # Eşit skorlu koşular için rank tabanlı dağıtım (stabil tiebreak: koşu içi sıra)
+            tie_key = np.asarray(proba_raw, dtype=float) + 1e-6 * (race_sizes[race_codes] - 1 - pos_in_race)
+            order = np.lexsort((-tie_key, race_codes))
+            rank_in_race = np.empty(len(order), dtype=int)
+            rank_in_race[order] = np.arange(len(order)) - np.repeat(np.cumsum(race_sizes) - race_sizes, race_sizes)
+            n_rows = race_sizes[race_codes].astype(float)
+            rank_scaled = (n_rows - rank_in_race) / (n_rows * (n_rows + 1) / 2.0)
+            n_unique = pd.Series(np.round(scaled_all, 6)).groupby(race_codes).transform('nunique').to_numpy()
+            flat = np.isnan(scaled_all) | ((n_unique <= 1) & (n_rows > 1))
+            scaled_all = np.where(flat, rank_scaled, scaled_all)
 
-                    # Model konsensüsü: 7 skorun std'si düşükse yüksek anlaşma
-                    try:
-                        mcols = [f'model_score_{k+1}' for k in range(7)]
-                        mstack = np.vstack([pd.to_numeric(predict_df.loc[list(group_index_labels)][c], errors='coerce').to_numpy() for c in mcols])
-                        stds = np.nanstd(mstack, axis=0)
-                        cons = 1.0 - _nz_norm(stds)
-                    except Exception:
-                        cons = np.zeros(len(positions))
-
-                    # Bonus ağırlıkları (mesafe band + pist türü + H2H eklendi)
-                    bonus = (
-                        0.13 * cls_inv +
-                        0.10 * form_n +
-                        0.06 * opp_n +
-                        0.08 * class_prior +
-                        0.06 * pist_prior +
-                        0.05 * mesafe_prior +
-                        0.04 * mesafe_band_prior +
-                        0.04 * pist_tur_prior +
-                        0.04 * h2h_prior +  # H2H genel skor eklendi
-                        0.05 * cons
-                    )
-                    boosted = group_scaled + bonus
-                    boosted = np.clip(boosted, 1e-9, None)
-                    boosted = boosted / boosted.sum()
-                    group_scaled = boosted
+            # ESKİ YOL - Top-1 re-rank: sabit ağırlıklı blend bonusu ve yeniden normalize.
+            # Koşullu logit aktifken aynı terimler kalibratörün girdisidir (yukarıda)
+            if not calibrated:
+                try:
+                    boosted = np.clip(scaled_all + self.blend_bonus(term_frame, meta_input, race_codes), 1e-9, None)
+                    scaled_all = boosted / np.bincount(race_codes, weights=boosted)[race_codes]
                 except Exception:
                     pass
 
-                proba_all[positions] = group_scaled
+            # Koşu anahtarı olmayan satırlar (NaN) sıfır kalır
+            proba_all = np.where(valid_race, scaled_all, 0.0)
         else:
             # Saat sütunu yoksa genel scaling
             proba_min = np.min(proba_raw)
@@ -2902,38 +4315,24 @@ class HorseRacingPredictor:
                 # Eğer tüm olasılıklar aynıysa, sabit bir değer kullan (0.5)
                 proba_all = np.full(len(proba_raw), 0.5)
         
-        # 6. Tahminleri TXT formatında kaydet
+        self.profiler.block(None)
         predict_df['win_proba'] = proba_all
         
-        # Sürpriz ve balon potansiyeli feature'larını ekle (sadece gösterim için, modele dahil değil)
-        predict_features = self.create_advanced_features(predict_df)
-        if 'at_surpriz_potansiyeli' in predict_features.columns and 'at_balon_potansiyeli' in predict_features.columns:
-            predict_df = predict_df.merge(
-                predict_features[['at_adi', 'at_surpriz_potansiyeli', 'at_balon_potansiyeli']],
-                on='at_adi',
-                how='left',
-                suffixes=('', '_features')
-            )
-        
-        # Geçmiş veriyi al (labellar için)
-        all_past_data = train_df.copy()
-        
-        # CSV dosyalarını kaydet
-        self.save_predictions(predict_df, proba_all)
-        
-        # TXT dosyasını kaydet
-        txt_file = self.save_txt_predictions(predict_df, proba_all, all_past_data=all_past_data)
-        
-        print(f"🎉 {self.hipodrom_key} tahmin sistemi tamamlandı!")
-        print(f"📄 TXT dosyası: {txt_file}")
-        return True
+        # Sürpriz ve balon potansiyeli (sadece gösterim için, modele dahil değil) - tahmin feature'larından
+        predict_df = predict_df.reset_index(drop=True)
+        if len(predict_features) == len(predict_df):
+            for col in ['at_surpriz_potansiyeli', 'at_balon_potansiyeli']:
+                if col in predict_features.columns:
+                    predict_df[col] = predict_features[col].to_numpy()
+        return predict_df, proba_all
 
 def main():
     """Ana fonksiyon"""
     import sys
     
-    if len(sys.argv) > 1:
-        hipodrom_key = sys.argv[1]
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if args:
+        hipodrom_key = args[0]
     else:
         hipodrom_key = input("Hipodrom anahtarı girin (örn: KOCAELI, ISTANBUL): ").strip()
     
@@ -2941,7 +4340,7 @@ def main():
         print("❌ Hipodrom anahtarı gerekli!")
         return
     
-    predictor = HorseRacingPredictor(hipodrom_key)
+    predictor = HorseRacingPredictor(hipodrom_key, as_of=as_of_arg(sys.argv[1:]))
     success = predictor.run_full_pipeline()
     
     if success:
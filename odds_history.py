@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Ganyan/AGF Oran Zaman Serisi
+- data/{HIPODROM}_odds.sqlite: (zaman, koşu, at, ganyan, agf1, agf2) kayıtları, sadece ekleme
+- Oranı değişmeyen atlar yeniden yazılmaz (at başına son kayıtla karşılaştırılır)
+- At başına son N değer 'recent' tablosunda sınırlı tutulur (halka tampon): okuma maliyeti
+  geçmişin uzunluğundan bağımsızdır; kart bazında toplu okuma
+- Karşılaştırma + ekleme tek BEGIN IMMEDIATE işleminde: aynı dosyayı kullanan süreçler
+  (gunicorn worker'ları) aynı değişikliği iki kez yazamaz
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS odds (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    race TEXT NOT NULL,
+    at_key TEXT NOT NULL,
+    ganyan REAL,
+    agf1 REAL,
+    agf2 REAL
+);
+CREATE INDEX IF NOT EXISTS odds_at_key ON odds (at_key, id);
+CREATE TABLE IF NOT EXISTS latest (
+    at_key TEXT PRIMARY KEY,
+    race TEXT NOT NULL,
+    ganyan REAL,
+    agf1 REAL,
+    agf2 REAL
+);
+CREATE TABLE IF NOT EXISTS recent (
+    at_key TEXT NOT NULL,
+    field TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (at_key, field, seq)
+) WITHOUT ROWID;
+"""
+
+# SQLite'ın tek sorguda izin verdiği parametre sayısının altında kal
+MAX_PARAMS = 500
+
+
+def chunked(items, size=MAX_PARAMS):
+    """Listeyi size'lık parçalara böl"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class OddsHistoryStore:
+    """Hipodrom bazında ekleme-only oran zaman serisi
+
+    Her yenilemede sadece son kayda göre değişen (koşu, ganyan, agf1, agf2)
+    satırlar eklenir; 'latest' tablosu at başına son değeri tuttuğu için
+    karşılaştırma tek sorguyla yapılır ve yazma miktarı değişen at sayısıyla
+    sınırlıdır. 'recent' tablosu her (at, alan) için geçerli (>0) ve bir
+    öncekinden farklı son CAPACITY değeri tutar (seq = odds.id); eskiler
+    ekleme sırasında silinir, okumalar sadece bu sınırlı satırları tarar.
+    """
+
+    CAPACITY = 10
+    FIELDS = ('ganyan', 'agf1', 'agf2')
+
+    def __init__(self, path):
+        self.path = path
+        self.version = 0  # Bu süreçteki yazma sayacı (okuma cache'leri için)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # isolation_level=None: işlemler (BEGIN IMMEDIATE) açıkça yönetilir
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.executescript(SCHEMA)
+        self._backfill_recent()
+
+    @contextmanager
+    def _write_transaction(self):
+        """Süreçler arası yazma kilidi (BEGIN IMMEDIATE) altında tek işlem"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    def _backfill_recent(self):
+        """'recent' tablosu olmadan yazılmış dosyalar: son CAPACITY değişimi odds'tan bir kez doldur"""
+        with self._write_transaction() as conn:
+            if conn.execute('SELECT 1 FROM recent LIMIT 1').fetchone() or \
+                    not conn.execute('SELECT 1 FROM odds LIMIT 1').fetchone():
+                return
+            for field in self.FIELDS:
+                conn.execute(f"""
+                    INSERT INTO recent (at_key, field, seq, value)
+                    SELECT at_key, ?, id, value FROM (
+                        SELECT at_key, id, value,
+                               ROW_NUMBER() OVER (PARTITION BY at_key ORDER BY id DESC) AS rn
+                        FROM (
+                            SELECT at_key, id, {field} AS value,
+                                   LAG({field}) OVER (PARTITION BY at_key ORDER BY id) AS prev
+                            FROM odds
+                            WHERE {field} > 0
+                        )
+                        WHERE prev IS NULL OR value != prev
+                    )
+                    WHERE rn <= ?
+                """, (field, self.CAPACITY))
+
+    @classmethod
+    def for_hipodrom(cls, hipodrom, data_dir='data', key=None):
+        """data/{HIPODROM}_odds.sqlite; boşsa eski {HIPODROM}_ganyan_history.json içe aktarılır"""
+        store = cls(os.path.join(data_dir, f'{hipodrom}_odds.sqlite'))
+        store.import_legacy_json(os.path.join(data_dir, f'{hipodrom}_ganyan_history.json'), key=key)
+        return store
+
+    def import_legacy_json(self, json_path, key=None):
+        """Eski {at: [son 10 ganyan]} dosyasını (zaman bilgisi yok) tek seferlik içe aktar
+
+        Args:
+            json_path: Eski geçmiş dosyası
+            key: At adını kayıt anahtarına çeviren fonksiyon (varsayılan: olduğu gibi)
+        """
+        if not os.path.exists(json_path):
+            return 0
+        with self._lock:
+            if self._conn.execute('SELECT 1 FROM odds LIMIT 1').fetchone():
+                return 0
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Eski ganyan geçmişi okunamadı ({json_path}): {e}")
+            return 0
+
+        # Aynı koşudan tekrar eden değerler append'te tek kayda indirilir
+        records = [('', key(at_adi) if key else at_adi, value, None, None)
+                   for at_adi, values in legacy.items() for value in values]
+        # Boşluk kontrolü yazma işleminin içinde tekrarlanır (iki süreç aynı anda içe aktaramaz)
+        written = self.append(records, ts=0.0, only_if_empty=True)
+        if written:
+            print(f"📦 {json_path}: {written} eski ganyan kaydı içe aktarıldı")
+        return written
+
+    def _latest(self, at_keys):
+        """at_key → (koşu, ganyan, agf1, agf2) son kayıtlar"""
+        latest = {}
+        for part in chunked(list(at_keys)):
+            placeholders = ','.join('?' * len(part))
+            rows = self._conn.execute(
+                f'SELECT at_key, race, ganyan, agf1, agf2 FROM latest WHERE at_key IN ({placeholders})', part
+            )
+            for at_key, race, ganyan, agf1, agf2 in rows:
+                latest[at_key] = (race, ganyan, agf1, agf2)
+        return latest
+
+    def _last_recent(self, at_keys):
+        """(at_key, alan) → recent tablosundaki son değer"""
+        last = {}
+        for part in chunked(list(at_keys)):
+            placeholders = ','.join('?' * len(part))
+            rows = self._conn.execute(f"""
+                SELECT at_key, field, value FROM recent AS r
+                WHERE at_key IN ({placeholders})
+                  AND seq = (SELECT MAX(seq) FROM recent WHERE at_key = r.at_key AND field = r.field)
+            """, part)
+            for at_key, field, value in rows:
+                last[(at_key, field)] = value
+        return last
+
+    def append(self, records, ts=None, only_if_empty=False):
+        """Oran kayıtlarını ekle; son kayıttan farkı olmayanları atla
+
+        Karşılaştırma ve ekleme tek BEGIN IMMEDIATE işlemindedir: aynı anda
+        yazan başka bir süreç değişikliği önce yazdıysa burada atlanır.
+
+        Args:
+            records: (koşu, at_key, ganyan, agf1, agf2) demetleri (eksik oran None)
+            ts: Kayıt zamanı (varsayılan: şimdi, epoch saniye)
+            only_if_empty: Sadece tabloda hiç kayıt yoksa yaz (eski geçmişin içe aktarımı)
+
+        Returns:
+            Yazılan kayıt sayısı
+        """
+        ts = time.time() if ts is None else ts
+        rows = [r for r in records if r[1] and any(v is not None for v in r[2:])]
+        if not rows:
+            return 0
+        with self._write_transaction() as conn:
+            if only_if_empty and conn.execute('SELECT 1 FROM odds LIMIT 1').fetchone():
+                return 0
+            at_keys = {r[1] for r in rows}
+            latest = self._latest(at_keys)
+            last = self._last_recent(at_keys)
+            written = 0
+            for race, at_key, ganyan, agf1, agf2 in rows:
+                current = (race, ganyan, agf1, agf2)
+                if latest.get(at_key) == current:
+                    continue
+                latest[at_key] = current
+                seq = conn.execute(
+                    'INSERT INTO odds (ts, race, at_key, ganyan, agf1, agf2) VALUES (?, ?, ?, ?, ?, ?)',
+                    (ts, race, at_key, ganyan, agf1, agf2)
+                ).lastrowid
+                conn.execute(
+                    'INSERT OR REPLACE INTO latest (at_key, race, ganyan, agf1, agf2) VALUES (?, ?, ?, ?, ?)',
+                    (at_key, race, ganyan, agf1, agf2)
+                )
+                # Halka tampon: geçerli ve bir öncekinden farklı değer eklenir, en eskiler silinir
+                for field, value in zip(self.FIELDS, (ganyan, agf1, agf2)):
+                    if value is None or not value > 0 or last.get((at_key, field)) == value:
+                        continue
+                    last[(at_key, field)] = value
+                    conn.execute('INSERT INTO recent (at_key, field, seq, value) VALUES (?, ?, ?, ?)',
+                                 (at_key, field, seq, value))
+                    conn.execute("""
+                        DELETE FROM recent WHERE at_key = ? AND field = ? AND seq NOT IN (
+                            SELECT seq FROM recent WHERE at_key = ? AND field = ? ORDER BY seq DESC LIMIT ?
+                        )
+                    """, (at_key, field, at_key, field, self.CAPACITY))
+                written += 1
+        if written:
+            self.version += 1
+        return written
+
+    def histories(self, at_keys, field='ganyan', size=None):
+        """Birden fazla at için son size (en fazla CAPACITY) değer (eskiden yeniye), tek sorguda
+
+        Geçersiz (boş/0) ve bir önceki kayıtla aynı değerler atlanır; yani
+        görünüm atın gerçek oran değişimlerini gösterir. Sadece sınırlı
+        'recent' satırları okunur.
+
+        Returns:
+            {at_key: [değer, ...]} (kaydı olmayan atlar dahil edilmez)
+        """
+        if field not in self.FIELDS:
+            raise ValueError(f'Bilinmeyen oran alanı: {field}')
+        size = min(size or self.CAPACITY, self.CAPACITY)
+        result = {}
+        with self._lock:
+            for part in chunked(list(dict.fromkeys(at_keys))):
+                placeholders = ','.join('?' * len(part))
+                rows = self._conn.execute(f"""
+                    SELECT at_key, value FROM recent
+                    WHERE field = ? AND at_key IN ({placeholders})
+                    ORDER BY at_key, seq
+                """, [field] + part)
+                for at_key, value in rows:
+                    result.setdefault(at_key, []).append(value)
+        return {at_key: values[-size:] for at_key, values in result.items()}
+
+    def history(self, at_key, field='ganyan', size=None):
+        """Tek at için son size değer (eskiden yeniye)"""
+        return self.histories([at_key], field=field, size=size).get(at_key, [])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -5,31 +5,46 @@ At Yarışı Tahmin Sistemi - Hızlı Kullanım
 
 import sys
 from horse_racing_predictor import HorseRacingPredictor
+from race_clock import as_of_arg
 
 def main():
     print("🏇 At Yarışı Tahmin Sistemi")
     print("=" * 40)
     
-    if len(sys.argv) != 2:
-        print("Kullanım: python3 predict.py [HİPODROM_ADI]")
+    # --profile (cProfile) veya --profile=pyinstrument: tüm çalışmayı profille
+    # --as-of=gg/aa/yyyy[ SS:DD]: o günün kartını tahmin et (geçmiş gün / yarın)
+    flags = [a for a in sys.argv[1:] if a.startswith('--')]
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    profile_mode = None
+    for flag in flags:
+        if flag == '--profile':
+            profile_mode = 'cprofile'
+        elif flag.startswith('--profile='):
+            profile_mode = flag.split('=', 1)[1]
+    
+    if len(args) != 1:
+        print("Kullanım: python3 predict.py [HİPODROM_ADI] [--profile[=pyinstrument]] [--as-of=gg/aa/yyyy]")
         print("Örnek: python3 predict.py ISTANBUL")
         print("\nMevcut hipodromlar:")
         print("- ISTANBUL (API'den çekilir)")
         print("- KOCAELI (yerel veri)")
         return
     
-    hipodrom = sys.argv[1].upper()
+    hipodrom = args[0].upper()
     
     print(f"🎯 Hedef: {hipodrom}")
     print("-" * 40)
     
-    predictor = HorseRacingPredictor(hipodrom)
+    predictor = HorseRacingPredictor(hipodrom, as_of=as_of_arg(flags))
+    if profile_mode:
+        predictor.profiler.profile_mode = profile_mode
     success = predictor.run_full_pipeline()
     
     if success:
         print(f"\n🎉 {hipodrom} tahminleri hazır!")
         print(f"📄 output/{hipodrom}_predictions_top3.csv")
         print(f"📄 output/{hipodrom}_predictions_all.csv")
+        print(f"⏱️ output/{hipodrom}_timing.json")
     else:
         print(f"\n❌ {hipodrom} için tahmin yapılamadı!")
 
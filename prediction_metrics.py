@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Tahmin Başarısı Takibi (sonuç işleme)
+- data/{HIPODROM}_metrics.sqlite: koşu başına saklanan tahminler ve kesinleşen sonuç metrikleri
+- Tahminler sonucu henüz belli olmayan koşular için kaydedilir (sonradan yazılan tahmin sayılmaz)
+- Sonuç gelen (kazananı belli) koşular bir kez işlenir: top-1 / top-3 isabet, logloss,
+  favoriye 1 birim ganyan oynamanın getirisi
+- Her metrik satırı kümülatif toplamları da tutar; son N koşunun özeti iki satır okumasıdır
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+import numpy as np
+
+from odds_history import chunked
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    race TEXT NOT NULL,
+    at_key TEXT NOT NULL,
+    tarih TEXT,
+    win_proba REAL NOT NULL,
+    rank INTEGER NOT NULL,
+    PRIMARY KEY (race, at_key)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    id INTEGER PRIMARY KEY,
+    race TEXT NOT NULL UNIQUE,
+    tarih TEXT,
+    ts REAL NOT NULL,
+    runners INTEGER NOT NULL,
+    top1_hit INTEGER NOT NULL,
+    top3_hit INTEGER NOT NULL,
+    logloss REAL NOT NULL,
+    stake REAL NOT NULL,
+    payout REAL NOT NULL,
+    cum_top1 INTEGER NOT NULL,
+    cum_top3 INTEGER NOT NULL,
+    cum_logloss REAL NOT NULL,
+    cum_stake REAL NOT NULL,
+    cum_payout REAL NOT NULL
+);
+"""
+
+CUMULATIVE_COLUMNS = ('cum_top1', 'cum_top3', 'cum_logloss', 'cum_stake', 'cum_payout')
+
+# Kazananın olasılığı 0 ise logloss sonsuza gitmesin
+PROBA_EPS = 1e-6
+
+
+class PredictionMetricsStore:
+    """Hipodrom bazında tahmin ve sonuç metrikleri
+
+    record_predictions() koşu kartının olasılıklarını saklar; ingest_results()
+    kazananı belli olan ve henüz işlenmemiş koşuları saklanan tahminlerle
+    birleştirip metrics tablosuna ekler. Metrik satırları ardışık id'lerle
+    ve kümülatif toplamlarla yazıldığı için rolling() son N koşunun özetini
+    koşu sayısından bağımsız olarak iki birincil anahtar okumasıyla verir.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+
+    @classmethod
+    def for_hipodrom(cls, hipodrom, data_dir='data'):
+        return cls(os.path.join(data_dir, f'{hipodrom}_metrics.sqlite'))
+
+    def _scored_races(self, races):
+        scored = set()
+        for part in chunked(list(races)):
+            placeholders = ','.join('?' * len(part))
+            scored.update(r for (r,) in self._conn.execute(
+                f'SELECT race FROM metrics WHERE race IN ({placeholders})', part))
+        return scored
+
+    def record_predictions(self, races, at_keys, win_proba, tarih=None, finalized=()):
+        """Koşu kartının tahminlerini sakla (aynı koşunun eski tahmini değiştirilir)
+
+        Sonucu belli olan (finalized) veya zaten işlenmiş koşular atlanır.
+
+        Args:
+            races, at_keys, win_proba: Satır başına koşu anahtarı, at anahtarı ve olasılık
+            tarih: Kart tarihi (gg/aa/yyyy)
+            finalized: Kazananı zaten belli olan koşu anahtarları
+
+        Returns:
+            Tahmini kaydedilen koşu sayısı
+        """
+        races = np.asarray(races, dtype=object)
+        win_proba = np.asarray(win_proba, dtype=float)
+        at_keys = np.asarray(at_keys, dtype=object)
+        valid = ~np.isnan(win_proba) & (at_keys != '')
+        races, at_keys, win_proba = races[valid], at_keys[valid], win_proba[valid]
+        if len(races) == 0:
+            return 0
+
+        # Koşu içi sıra (1 = en yüksek olasılık)
+        order = np.lexsort((-win_proba, races.astype(str)))
+        rank = np.empty(len(order), dtype=int)
+        sorted_races = races[order]
+        starts = np.r_[0, np.flatnonzero(sorted_races[1:] != sorted_races[:-1]) + 1]
+        rank[order] = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)])) + 1
+
+        with self._lock:
+            skip = set(finalized) | self._scored_races(set(races))
+            keep = [i for i, race in enumerate(races) if race not in skip]
+            if not keep:
+                return 0
+            new_races = sorted({races[i] for i in keep})
+            with self._conn:
+                for part in chunked(new_races):
+                    placeholders = ','.join('?' * len(part))
+                    self._conn.execute(f'DELETE FROM predictions WHERE race IN ({placeholders})', part)
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO predictions (race, at_key, tarih, win_proba, rank) VALUES (?, ?, ?, ?, ?)',
+                    [(races[i], at_keys[i], tarih, float(win_proba[i]), int(rank[i])) for i in keep]
+                )
+            return len(new_races)
+
+    def ingest_results(self, races, at_keys, sonuc, ganyan, tarih=None, ts=None):
+        """Kazananı belli olan, tahmini saklı ve henüz işlenmemiş koşuların metriklerini ekle
+
+        Args:
+            races, at_keys: Sonuç satırlarının koşu ve at anahtarları
+            sonuc: Bitiş sırası (sayı; belli değilse NaN)
+            ganyan: Kapanış ganyanı (1 birimin dönüşü; yoksa NaN)
+
+        Returns:
+            İşlenen koşu sayısı
+        """
+        sonuc = np.asarray(sonuc, dtype=float)
+        ganyan = np.asarray(ganyan, dtype=float)
+        winners = {}
+        for race, at_key, place, odds in zip(races, at_keys, sonuc, ganyan):
+            if place == 1 and race not in winners:
+                winners[race] = (at_key, odds)
+        if not winners:
+            return 0
+        ts = time.time() if ts is None else ts
+
+        with self._lock:
+            scored = self._scored_races(winners)
+            pending = [r for r in winners if r not in scored]
+            if not pending:
+                return 0
+            predictions = {}
+            for part in chunked(pending):
+                placeholders = ','.join('?' * len(part))
+                rows = self._conn.execute(
+                    f'SELECT race, at_key, win_proba, rank FROM predictions WHERE race IN ({placeholders})', part)
+                for race, at_key, proba, rank in rows:
+                    predictions.setdefault(race, {})[at_key] = (proba, rank)
+
+            last = self._conn.execute(
+                f'SELECT id, {", ".join(CUMULATIVE_COLUMNS)} FROM metrics ORDER BY id DESC LIMIT 1'
+            ).fetchone() or (0, 0, 0, 0.0, 0.0, 0.0)
+            next_id, cum = last[0] + 1, list(last[1:])
+            new_rows = []
+            for race in pending:
+                horses = predictions.get(race)
+                winner, winner_odds = winners[race]
+                # Tahmini olmayan veya kazananı tahminlerde bulunmayan koşu işlenemez
+                if not horses or winner not in horses:
+                    continue
+                total = sum(p for p, _ in horses.values())
+                winner_proba, winner_rank = horses[winner]
+                top1 = int(winner_rank == 1)
+                top3 = int(winner_rank <= 3)
+                logloss = -float(np.log(max(winner_proba / total if total > 0 else 0.0, PROBA_EPS)))
+                # Favoriye (rank 1) 1 birim ganyan
+                stake = 1.0
+                payout = float(winner_odds) if top1 and not np.isnan(winner_odds) else 0.0
+                cum = [cum[0] + top1, cum[1] + top3, cum[2] + logloss, cum[3] + stake, cum[4] + payout]
+                new_rows.append((next_id, race, tarih, ts, len(horses), top1, top3, logloss, stake, payout, *cum))
+                next_id += 1
+            if not new_rows:
+                return 0
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT INTO metrics (id, race, tarih, ts, runners, top1_hit, top3_hit, logloss, stake, payout, '
+                    f'{", ".join(CUMULATIVE_COLUMNS)}) VALUES ({", ".join("?" * 15)})', new_rows
+                )
+            return len(new_rows)
+
+    def rolling(self, window=None):
+        """Son window koşunun (None: tümü) isabet oranları, ortalama logloss ve ROI
+
+        Kümülatif toplamlardan iki satır farkıyla hesaplanır (O(1)).
+        """
+        columns = ', '.join(('id',) + CUMULATIVE_COLUMNS)
+        with self._lock:
+            last = self._conn.execute(f'SELECT {columns} FROM metrics ORDER BY id DESC LIMIT 1').fetchone()
+            if last is None:
+                return {'races': 0, 'top1_rate': None, 'top3_rate': None, 'logloss': None, 'roi': None}
+            base = None
+            if window is not None and last[0] > window:
+                base = self._conn.execute(f'SELECT {columns} FROM metrics WHERE id = ?', (last[0] - window,)).fetchone()
+        base = base or (0, 0, 0, 0.0, 0.0, 0.0)
+        races = last[0] - base[0]
+        top1, top3, logloss, stake, payout = (a - b for a, b in zip(last[1:], base[1:]))
+        return {
+            'races': races,
+            'top1_rate': round(top1 / races, 4),
+            'top3_rate': round(top3 / races, 4),
+            'logloss': round(logloss / races, 4),
+            'roi': round((payout - stake) / stake, 4) if stake else None,
+        }
+
+    def summary(self, windows=(20, 100, None)):
+        """Birden fazla pencere için rolling() özetleri ('son_20', 'son_100', 'tum')"""
+        return {(f'son_{w}' if w else 'tum'): self.rolling(w) for w in windows}
+
+    def daily(self):
+        """Tarih bazında koşu sayısı, isabet oranları, ortalama logloss ve ROI (işlenme sırasıyla)"""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT tarih, COUNT(*), SUM(top1_hit), SUM(top3_hit), SUM(logloss), SUM(stake), SUM(payout)
+                FROM metrics GROUP BY tarih ORDER BY MIN(id)
+            """).fetchall()
+        return [{
+            'tarih': tarih,
+            'races': races,
+            'top1_rate': round(top1 / races, 4),
+            'top3_rate': round(top3 / races, 4),
+            'logloss': round(logloss / races, 4),
+            'roi': round((payout - stake) / stake, 4) if stake else None,
+        } for tarih, races, top1, top3, logloss, stake, payout in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
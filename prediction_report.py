@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Tahmin Raporu (TXT / CSV / JSON)
+- Skorlanmış kart (win_proba kolonu) bir kez koşulara gruplanır ve koşu içi sıralanır
+- Aynı yapıdan output/{HIPODROM}_tahminler.txt, _predictions_all.csv,
+  _predictions_top3.csv ve _tahminler.json üretilir
+- Metin satırları listede biriktirilip tek yazmada dosyaya basılır
+- format_predictions.py konsol çıktısını JSON'dan (yoksa CSV'den) aynı yapıyla basar
+"""
+
+import json
+import math
+import numpy as np
+import pandas as pd
+
+from race_clock import turkey_time
+
+NAME_COLUMNS = ("at_adi", "at_ismi", "at")
+
+
+def prob_emoji(prob):
+    """Probability'ye göre emoji"""
+    if prob > 0.7:
+        return "🔥"
+    if prob > 0.5:
+        return "⭐"
+    if prob > 0.3:
+        return "📈"
+    return "📉"
+
+
+def json_value(value):
+    """JSON'a yazılabilir değer (NaN → None, numpy skalerleri → Python)"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class PredictionReport:
+    """Skorlanmış kartın koşu bazlı, sıralı görünümü
+
+    Koşular 'saat' (yoksa 'yaris_kosu_key') kolonuna göre bir kez gruplanır;
+    her koşu için atların kart içi pozisyonları win_proba'ya göre sıralı
+    tutulur. TXT/CSV/JSON çıktıları ve konsol özeti bu yapıdan üretilir.
+    """
+
+    def __init__(self, df, hipodrom_key, now=None):
+        self.df = df.reset_index(drop=True)
+        self.hipodrom_key = hipodrom_key
+        self.now = now or turkey_time()
+        self.name_col = next((c for c in NAME_COLUMNS if c in self.df.columns), None)
+        self.group_col = 'saat' if 'saat' in self.df.columns else 'yaris_kosu_key'
+
+        df = self.df
+        n = len(df)
+        self.names = df[self.name_col].to_numpy(dtype=object)
+        self.proba = df['win_proba'].to_numpy(dtype=float)
+        self.sonuc = df['sonuc'].to_numpy(dtype=object) if 'sonuc' in df.columns else np.full(n, None, dtype=object)
+
+        # At başına ek etiketler: sürpriz/balon potansiyeli ve akıllı labellar
+        def column(col, default):
+            return df[col].to_numpy(dtype=object) if col in df.columns else np.full(n, default, dtype=object)
+
+        self.labels = []
+        for surpriz, balon, smart in zip(column('at_surpriz_potansiyeli', 0), column('at_balon_potansiyeli', 0),
+                                         column('smart_labels', '')):
+            labels = []
+            if not pd.isna(surpriz) and surpriz >= 2:
+                labels.append(f"🎯 Sürpriz:{int(surpriz)}")
+            if not pd.isna(balon) and balon >= 2:
+                labels.append(f"⚠️ Balon:{int(balon)}")
+            if smart:
+                labels.append(smart)
+            self.labels.append(labels)
+
+        # Koşular (grup sırası) ve koşu içi win_proba sırası
+        self.races = []
+        if self.group_col in df.columns and n:
+            grouped = df.groupby(self.group_col, observed=True)
+            codes = grouped.ngroup().to_numpy()
+            keys = grouped.size().index
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+            cins = column('cins_detay', None)
+            for i, key in enumerate(keys):
+                pos = order[bounds[i]:bounds[i + 1]]
+                if len(pos) == 0:
+                    continue
+                pos = pos[pd.Series(self.proba[pos]).sort_values(ascending=False).index.to_numpy()]
+                # Cins detay bilgisi (en yüksek olasılıklı attan)
+                first_cins = cins[pos[0]]
+                self.races.append({
+                    'key': key,
+                    'cins_detay': str(first_cins) if pd.notna(first_cins) else '',
+                    'rows': pos,
+                })
+
+    def to_text(self):
+        """TXT tahmin dosyasının içeriği"""
+        df = self.df
+        lines = [
+            f"🏇 {self.hipodrom_key} AT YARIŞI TAHMİNLERİ",
+            "=" * 60,
+            f"📅 Tarih: {self.now.strftime('%d/%m/%Y %H:%M')}",
+            f"📊 Toplam Koşu: {df['yaris_kosu_key'].nunique()}",
+            f"📊 Toplam At: {len(df)}",
+            "=" * 60,
+            "",
+        ]
+        by_saat = self.group_col == 'saat'
+        for race_count, race in enumerate(self.races, 1):
+            header = f"🏁 KOŞU {race_count}"
+            if by_saat:
+                header += f" - Saat {race['key']}"
+            if race['cins_detay']:
+                header += f" - {race['cins_detay']}"
+            lines.append(header)
+            lines.append("-" * 40)
+            for i, p in enumerate(race['rows'], 1):
+                prob = self.proba[p]
+                label_str = " " + " ".join(self.labels[p]) if self.labels[p] else ""
+                lines.append(f"{i:2d}. {prob_emoji(prob)} {self.names[p]:25} - {prob*100:5.1f}%{label_str}")
+            # En yüksek 3'ü vurgula
+            lines.append("")
+            lines.append("🎯 En Yüksek 3 Tahmin:")
+            for i, p in enumerate(race['rows'][:3], 1):
+                lines.append(f"   {i}. {self.names[p]:25} - {self.proba[p]*100:5.1f}%")
+            lines.append("")
+            lines.append("=" * 60)
+            lines.append("")
+
+        # Özet istatistikler
+        lines.append("📊 ÖZET İSTATİSTİKLER")
+        lines.append("-" * 30)
+        lines.append("🔥 En Yüksek 5 Kazanma Olasılığı:")
+        for i, p in enumerate(self.top_positions(5), 1):
+            lines.append(f"   {i}. {self.names[p]:25} - {self.proba[p]*100:5.1f}%")
+        lines.append("")
+        lines.append("📈 Probability Dağılımı:")
+        lines.append(f"   En yüksek: {df['win_proba'].max()*100:.1f}%")
+        lines.append(f"   En düşük:  {df['win_proba'].min()*100:.1f}%")
+        lines.append(f"   Ortalama:  {df['win_proba'].mean()*100:.1f}%")
+        return "\n".join(lines) + "\n"
+
+    def top_positions(self, n):
+        """Tüm kartta en yüksek olasılıklı n atın pozisyonları"""
+        return self.df['win_proba'].reset_index(drop=True).nlargest(n).index.to_numpy()
+
+    def to_dict(self):
+        """Koşu bazlı yapılandırılmış çıktı (JSON / konsol için)"""
+        by_saat = self.group_col == 'saat'
+        kosular = []
+        for race_count, race in enumerate(self.races, 1):
+            kosular.append({
+                'kosu': race_count,
+                'saat': json_value(race['key']) if by_saat else None,
+                'cins_detay': race['cins_detay'],
+                'atlar': [{
+                    'sira': i,
+                    'at_adi': json_value(self.names[p]),
+                    'win_proba': json_value(self.proba[p]),
+                    'sonuc': json_value(self.sonuc[p]),
+                    'etiketler': self.labels[p],
+                } for i, p in enumerate(race['rows'], 1)],
+            })
+        proba = self.df['win_proba']
+        return {
+            'hipodrom': self.hipodrom_key,
+            'tarih': self.now.strftime('%d/%m/%Y %H:%M'),
+            'toplam_kosu': int(self.df['yaris_kosu_key'].nunique()),
+            'toplam_at': len(self.df),
+            'kosular': kosular,
+            'en_yuksek_5': [{'at_adi': json_value(self.names[p]), 'win_proba': json_value(self.proba[p])}
+                            for p in self.top_positions(5)],
+            'en_yuksek': json_value(proba.max()),
+            'en_dusuk': json_value(proba.min()),
+            'ortalama': json_value(proba.mean()),
+        }
+
+    def write_csv(self, all_file, top3_file):
+        """Tüm tahminler ve koşu başına ilk 3 (CSV)"""
+        group_col = "yaris_kosu_key"
+        keep = [c for c in [group_col, self.name_col, "win_proba", "sonuc"] if c in self.df.columns]
+        self.df[keep].to_csv(all_file, index=False)
+        ranked = self.df.sort_values([group_col, "win_proba"], ascending=[True, False])
+        ranked.groupby(group_col, observed=True).head(3)[keep].to_csv(top3_file, index=False)
+
+    def write_text(self, txt_file):
+        with open(txt_file, 'w', encoding='utf-8') as f:
+            f.write(self.to_text())
+
+    def write_json(self, json_file):
+        with open(json_file, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+
+def render_console(report):
+    """Yapılandırılmış rapordan (to_dict) anlaşılır konsol çıktısı"""
+    lines = [
+        f"🏇 {report['hipodrom']} BUGÜNÜN AT YARIŞI TAHMİNLERİ",
+        "=" * 60,
+        f"📅 Tarih: {report['tarih']}",
+        f"📊 Bugünün Koşu Sayısı: {report['toplam_kosu']}",
+        f"📊 Bugünün At Sayısı: {report['toplam_at']}",
+        "=" * 60,
+    ]
+    for kosu in report['kosular']:
+        saat = kosu['saat'] if kosu['saat'] is not None else 'Bilinmiyor'
+        lines.append(f"\n🏁 KOŞU {kosu['kosu']} - Saat {saat}")
+        lines.append("-" * 50)
+        for at in kosu['atlar']:
+            prob = at['win_proba']
+            sonuc = pd.to_numeric(at['sonuc'], errors='coerce')
+            if sonuc == 1:
+                status = "🏆 KAZANDI"
+            elif pd.notna(sonuc):
+                status = f"📊 {int(sonuc)}. sıra"
+            else:
+                status = "⏳ Tahmin"
+            lines.append(f"{at['sira']:2d}. {prob_emoji(prob)} {at['at_adi']:25} - {prob*100:5.1f}% - {status}")
+        lines.append("\n🎯 En Yüksek 3 Tahmin:")
+        for at in kosu['atlar'][:3]:
+            lines.append(f"   {at['sira']}. {at['at_adi']:25} - {at['win_proba']*100:5.1f}%")
+
+    lines.append("\n📊 ÖZET İSTATİSTİKLER")
+    lines.append("-" * 30)
+    lines.append("🔥 En Yüksek 5 Kazanma Olasılığı:")
+    for i, at in enumerate(report['en_yuksek_5'], 1):
+        lines.append(f"   {i}. {at['at_adi']:25} - {at['win_proba']*100:5.1f}%")
+    lines.append("\n📈 Probability Dağılımı:")
+    lines.append(f"   En yüksek: {report['en_yuksek']*100:.1f}%")
+    lines.append(f"   En düşük:  {report['en_dusuk']*100:.1f}%")
+    lines.append(f"   Ortalama:  {report['ortalama']*100:.1f}%")
+
+    winners = [at for kosu in report['kosular'] for at in kosu['atlar']
+               if pd.to_numeric(at['sonuc'], errors='coerce') == 1]
+    if winners:
+        lines.append("\n🏆 Gerçek Kazananlar:")
+        for at in winners:
+            lines.append(f"   {at['at_adi']:25} - {at['win_proba']*100:5.1f}%")
+    return "\n".join(lines)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Yarış Günü Takvimi
+- data/*_races.csv dosyalarından verilen günde (as-of) koşu olan şehirleri bulur
+- daily_update.py ve batch_predict.py tarafından ortak kullanılır
+"""
+
+import pandas as pd
+from pathlib import Path
+
+from race_clock import DATE_FORMAT
+
+# Proje dizini
+BASE_DIR = Path(__file__).parent
+
+def get_cities_with_races_today(as_of):
+    """Bugün (as_of günü) koşu olan şehirleri tespit et"""
+    data_dir = BASE_DIR / 'data'
+    today = as_of.strftime(DATE_FORMAT)
+    
+    cities_with_races = []
+    
+    # Tüm CSV dosyalarını kontrol et
+    for csv_file in data_dir.glob('*_races.csv'):
+        try:
+            # Şehir adını dosya adından çıkar (örn: ISTANBUL_races.csv -> ISTANBUL)
+            city_name = csv_file.stem.replace('_races', '').upper()
+            
+            # CSV'yi oku
+            df = pd.read_csv(csv_file, encoding='utf-8')
+            
+            # Bugün koşu var mı kontrol et
+            if 'tarih' in df.columns:
+                today_races = df[df['tarih'] == today]
+                if len(today_races) > 0:
+                    cities_with_races.append(city_name)
+                    print(f"✅ {city_name}: Bugün {len(today_races)} at var")
+        except Exception as e:
+            print(f"⚠️ {csv_file.name} okunurken hata: {e}")
+            continue
+    
+    return sorted(cities_with_races)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Yarış Günü Saati (as-of)
+- Pipeline, web katmanı ve scriptler 'şimdi'yi ve 'bugün'ü tek yerden alır
+- Varsayılan: İstanbul duvar saati (sunucunun saat diliminden bağımsız)
+- GALOPCU_AS_OF=gg/aa/yyyy[ SS:DD] ortam değişkeni (veya scriptlerde --as-of) saati o ana
+  sabitler: geçmiş bir gün yeniden işlenir, yarının kartı önceden hesaplanır
+- Sadece tarih verilirse saat 12:00 kabul edilir
+"""
+
+import os
+from datetime import datetime, date
+
+import pytz
+
+TURKEY_TZ = pytz.timezone('Europe/Istanbul')
+AS_OF_ENV = 'GALOPCU_AS_OF'
+DATE_FORMAT = '%d/%m/%Y'
+AS_OF_FORMATS = ('%d/%m/%Y %H:%M', '%d/%m/%Y')
+
+
+def turkey_time(timestamp=None):
+    """Epoch saniyesinin (None: şimdi) İstanbul duvar saati (naive datetime)"""
+    if timestamp is None:
+        return datetime.now(TURKEY_TZ).replace(tzinfo=None)
+    return datetime.fromtimestamp(timestamp, TURKEY_TZ).replace(tzinfo=None)
+
+
+def parse_as_of(value):
+    """'gg/aa/yyyy[ SS:DD]', date veya datetime → naive datetime (sadece tarih: 12:00)"""
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None) if value.tzinfo is None else value.astimezone(TURKEY_TZ).replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day, 12)
+    text = str(value).strip()
+    for fmt in AS_OF_FORMATS:
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return parsed if fmt != DATE_FORMAT else parsed.replace(hour=12)
+    raise ValueError(f"Geçersiz as-of tarihi: {value!r} (beklenen: gg/aa/yyyy[ SS:DD])")
+
+
+def as_of_clock(as_of=None):
+    """Saat fonksiyonu: as_of (yoksa GALOPCU_AS_OF) verilmişse o ana sabit, değilse İstanbul saati"""
+    if as_of is None or as_of == '':
+        as_of = os.environ.get(AS_OF_ENV) or None
+    if as_of is None:
+        return turkey_time
+    fixed = parse_as_of(as_of)
+    return lambda: fixed
+
+
+def as_of_arg(argv):
+    """Komut satırındaki --as-of=... değeri (yoksa None)"""
+    return next((a.split('=', 1)[1] for a in argv if a.startswith('--as-of=')), None)
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Sentetik Koşu Verisi Üreteci (yük testi için)
+- data/*_races.csv ile birebir aynı 52 kolonluk şemada CSV üretir
+- Tekrar tekrar koşan atlar (kariyer penceresi), sabit jokey/antrenör/sahip ilişkileri
+- cins_detay sınıf karışımı, grup, pist/mesafe dağılımları gerçek verideki oranlarda
+- son6 ve kgs atın kendi önceki sonuçlarından hesaplanır; '<nil>' ve boş değerler
+  gerçek verideki sıklıklarda bulunur
+- Binlerden milyonlarca satıra kadar ölçeklenir (tüm üretim vektörel)
+- Son gün (bugün) koşularının sonucu boş bırakılır: pipeline tahmin modunda çalışır
+
+Kullanım:
+    python3 synthetic_races.py --rows=100000 [--hipodrom=SENTETIK] [--seed=42]
+                               [--end=14/11/2025] [--out=synthetic/SENTETIK_races.csv]
+"""
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Gerçek CSV'lerdeki kolon sırası (52 kolon)
+RACE_CSV_COLUMNS = [
+    'hipodrom_key', 'yaris_kosu_key', 'pist', 'start', 'sahip_adi', 'handikap', 'kgs', 'taki',
+    'kilo', 'nem', 'kosu_kodu', 'no', 'tarih', 'saat', 'at_key', 'antrenor_kodu',
+    'cim_pist_agirlik', 'at_adi', 'yas', 'kosmaz', 'en_iyi_derece', 'en_iyi_derece_farkli_hipodrom',
+    'gec_cikis_boy', 'agf1', 'jokey_adi', 'jokey_kodu', 'antrenor_adi', 'ganyan', 'sonuc', 'son6',
+    'sicaklik', 'kum', 'at_sayisi', 'fark', 'cim', 'grup', 'son800', 'agf2_sira', 'yaris_key',
+    'kum_pist_agirlik', 'mesafe', 'cins_detay', 'sahip_kodu', 'son20', 'derece', 'agf1_sira',
+    'gece', 'hava_durumu', 'fazla_kilo', 'apranti_kilo_indirimi', 'yetistirici_adi', 'agf2',
+]
+
+# Koşu sınıfı karışımı (gerçek verideki oranlara yakın)
+CINS_DETAY_WEIGHTS = {
+    'Maiden': 0.20, 'Handikap 15': 0.11, 'ŞARTLI 4': 0.11, 'Handikap 16': 0.09, 'ŞARTLI 3': 0.08,
+    'Handikap 14': 0.08, 'ŞARTLI 5': 0.08, 'KV-6': 0.04, 'ŞARTLI 1': 0.03, 'Handikap 17': 0.03,
+    'KV-7': 0.026, 'KV-8': 0.02, 'ŞARTLI 2': 0.015, 'G 3': 0.009, 'SATIŞ 1': 0.008, 'SATIŞ 2': 0.006,
+    'G 1': 0.006, 'KV-9': 0.006, 'G 2': 0.005, 'Kısa Vade Handikap 22': 0.005, 'Maiden/Satış': 0.002,
+}
+GRUP_WEIGHTS = {
+    '4 ve Yukarı Araplar': 0.225, '3 Yaşlı Araplar': 0.185, '3 Yaşlı İngilizler': 0.176,
+    '3 ve Yukarı İngilizler': 0.132, '2 Yaşlı İngilizler': 0.127, '4 Yaşlı Araplar': 0.118,
+    '4 ve Yukarı İngilizler': 0.034, '5 ve Yukarı Araplar': 0.003,
+}
+PIST_WEIGHTS = {'kum': 0.58, 'cim': 0.30, 'sentetik': 0.12}
+MESAFE_WEIGHTS = {1000: 0.02, 1100: 0.03, 1200: 0.14, 1300: 0.12, 1400: 0.14, 1500: 0.08, 1600: 0.09,
+                  1700: 0.02, 1800: 0.06, 1900: 0.09, 2000: 0.09, 2100: 0.04, 2200: 0.04, 2400: 0.04}
+HAVA_WEIGHTS = {'Açık': 0.45, 'Çok Bulutlu': 0.27, 'Parçalı Bulutlu': 0.12, 'Az Bulutlu': 0.11,
+                'Hafif Yağmurlu': 0.02, 'Yağmurlu': 0.015, 'Sağanak Yağışlı': 0.015}
+KUM_WEIGHTS = {'Normal': 0.93, 'Nemli': 0.033, 'Islak': 0.021, '': 0.01, 'Sulu': 0.006}
+CIM_WEIGHTS = {'Normal': 0.76, 'Çok Yumuşak': 0.07, 'Biraz Yumuşak': 0.06, 'Çok Ağır': 0.05,
+               'Yumuşak': 0.045, 'Ağır': 0.015}
+TAKI_WEIGHTS = {'KG DB SK': 0.2, 'KG SK': 0.16, 'KG K': 0.09, 'DB SK': 0.08, 'DB SKG SK': 0.07,
+                'SKG SK': 0.065, 'KG K DB': 0.065, 'SK': 0.055, 'KG DB': 0.05, '': 0.045, 'K': 0.04,
+                'DB': 0.04, 'KG': 0.04}
+FARK_VALUES = ['Burun', 'Baş', 'Boyun', 'Yarım Boy', '1 Boy', '1,5  Boy', '2 Boy', '2,5 Boy', '3 Boy',
+               '3,5 Boy', '4 Boy', '5 Boy', '6 Boy', '8 Boy', '10 Boy', '15 Boy', 'Uzak']
+DIGER_HIPODROMLAR = ['ISTANBUL', 'ANKARA', 'IZMIR', 'BURSA', 'ADANA', 'KOCAELI', 'ELAZIG', 'SANLIURFA']
+
+# İsim üretimi için Türkçe karakterli hece/isim havuzları
+HECELER = ['KA', 'RA', 'DE', 'Mİ', 'Rİ', 'ŞA', 'HİN', 'TU', 'NA', 'YEL', 'BO', 'ZOK', 'ÇA', 'KIR', 'GÜL',
+           'SU', 'DE', 'NİZ', 'ÖZ', 'GÜR', 'AY', 'DIN', 'YA', 'ĞIZ', 'TAN', 'ER', 'KAN', 'SEL', 'Çİ', 'ÇEK',
+           'BU', 'LUT', 'YIL', 'DIZ', 'AK', 'SA', 'KAR', 'TAL', 'BEY', 'HAN', 'ŞİM', 'ŞEK', 'ÜL', 'KÜ',
+           'ÖR', 'NEK', 'Lİ', 'MAN', 'DO', 'ĞAN', 'İL', 'KAY', 'FI', 'RAT', 'PO', 'YRAZ', 'LE', 'VENT']
+ADLAR = ['AHMET', 'MEHMET', 'ALİ', 'HÜSEYİN', 'İSA', 'FERİT', 'GÖKHAN', 'ÖZCAN', 'ŞAHİN', 'ÇAĞLAR',
+         'NEVZAT', 'HALİS', 'AKIN', 'SELİM', 'EMRE', 'GÜLİZAR', 'NİMET', 'AYŞE', 'FATMA', 'ZEYNEP',
+         'MUSTAFA', 'HAKKI', 'TARIK', 'KADİR', 'VEDAT', 'YUNUS', 'MELEK', 'ÜMİT', 'ERDAL', 'TUĞBA',
+         'BURAK', 'SERKAN', 'OĞUZ', 'İBRAHİM', 'RECEP', 'MUHARREM', 'GIYASETTİN', 'KASIM', 'DİLEK', 'ŞULE']
+SOYADLAR = ['YILDIZ', 'KAYA', 'ŞEN', 'ÇELİK', 'ÖZGÜL', 'YARDIMCI', 'KATAR', 'AVCİ', 'SÖZEN', 'ÇİZİK',
+            'TUMBUL', 'DİKENCİK', 'KURTEL', 'CANPOLAT', 'YANIK', 'ALTIN', 'TUNCAY', 'ÖNDER', 'SUSEN', 'GÜLERCE',
+            'AKYOL', 'TEKİNALP', 'DENİZ', 'KOZAN', 'TURAN', 'ŞAHİN', 'DOĞAN', 'AYDIN', 'ÖZTÜRK', 'KILIÇ',
+            'ARSLAN', 'KOÇ', 'KURT', 'ÖZDEMİR', 'AKSOY', 'GÖKTÜRK', 'ERDOĞAN', 'BİLGİN', 'AKYAVUZ', 'SANSAR']
+
+
+def _choice(rng, weights, size):
+    """{değer: ağırlık} sözlüğünden size adet örnek (object dizi)"""
+    values = np.array(list(weights.keys()), dtype=object)
+    p = np.array(list(weights.values()), dtype=float)
+    return values[rng.choice(len(values), size=size, p=p / p.sum())]
+
+
+def _hex_keys(rng, n):
+    """n adet 32 karakterlik md5 benzeri anahtar"""
+    raw = np.frombuffer(rng.bytes(16 * n), dtype=np.uint8).reshape(n, 16)
+    return pd.Series([r.tobytes().hex() for r in raw], dtype=object).to_numpy()
+
+
+def _unique_names(rng, n, make):
+    """make(rng, k) ile üretilen isimleri tekilleştir (çakışmalara ' II', ' III' ... eklenir)"""
+    names = pd.Series(make(rng, n), dtype=object)
+    dup = names.groupby(names).cumcount()
+    roman = np.array(['', ' II', ' III', ' IV', ' V', ' VI', ' VII', ' VIII', ' IX', ' X'], dtype=object)
+    suffix = np.where(dup < len(roman), roman[np.minimum(dup, len(roman) - 1)], ' ' + dup.astype(str))
+    return (names + suffix).to_numpy()
+
+
+def _horse_names(rng, n):
+    hece = np.array(HECELER, dtype=object)
+    n_syl = rng.choice([2, 3], size=n, p=[0.6, 0.4])
+    parts = hece[rng.integers(0, len(hece), size=(n, 3))]
+    names = parts[:, 0] + parts[:, 1] + np.where(n_syl == 3, parts[:, 2], '')
+    # Bazı atlar iki kelimelik isim alır (örn. "SULTAN NENE")
+    two = rng.random(n) < 0.25
+    return np.where(two, names + ' ' + hece[rng.integers(0, len(hece), n)] + hece[rng.integers(0, len(hece), n)], names)
+
+
+def _person_names(rng, n):
+    ad = np.array(ADLAR, dtype=object)
+    soyad = np.array(SOYADLAR, dtype=object)
+    first = ad[rng.integers(0, len(ad), n)]
+    middle = np.where(rng.random(n) < 0.3, ' ' + ad[rng.integers(0, len(ad), n)], '')
+    return first + middle + ' ' + soyad[rng.integers(0, len(soyad), n)]
+
+
+def _fmt_time(seconds):
+    """Saniye → 'D.SS.ss' derece formatı (örn. 1.23.41)"""
+    seconds = np.maximum(seconds, 0)
+    minutes = (seconds // 60).astype(int)
+    rest = seconds - 60 * minutes
+    sec = rest.astype(int)
+    cs = np.round((rest - sec) * 100).astype(int).clip(0, 99)
+    return (pd.Series(minutes).astype(str) + '.' + pd.Series(sec).astype(str).str.zfill(2)
+            + '.' + pd.Series(cs).astype(str).str.zfill(2)).to_numpy(dtype=object)
+
+
+def _fmt_decimal(values, decimals=2, comma=False):
+    out = pd.Series(np.round(values, decimals)).map(('{:.%df}' % decimals).format)
+    return (out.str.replace('.', ',', regex=False) if comma else out).to_numpy(dtype=object)
+
+
+def generate_races(n_rows, hipodrom='SENTETIK', seed=42, end_date=None, races_per_day=(6, 10),
+                   field_size=(10, 2.5), starts_per_horse=20, career_days=730, main_share=0.7,
+                   upcoming_last_day=True):
+    """Sentetik koşu verisi (yaklaşık n_rows satır, RACE_CSV_COLUMNS şemasında string DataFrame)
+
+    Args:
+        n_rows: Hedef satır sayısı (koşu bütünlüğü için birkaç satır sapabilir)
+        hipodrom: Ana hipodrom anahtarı; koşu günlerinin main_share'i bu hipodromda
+        end_date: Son (bugün) koşu günü 'dd/mm/YYYY' (varsayılan bugün)
+        races_per_day: Gün başına koşu sayısı aralığı
+        field_size: Koşu başına at sayısı (ortalama, std), 4..18 arasında kırpılır
+        starts_per_horse: At başına ortalama koşu sayısı (geçmiş derinliği)
+        career_days: Bir atın koşularının yayıldığı yaklaşık gün sayısı
+        upcoming_last_day: Son günün sonuç kolonlarını boş bırak (tahmin modu)
+    """
+    rng = np.random.default_rng(seed)
+    end = datetime.strptime(end_date, '%d/%m/%Y') if end_date else datetime.now()
+    end = end.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # --- Koşular ---
+    n_races = max(1, int(round(n_rows / field_size[0])))
+    day_counts = rng.integers(races_per_day[0], races_per_day[1] + 1, size=n_races // races_per_day[0] + 2)
+    day_counts = day_counts[:np.searchsorted(np.cumsum(day_counts), n_races) + 1]
+    day_counts[-1] -= day_counts.sum() - n_races
+    day_counts = day_counts[day_counts > 0]
+    n_days = len(day_counts)
+    # Koşu günleri: haftada ~4 gün, bugünden geriye
+    gaps = rng.choice([1, 1, 2, 3], size=n_days - 1) if n_days > 1 else np.array([], dtype=int)
+    day_offsets = np.concatenate([[0], np.cumsum(gaps)])[::-1]
+    day_dates = pd.DatetimeIndex([end - timedelta(days=int(o)) for o in day_offsets])
+    day_hipodrom = np.where(rng.random(n_days) < main_share, hipodrom,
+                            np.array(DIGER_HIPODROMLAR, dtype=object)[rng.integers(0, len(DIGER_HIPODROMLAR), n_days)])
+    day_hipodrom[-1] = hipodrom
+    day_hava = _choice(rng, HAVA_WEIGHTS, n_days)
+    day_kum = _choice(rng, KUM_WEIGHTS, n_days)
+    day_cim = _choice(rng, CIM_WEIGHTS, n_days)
+    day_sicaklik = rng.integers(0, 36, n_days)
+    day_nem = rng.integers(15, 95, n_days)
+    day_key = _hex_keys(rng, n_days)
+
+    race_day = np.repeat(np.arange(n_days), day_counts)
+    race_no = np.arange(n_races) - np.repeat(np.cumsum(day_counts) - day_counts, day_counts) + 1
+    start_min = np.where(rng.random(n_days) < 0.5, 13 * 60 + 30, 17 * 60)[race_day] + 30 * (race_no - 1)
+    race_saat = (pd.Series(start_min // 60).astype(str).str.zfill(2) + ':'
+                 + pd.Series(start_min % 60).astype(str).str.zfill(2)).to_numpy(dtype=object)
+    race_pist = _choice(rng, PIST_WEIGHTS, n_races)
+    race_mesafe = _choice(rng, MESAFE_WEIGHTS, n_races).astype(int)
+    race_cins = _choice(rng, CINS_DETAY_WEIGHTS, n_races)
+    race_grup = _choice(rng, GRUP_WEIGHTS, n_races)
+    race_size = np.clip(np.round(rng.normal(field_size[0], field_size[1], n_races)), 4, 18).astype(int)
+    race_key = _hex_keys(rng, n_races)
+
+    # --- Atlar, jokeyler, antrenörler, sahipler ---
+    n_entries = int(race_size.sum())
+    # Kısa dönemlerde at başına koşu sayısı ~14 günde bir koşuyla sınırlı
+    span_days = max(1, int(day_offsets[0]))
+    starts_per_horse = max(1, min(starts_per_horse, span_days // 14))
+    n_horses = max(int(race_size.max()) * 3, n_entries // starts_per_horse)
+    n_jokey = max(20, n_horses // 10)
+    n_antrenor = max(15, n_horses // 6)
+    n_sahip = max(20, n_horses // 2)
+    n_yetistirici = max(10, n_horses // 3)
+    horse_names = _unique_names(rng, n_horses, _horse_names)
+    horse_keys = _hex_keys(rng, n_horses)
+    horse_ability = rng.normal(0, 1, n_horses)
+    horse_jokey = rng.integers(0, n_jokey, n_horses)
+    horse_antrenor = rng.integers(0, n_antrenor, n_horses)
+    horse_sahip = rng.integers(0, n_sahip, n_horses)
+    horse_yetistirici = rng.integers(0, n_yetistirici, n_horses)
+    horse_birth = end.year - rng.integers(2, 9, n_horses)
+    horse_renk = np.array(['d', 'a', 'k', 'y'], dtype=object)[rng.choice(4, n_horses, p=[0.45, 0.3, 0.2, 0.05])]
+    horse_cins = np.array(['e', 'd', 'a', 'k'], dtype=object)[rng.integers(0, 4, n_horses)]
+    horse_handikap = np.clip(rng.normal(45, 15, n_horses) + 8 * horse_ability, 10, 110).astype(int)
+    jokey_names = _unique_names(rng, n_jokey, _person_names)
+    jokey_skill = rng.normal(0, 0.5, n_jokey)
+    antrenor_names = _unique_names(rng, n_antrenor, _person_names)
+    sahip_names = _unique_names(rng, n_sahip, _person_names)
+    yetistirici_names = _unique_names(rng, n_yetistirici, _person_names)
+    jokey_codes = rng.permutation(np.arange(50, 50 + 5 * n_jokey))[:n_jokey]
+    antrenor_codes = rng.permutation(np.arange(1000, 1000 + 5 * n_antrenor))[:n_antrenor]
+    sahip_codes = rng.permutation(np.arange(100, 100 + 3 * n_sahip))[:n_sahip]
+
+    # --- Koşu katılımları: at kariyerleri zamana yayılı (sıra ~ kariyer ortası) ---
+    entry_race = np.repeat(np.arange(n_races), race_size)
+    t = entry_race / max(1, n_races - 1)
+    # Kariyer ~career_days gün: pencere (at sırası biriminde) toplam süreye oranla
+    window = max(2.0 * race_size.max(), n_horses * min(1.0, career_days / span_days) / 4)
+    horse = np.rint(t * (n_horses - 1) + rng.normal(0, window, n_entries)).astype(int)
+    entry_day = race_day[entry_race]
+    for _ in range(20):
+        # Kenarlarda yansıt, aynı gün ikinci kez koşan atları yeniden seç
+        horse = np.abs(horse)
+        horse = np.where(horse > n_horses - 1, 2 * (n_horses - 1) - horse, horse) % n_horses
+        dup = pd.DataFrame({'d': entry_day, 'h': horse}).duplicated().to_numpy()
+        if not dup.any():
+            break
+        horse[dup] = np.rint(t[dup] * (n_horses - 1) + rng.normal(0, window, int(dup.sum()))).astype(int)
+    keep = ~pd.DataFrame({'d': entry_day, 'h': horse}).duplicated().to_numpy()
+    entry_race, horse = entry_race[keep], horse[keep]
+    n = len(entry_race)
+
+    # Jokey: %65 atın sabit jokeyi, diğerleri rastgele
+    jokey = np.where(rng.random(n) < 0.65, horse_jokey[horse], rng.integers(0, n_jokey, n))
+
+    # Sonuç: yetenek + jokey + gürültü ile koşu içi sıra
+    strength = horse_ability[horse] + jokey_skill[jokey]
+    perf = strength + rng.gumbel(0, 1.0, n)
+    order = np.lexsort((-perf, entry_race))
+    size_e = np.bincount(entry_race, minlength=n_races)
+    starts = np.cumsum(size_e) - size_e
+    sonuc = np.empty(n, dtype=int)
+    sonuc[order] = np.arange(n) - np.repeat(starts, size_e) + 1
+    at_sayisi = size_e[entry_race]
+
+    # Program no / start kulvarı: koşu içi rastgele permütasyonlar
+    def race_perm():
+        o = np.lexsort((rng.random(n), entry_race))
+        p = np.empty(n, dtype=int)
+        p[o] = np.arange(n) - np.repeat(starts, size_e) + 1
+        return p
+
+    # Bahis oranları: gücün koşu içi softmax'ı
+    expw = np.exp(strength - pd.Series(strength).groupby(entry_race).transform('max').to_numpy())
+    p_win = expw / np.bincount(entry_race, weights=expw)[entry_race]
+    ganyan = np.clip(0.85 / p_win, 1.05, 150.0)
+    agf1 = p_win * 100 * rng.uniform(0.8, 1.2, n)
+    agf1_sira = pd.Series(-agf1).groupby(entry_race).rank(method='first').astype(int).to_numpy()
+    agf2 = p_win * 100 * rng.uniform(0.7, 1.3, n)
+    agf2_sira = pd.Series(-agf2).groupby(entry_race).rank(method='first').astype(int).to_numpy()
+    race_has_agf1 = rng.random(n_races) > 0.31
+    race_has_agf2 = rng.random(n_races) > 0.47
+
+    # Derece: mesafeye göre temel süre + sıra farkı
+    mesafe = race_mesafe[entry_race]
+    pist = race_pist[entry_race]
+    base = mesafe / np.where(pist == 'cim', 16.8, 16.2)
+    seconds = base + (sonuc - 1) * rng.uniform(0.15, 0.4, n) + rng.normal(0, 0.6, n)
+    derece = _fmt_time(seconds)
+    en_iyi = _fmt_time(base - np.abs(rng.normal(1.0, 0.8, n)))
+
+    date_e = day_dates[race_day[entry_race]]
+    frame = pd.DataFrame({
+        'hipodrom_key': day_hipodrom[race_day[entry_race]],
+        'yaris_kosu_key': race_key[entry_race],
+        'pist': pist,
+        'start': race_perm(),
+        'sahip_adi': sahip_names[horse_sahip[horse]],
+        'handikap': np.where(rng.random(n) < 0.13, '', horse_handikap[horse].astype(str)),
+        'taki': _choice(rng, TAKI_WEIGHTS, n),
+        'kilo': np.clip(np.round(rng.normal(56, 2.5, n) * 2) / 2, 48, 63),
+        'nem': day_nem[race_day[entry_race]],
+        'kosu_kodu': 200000 + entry_race,
+        'no': race_perm(),
+        'tarih': date_e.strftime('%d/%m/%Y'),
+        'saat': race_saat[entry_race],
+        'at_key': horse_keys[horse],
+        'antrenor_kodu': antrenor_codes[horse_antrenor[horse]],
+        'cim_pist_agirlik': np.where(pist == 'cim', np.round(rng.uniform(3.0, 5.5, n), 1), 0.0),
+        'at_adi': horse_names[horse],
+        'yas': (pd.Series(np.clip(date_e.year - horse_birth[horse], 2, 12)).astype(str) + 'y '
+                + horse_renk[horse] + np.where(rng.random(n) < 0.5, '  ', ' ') + horse_cins[horse]),
+        'kosmaz': np.where(rng.random(n) < 0.01, 'true', 'false'),
+        'en_iyi_derece': np.where(rng.random(n) < 0.38, '', en_iyi),
+        'en_iyi_derece_farkli_hipodrom': np.where(rng.random(n) < 0.4, 'true', 'false'),
+        'gec_cikis_boy': _choice(rng, {'': 0.91, '<nil>': 0.01, '1 Boy': 0.03, '2 Boy': 0.03, '3 Boy': 0.02}, n),
+        'agf1': np.where(race_has_agf1[entry_race], _fmt_decimal(agf1), '<nil>'),
+        'jokey_adi': jokey_names[jokey],
+        'jokey_kodu': jokey_codes[jokey],
+        'antrenor_adi': antrenor_names[horse_antrenor[horse]],
+        'ganyan': np.where(rng.random(n) < 0.02, '', _fmt_decimal(ganyan, comma=True)),
+        'sonuc': sonuc.astype(str),
+        'sicaklik': day_sicaklik[race_day[entry_race]],
+        'kum': day_kum[race_day[entry_race]],
+        'at_sayisi': at_sayisi,
+        'fark': np.where((sonuc == 1) | (rng.random(n) < 0.45), '', np.array(FARK_VALUES, dtype=object)[
+            np.clip(sonuc - 2 + rng.integers(0, 4, n), 0, len(FARK_VALUES) - 1)]),
+        'cim': np.where(pist == 'cim', day_cim[race_day[entry_race]], ''),
+        'grup': race_grup[entry_race],
+        'son800': np.where(rng.random(n) < 0.05, np.where(rng.random(n) < 0.2, '<nil>', ''),
+                           np.char.add(np.char.add(_fmt_time(rng.normal(52, 3, n)).astype(str), '-'),
+                                       _fmt_time(rng.normal(53, 3, n)).astype(str)).astype(object)),
+        'agf2_sira': np.where(race_has_agf2[entry_race], agf2_sira.astype(str), '<nil>'),
+        'yaris_key': day_key[race_day[entry_race]],
+        'kum_pist_agirlik': 0,
+        'mesafe': mesafe,
+        'cins_detay': race_cins[entry_race],
+        'sahip_kodu': sahip_codes[horse_sahip[horse]],
+        'son20': rng.integers(10, 21, n),
+        'derece': np.where(rng.random(n) < 0.01, '<nil>', derece),
+        'agf1_sira': np.where(race_has_agf1[entry_race], agf1_sira.astype(str), '<nil>'),
+        'gece': np.where(start_min[entry_race] >= 19 * 60, 'true', 'false'),
+        'hava_durumu': day_hava[race_day[entry_race]],
+        'fazla_kilo': np.where(rng.random(n) < 0.85, 0.0, rng.choice([0.5, 1.0, 1.5, 2.0], n)),
+        'apranti_kilo_indirimi': np.where(rng.random(n) < 0.8, 0.0, rng.choice([1.0, 1.5, 2.0, 3.0, 4.0], n)),
+        'yetistirici_adi': yetistirici_names[horse_yetistirici[horse]],
+        'agf2': np.where(race_has_agf2[entry_race], _fmt_decimal(agf2), '<nil>'),
+    })
+
+    # son6 ve kgs: atın önceki koşularından (en eski solda, son koşu en sağda; 10.+ → 0)
+    chrono = np.lexsort((entry_race, horse))
+    h_sorted = horse[chrono]
+    surface = np.where(pist == 'cim', 'C', np.where((pist == 'sentetik') & (rng.random(n) < 0.2), 'S', 'K'))
+    code = pd.Series(surface[chrono] + np.where(sonuc[chrono] >= 10, 0, sonuc[chrono]).astype(str), dtype=object)
+    grouped = code.groupby(h_sorted)
+    son6 = pd.Series('', index=code.index, dtype=object)
+    for lag in range(6, 0, -1):
+        son6 = son6 + grouped.shift(lag).fillna('')
+    days = pd.Series(date_e[chrono].to_numpy()).groupby(h_sorted).diff().dt.days
+    son6_out = np.empty(n, dtype=object)
+    son6_out[chrono] = son6.to_numpy()
+    kgs_out = np.empty(n, dtype=object)
+    kgs_out[chrono] = np.where(days.isna(), '', days.fillna(0).astype(int).astype(str))
+    frame['son6'] = son6_out
+    frame['kgs'] = kgs_out
+
+    if upcoming_last_day:
+        # Bugünün koşuları: sonuç/derece/fark henüz yok
+        today = race_day[entry_race] == n_days - 1
+        for col in ('sonuc', 'derece', 'fark', 'son800'):
+            frame.loc[today, col] = ''
+
+    return frame[RACE_CSV_COLUMNS].astype(str)
+
+
+def write_races_csv(path, n_rows, **kwargs):
+    """generate_races çıktısını CSV'ye yaz; DataFrame'i döndürür"""
+    frame = generate_races(n_rows, **kwargs)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    frame.to_csv(path, index=False, encoding='utf-8')
+    return frame
+
+
+def main():
+    """Ana fonksiyon"""
+    opts = dict(a[2:].split('=', 1) for a in sys.argv[1:] if a.startswith('--') and '=' in a)
+    n_rows = int(float(opts.get('rows', 10000)))
+    hipodrom = opts.get('hipodrom', 'SENTETIK').upper()
+    out = opts.get('out') or os.path.join('synthetic', f"{hipodrom}_races.csv")
+
+    print(f"🧪 {n_rows:,} satırlık sentetik veri üretiliyor ({hipodrom})...")
+    start = time.time()
+    frame = write_races_csv(out, n_rows, hipodrom=hipodrom, seed=int(opts.get('seed', 42)),
+                            end_date=opts.get('end'))
+    print(f"✅ {len(frame):,} satır, {frame['yaris_kosu_key'].nunique():,} koşu, "
+          f"{frame['at_key'].nunique():,} at → {out} ({time.time() - start:.1f} sn)")
+
+
+if __name__ == '__main__':
+    main()
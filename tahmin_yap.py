@@ -6,22 +6,24 @@ At yarışı tahmin sistemi - Ana kullanım dosyası
 import sys
 import os
 from horse_racing_predictor import HorseRacingPredictor
+from race_clock import as_of_arg
 
 def main():
     """Ana fonksiyon"""
-    if len(sys.argv) != 2:
-        print("❌ Kullanım: python3 tahmin_yap.py <HIPODROM>")
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    if len(args) != 1:
+        print("❌ Kullanım: python3 tahmin_yap.py <HIPODROM> [--as-of=gg/aa/yyyy[ SS:DD]]")
         print("📋 Mevcut hipodromlar: ANKARA, IZMIR")
         print("📝 Örnek: python3 tahmin_yap.py ANKARA")
         sys.exit(1)
     
-    hipodrom_key = sys.argv[1].upper()
+    hipodrom_key = args[0].upper()
     
     print(f"🏇 {hipodrom_key} At Yarışı Tahmin Sistemi")
     print("=" * 50)
     
     try:
-        predictor = HorseRacingPredictor(hipodrom_key)
+        predictor = HorseRacingPredictor(hipodrom_key, as_of=as_of_arg(sys.argv[1:]))
         success = predictor.run_full_pipeline()
         
         if success:
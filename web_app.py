@@ -6,15 +6,18 @@ Modern, mobil uyumlu web arayüzü
 
 import os
 import re
-import json
 import threading
+import functools
 import subprocess
+import unicodedata
+import numpy as np
 import pandas as pd
 from flask import Flask, render_template, jsonify, request
 from flask_cors import CORS
 from pathlib import Path
-from datetime import datetime
-import pytz
+from odds_history import OddsHistoryStore
+from prediction_metrics import PredictionMetricsStore
+from race_clock import TURKEY_TZ, DATE_FORMAT, as_of_clock, turkey_time
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
@@ -24,16 +27,39 @@ app.config['TEMPLATES_AUTO_RELOAD'] = True
 CORS(app)  # Tüm origin'lerden isteklere izin ver
 
 # Scheduler
+# GALOPCU_DISABLE_SCHEDULER=1: arka plan işleri (veri indirme/tahmin) başlatılmaz (test/benchmark için)
+BACKGROUND_JOBS_ENABLED = os.environ.get('GALOPCU_DISABLE_SCHEDULER', '') != '1'
 scheduler = BackgroundScheduler()
-scheduler.start()
+if BACKGROUND_JOBS_ENABLED:
+    scheduler.start()
 
-# Son güncelleme zamanı (site yenileme için)
+# Son güncelleme zamanı (site yenileme için, İstanbul saati)
 last_update_time = None
 
+
+def web_now():
+    """Web katmanının 'şimdi'si: GALOPCU_AS_OF verilmişse o an, değilse İstanbul saati
+
+    Handler'lar 'bugün'ü ve koşu saatlerini buradan alır; arka plandaki
+    tahmin süreçlerine de aynı an --as-of ile geçirilir.
+    """
+    return as_of_clock()()
+
+
+def as_of_flag():
+    """Alt süreçler (tahmin_yap.py, daily_update.py) için --as-of argümanı"""
+    return f"--as-of={web_now().strftime('%d/%m/%Y %H:%M')}"
+
 # Cache mekanizması (API yanıtlarını hızlı tutmak için)
-_tahmin_cache = {}  # {hipodrom: {'data': {...}, 'timestamp': datetime, 'file_mtime': float}}
-_ganyan_cache = {}  # {hipodrom: {'data': {...}, 'timestamp': datetime}}
-CACHE_TTL = 60  # Cache süresi (saniye) - 1 dakika
+_race_card_cache = {}  # {hipodrom: {'key': (tahmin_mtime, csv_statik_ozet, gun), 'card': {...}}}
+_race_card_lock = threading.Lock()
+_odds_overlay_cache = {}  # {hipodrom: {'card': {...}, 'odds': ndarray, 'races': [{'fields': {...}, 'top_3': [...]}], ...}}
+_race_index_cache = {}  # {hipodrom: {'key': (csv_mtime, today), 'index': {...}}}
+_ganyan_history_cache = {}  # {hipodrom: {'version': int, 'histories': {at_key: [...]}, 'loaded': set}}
+_odds_stores = {}  # {hipodrom: OddsHistoryStore}
+_odds_store_lock = threading.Lock()
+_metrics_stores = {}  # {hipodrom: PredictionMetricsStore}
+_metrics_predictions_mtime = {}  # {hipodrom: kaydedilen predictions_all.csv mtime}
 
 # Hipodrom listesi
 HIPODROMLAR = [
@@ -195,9 +221,7 @@ def get_race_winner_helper(hipodrom, kosu_no, kosu_saat=None):
     
     try:
         df = pd.read_csv(csv_path, encoding='utf-8')
-        # Türkiye timezone'una göre tarih al
-        turkey_tz = pytz.timezone('Europe/Istanbul')
-        today = datetime.now(turkey_tz).strftime('%d/%m/%Y')
+        today = web_now().strftime(DATE_FORMAT)
         today_df = df[df['tarih'] == today]
         
         if len(today_df) == 0:
@@ -244,17 +268,16 @@ def api_update_time():
     global last_update_time
     return jsonify({
         'last_update_time': last_update_time,
-        'timestamp': datetime.now().isoformat()
+        'timestamp': turkey_time().isoformat()
     })
 
 @app.route('/api/hipodromlar')
 def api_hipodromlar():
     """Mevcut hipodromları döndür - Yakında yarış olanları başa getir"""
     hipodrom_list = []
-    # Türkiye timezone'una göre tarih ve saat al
-    turkey_tz = pytz.timezone('Europe/Istanbul')
-    today = datetime.now(turkey_tz).strftime('%d/%m/%Y')
-    current_time = datetime.now(turkey_tz)
+    # Türkiye saatine (veya as-of anına) göre tarih ve saat
+    current_time = web_now()
+    today = current_time.strftime(DATE_FORMAT)
     current_hour = current_time.hour
     current_minute = current_time.minute
     
@@ -307,7 +330,7 @@ def api_hipodromlar():
         if os.path.exists(file_path):
             # Dosya tarihini al
             file_time = os.path.getmtime(file_path)
-            file_date = datetime.fromtimestamp(file_time).strftime('%d/%m/%Y %H:%M')
+            file_date = turkey_time(file_time).strftime('%d/%m/%Y %H:%M')
             
             hipodrom_list.append({
                 'adi': hipodrom,
@@ -360,67 +383,178 @@ def api_hipodromlar():
     
     return jsonify(hipodrom_list)
 
-def get_ganyan_agf_data(hipodrom):
-    """CSV'den bugünün ganyan ve AGF verilerini çek"""
+# Türkçe büyük harf: str.upper() 'i'→'I' yapar, Türkçe'de 'i'→'İ' ve 'ı'→'I' olmalı
+_TR_UPPER = str.maketrans({'i': 'İ', 'ı': 'I'})
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=65536)
+def _normalize_horse_name_str(name):
+    s = unicodedata.normalize('NFKD', name.translate(_TR_UPPER).upper())
+    # Aksan/noktaları at (İ→I, Ş→S, Ğ→G, Ü→U, Ö→O, Ç→C, Â→A)
+    s = ''.join(c for c in s if not unicodedata.combining(c))
+    return _WHITESPACE_RE.sub(' ', s).strip()
+
+
+def normalize_horse_name(name):
+    """At adı için kanonik eşleştirme anahtarı
+
+    Türkçe kurallı büyük harf, aksan/nokta temizliği ve boşluk sadeleştirmesi:
+    'Şahin  Bey', 'ŞAHİN BEY' ve 'SAHIN BEY' aynı anahtara ('SAHIN BEY') düşer.
+    """
+    if name is None or (not isinstance(name, str) and pd.isna(name)):
+        return ''
+    return _normalize_horse_name_str(str(name))
+
+
+def build_ganyan_name_index(ganyan_agf_data):
+    """{kosu_key: {at_adi: {...}}} yapısından {at_key: {...}} indeksi"""
+    index = {}
+    for atlar in ganyan_agf_data.values():
+        for at_name, at_data in atlar.items():
+            at_key = normalize_horse_name(at_name)
+            # Ganyanı olan ilk eşleşme tercih edilir
+            if at_key not in index or index[at_key]['ganyan'] is None:
+                index[at_key] = at_data
+    return index
+
+
+# Oranlara bağlı CSV kolonları (5 dakikada bir değişir)
+ODDS_COLUMNS = ['ganyan', 'agf1', 'agf2', 'agf1_sira', 'agf2_sira']
+
+
+def parse_odds_column(series):
+    """'2,85' / '<nil>' / boş gibi oran değerlerini float dizisine çevir (geçersiz → NaN)"""
+    text = series.astype(str).str.strip().str.replace(',', '.', regex=False)
+    return pd.to_numeric(text, errors='coerce').to_numpy(dtype=float)
+
+
+def get_race_index(hipodrom):
+    """CSV'yi bir kez okuyup bugünün/geçmişin at adı indekslerini oluştur (CSV değişene kadar cache'li)
+
+    Dönen sözlük:
+        today_df / past_df: Bugünkü ve geçmiş satırlar ('at_key' kolonu eklenmiş)
+        today_by_saat / today_by_kosu / today_by_name: (saat, at_key) / (yaris_kosu_key, at_key) /
+            at_key → bugünkü ilk satırın etiketi
+        past_by_name: at_key → geçmiş satırların konumları
+        today_odds: Bugünkü satırların sayıya çevrilmiş oran kolonları (ODDS_COLUMNS, geçersiz → NaN)
+        static_signature: Oran kolonları dışındaki bugünkü veri + geçmiş satır sayısı özeti
+            (sadece oranlar değiştiyse statik koşu kartı yeniden oluşturulmaz)
+    """
     csv_path = f'data/{hipodrom}_races.csv'
     if not os.path.exists(csv_path):
-        return {}
-    
+        return None
+
+    today = web_now().strftime(DATE_FORMAT)
+    cache_key = (os.path.getmtime(csv_path), today)
+    cache_entry = _race_index_cache.get(hipodrom)
+    if cache_entry is not None and cache_entry['key'] == cache_key:
+        return cache_entry['index']
+
+    df = pd.read_csv(csv_path, encoding='utf-8')
+    if 'tarih' not in df.columns or 'at_adi' not in df.columns:
+        return None
+    df['at_key'] = df['at_adi'].map(normalize_horse_name)
+    today_df = df[df['tarih'] == today]
+    past_df = df[df['tarih'] != today]
+
+    def first_labels(keys):
+        index = {}
+        for key, label in zip(keys, today_df.index):
+            index.setdefault(key, label)
+        return index
+
+    at_keys = today_df['at_key'].tolist()
+    if 'saat' in today_df.columns:
+        saat = today_df['saat'].astype(str).str.strip().tolist()
+        today_by_saat = first_labels(zip(saat, at_keys))
+    else:
+        today_by_saat = {}
+    if 'yaris_kosu_key' in today_df.columns:
+        today_by_kosu = first_labels(zip(today_df['yaris_kosu_key'].tolist(), at_keys))
+    else:
+        today_by_kosu = {}
+
+    today_odds = pd.DataFrame(
+        {col: parse_odds_column(today_df[col]) if col in today_df.columns else np.nan for col in ODDS_COLUMNS},
+        index=today_df.index
+    )
+    static_columns = [col for col in today_df.columns if col not in ODDS_COLUMNS]
+    static_signature = (int(pd.util.hash_pandas_object(today_df[static_columns].astype(str), index=False).sum()), len(past_df))
+
+    index = {
+        'today_df': today_df,
+        'past_df': past_df,
+        'today_odds': today_odds,
+        'static_signature': static_signature,
+        'today_saatler': {s for s, _ in today_by_saat},
+        'today_kosular': {k for k, _ in today_by_kosu},
+        'today_by_saat': today_by_saat,
+        'today_by_kosu': today_by_kosu,
+        'today_by_name': first_labels(at_keys),
+        'past_by_name': past_df.groupby('at_key', sort=False).indices if len(past_df) else {},
+    }
+    _race_index_cache[hipodrom] = {'key': cache_key, 'index': index}
+    return index
+
+
+def find_today_label(race_index, at_adi, kosu_saat=None, kosu_no=None):
+    """Bugünkü kartta atın satır etiketini bul (önce koşu saati, sonra yaris_kosu_key, son olarak sadece at adı)"""
+    at_key = normalize_horse_name(at_adi)
+    saat = kosu_saat.strip() if kosu_saat else None
+    kosu_key = f'kosu_{kosu_no}'
+    if saat and saat in race_index['today_saatler']:
+        label = race_index['today_by_saat'].get((saat, at_key))
+    elif kosu_key in race_index['today_kosular']:
+        label = race_index['today_by_kosu'].get((kosu_key, at_key))
+    else:
+        label = race_index['today_by_name'].get(at_key)
+    return label
+
+
+def find_today_row(race_index, at_adi, kosu_saat=None, kosu_no=None):
+    """Bugünkü kartta atın satırı (bulunamazsa None)"""
+    label = find_today_label(race_index, at_adi, kosu_saat, kosu_no)
+    if label is None:
+        return None
+    return race_index['today_df'].loc[label]
+
+
+def find_past_rows(race_index, at_adi):
+    """Atın geçmiş (bugün hariç) yarış satırları"""
+    positions = race_index['past_by_name'].get(normalize_horse_name(at_adi))
+    if positions is None:
+        return race_index['past_df'].iloc[0:0]
+    return race_index['past_df'].iloc[positions]
+
+def get_ganyan_agf_data(hipodrom):
+    """CSV'den bugünün ganyan ve AGF verilerini çek: {kosu_key: {at_adi: {'ganyan', 'agf1', 'agf2'}}}"""
     try:
-        df = pd.read_csv(csv_path, encoding='utf-8')
-        # Bugünün tarihini bul (en son tarih)
-        if 'tarih' not in df.columns:
+        race_index = get_race_index(hipodrom)
+        if race_index is None or race_index['today_df'].empty:
             return {}
+        today_df = race_index['today_df']
+        odds = race_index['today_odds']
         
-        # Bugünün verilerini filtrele
-        # Türkiye timezone'una göre tarih al
-        turkey_tz = pytz.timezone('Europe/Istanbul')
-        today = datetime.now(turkey_tz).strftime('%d/%m/%Y')
-        today_df = df[df['tarih'] == today].copy()
+        def column(name):
+            return today_df[name].tolist() if name in today_df.columns else [''] * len(today_df)
         
-        if today_df.empty:
-            return {}
+        def optional(values):
+            return [None if np.isnan(v) else float(v) for v in values]
         
-        # Ganyan ve AGF verilerini organize et
+        # Ganyan ve AGF verilerini organize et (oranlar get_race_index'te bir kez sayıya çevrildi)
         result = {}
-        
-        for _, row in today_df.iterrows():
+        rows = zip(column('kosu_kodu'), column('yaris_kosu_key'), column('kosu_no'), column('at_adi'),
+                   optional(odds['ganyan']), optional(odds['agf1']), optional(odds['agf2']))
+        for kosu_kodu, yaris_kosu_key, kosu_no, at_adi, ganyan, agf1, agf2 in rows:
             # Koşu key'ini bul - önce kosu_kodu, sonra yaris_kosu_key, son olarak kosu_no kullan
-            kosu_key = row.get('kosu_kodu', '')
-            if not kosu_key:
-                kosu_key = row.get('yaris_kosu_key', '')
-            if not kosu_key:
-                # kosu_no varsa onu kullan
-                kosu_no = row.get('kosu_no', '')
-                if kosu_no and pd.notna(kosu_no):
-                    kosu_key = f'kosu_{kosu_no}'
-            
-            at_adi = str(row.get('at_adi', '')).strip()
-            
+            kosu_key = kosu_kodu or yaris_kosu_key
+            if not kosu_key and kosu_no and pd.notna(kosu_no):
+                kosu_key = f'kosu_{kosu_no}'
+            at_adi = str(at_adi).strip()
             if not kosu_key or not at_adi:
                 continue
-            
-            if kosu_key not in result:
-                result[kosu_key] = {}
-            
-            ganyan = row.get('ganyan', '')
-            agf1 = row.get('agf1', '')
-            agf2 = row.get('agf2', '')
-            
-            # Ganyan'ı float'a çevir (virgülü noktaya çevir)
-            ganyan_val = None
-            if pd.notna(ganyan) and str(ganyan).strip():
-                try:
-                    ganyan_str = str(ganyan).replace(',', '.')
-                    ganyan_val = float(ganyan_str)
-                except:
-                    pass
-    
-            result[kosu_key][at_adi] = {
-                'ganyan': ganyan_val,
-                'agf1': float(agf1) if pd.notna(agf1) and str(agf1).strip() and str(agf1) != '<nil>' else None,
-                'agf2': float(agf2) if pd.notna(agf2) and str(agf2).strip() and str(agf2) != '<nil>' else None
-            }
+            result.setdefault(kosu_key, {})[at_adi] = {'ganyan': ganyan, 'agf1': agf1, 'agf2': agf2}
         
         return result
     except Exception as e:
@@ -509,29 +643,814 @@ def calculate_profit_from_score_and_ganyan(combined_score, ganyan):
         return None
     
     
+def race_minutes_to_start(kosu_saat, now):
+    """Koşu saatine kalan dakika (geçmişse negatif); saat okunamazsa None"""
+    try:
+        # Saat formatını parse et (örn: "17:30")
+        race_hour, race_minute = map(int, kosu_saat.split(':'))
+        return (race_hour * 60 + race_minute) - (now.hour * 60 + now.minute)
+    except:
+        return None
+
+def is_race_soon(kosu_saat, now):
+    """Koşu yakında mı? (1 saat içinde)"""
+    minutes = race_minutes_to_start(kosu_saat, now)
+    return minutes is not None and 0 <= minutes <= 60
+
+def is_race_finished(kosu_saat, now):
+    """Koşu bitmiş mi? (saati en az 10 dakika geçmiş mi?)"""
+    minutes = race_minutes_to_start(kosu_saat, now)
+    return minutes is not None and -minutes >= 10
+
+def build_race_card(hipodrom):
+    """Tahmin dosyası + CSV'den koşu kartının saatten ve oranlardan bağımsız (statik) kısmını oluştur
+
+    CSV alanları, olasılık sırası, son yarışlar ve kazanan burada bir kez hesaplanır;
+    oranlara bağlı alanlar (ganyan/AGF, birleşik skor, value/kâr skorları, en iyi 3 at)
+    get_odds_overlay, saate bağlı alanlar (is_soon, is_finished) overlay_race_card ile eklenir.
+    """
+    file_path = f'output/{hipodrom}_tahminler.txt'
+    data = parse_tahmin_dosyasi(file_path)
+    if not data:
+        return None
+    
+    # Yarış CSV'si at adı indeksleri
+    race_index = get_race_index(hipodrom)
+    
+    def get_race_winner(hipodrom, kosu_no, kosu_saat=None):
+        """CSV'den koşunun kazananını bul (sonuc sütununu kullan)"""
+        if race_index is None:
+            return None
+        
+        try:
+            today_df = race_index['today_df']
+            
+            if len(today_df) == 0:
+                return None
+            
+            # Koşu numarasına göre filtrele
+            kosu_df = None
+            
+            # Önce saat ile eşleştir (en güvenilir yöntem)
+            if kosu_saat and 'saat' in today_df.columns:
+                try:
+                    # Saat formatını normalize et
+                    kosu_saat_normalized = kosu_saat.strip()
+                    kosu_df = today_df[today_df['saat'].astype(str).str.strip() == kosu_saat_normalized]
+                    print(f"🔍 Saat ile arama ({kosu_saat_normalized}): {len(kosu_df)} kayıt bulundu")
+                except Exception as e:
+                    print(f"⚠️ Saat ile arama hatası: {e}")
+                    pass
+            
+            # Bulamazsa no sütunu ile dene (at numarası değil, koşu numarası olabilir)
+            if (kosu_df is None or len(kosu_df) == 0) and 'no' in today_df.columns:
+                try:
+                    kosu_df = today_df[today_df['no'] == int(kosu_no)]
+                    print(f"🔍 no ile arama (koşu {kosu_no}): {len(kosu_df)} kayıt bulundu")
+                except:
+                    pass
+            
+            # Bulamazsa kosu_kodu ile dene
+            if (kosu_df is None or len(kosu_df) == 0) and 'kosu_kodu' in today_df.columns:
+                try:
+                    kosu_df = today_df[today_df['kosu_kodu'] == int(kosu_no)]
+                    print(f"🔍 kosu_kodu ile arama (koşu {kosu_no}): {len(kosu_df)} kayıt bulundu")
+                except:
+                    pass
+            
+            # Bulamazsa yaris_kosu_key ile dene (hash değeri olabilir)
+            if (kosu_df is None or len(kosu_df) == 0) and 'yaris_kosu_key' in today_df.columns:
+                kosu_df = today_df[today_df['yaris_kosu_key'] == f'kosu_{kosu_no}']
+            
+            # Bulamazsa kosu_no sütunu ile dene
+            if (kosu_df is None or len(kosu_df) == 0) and 'kosu_no' in today_df.columns:
+                try:
+                    kosu_df = today_df[today_df['kosu_no'] == int(kosu_no)]
+                except:
+                    pass
+            
+            # Bulamazsa kosu sütunu ile dene
+            if (kosu_df is None or len(kosu_df) == 0) and 'kosu' in today_df.columns:
+                try:
+                    kosu_df = today_df[today_df['kosu'] == int(kosu_no)]
+                except:
+                    pass
+            
+            if kosu_df is None or len(kosu_df) == 0:
+                return None
+            
+            # Önce sonuc=1 olanı bul (kazanan)
+            if 'sonuc' in kosu_df.columns:
+                try:
+                    # Sonuc sütununda 1 olan atı bul (string veya int)
+                    winner_row = kosu_df[(kosu_df['sonuc'] == 1) | (kosu_df['sonuc'] == '1') | (kosu_df['sonuc'] == '1.0') | (kosu_df['sonuc'].astype(str).str.strip() == '1')]
+                    if len(winner_row) > 0:
+                        winner_name = winner_row.iloc[0].get('at_adi', '')
+                        if pd.notna(winner_name) and str(winner_name).strip() and str(winner_name).strip() != '<nil>':
+                            winner = str(winner_name).strip()
+                            print(f"✅ Kazanan bulundu ({hipodrom} Koşu {kosu_no}): {winner}")
+                            return winner
+                except Exception as e:
+                    print(f"Sonuc=1 kontrol hatası ({hipodrom} Koşu {kosu_no}): {e}")
+                    pass
+            
+            # Sonuc=1 yoksa derece=1 olanı bul
+            if 'derece' in kosu_df.columns:
+                try:
+                    winner_row = kosu_df[(kosu_df['derece'] == 1) | (kosu_df['derece'] == '1') | (kosu_df['derece'] == '1.0') | (kosu_df['derece'].astype(str).str.strip() == '1')]
+                    if len(winner_row) > 0:
+                        winner_name = winner_row.iloc[0].get('at_adi', '')
+                        if pd.notna(winner_name) and str(winner_name).strip():
+                            winner = str(winner_name).strip()
+                            print(f"✅ Kazanan bulundu (derece=1) ({hipodrom} Koşu {kosu_no}): {winner}")
+                            return winner
+                except Exception as e:
+                    print(f"Derece=1 kontrol hatası ({hipodrom} Koşu {kosu_no}): {e}")
+                    pass
+            
+            print(f"⚠️ Kazanan bulunamadı ({hipodrom} Koşu {kosu_no})")
+            return None
+        except Exception as e:
+            print(f"❌ Kazanan bulma hatası ({hipodrom} Koşu {kosu_no}): {e}")
+            import traceback
+            print(traceback.format_exc())
+            return None
+    
+    # Her koşu için statik bilgileri topla
+    races = []
+    slots = []  # (koşu konumu, at adı, olasılık) - oran dizileri bu sırayla tutulur
+    for kosu in data['kosular']:
+        # Kazanan CSV'de varsa bulunur; yalnızca bitmiş koşularda gösterilir (overlay)
+        race_winner = get_race_winner(hipodrom, kosu['kosu_no'], kosu['saat'])
+        
+        # CSV'den koşu mesafesini al
+        kosu_mesafe = None
+        if race_index is not None:
+            try:
+                today_df = race_index['today_df']
+                
+                if len(today_df) > 0:
+                    # Koşu numarasına göre filtrele - saat ile eşleştirme
+                    kosu_df = None
+                    if kosu.get('saat') and 'saat' in today_df.columns:
+                        kosu_df = today_df[today_df['saat'].astype(str).str.strip() == kosu['saat'].strip()]
+                    
+                    if kosu_df is None or len(kosu_df) == 0:
+                        # Yaris_kosu_key ile dene
+                        kosu_df = today_df[today_df['yaris_kosu_key'] == f'kosu_{kosu["kosu_no"]}']
+                    
+                    if kosu_df is not None and len(kosu_df) > 0:
+                        # İlk satırdan mesafe bilgisini al
+                        row = kosu_df.iloc[0]
+                        mesafe_val = row.get('mesafe', None)
+                        if pd.notna(mesafe_val) and str(mesafe_val).strip() and str(mesafe_val) != '<nil>':
+                            try:
+                                # Mesafe değerini sayıya çevir (string olabilir, "1600" gibi)
+                                mesafe_str = str(mesafe_val).strip()
+                                # Sadece sayıları al
+                                mesafe_num = ''.join(filter(str.isdigit, mesafe_str))
+                                if mesafe_num:
+                                    kosu_mesafe = int(mesafe_num)
+                            except:
+                                pass
+            except Exception as e:
+                pass
+        
+        # Önce koşudaki tüm atların olasılık ve CSV bilgilerini topla
+        kosu_atlar_info = []
+        kosu_pist_tur = None  # Koşu seviyesinde pist türü
+        kosu_cins_detay = None  # Koşu seviyesinde cins detay
+        
+        for at in kosu['atlar']:
+            at_adi = at['at_adi']
+            olasilik = at['olasilik']
+            
+            # En iyi derece bilgilerini varsayılan değerlerle başlat
+            en_iyi_derece = None
+            en_iyi_derece_farkli_hipodrom = False
+            
+            # CSV'den pist türü, jokey, at no ve derece/sonuç bilgisini al (oranlar get_odds_overlay'de)
+            pist_tur = None
+            jokey_adi = None
+            at_no = None
+            derece_sonuc = None  # Bitmiş koşularda atın kaçıncı olduğu
+            if race_index is not None:
+                try:
+                    # Koşu saati → yaris_kosu_key → sadece at adı sırasıyla indeksten eşleştir
+                    row = find_today_row(race_index, at_adi, kosu.get('saat'), kosu['kosu_no'])
+                    if row is not None:
+                        # Pist türü
+                        pist_val = row.get('pist', None)
+                        if pd.notna(pist_val) and str(pist_val).strip() and str(pist_val) != '<nil>':
+                            pist_tur = str(pist_val).strip()
+                            # Koşu seviyesinde pist türü bilgisini de kaydet (ilk atın pist türü)
+                            if kosu_pist_tur is None:
+                                kosu_pist_tur = pist_tur
+                            
+                        # Cins detay
+                        cins_detay_val = row.get('cins_detay', None)
+                        if pd.notna(cins_detay_val) and str(cins_detay_val).strip() and str(cins_detay_val) != '<nil>':
+                            cins_detay = str(cins_detay_val).strip()
+                            # Koşu seviyesinde cins detay bilgisini de kaydet (ilk atın cins detay)
+                            if kosu_cins_detay is None:
+                                kosu_cins_detay = cins_detay
+                            
+                        # Jokey adı
+                        jokey_val = row.get('jokey_adi', None)
+                        if pd.notna(jokey_val) and str(jokey_val).strip() and str(jokey_val) != '<nil>':
+                            jokey_adi = str(jokey_val).strip()
+                            
+                        # At numarası (no sütunu)
+                        no_val = row.get('no', None)
+                        if pd.notna(no_val) and str(no_val).strip() and str(no_val) != '<nil>':
+                            try:
+                                at_no = int(float(str(no_val).strip()))
+                                print(f"✅ At numarası bulundu: {at_adi} -> {at_no}")
+                            except Exception as e:
+                                print(f"⚠️ At numarası parse hatası ({at_adi}): {e}")
+                                pass
+                            
+                        # En iyi derece
+                        en_iyi_derece_val = row.get('en_iyi_derece', None)
+                        en_iyi_derece = None
+                        if pd.notna(en_iyi_derece_val) and str(en_iyi_derece_val).strip() and str(en_iyi_derece_val) != '<nil>':
+                            try:
+                                en_iyi_derece = str(en_iyi_derece_val).strip()
+                            except:
+                                pass
+                            
+                        # En iyi derece farklı hipodrom
+                        en_iyi_derece_farkli_hipodrom_val = row.get('en_iyi_derece_farkli_hipodrom', None)
+                        en_iyi_derece_farkli_hipodrom = False
+                        if pd.notna(en_iyi_derece_farkli_hipodrom_val):
+                            try:
+                                # Boolean kontrolü: True, 1, "True", "1" gibi değerler
+                                val_str = str(en_iyi_derece_farkli_hipodrom_val).strip().lower()
+                                en_iyi_derece_farkli_hipodrom = val_str in ['true', '1', 'yes', 'evet']
+                            except:
+                                pass
+                            
+                        # Derece/Sonuç (bitmiş koşularda gösterilir)
+                        # Önce sonuc sütununu kontrol et
+                        sonuc_val = row.get('sonuc', None)
+                        if pd.notna(sonuc_val) and str(sonuc_val).strip() and str(sonuc_val) != '<nil>':
+                            try:
+                                sonuc_int = int(float(str(sonuc_val).strip()))
+                                if sonuc_int > 0:
+                                    derece_sonuc = sonuc_int
+                            except:
+                                pass
+                            
+                        # Sonuc yoksa derece sütununu kontrol et
+                        if derece_sonuc is None:
+                            derece_val = row.get('derece', None)
+                            if pd.notna(derece_val) and str(derece_val).strip() and str(derece_val) != '<nil>':
+                                try:
+                                    # Derece sütunu zaman formatı olabilir (2.33.84 gibi), sadece sonuc=1 kontrolü yaptık
+                                    # Ama eğer sonuc yoksa, derece sütunundan ilk sayıyı al
+                                    derece_str = str(derece_val).strip()
+                                    # Sadece sayısal değer varsa (1, 2, 3 gibi)
+                                    if derece_str.isdigit():
+                                        derece_sonuc = int(derece_str)
+                                except:
+                                    pass
+                except Exception as e:
+                    print(f"CSV okuma hatası: {e}")
+                    pass
+            
+            kosu_atlar_info.append({
+                'at': at,
+                'at_adi': at_adi,
+                'olasilik': olasilik,
+                'pist_tur': pist_tur,
+                'jokey_adi': jokey_adi,
+                'at_no': at_no,
+                'derece_sonuc': derece_sonuc,
+                'en_iyi_derece': en_iyi_derece,
+                'en_iyi_derece_farkli_hipodrom': en_iyi_derece_farkli_hipodrom
+            })
+        
+        # Olasılık sırasını hesapla (aynı koşudaki atlar arasında)
+        kosu_atlar_info.sort(key=lambda x: x['olasilik'], reverse=True)
+        for idx, at_info in enumerate(kosu_atlar_info):
+            at_info['olasilik_sira'] = idx + 1
+        
+        # Koşu objesine mesafeyi, pist türünü ve cins detay ekle
+        kosu['mesafe'] = kosu_mesafe
+        kosu['pist_tur'] = kosu_pist_tur
+        kosu['cins_detay'] = kosu_cins_detay
+        
+        # Şimdi bilgileri atlara ekle ve best_bets için hazırla
+        horses = []
+        for at_info in kosu_atlar_info:
+            at = at_info['at']
+            at_adi = at_info['at_adi']
+            olasilik = at_info['olasilik']
+            olasilik_sira = at_info['olasilik_sira']
+            pist_tur = at_info.get('pist_tur')
+            jokey_adi = at_info.get('jokey_adi')
+            at_no = at_info.get('at_no')
+            derece_sonuc = at_info.get('derece_sonuc')
+            
+            # Son 5 yarış bilgisini al
+            son_6_yaris = []
+            if race_index is not None:
+                try:
+                    # Bugünün tarihinden önceki yarışları al
+                    past_df = race_index['past_df']
+                    if 'tarih' in past_df.columns:
+                        # At adına göre filtrele (at adı indeksinden)
+                        at_df = find_past_rows(race_index, at_adi).copy()
+                        
+                        if len(at_df) > 0:
+                            # Tarih sıralaması için tarih sütununu datetime'a çevir
+                            try:
+                                at_df['tarih_datetime'] = pd.to_datetime(at_df['tarih'], format='%d/%m/%Y', errors='coerce')
+                                at_df = at_df.sort_values('tarih_datetime', ascending=False)
+                                at_df = at_df.head(5)  # Son 5 yarış
+                                
+                                for _, row in at_df.iterrows():
+                                    mesafe = row.get('mesafe', '')
+                                    pist = row.get('pist', '')
+                                    sinif = row.get('sinif', '')
+                                    handikap = row.get('handikap', '')
+                                    cins_detay = row.get('cins_detay', '')
+                                    sonuc = row.get('sonuc', None)
+                                    derece = row.get('derece', None)
+                                    tarih = row.get('tarih', None)
+                                    agf1_sira_val = row.get('agf1_sira', None)
+                                    agf2_sira_val = row.get('agf2_sira', None)
+                                    jokey_val = row.get('jokey_adi', None)
+                                    
+                                    # Koşu numarasını bul
+                                    kosu_no_val = None
+                                    for col in ['kosu_no', 'no', 'kosu', 'yaris_kosu_key']:
+                                        kosu_val = row.get(col, None)
+                                        if pd.notna(kosu_val) and str(kosu_val).strip() and str(kosu_val) != '<nil>':
+                                            try:
+                                                # yaris_kosu_key formatı: "kosu_2" gibi olabilir
+                                                kosu_str = str(kosu_val).strip()
+                                                if col == 'yaris_kosu_key' and 'kosu_' in kosu_str:
+                                                    kosu_no_val = int(kosu_str.split('_')[1])
+                                                else:
+                                                    kosu_no_val = int(float(kosu_str))
+                                                break
+                                            except:
+                                                pass
+                                    
+                                    # Mesafe formatla
+                                    mesafe_str = ''
+                                    if pd.notna(mesafe) and str(mesafe).strip() and str(mesafe) != '<nil>':
+                                        mesafe_str = str(mesafe).strip()
+                                        # Sadece sayıları al
+                                        mesafe_num = ''.join(filter(str.isdigit, mesafe_str))
+                                        if mesafe_num:
+                                            mesafe_str = f"{mesafe_num}m"
+                                    
+                                    # Pist türü formatla (baş harfi büyük: Çim, Kum)
+                                    pist_str = ''
+                                    if pd.notna(pist) and str(pist).strip() and str(pist) != '<nil>':
+                                        pist_val = str(pist).strip()
+                                        # Baş harfi büyük yap
+                                        if pist_val:
+                                            pist_str = pist_val[0].upper() + pist_val[1:].lower() if len(pist_val) > 1 else pist_val.upper()
+                                        # Türkçe karakterler için özel düzenleme
+                                        pist_str = pist_str.replace('CIM', 'Çim').replace('cim', 'Çim').replace('Cim', 'Çim')
+                                        pist_str = pist_str.replace('KUM', 'Kum').replace('kum', 'Kum').replace('Kum', 'Kum')
+                                    
+                                    # Cins detay formatla (G1, Handikap 16, Şartlı 3 gibi)
+                                    cins_detay_str = ''
+                                    if pd.notna(cins_detay) and str(cins_detay).strip() and str(cins_detay) != '<nil>':
+                                        cins_detay_val = str(cins_detay).strip()
+                                        # Cins detay değerini temizle ve formatla
+                                        if cins_detay_val:
+                                            # "G1", "Handikap 16", "Şartlı 3" gibi formatları koru
+                                            cins_detay_str = cins_detay_val
+                                    
+                                    # Eğer cins_detay yoksa handikap kullan (geriye dönük uyumluluk için)
+                                    if not cins_detay_str and pd.notna(handikap) and str(handikap).strip() and str(handikap) != '<nil>':
+                                        try:
+                                            handikap_val = str(handikap).strip()
+                                            # Handikap değerini al (sadece sayı olabilir)
+                                            if handikap_val.isdigit():
+                                                # Çok büyük sayılar (960 gibi) muhtemelen yanlış veri, atla
+                                                handikap_num = int(handikap_val)
+                                                if handikap_num < 100:  # Sadece mantıklı handikap değerleri (0-99)
+                                                    cins_detay_str = f"Handikap {handikap_num}"
+                                            else:
+                                                # Sayı içeriyorsa al
+                                                handikap_num = ''.join(filter(str.isdigit, handikap_val))
+                                                if handikap_num and int(handikap_num) < 100:
+                                                    cins_detay_str = f"Handikap {handikap_num}"
+                                        except:
+                                            pass
+                                    
+                                    # Eğer hala yoksa sınıf kullan
+                                    if not cins_detay_str and pd.notna(sinif) and str(sinif).strip() and str(sinif) != '<nil>':
+                                        cins_detay_str = str(sinif).strip()
+                                    
+                                    # Sonuç formatla
+                                    sonuc_str = ''
+                                    if pd.notna(sonuc) and str(sonuc).strip() and str(sonuc) != '<nil>':
+                                        try:
+                                            sonuc_int = int(float(str(sonuc).strip()))
+                                            if sonuc_int == 1:
+                                                sonuc_str = 'Kazandı'
+                                            else:
+                                                sonuc_str = f'{sonuc_int}. oldu'
+                                        except:
+                                            pass
+                                    
+                                    if not sonuc_str and pd.notna(derece) and str(derece).strip() and str(derece) != '<nil>':
+                                        try:
+                                            derece_str = str(derece).strip()
+                                            if derece_str.isdigit():
+                                                derece_int = int(derece_str)
+                                                if derece_int == 1:
+                                                    sonuc_str = 'Kazandı'
+                                                else:
+                                                    sonuc_str = f'{derece_int}. oldu'
+                                        except:
+                                            pass
+                                    
+                                    # Tarih formatla
+                                    tarih_str = None
+                                    if pd.notna(tarih) and str(tarih).strip() and str(tarih) != '<nil>':
+                                        tarih_str = str(tarih).strip()
+                                    
+                                    # AGF1_sira formatla
+                                    agf1_sira_str = None
+                                    if pd.notna(agf1_sira_val) and str(agf1_sira_val).strip() and str(agf1_sira_val) != '<nil>':
+                                        try:
+                                            agf1_sira_str = int(float(str(agf1_sira_val).strip()))
+                                        except:
+                                            pass
+                                    
+                                    # AGF2_sira formatla
+                                    agf2_sira_str = None
+                                    if pd.notna(agf2_sira_val) and str(agf2_sira_val).strip() and str(agf2_sira_val) != '<nil>':
+                                        try:
+                                            agf2_sira_str = int(float(str(agf2_sira_val).strip()))
+                                        except:
+                                            pass
+                                    
+                                    # Jokey formatla
+                                    jokey_str = None
+                                    if pd.notna(jokey_val) and str(jokey_val).strip() and str(jokey_val) != '<nil>':
+                                        jokey_str = str(jokey_val).strip()
+                                    
+                                    # Formatla: "1200m Çim, G1, Kazandı" veya "1200m Çim, Handikap 16, 2. oldu"
+                                    if mesafe_str or pist_str or cins_detay_str or sonuc_str:
+                                        parts = []
+                                        if mesafe_str:
+                                            parts.append(mesafe_str)
+                                        if pist_str:
+                                            parts.append(pist_str)
+                                        if cins_detay_str:
+                                            parts.append(cins_detay_str)
+                                        if sonuc_str:
+                                            parts.append(sonuc_str)
+                                        
+                                        if parts:
+                                            # Detaylı bilgi ile birlikte ekle
+                                            yaris_info = {
+                                                'text': ', '.join(parts),
+                                                'tarih': tarih_str,
+                                                'kosu_no': kosu_no_val,
+                                                'agf1_sira': agf1_sira_str,
+                                                'agf2_sira': agf2_sira_str,
+                                                'jokey': jokey_str
+                                            }
+                                            son_6_yaris.append(yaris_info)
+                            except Exception as e:
+                                print(f"Son 5 yarış parse hatası ({at_adi}): {e}")
+                                pass
+                except Exception as e:
+                    print(f"Son 5 yarış okuma hatası ({at_adi}): {e}")
+                    pass
+            
+            # Son 5 yarış bilgisini at objesine ekle
+            at['son_6_yaris'] = son_6_yaris
+            
+            # Tahmin ve CSV bilgilerini ekle (ganyan/AGF ve son 10 ganyan istek anında eklenir)
+            at['olasilik_sira'] = olasilik_sira
+            at['jokey_adi'] = jokey_adi
+            at['at_no'] = at_no
+            at['en_iyi_derece'] = at_info.get('en_iyi_derece')
+            at['en_iyi_derece_farkli_hipodrom'] = at_info.get('en_iyi_derece_farkli_hipodrom', False)
+            
+            # Kazandı mı kontrol et (bitmiş koşularda gösterilir)
+            is_winner = False
+            if race_winner:
+                is_winner = (normalize_horse_name(at_adi) == normalize_horse_name(race_winner))
+            
+            # En iyi derece bilgisi
+            en_iyi_derece = at_info.get('en_iyi_derece')
+            en_iyi_derece_farkli_hipodrom = at_info.get('en_iyi_derece_farkli_hipodrom', False)
+            
+            # En mantıklı oyun adayı (oranlara ve saate bağlı alanlar overlay'de eklenir)
+            candidate = {
+                'kosu_no': kosu['kosu_no'],
+                'kosu_saat': kosu['saat'],
+                'kosu_sinif': kosu['sinif'],
+                'kosu_mesafe': kosu.get('mesafe'),  # Koşu mesafesi eklendi
+                'pist_tur': pist_tur,  # Pist türü eklendi
+                'jokey_adi': jokey_adi,  # Jokey adı eklendi
+                'at_no': at_no,  # At numarası eklendi
+                'at_adi': at_adi,
+                'olasilik': olasilik,
+                'olasilik_sira': olasilik_sira,
+                'en_iyi_derece': en_iyi_derece,  # En iyi derece (varsa)
+                'en_iyi_derece_farkli_hipodrom': en_iyi_derece_farkli_hipodrom  # Farklı hipodrom mu
+            }
+            horses.append({
+                'at': at,
+                'candidate': candidate,
+                'slot': len(slots),  # Oran dizilerindeki konum
+                'is_winner': is_winner,
+                'derece_sonuc': derece_sonuc  # Bitmiş koşularda atın kaçıncı olduğu
+            })
+            slots.append((len(races), at_adi, olasilik))
+        
+        # Atlar tahmin dosyasındaki sırayla tutulur; 'ranked' olasılık sırasıdır (AGF1 sırası ve en iyi 3 için)
+        by_at = {id(h['at']): h for h in horses}
+        races.append({
+            'kosu': kosu,
+            'race_winner': race_winner,
+            'horses': [by_at[id(at)] for at in kosu['atlar']],
+            'ranked': [h['slot'] for h in horses]
+        })
+    
+    return {
+        'hipodrom': hipodrom,
+        'data': data,
+        'races': races,
+        'slot_race': np.array([race_i for race_i, _, _ in slots], dtype=int),
+        'slot_at_adi': [at_adi for _, at_adi, _ in slots],
+        'slot_olasilik': np.array([olasilik for _, _, olasilik in slots], dtype=float)
+    }
+    
+
+def race_card_key(hipodrom):
+    """Statik kartın geçerlilik anahtarı: tahmin dosyası, CSV'nin oran dışı içeriği ve gün"""
+    file_path = f'output/{hipodrom}_tahminler.txt'
+    race_index = get_race_index(hipodrom)
+    return (
+        os.path.getmtime(file_path) if os.path.exists(file_path) else None,
+        race_index['static_signature'] if race_index is not None else None,
+        web_now().strftime(DATE_FORMAT)
+    )
+
+def get_race_card(hipodrom):
+    """Statik koşu kartını döndür; tahminler veya oran dışı CSV verisi değiştiyse yeniden oluştur"""
+    key = race_card_key(hipodrom)
+    with _race_card_lock:
+        cache_entry = _race_card_cache.get(hipodrom)
+        if cache_entry is not None and cache_entry['key'] == key:
+            return cache_entry['card']
+        card = build_race_card(hipodrom)
+        if card is not None:
+            _race_card_cache[hipodrom] = {'key': key, 'card': card}
+        return card
+
+def read_odds_snapshot(card, race_index):
+    """Karttaki her at için güncel oranlar: (n_at, len(ODDS_COLUMNS)) dizisi, eksik → NaN
+
+    Ganyan/AGF önce at adı indeksinden (tüm koşular), ganyan ve AGF sıraları atın
+    bugünkü CSV satırından alınır (satırdaki geçerli ganyan önceliklidir).
+    """
+    n = len(card['slot_at_adi'])
+    snapshot = np.full((n, len(ODDS_COLUMNS)), np.nan)
+    if race_index is None or n == 0:
+        return snapshot
+    
+    name_index = build_ganyan_name_index(get_ganyan_agf_data(card['hipodrom']))
+    races = card['races']
+    labels = []
+    for slot, (race_i, at_adi) in enumerate(zip(card['slot_race'], card['slot_at_adi'])):
+        at_data = name_index.get(normalize_horse_name(at_adi))
+        if at_data is not None:
+            snapshot[slot, :3] = [np.nan if at_data[col] is None else at_data[col] for col in ('ganyan', 'agf1', 'agf2')]
+        kosu = races[race_i]['kosu']
+        labels.append(find_today_label(race_index, at_adi, kosu.get('saat'), kosu['kosu_no']))
+    
+    found = np.array([label is not None for label in labels], dtype=bool)
+    if found.any():
+        row_odds = race_index['today_odds'].loc[[label for label in labels if label is not None]]
+        row_ganyan = row_odds['ganyan'].to_numpy()
+        snapshot[found, 0] = np.where(np.isnan(row_ganyan), snapshot[found, 0], row_ganyan)
+        snapshot[found, 3] = row_odds['agf1_sira'].to_numpy()
+        snapshot[found, 4] = row_odds['agf2_sira'].to_numpy()
+    return snapshot
+
+def round_2(values):
+    """Python round(x, 2) ile birebir aynı yuvarlama (np.round ikili kayan noktada farklı sonuç verebilir)"""
+    return np.fromiter((round(v, 2) for v in values.tolist()), dtype=float, count=len(values))
+
+def compute_odds_scores(olasilik, odds):
+    """Oranlara bağlı skorları vektörel hesapla (calculate_* fonksiyonlarının dizi karşılığı)
+
+    Args:
+        olasilik: Yapay zeka olasılıkları (%)
+        odds: read_odds_snapshot satırları (ganyan, agf1, agf2, ...)
+    """
+    ganyan, agf1, agf2 = odds[:, 0], odds[:, 1], odds[:, 2]
+    prob = olasilik / 100.0
+    
+    # AGF1 varsa AGF1, yoksa AGF2, ikisi de yoksa 0
+    agf_value = np.where(agf1 > 0, agf1, np.where(agf2 > 0, agf2, 0.0))
+    agf_type = np.where(agf1 > 0, 'AGF1', np.where(agf2 > 0, 'AGF2', ''))
+    # AGF'i normalize et: yüksek AGF = yüksek skor (1 → 0.0, 100 → 1.0)
+    agf_score = np.where(agf_value >= 100.0, 1.0, np.where(agf_value <= 1.0, 0.0, (agf_value - 1.0) / (100.0 - 1.0)))
+    # Birleştirilmiş skor: AGF %40, AI olasılık skoru %60
+    combined_score = (0.4 * agf_score) + (0.6 * prob)
+    
+    with np.errstate(invalid='ignore'):
+        has_ganyan = ganyan > 0
+        # Value = (olasılık * oran) - 1, yüzde (1000'den büyükse hatalı veri sayılır)
+        value_score = round_2(((prob * ganyan) - 1) * 100)
+        value_score = np.where(has_ganyan & (value_score <= 1000), value_score, np.nan)
+        # Kazanç skoru: beklenen getiri * risk faktörü (0.5-1.0)
+        profit_score = round_2(((prob * ganyan) * (0.5 + 0.5 * prob) - 1) * 100)
+        profit_score = np.where(has_ganyan, profit_score, np.nan)
+        # Skor * Ganyan (dümdüz çarpım)
+        profit_from_score = np.where(has_ganyan, round_2(combined_score * ganyan), np.nan)
+    
+    return {
+        'agf_value': agf_value,
+        'agf_type': agf_type,
+        'combined_score': combined_score,
+        'value_score': value_score,
+        'profit_score': profit_score,
+        'profit_from_score': profit_from_score
+    }
+
+def build_race_odds(card, race_i, odds, scores):
+    """Tek koşunun oran overlay'i: at bazında oran alanları, AGF1 sırası ve en iyi 3 at"""
+    def optional(value, cast=float):
+        return None if np.isnan(value) else cast(value)
+    
+    ranked = card['races'][race_i]['ranked']
+    fields = {}
+    for slot in ranked:
+        agf1 = optional(odds[slot, 1])
+        agf2 = optional(odds[slot, 2])
+        agf_type = str(scores['agf_type'][slot]) or None
+        fields[slot] = {
+            'ganyan': optional(odds[slot, 0]),
+            'agf1': agf1,
+            'agf2': agf2,
+            'agf1_sira': optional(odds[slot, 3], int),
+            'agf2_sira': optional(odds[slot, 4], int),
+            'agf_value': agf1 if agf_type == 'AGF1' else agf2 if agf_type == 'AGF2' else 0,  # Kullanılan AGF değeri
+            'agf_type': agf_type,  # 'AGF1' veya 'AGF2'
+            'combined_score': float(scores['combined_score'][slot]),
+            'value_score': optional(scores['value_score'][slot]),
+            'profit_score': optional(scores['profit_score'][slot]),
+            'profit_from_score': optional(scores['profit_from_score'][slot])
+        }
+    
+    # AGF1 sırası CSV'de yoksa koşudaki AGF1 değerlerinden hesapla (AGF1 yüksek = iyi)
+    with_agf1 = sorted((slot for slot in ranked if odds[slot, 1] > 0), key=lambda slot: odds[slot, 1], reverse=True)
+    for idx, slot in enumerate(with_agf1):
+        if fields[slot]['agf1_sira'] is None:
+            fields[slot]['agf1_sira'] = idx + 1
+    
+    # Koşunun en yüksek 3 atı (combined_score'a göre)
+    top_3 = sorted(ranked, key=lambda slot: fields[slot]['combined_score'], reverse=True)[:3]
+    return {'fields': fields, 'top_3': top_3}
+
+def update_odds_overlay(hipodrom, card, race_index):
+    """Oran güncelleme aşaması: yeni oranları önceki anlık görüntüyle karşılaştır, sadece
+    değişen atların skorlarını yeniden hesapla ve değişen koşuların overlay'ini yayınla"""
+    previous = _odds_overlay_cache.get(hipodrom)
+    odds = read_odds_snapshot(card, race_index)
+    
+    if previous is None or previous['card'] is not card:
+        # Yeni kart: tüm atlar değişmiş sayılır
+        changed = np.ones(len(odds), dtype=bool)
+        scores = {key: values.copy() for key, values in compute_odds_scores(card['slot_olasilik'], odds).items()}
+        races = [None] * len(card['races'])
+    else:
+        same = (odds == previous['odds']) | (np.isnan(odds) & np.isnan(previous['odds']))
+        changed = ~same.all(axis=1)
+        scores = previous['scores']
+        races = list(previous['races'])
+        if changed.any():
+            scores = {key: values.copy() for key, values in scores.items()}
+            changed_scores = compute_odds_scores(card['slot_olasilik'][changed], odds[changed])
+            for key, values in changed_scores.items():
+                scores[key][changed] = values
+    
+    # Sadece değişen koşuların overlay'i yeniden oluşturulur (AGF1 sırası ve en iyi 3 koşu içi)
+    changed_races = set(card['slot_race'][changed].tolist())
+    for race_i in range(len(races)):
+        if races[race_i] is None or race_i in changed_races:
+            races[race_i] = build_race_odds(card, race_i, odds, scores)
+    
+    overlay = {
+        'card': card,
+        'race_index': race_index,
+        'odds': odds,
+        'scores': scores,
+        'races': races,
+        'changed': int(changed.sum()),
+        'updated_at': turkey_time().isoformat()
+    }
+    _odds_overlay_cache[hipodrom] = overlay
+    return overlay
+
+def get_odds_overlay(hipodrom, card):
+    """Kartın güncel oran overlay'i; CSV değiştiyse oran güncelleme aşamasını çalıştır"""
+    race_index = get_race_index(hipodrom)
+    with _race_card_lock:
+        overlay = _odds_overlay_cache.get(hipodrom)
+        if overlay is not None and overlay['card'] is card and overlay['race_index'] is race_index:
+            return overlay
+        return update_odds_overlay(hipodrom, card, race_index)
+
+def refresh_race_card(hipodrom):
+    """Tahmin/veri güncellemesinden sonra statik kartı ve oran overlay'ini önceden hazırla (ilk istek beklemesin)"""
+    if not os.path.exists(f'output/{hipodrom}_tahminler.txt'):
+        return
+    try:
+        card = get_race_card(hipodrom)
+        if card is not None:
+            overlay = get_odds_overlay(hipodrom, card)
+            print(f"🗂️ {hipodrom} koşu kartı hazırlandı ({overlay['changed']} atın oranı güncellendi)")
+    except Exception as e:
+        print(f"⚠️ {hipodrom} koşu kartı hazırlanamadı: {e}")
+
+# Oran overlay'inden ata ve adaya eklenen alanlar
+AT_ODDS_FIELDS = ['ganyan', 'agf1', 'agf2', 'agf1_sira', 'agf2_sira']
+CANDIDATE_ODDS_FIELDS = AT_ODDS_FIELDS + ['agf_value', 'agf_type', 'profit_from_score', 'combined_score']
+
+def overlay_race_card(card, odds_overlay, now):
+    """Statik karta oran ve saate bağlı alanları ekleyerek API yanıtını oluştur (statik kart değiştirilmez)"""
+    # Karttaki tüm atların son 10 ganyanı tek sorguda
+    ganyan_histories = get_ganyan_histories(card['hipodrom'], card['slot_at_adi'])
+    
+    kosular = []
+    active_bets = []
+    finished_bets = []
+    for race, race_odds in zip(card['races'], odds_overlay['races']):
+        kosu = race['kosu']
+        kosu_soon = is_race_soon(kosu['saat'], now)
+        kosu_finished = is_race_finished(kosu['saat'], now)
+        race_winner = race['race_winner'] if kosu_finished else None
+        
+        def live_fields(horse, odds):
+            # Value skoru sadece yakındaki koşularda, sonuç/kazanan sadece bitmiş koşularda
+            show_value = kosu_soon and bool(odds['ganyan'])
+            return {
+                'value_score': odds['value_score'] if show_value else None,
+                'profit_score': odds['profit_score'] if show_value else None,
+                'is_winner': bool(kosu_finished and horse['is_winner']),
+                'derece_sonuc': horse['derece_sonuc'] if kosu_finished else None
+            }
+        
+        atlar = []
+        for horse in race['horses']:
+            odds = race_odds['fields'][horse['slot']]
+            atlar.append({
+                **horse['at'],
+                **{key: odds[key] for key in AT_ODDS_FIELDS},
+                'son_10_ganyan': ganyan_histories.get(normalize_horse_name(horse['at']['at_adi']), []),
+                **live_fields(horse, odds)
+            })
+        kosular.append({**kosu, 'atlar': atlar, 'is_finished': kosu_finished, 'race_winner': race_winner})
+        
+        horses_by_slot = {horse['slot']: horse for horse in race['horses']}
+        bets = finished_bets if kosu_finished else active_bets
+        for slot in race_odds['top_3']:
+            horse = horses_by_slot[slot]
+            odds = race_odds['fields'][slot]
+            bets.append({
+                **horse['candidate'],
+                **{key: odds[key] for key in CANDIDATE_ODDS_FIELDS},
+                **live_fields(horse, odds),
+                'is_soon': kosu_soon,
+                'is_finished': kosu_finished,
+                'race_winner': race_winner  # Her at için race_winner ekle (bitmiş koşularda)
+            })
+    
+    # Koşu numarasına göre sırala; önce aktifleri, sonra bitmişleri ekle
+    def bet_order(bet):
+        return (bet['kosu_no'], -bet['combined_score'])
+    active_bets.sort(key=bet_order)
+    finished_bets.sort(key=bet_order)
+    
+    # En mantıklı oyunlar: Koşu bazında gruplanmış, her koşu için en yüksek 3 at
+    return {**card['data'], 'kosular': kosular, 'best_bets': active_bets + finished_bets}
+
 @app.route('/api/tahminler/<hipodrom>')
 def api_tahminler(hipodrom):
-    """Belirli bir hipodrom için tahminleri döndür (cache'li ve asenkron)"""
-    global last_update_time, _tahmin_cache
+    """Belirli bir hipodrom için tahminleri döndür (statik kart + saate bağlı alanlar)"""
+    global last_update_time
     try:
         hipodrom = hipodrom.upper()
         file_path = f'output/{hipodrom}_tahminler.txt'
         
-        # Cache kontrolü - eğer cache'de varsa ve dosya değişmemişse direkt döndür
-        if hipodrom in _tahmin_cache:
-            cache_entry = _tahmin_cache[hipodrom]
-            cache_time = cache_entry['timestamp']
-            cache_file_mtime = cache_entry['file_mtime']
-            
-            # Dosya hala var mı ve değişmiş mi kontrol et
-            if os.path.exists(file_path):
-                current_file_mtime = os.path.getmtime(file_path)
-                # Cache süresi dolmamış ve dosya değişmemişse cache'den döndür
-                time_diff = (datetime.now() - cache_time).total_seconds()
-                if time_diff < CACHE_TTL and current_file_mtime == cache_file_mtime:
-                    print(f"⚡ {hipodrom} için cache'den döndürülüyor (hızlı yanıt)")
-                    return jsonify(cache_entry['data'])
-        
         if not os.path.exists(file_path):
             print(f"❌ {hipodrom} için tahmin dosyası bulunamadı: {file_path}")
             # Output klasörünü kontrol et
@@ -558,832 +1477,26 @@ def api_tahminler(hipodrom):
         
         # Tahmin dosyasının son güncelleme zamanını kontrol et ve last_update_time'ı güncelle
         file_mtime = os.path.getmtime(file_path)
-        file_time = datetime.fromtimestamp(file_mtime).isoformat()
+        file_time = turkey_time(file_mtime).isoformat()
         
         # Eğer dosya zamanı last_update_time'dan daha yeni ise güncelle
         if last_update_time is None or file_time > last_update_time:
             last_update_time = file_time
             print(f"🔄 Tahmin dosyası güncellendi: {hipodrom} - {file_time}")
         
-        # Parse işlemini background thread'de yap (asenkron)
-        # Ama önce cache'de varsa onu kullan
-        data = None
-        if hipodrom in _tahmin_cache:
-            cache_entry = _tahmin_cache[hipodrom]
-            if os.path.exists(file_path) and os.path.getmtime(file_path) == cache_entry['file_mtime']:
-                # Cache'den parse edilmiş data'yı al
-                data = cache_entry.get('parsed_data')
-        
-        # Cache'de yoksa parse et (bu hızlı olmalı)
-        if data is None:
-        data = parse_tahmin_dosyasi(file_path)
-        if not data:
+        # Statik koşu kartı (tahminler veya oran dışı CSV verisi değişmedikçe yeniden hesaplanmaz)
+        card = get_race_card(hipodrom)
+        if card is None:
             print(f"❌ {hipodrom} için tahmin dosyası parse edilemedi")
             return jsonify({'error': 'Tahmin dosyası parse edilemedi'}), 500
+        # Oran overlay'i (CSV yenilendiyse sadece değişen atlar yeniden hesaplanır)
+        odds_overlay = get_odds_overlay(hipodrom, card)
         
-        # Ganyan ve AGF verilerini ekle (cache'li)
-        global _ganyan_cache
-        if hipodrom in _ganyan_cache:
-            cache_entry = _ganyan_cache[hipodrom]
-            time_diff = (datetime.now() - cache_entry['timestamp']).total_seconds()
-            if time_diff < CACHE_TTL:
-                ganyan_agf_data = cache_entry['data']
-            else:
-        ganyan_agf_data = get_ganyan_agf_data(hipodrom)
-                _ganyan_cache[hipodrom] = {
-                    'data': ganyan_agf_data,
-                    'timestamp': datetime.now()
-                }
-        else:
-            ganyan_agf_data = get_ganyan_agf_data(hipodrom)
-            _ganyan_cache[hipodrom] = {
-                'data': ganyan_agf_data,
-                'timestamp': datetime.now()
-            }
-        
-        # En mantıklı oyunlar listesi - AGF1 ve Yapay Zeka skoruna göre
-        all_candidates = []
-        
-        # Şu anki saat (saat:dakika formatında)
-        # Türkiye timezone'una göre saat al (GMT+3)
-        turkey_tz = pytz.timezone('Europe/Istanbul')
-        current_time = datetime.now(turkey_tz)
-        current_hour = current_time.hour
-        current_minute = current_time.minute
-        
-        def is_race_soon(kosu_saat):
-            """Koşu yakında mı? (1 saat içinde)"""
-            try:
-                # Saat formatını parse et (örn: "17:30")
-                race_hour, race_minute = map(int, kosu_saat.split(':'))
-                race_total_minutes = race_hour * 60 + race_minute
-                current_total_minutes = current_hour * 60 + current_minute
-                
-                # 1 saat içindeyse True
-                time_diff = race_total_minutes - current_total_minutes
-                return 0 <= time_diff <= 60
-            except:
-                return False
-        
-        def is_race_finished(kosu_saat):
-            """Koşu bitmiş mi? (saati geçmiş mi?)"""
-            try:
-                # Saat formatını parse et (örn: "17:30")
-                race_hour, race_minute = map(int, kosu_saat.split(':'))
-                race_total_minutes = race_hour * 60 + race_minute
-                current_total_minutes = current_hour * 60 + current_minute
-                
-                # Saati geçmişse True (en az 10 dakika geçmiş olmalı)
-                time_diff = current_total_minutes - race_total_minutes
-                return time_diff >= 10
-            except:
-                return False
-        
-        def get_race_winner(hipodrom, kosu_no, kosu_saat=None):
-            """CSV'den koşunun kazananını bul (sonuc sütununu kullan)"""
-            csv_path = f'data/{hipodrom}_races.csv'
-            if not os.path.exists(csv_path):
-                return None
-            
-            try:
-                df = pd.read_csv(csv_path, encoding='utf-8')
-                # Türkiye timezone'una göre tarih al
-                turkey_tz = pytz.timezone('Europe/Istanbul')
-                today = datetime.now(turkey_tz).strftime('%d/%m/%Y')
-                today_df = df[df['tarih'] == today]
-                
-                if len(today_df) == 0:
-                    return None
-                
-                # Koşu numarasına göre filtrele
-                kosu_df = None
-                
-                # Önce saat ile eşleştir (en güvenilir yöntem)
-                if kosu_saat and 'saat' in today_df.columns:
-                    try:
-                        # Saat formatını normalize et
-                        kosu_saat_normalized = kosu_saat.strip()
-                        kosu_df = today_df[today_df['saat'].astype(str).str.strip() == kosu_saat_normalized]
-                        print(f"🔍 Saat ile arama ({kosu_saat_normalized}): {len(kosu_df)} kayıt bulundu")
-                    except Exception as e:
-                        print(f"⚠️ Saat ile arama hatası: {e}")
-                        pass
-                
-                # Bulamazsa no sütunu ile dene (at numarası değil, koşu numarası olabilir)
-                if (kosu_df is None or len(kosu_df) == 0) and 'no' in today_df.columns:
-                    try:
-                        kosu_df = today_df[today_df['no'] == int(kosu_no)]
-                        print(f"🔍 no ile arama (koşu {kosu_no}): {len(kosu_df)} kayıt bulundu")
-                    except:
-                        pass
-                
-                # Bulamazsa kosu_kodu ile dene
-                if (kosu_df is None or len(kosu_df) == 0) and 'kosu_kodu' in today_df.columns:
-                    try:
-                        kosu_df = today_df[today_df['kosu_kodu'] == int(kosu_no)]
-                        print(f"🔍 kosu_kodu ile arama (koşu {kosu_no}): {len(kosu_df)} kayıt bulundu")
-                    except:
-                        pass
-                
-                # Bulamazsa yaris_kosu_key ile dene (hash değeri olabilir)
-                if (kosu_df is None or len(kosu_df) == 0) and 'yaris_kosu_key' in today_df.columns:
-                    kosu_df = today_df[today_df['yaris_kosu_key'] == f'kosu_{kosu_no}']
-                
-                # Bulamazsa kosu_no sütunu ile dene
-                if (kosu_df is None or len(kosu_df) == 0) and 'kosu_no' in today_df.columns:
-                    try:
-                        kosu_df = today_df[today_df['kosu_no'] == int(kosu_no)]
-                    except:
-                        pass
-                
-                # Bulamazsa kosu sütunu ile dene
-                if (kosu_df is None or len(kosu_df) == 0) and 'kosu' in today_df.columns:
-                    try:
-                        kosu_df = today_df[today_df['kosu'] == int(kosu_no)]
-                    except:
-                        pass
-                
-                if kosu_df is None or len(kosu_df) == 0:
-                    return None
-                
-                # Önce sonuc=1 olanı bul (kazanan)
-                if 'sonuc' in kosu_df.columns:
-                    try:
-                        # Sonuc sütununda 1 olan atı bul (string veya int)
-                        winner_row = kosu_df[(kosu_df['sonuc'] == 1) | (kosu_df['sonuc'] == '1') | (kosu_df['sonuc'] == '1.0') | (kosu_df['sonuc'].astype(str).str.strip() == '1')]
-                        if len(winner_row) > 0:
-                            winner_name = winner_row.iloc[0].get('at_adi', '')
-                            if pd.notna(winner_name) and str(winner_name).strip() and str(winner_name).strip() != '<nil>':
-                                winner = str(winner_name).strip()
-                                print(f"✅ Kazanan bulundu ({hipodrom} Koşu {kosu_no}): {winner}")
-                                return winner
-                    except Exception as e:
-                        print(f"Sonuc=1 kontrol hatası ({hipodrom} Koşu {kosu_no}): {e}")
-                        pass
-                
-                # Sonuc=1 yoksa derece=1 olanı bul
-                if 'derece' in kosu_df.columns:
-                    try:
-                        winner_row = kosu_df[(kosu_df['derece'] == 1) | (kosu_df['derece'] == '1') | (kosu_df['derece'] == '1.0') | (kosu_df['derece'].astype(str).str.strip() == '1')]
-                        if len(winner_row) > 0:
-                            winner_name = winner_row.iloc[0].get('at_adi', '')
-                            if pd.notna(winner_name) and str(winner_name).strip():
-                                winner = str(winner_name).strip()
-                                print(f"✅ Kazanan bulundu (derece=1) ({hipodrom} Koşu {kosu_no}): {winner}")
-                                return winner
-                    except Exception as e:
-                        print(f"Derece=1 kontrol hatası ({hipodrom} Koşu {kosu_no}): {e}")
-                        pass
-                
-                print(f"⚠️ Kazanan bulunamadı ({hipodrom} Koşu {kosu_no})")
-                return None
-            except Exception as e:
-                print(f"❌ Kazanan bulma hatası ({hipodrom} Koşu {kosu_no}): {e}")
-                import traceback
-                print(traceback.format_exc())
-                return None
-        
-        # Her koşu için AGF1 ve yapay zeka skorunu birleştir
-        for kosu in data['kosular']:
-            kosu_soon = is_race_soon(kosu['saat'])
-            kosu_finished = is_race_finished(kosu['saat'])
-            race_winner = get_race_winner(hipodrom, kosu['kosu_no'], kosu['saat']) if kosu_finished else None
-            
-            # CSV'den koşu mesafesini al
-            kosu_mesafe = None
-            csv_path = f'data/{hipodrom}_races.csv'
-            if os.path.exists(csv_path):
-                try:
-                    df = pd.read_csv(csv_path, encoding='utf-8')
-                    # Türkiye timezone'una göre tarih al
-                    turkey_tz = pytz.timezone('Europe/Istanbul')
-                    today = datetime.now(turkey_tz).strftime('%d/%m/%Y')
-                    today_df = df[df['tarih'] == today]
-                    
-                    if len(today_df) > 0:
-                        # Koşu numarasına göre filtrele - saat ile eşleştirme
-                        kosu_df = None
-                        if kosu.get('saat') and 'saat' in today_df.columns:
-                            kosu_df = today_df[today_df['saat'].astype(str).str.strip() == kosu['saat'].strip()]
-                        
-                        if kosu_df is None or len(kosu_df) == 0:
-                            # Yaris_kosu_key ile dene
-                            kosu_df = today_df[today_df['yaris_kosu_key'] == f'kosu_{kosu["kosu_no"]}']
-                        
-                        if kosu_df is not None and len(kosu_df) > 0:
-                            # İlk satırdan mesafe bilgisini al
-                            row = kosu_df.iloc[0]
-                            mesafe_val = row.get('mesafe', None)
-                            if pd.notna(mesafe_val) and str(mesafe_val).strip() and str(mesafe_val) != '<nil>':
-                                try:
-                                    # Mesafe değerini sayıya çevir (string olabilir, "1600" gibi)
-                                    mesafe_str = str(mesafe_val).strip()
-                                    # Sadece sayıları al
-                                    mesafe_num = ''.join(filter(str.isdigit, mesafe_str))
-                                    if mesafe_num:
-                                        kosu_mesafe = int(mesafe_num)
-                                except:
-                                    pass
-                except Exception as e:
-                    pass
-            
-            # Önce koşudaki tüm atların AGF1 ve olasılık bilgilerini topla
-            kosu_atlar_info = []
-            kosu_pist_tur = None  # Koşu seviyesinde pist türü
-            kosu_cins_detay = None  # Koşu seviyesinde cins detay
-            
-            for at in kosu['atlar']:
-                at_adi = at['at_adi']
-                olasilik = at['olasilik']
-                
-                # Ganyan ve AGF verilerini bul
-                ganyan = None
-                agf1 = None
-                agf2 = None
-                agf1_sira = None
-                
-                # En iyi derece bilgilerini varsayılan değerlerle başlat
-                en_iyi_derece = None
-                en_iyi_derece_farkli_hipodrom = False
-                
-                # Ganyan verisini bul - tüm koşularda ara
-                for kosu_key, atlar in ganyan_agf_data.items():
-                    for at_name_in_data, at_data in atlar.items():
-                        if at_name_in_data.upper().strip() == at_adi.upper().strip():
-                            ganyan = at_data['ganyan']
-                            agf1 = at_data['agf1']
-                            agf2 = at_data['agf2']
-                            break
-                    if ganyan is not None:
-                        break
-                
-                # CSV'den AGF1_sira, AGF2_sira, pist türü, jokey, at no ve derece/sonuç bilgisini al
-                pist_tur = None
-                jokey_adi = None
-                at_no = None
-                agf2_sira = None
-                derece_sonuc = None  # Bitmiş koşularda atın kaçıncı olduğu
-                csv_path = f'data/{hipodrom}_races.csv'
-                if os.path.exists(csv_path):
-                    try:
-                        df = pd.read_csv(csv_path, encoding='utf-8')
-                        # Türkiye timezone'una göre tarih al
-                        turkey_tz = pytz.timezone('Europe/Istanbul')
-                        today = datetime.now(turkey_tz).strftime('%d/%m/%Y')
-                        today_df = df[df['tarih'] == today]
-                        
-                        if len(today_df) > 0:
-                            # Koşu numarasına göre filtrele - saat ile eşleştirme
-                            kosu_df = None
-                            if kosu.get('saat') and 'saat' in today_df.columns:
-                                kosu_df = today_df[today_df['saat'].astype(str).str.strip() == kosu['saat'].strip()]
-                            
-                            if kosu_df is None or len(kosu_df) == 0:
-                                # Yaris_kosu_key ile dene
-                                kosu_df = today_df[today_df['yaris_kosu_key'] == f'kosu_{kosu["kosu_no"]}']
-                            
-                            if kosu_df is None or len(kosu_df) == 0:
-                                # Yaris_kosu_key yoksa, sadece at adına göre ara
-                                kosu_df = today_df
-                            
-                            at_row = kosu_df[kosu_df['at_adi'].str.upper().str.strip() == at_adi.upper().strip()]
-                            if len(at_row) > 0:
-                                row = at_row.iloc[0]
-                                
-                                # AGF1_sira
-                                agf1_sira_val = row.get('agf1_sira', None)
-                                if pd.notna(agf1_sira_val) and str(agf1_sira_val).strip() and str(agf1_sira_val) != '<nil>':
-                                    try:
-                                        agf1_sira = int(float(agf1_sira_val))
-                                    except:
-                                        pass
-                                
-                                # AGF2_sira
-                                agf2_sira_val = row.get('agf2_sira', None)
-                                if pd.notna(agf2_sira_val) and str(agf2_sira_val).strip() and str(agf2_sira_val) != '<nil>':
-                                    try:
-                                        agf2_sira = int(float(agf2_sira_val))
-                                    except:
-                                        pass
-                                
-                                # Pist türü
-                                pist_val = row.get('pist', None)
-                                if pd.notna(pist_val) and str(pist_val).strip() and str(pist_val) != '<nil>':
-                                    pist_tur = str(pist_val).strip()
-                                    # Koşu seviyesinde pist türü bilgisini de kaydet (ilk atın pist türü)
-                                    if kosu_pist_tur is None:
-                                        kosu_pist_tur = pist_tur
-                                
-                                # Cins detay
-                                cins_detay_val = row.get('cins_detay', None)
-                                if pd.notna(cins_detay_val) and str(cins_detay_val).strip() and str(cins_detay_val) != '<nil>':
-                                    cins_detay = str(cins_detay_val).strip()
-                                    # Koşu seviyesinde cins detay bilgisini de kaydet (ilk atın cins detay)
-                                    if kosu_cins_detay is None:
-                                        kosu_cins_detay = cins_detay
-                                
-                                # Jokey adı
-                                jokey_val = row.get('jokey_adi', None)
-                                if pd.notna(jokey_val) and str(jokey_val).strip() and str(jokey_val) != '<nil>':
-                                    jokey_adi = str(jokey_val).strip()
-                                
-                                # At numarası (no sütunu)
-                                no_val = row.get('no', None)
-                                if pd.notna(no_val) and str(no_val).strip() and str(no_val) != '<nil>':
-                                    try:
-                                        at_no = int(float(str(no_val).strip()))
-                                        print(f"✅ At numarası bulundu: {at_adi} -> {at_no}")
-                                    except Exception as e:
-                                        print(f"⚠️ At numarası parse hatası ({at_adi}): {e}")
-                                        pass
-                                
-                                # Ganyan (CSV'den direkt oku)
-                                ganyan_val = row.get('ganyan', None)
-                                if pd.notna(ganyan_val) and str(ganyan_val).strip() and str(ganyan_val) != '<nil>':
-                                    try:
-                                        ganyan_str = str(ganyan_val).replace(',', '.')
-                                        ganyan = float(ganyan_str)
-                                    except:
-                                        pass
-                                
-                                # En iyi derece
-                                en_iyi_derece_val = row.get('en_iyi_derece', None)
-                                en_iyi_derece = None
-                                if pd.notna(en_iyi_derece_val) and str(en_iyi_derece_val).strip() and str(en_iyi_derece_val) != '<nil>':
-                                    try:
-                                        en_iyi_derece = str(en_iyi_derece_val).strip()
-                                    except:
-                                        pass
-                                
-                                # En iyi derece farklı hipodrom
-                                en_iyi_derece_farkli_hipodrom_val = row.get('en_iyi_derece_farkli_hipodrom', None)
-                                en_iyi_derece_farkli_hipodrom = False
-                                if pd.notna(en_iyi_derece_farkli_hipodrom_val):
-                                    try:
-                                        # Boolean kontrolü: True, 1, "True", "1" gibi değerler
-                                        val_str = str(en_iyi_derece_farkli_hipodrom_val).strip().lower()
-                                        en_iyi_derece_farkli_hipodrom = val_str in ['true', '1', 'yes', 'evet']
-                                    except:
-                                        pass
-                                
-                                # Derece/Sonuç (bitmiş koşularda)
-                                if kosu_finished:
-                                    # Önce sonuc sütununu kontrol et
-                                    sonuc_val = row.get('sonuc', None)
-                                    if pd.notna(sonuc_val) and str(sonuc_val).strip() and str(sonuc_val) != '<nil>':
-                                        try:
-                                            sonuc_int = int(float(str(sonuc_val).strip()))
-                                            if sonuc_int > 0:
-                                                derece_sonuc = sonuc_int
-                                        except:
-                                            pass
-                                    
-                                    # Sonuc yoksa derece sütununu kontrol et
-                                    if derece_sonuc is None:
-                                        derece_val = row.get('derece', None)
-                                        if pd.notna(derece_val) and str(derece_val).strip() and str(derece_val) != '<nil>':
-                                            try:
-                                                # Derece sütunu zaman formatı olabilir (2.33.84 gibi), sadece sonuc=1 kontrolü yaptık
-                                                # Ama eğer sonuc yoksa, derece sütunundan ilk sayıyı al
-                                                derece_str = str(derece_val).strip()
-                                                # Sadece sayısal değer varsa (1, 2, 3 gibi)
-                                                if derece_str.isdigit():
-                                                    derece_sonuc = int(derece_str)
-                                            except:
-                                                pass
-                    except Exception as e:
-                        print(f"CSV okuma hatası: {e}")
-                        pass
-                
-                kosu_atlar_info.append({
-                    'at': at,
-                    'at_adi': at_adi,
-                    'olasilik': olasilik,
-                    'ganyan': ganyan,
-                    'agf1': agf1,
-                    'agf2': agf2,
-                    'agf1_sira': agf1_sira,
-                    'agf2_sira': agf2_sira,
-                    'pist_tur': pist_tur,
-                    'jokey_adi': jokey_adi,
-                    'at_no': at_no,
-                    'derece_sonuc': derece_sonuc,
-                    'en_iyi_derece': en_iyi_derece,
-                    'en_iyi_derece_farkli_hipodrom': en_iyi_derece_farkli_hipodrom
-                })
-            
-            # Olasılık sırasını hesapla (aynı koşudaki atlar arasında)
-            kosu_atlar_info.sort(key=lambda x: x['olasilik'], reverse=True)
-            for idx, at_info in enumerate(kosu_atlar_info):
-                at_info['olasilik_sira'] = idx + 1
-            
-            # AGF1 sırasını hesapla (aynı koşudaki atlar arasında, AGF1 yüksek = iyi)
-            kosu_atlar_with_agf1 = [a for a in kosu_atlar_info if a['agf1'] is not None and a['agf1'] > 0]
-            kosu_atlar_with_agf1.sort(key=lambda x: x['agf1'], reverse=True)
-            for idx, at_info in enumerate(kosu_atlar_with_agf1):
-                if at_info['agf1_sira'] is None:
-                    at_info['agf1_sira'] = idx + 1
-            
-            # Koşu objesine bitmiş bilgisi, kazananı, mesafeyi, pist türünü ve cins detay ekle
-            kosu['is_finished'] = kosu_finished
-            kosu['race_winner'] = race_winner
-            kosu['mesafe'] = kosu_mesafe
-            kosu['pist_tur'] = kosu_pist_tur
-            kosu['cins_detay'] = kosu_cins_detay
-            
-            # Şimdi bilgileri atlara ekle ve best_bets için hazırla
-            for at_info in kosu_atlar_info:
-                at = at_info['at']
-                at_adi = at_info['at_adi']
-                olasilik = at_info['olasilik']
-                ganyan = at_info['ganyan']
-                agf1 = at_info['agf1']
-                agf2 = at_info['agf2']
-                agf1_sira = at_info['agf1_sira']
-                agf2_sira = at_info.get('agf2_sira')
-                olasilik_sira = at_info['olasilik_sira']
-                pist_tur = at_info.get('pist_tur')
-                jokey_adi = at_info.get('jokey_adi')
-                at_no = at_info.get('at_no')
-                derece_sonuc = at_info.get('derece_sonuc')
-                
-                # Son 5 yarış bilgisini al
-                son_6_yaris = []
-                csv_path = f'data/{hipodrom}_races.csv'
-                if os.path.exists(csv_path):
-                    try:
-                        df = pd.read_csv(csv_path, encoding='utf-8')
-                        # Türkiye timezone'una göre tarih al
-                        turkey_tz = pytz.timezone('Europe/Istanbul')
-                        today = datetime.now(turkey_tz).strftime('%d/%m/%Y')
-                        
-                        # Bugünün tarihinden önceki yarışları al
-                        past_df = df[df['tarih'] != today].copy()
-                        if 'tarih' in past_df.columns:
-                            # At adına göre filtrele
-                            at_df = past_df[past_df['at_adi'].str.upper().str.strip() == at_adi.upper().strip()].copy()
-                            
-                            if len(at_df) > 0:
-                                # Tarih sıralaması için tarih sütununu datetime'a çevir
-                                try:
-                                    at_df['tarih_datetime'] = pd.to_datetime(at_df['tarih'], format='%d/%m/%Y', errors='coerce')
-                                    at_df = at_df.sort_values('tarih_datetime', ascending=False)
-                                    at_df = at_df.head(5)  # Son 5 yarış
-                                    
-                                    for _, row in at_df.iterrows():
-                                        mesafe = row.get('mesafe', '')
-                                        pist = row.get('pist', '')
-                                        sinif = row.get('sinif', '')
-                                        handikap = row.get('handikap', '')
-                                        cins_detay = row.get('cins_detay', '')
-                                        sonuc = row.get('sonuc', None)
-                                        derece = row.get('derece', None)
-                                        tarih = row.get('tarih', None)
-                                        agf1_sira_val = row.get('agf1_sira', None)
-                                        agf2_sira_val = row.get('agf2_sira', None)
-                                        jokey_val = row.get('jokey_adi', None)
-                                        
-                                        # Koşu numarasını bul
-                                        kosu_no_val = None
-                                        for col in ['kosu_no', 'no', 'kosu', 'yaris_kosu_key']:
-                                            kosu_val = row.get(col, None)
-                                            if pd.notna(kosu_val) and str(kosu_val).strip() and str(kosu_val) != '<nil>':
-                                                try:
-                                                    # yaris_kosu_key formatı: "kosu_2" gibi olabilir
-                                                    kosu_str = str(kosu_val).strip()
-                                                    if col == 'yaris_kosu_key' and 'kosu_' in kosu_str:
-                                                        kosu_no_val = int(kosu_str.split('_')[1])
-                                                    else:
-                                                        kosu_no_val = int(float(kosu_str))
-                                                    break
-                                                except:
-                                                    pass
-                                        
-                                        # Mesafe formatla
-                                        mesafe_str = ''
-                                        if pd.notna(mesafe) and str(mesafe).strip() and str(mesafe) != '<nil>':
-                                            mesafe_str = str(mesafe).strip()
-                                            # Sadece sayıları al
-                                            mesafe_num = ''.join(filter(str.isdigit, mesafe_str))
-                                            if mesafe_num:
-                                                mesafe_str = f"{mesafe_num}m"
-                                        
-                                        # Pist türü formatla (baş harfi büyük: Çim, Kum)
-                                        pist_str = ''
-                                        if pd.notna(pist) and str(pist).strip() and str(pist) != '<nil>':
-                                            pist_val = str(pist).strip()
-                                            # Baş harfi büyük yap
-                                            if pist_val:
-                                                pist_str = pist_val[0].upper() + pist_val[1:].lower() if len(pist_val) > 1 else pist_val.upper()
-                                            # Türkçe karakterler için özel düzenleme
-                                            pist_str = pist_str.replace('CIM', 'Çim').replace('cim', 'Çim').replace('Cim', 'Çim')
-                                            pist_str = pist_str.replace('KUM', 'Kum').replace('kum', 'Kum').replace('Kum', 'Kum')
-                                        
-                                        # Cins detay formatla (G1, Handikap 16, Şartlı 3 gibi)
-                                        cins_detay_str = ''
-                                        if pd.notna(cins_detay) and str(cins_detay).strip() and str(cins_detay) != '<nil>':
-                                            cins_detay_val = str(cins_detay).strip()
-                                            # Cins detay değerini temizle ve formatla
-                                            if cins_detay_val:
-                                                # "G1", "Handikap 16", "Şartlı 3" gibi formatları koru
-                                                cins_detay_str = cins_detay_val
-                                        
-                                        # Eğer cins_detay yoksa handikap kullan (geriye dönük uyumluluk için)
-                                        if not cins_detay_str and pd.notna(handikap) and str(handikap).strip() and str(handikap) != '<nil>':
-                                            try:
-                                                handikap_val = str(handikap).strip()
-                                                # Handikap değerini al (sadece sayı olabilir)
-                                                if handikap_val.isdigit():
-                                                    # Çok büyük sayılar (960 gibi) muhtemelen yanlış veri, atla
-                                                    handikap_num = int(handikap_val)
-                                                    if handikap_num < 100:  # Sadece mantıklı handikap değerleri (0-99)
-                                                        cins_detay_str = f"Handikap {handikap_num}"
-                                                else:
-                                                    # Sayı içeriyorsa al
-                                                    handikap_num = ''.join(filter(str.isdigit, handikap_val))
-                                                    if handikap_num and int(handikap_num) < 100:
-                                                        cins_detay_str = f"Handikap {handikap_num}"
-                                            except:
-                                                pass
-                                        
-                                        # Eğer hala yoksa sınıf kullan
-                                        if not cins_detay_str and pd.notna(sinif) and str(sinif).strip() and str(sinif) != '<nil>':
-                                            cins_detay_str = str(sinif).strip()
-                                        
-                                        # Sonuç formatla
-                                        sonuc_str = ''
-                                        if pd.notna(sonuc) and str(sonuc).strip() and str(sonuc) != '<nil>':
-                                            try:
-                                                sonuc_int = int(float(str(sonuc).strip()))
-                                                if sonuc_int == 1:
-                                                    sonuc_str = 'Kazandı'
-                                                else:
-                                                    sonuc_str = f'{sonuc_int}. oldu'
-                                            except:
-                                                pass
-                                        
-                                        if not sonuc_str and pd.notna(derece) and str(derece).strip() and str(derece) != '<nil>':
-                                            try:
-                                                derece_str = str(derece).strip()
-                                                if derece_str.isdigit():
-                                                    derece_int = int(derece_str)
-                                                    if derece_int == 1:
-                                                        sonuc_str = 'Kazandı'
-                                                    else:
-                                                        sonuc_str = f'{derece_int}. oldu'
-                                            except:
-                                                pass
-                                        
-                                        # Tarih formatla
-                                        tarih_str = None
-                                        if pd.notna(tarih) and str(tarih).strip() and str(tarih) != '<nil>':
-                                            tarih_str = str(tarih).strip()
-                                        
-                                        # AGF1_sira formatla
-                                        agf1_sira_str = None
-                                        if pd.notna(agf1_sira_val) and str(agf1_sira_val).strip() and str(agf1_sira_val) != '<nil>':
-                                            try:
-                                                agf1_sira_str = int(float(str(agf1_sira_val).strip()))
-                                            except:
-                                                pass
-                                        
-                                        # AGF2_sira formatla
-                                        agf2_sira_str = None
-                                        if pd.notna(agf2_sira_val) and str(agf2_sira_val).strip() and str(agf2_sira_val) != '<nil>':
-                                            try:
-                                                agf2_sira_str = int(float(str(agf2_sira_val).strip()))
-                                            except:
-                                                pass
-                                        
-                                        # Jokey formatla
-                                        jokey_str = None
-                                        if pd.notna(jokey_val) and str(jokey_val).strip() and str(jokey_val) != '<nil>':
-                                            jokey_str = str(jokey_val).strip()
-                                        
-                                        # Formatla: "1200m Çim, G1, Kazandı" veya "1200m Çim, Handikap 16, 2. oldu"
-                                        if mesafe_str or pist_str or cins_detay_str or sonuc_str:
-                                            parts = []
-                                            if mesafe_str:
-                                                parts.append(mesafe_str)
-                                            if pist_str:
-                                                parts.append(pist_str)
-                                            if cins_detay_str:
-                                                parts.append(cins_detay_str)
-                                            if sonuc_str:
-                                                parts.append(sonuc_str)
-                                            
-                                            if parts:
-                                                # Detaylı bilgi ile birlikte ekle
-                                                yaris_info = {
-                                                    'text': ', '.join(parts),
-                                                    'tarih': tarih_str,
-                                                    'kosu_no': kosu_no_val,
-                                                    'agf1_sira': agf1_sira_str,
-                                                    'agf2_sira': agf2_sira_str,
-                                                    'jokey': jokey_str
-                                                }
-                                                son_6_yaris.append(yaris_info)
-                                except Exception as e:
-                                    print(f"Son 5 yarış parse hatası ({at_adi}): {e}")
-                                    pass
-                    except Exception as e:
-                        print(f"Son 5 yarış okuma hatası ({at_adi}): {e}")
-                        pass
-                
-                # Son 5 yarış bilgisini at objesine ekle
-                at['son_6_yaris'] = son_6_yaris
-                
-                # Son 10 ganyan geçmişini al (JSON dosyasından)
-                son_10_ganyan = get_ganyan_history(hipodrom, at_adi)
-                at['son_10_ganyan'] = son_10_ganyan
-                
-                # Ganyan ve AGF bilgilerini ekle
-                at['ganyan'] = ganyan
-                at['agf1'] = agf1
-                at['agf2'] = agf2
-                at['agf1_sira'] = agf1_sira
-                at['agf2_sira'] = agf2_sira
-                at['olasilik_sira'] = olasilik_sira
-                at['jokey_adi'] = jokey_adi
-                at['at_no'] = at_no
-                at['en_iyi_derece'] = at_info.get('en_iyi_derece')
-                at['en_iyi_derece_farkli_hipodrom'] = at_info.get('en_iyi_derece_farkli_hipodrom', False)
-                
-                # Bitmiş koşularda kazanan bilgisini ekle
-                at['is_winner'] = False
-                at['derece_sonuc'] = derece_sonuc
-                if kosu_finished and race_winner:
-                    at['is_winner'] = (at_adi.upper().strip() == race_winner.upper().strip())
-                
-                # AGF1 veya AGF2'den biri olmalı - ikisi de yoksa varsayılan değer kullan
-                # AGF1 varsa her zaman AGF1 kullan (koşu numarasına bakmadan)
-                # AGF1 yoksa AGF2 kullan
-                # İkisi de yoksa 0 kullan (AGF bilgisi olmayan atlar için)
-                agf_value = None
-                agf_type = None
-                
-                if agf1 is not None and agf1 > 0:
-                    # AGF1 varsa her zaman AGF1 kullan
-                    agf_value = agf1
-                    agf_type = 'AGF1'
-                elif agf2 is not None and agf2 > 0:
-                    # AGF1 yoksa AGF2 kullan
-                    agf_value = agf2
-                    agf_type = 'AGF2'
-                else:
-                    # AGF1 ve AGF2 bilgisi yoksa varsayılan değer kullan (0)
-                    agf_value = 0
-                    agf_type = None
-                
-                # AGF ve yapay zeka skorunu birleştir
-                # Olasılık skoru (combined_score) = AGF skoru (%40) + AI olasılık skoru (%60)
-                combined_score = None
-                value_score = None
-                profit_score = None
-                profit_from_score = None
-                
-                # Yapay zeka skoru: olasılık (0-100 arası) -> 0-1 arasına normalize et
-                ai_score = olasilik / 100.0  # 0-1 arası
-                
-                # AGF skoru: yüksek AGF = güçlü at (yüksek skor)
-                # Normalize et: AGF yüksek = yüksek skor
-                # Örnek: AGF=50 -> skor=1.0, AGF=1 -> skor=0.0
-                min_agf = 1.0  # Minimum AGF (zayıf)
-                max_agf = 100.0  # Maximum AGF (güçlü)
-                
-                # AGF'i normalize et: yüksek AGF = yüksek skor
-                if agf_value is None or agf_value <= 0:
-                    agf_score = 0.0
-                elif agf_value >= max_agf:
-                    agf_score = 1.0
-                elif agf_value <= min_agf:
-                    agf_score = 0.0
-                else:
-                    # Lineer interpolasyon: yüksek AGF = yüksek skor
-                    agf_score = (agf_value - min_agf) / (max_agf - min_agf)
-                
-                # Birleştirilmiş skor (Olasılık Skoru): AGF ve AI skorunun ağırlıklı ortalaması
-                # AGF %40, AI olasılık skoru %60 ağırlık (daha fazla AI'a güven)
-                combined_score = (0.4 * agf_score) + (0.6 * ai_score)
-                
-                # Value skoru hesapla (sadece yakındaki koşular için)
-                if kosu_soon and ganyan:
-                    value_score = calculate_value_score(olasilik, ganyan)
-                    profit_score = calculate_profit_score(olasilik, ganyan)
-                    at['value_score'] = value_score
-                    at['profit_score'] = profit_score
-                else:
-                    at['value_score'] = None
-                    at['profit_score'] = None
-                
-                # Skor ve Ganyan'dan kazanç skoru hesapla (ganyan varsa)
-                if ganyan and combined_score is not None:
-                    profit_from_score = calculate_profit_from_score_and_ganyan(combined_score, ganyan)
-                
-                # Kazandı mı kontrol et
-                is_winner = False
-                if kosu_finished and race_winner:
-                    is_winner = (at_adi.upper().strip() == race_winner.upper().strip())
-                
-                # En iyi derece bilgisi
-                en_iyi_derece = at_info.get('en_iyi_derece')
-                en_iyi_derece_farkli_hipodrom = at_info.get('en_iyi_derece_farkli_hipodrom', False)
-                
-                # AGF1 veya AGF2'ye sahip atları ekle
-                all_candidates.append({
-                    'kosu_no': kosu['kosu_no'],
-                    'kosu_saat': kosu['saat'],
-                    'kosu_sinif': kosu['sinif'],
-                    'kosu_mesafe': kosu.get('mesafe'),  # Koşu mesafesi eklendi
-                    'pist_tur': pist_tur,  # Pist türü eklendi
-                    'jokey_adi': jokey_adi,  # Jokey adı eklendi
-                    'at_no': at_no,  # At numarası eklendi
-                    'at_adi': at_adi,
-                    'olasilik': olasilik,
-                    'olasilik_sira': olasilik_sira,
-                    'agf1': agf1,  # Orijinal AGF1 değeri (varsa)
-                    'agf2': agf2,  # Orijinal AGF2 değeri (varsa)
-                    'agf_value': agf_value,  # Kullanılan AGF değeri (AGF1 veya AGF2)
-                    'agf_type': agf_type,  # 'AGF1' veya 'AGF2'
-                    'agf1_sira': agf1_sira,  # AGF1 sırası (varsa)
-                    'agf2_sira': agf2_sira,  # AGF2 sırası (varsa)
-                    'ganyan': ganyan,  # Her zaman ekle (göstermek için)
-                    'en_iyi_derece': en_iyi_derece,  # En iyi derece (varsa)
-                    'en_iyi_derece_farkli_hipodrom': en_iyi_derece_farkli_hipodrom,  # Farklı hipodrom mu
-                    'value_score': value_score,
-                    'profit_score': profit_score if kosu_soon and ganyan else None,
-                    'profit_from_score': profit_from_score,  # Skor ve Ganyan'dan hesaplanan
-                    'combined_score': combined_score,
-                    'is_soon': kosu_soon,
-                    'is_finished': kosu_finished,
-                    'is_winner': is_winner,
-                    'race_winner': race_winner if kosu_finished else None,  # Her at için race_winner ekle (bitmiş koşularda)
-                    'derece_sonuc': derece_sonuc  # Bitmiş koşularda atın kaçıncı olduğu
-                })
-        
-        # Koşu bazında grupla ve her koşu için en yüksek 3 atı al
-        # Önce aktif olanları, sonra bitmişleri işle
-        active_bets = [b for b in all_candidates if not b.get('is_finished', False)]
-        finished_bets = [b for b in all_candidates if b.get('is_finished', False)]
-        
-        print(f"📊 {hipodrom} - Toplam aday: {len(all_candidates)}, Aktif: {len(active_bets)}, Bitmiş: {len(finished_bets)}")
-        
-        # Koşu bazında grupla (debug için)
-        races_debug = {}
-        for bet in all_candidates:
-            race_key = f"{bet['kosu_no']}_{bet['kosu_saat']}"
-            if race_key not in races_debug:
-                races_debug[race_key] = {'is_finished': bet.get('is_finished', False), 'count': 0}
-            races_debug[race_key]['count'] += 1
-        
-        print(f"📊 {hipodrom} - Toplam koşu sayısı: {len(races_debug)}")
-        for race_key, info in sorted(races_debug.items()):
-            print(f"  - Koşu {race_key}: {'Bitmiş' if info['is_finished'] else 'Aktif'}, {info['count']} at")
-        
-        def get_top_3_per_race(bets):
-            """Koşu bazında grupla ve her koşu için en yüksek 3 atı al"""
-            # Koşu bazında grupla (koşu_no, kosu_saat kombinasyonu)
-            races_dict = {}
-            for bet in bets:
-                race_key = f"{bet['kosu_no']}_{bet['kosu_saat']}"
-                if race_key not in races_dict:
-                    races_dict[race_key] = []
-                races_dict[race_key].append(bet)
-            
-            # Her koşu için en yüksek 3 atı al (combined_score'a göre)
-            result = []
-            for race_key, race_bets in races_dict.items():
-                # Combined_score'a göre sırala (yüksekten düşüğe)
-                race_bets.sort(key=lambda x: x['combined_score'] if x['combined_score'] is not None else -1, reverse=True)
-                # En yüksek 3 atı al
-                result.extend(race_bets[:3])
-            
-            # Koşu numarasına göre sırala
-            result.sort(key=lambda x: (x['kosu_no'], -(x['combined_score'] if x['combined_score'] is not None else -1)))
-            return result
-        
-        # Aktif koşular için en yüksek 3 atı al
-        active_top_bets = get_top_3_per_race(active_bets)
-        
-        # Bitmiş koşular için en yüksek 3 atı al
-        finished_top_bets = get_top_3_per_race(finished_bets)
-        
-        # Önce aktifleri, sonra bitmişleri ekle
-        all_candidates_sorted = active_top_bets + finished_top_bets
+        # Türkiye saatine (veya as-of anına) göre koşu durumları
+        response_data = overlay_race_card(card, odds_overlay, web_now())
         
-        # En mantıklı oyunlar: Koşu bazında gruplanmış, her koşu için en yüksek 3 at
-        data['best_bets'] = all_candidates_sorted
-        
-        # Response'u hazırla
-        response_data = data
-        
-        # Cache'e kaydet (parse edilmiş data'yı da sakla)
-        _tahmin_cache[hipodrom] = {
-            'data': response_data,
-            'timestamp': datetime.now(),
-            'file_mtime': file_mtime,
-            'parsed_data': data  # Parse edilmiş data'yı da sakla (tekrar parse etmemek için)
-        }
+        active_count = sum(1 for kosu in response_data['kosular'] if not kosu['is_finished'])
+        print(f"📊 {hipodrom} - Koşu: {len(response_data['kosular'])}, Aktif: {active_count}, En mantıklı oyun: {len(response_data['best_bets'])}")
         
         return jsonify(response_data)
     except Exception as e:
@@ -1399,7 +1512,7 @@ def api_manual_update():
     try:
         print("="*60)
         print("🔄 Manuel güncelleme tetiklendi...")
-        print(f"📅 Zaman: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+        print(f"📅 Zaman: {turkey_time().strftime('%d/%m/%Y %H:%M:%S')}")
         print("="*60)
         # Background thread'de çalıştır
         import threading
@@ -1412,7 +1525,7 @@ def api_manual_update():
                 run_daily_update()
                 print("="*60)
                 print("✅ Manuel güncelleme tamamlandı!")
-                print(f"📅 Zaman: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+                print(f"📅 Zaman: {turkey_time().strftime('%d/%m/%Y %H:%M:%S')}")
                 print("="*60)
             except Exception as e:
                 print("="*60)
@@ -1434,6 +1547,17 @@ def api_manual_update():
             'message': str(e)
         }), 500
 
+@app.route('/api/metrics/<hipodrom>')
+def api_metrics(hipodrom):
+    """Tahmin başarısı: son 20 / son 100 / tüm koşular için top-1, top-3, logloss ve ROI"""
+    hipodrom = hipodrom.upper()
+    if hipodrom not in HIPODROMLAR:
+        return jsonify({'error': 'Hipodrom bulunamadı'}), 404
+    try:
+        return jsonify({'hipodrom': hipodrom, 'metrics': get_metrics_store(hipodrom).summary()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/scheduler-status')
 def api_scheduler_status():
     """Scheduler durumunu kontrol et"""
@@ -1476,12 +1600,12 @@ def api_completed_races():
                             try:
                                 # Ganyan ve AGF verilerini ekle
                                 ganyan_agf_data = get_ganyan_agf_data(hipodrom)
+                                ganyan_index = build_ganyan_name_index(ganyan_agf_data)
                                 
                                 # En mantıklı oyunlar listesi oluştur
                                 if 'kosular' in data and data['kosular']:
-                                    # Türkiye timezone'una göre saat al
-                                    turkey_tz = pytz.timezone('Europe/Istanbul')
-                                    current_time = datetime.now(turkey_tz)
+                                    # Türkiye saatine (veya as-of anına) göre saat
+                                    current_time = web_now()
                                     current_hour = current_time.hour
                                     current_minute = current_time.minute
                                     
@@ -1507,8 +1631,9 @@ def api_completed_races():
                                             at_adi = at.get('at_adi')
                                             
                                             # Ganyan ve AGF verilerini al
-                                            ganyan_value = ganyan_agf_data.get(at_adi, {}).get('ganyan')
-                                            agf1_value = ganyan_agf_data.get(at_adi, {}).get('agf1')
+                                            at_data = ganyan_index.get(normalize_horse_name(at_adi), {})
+                                            ganyan_value = at_data.get('ganyan')
+                                            agf1_value = at_data.get('agf1')
                                             
                                             # Combined score hesapla
                                             ai_score = at.get('ai_score', 0)
@@ -1573,51 +1698,51 @@ def api_completed_races():
                                                 finished_winners.append(top_bet)
                                 
                                 # Her kazanan için completed_races'e ekle
-                                    try:
-                                for bet in finished_winners:
-                                    # Timestamp hesapla
-                                    try:
-                                        race_hour, race_minute = map(int, bet['kosu_saat'].split(':'))
-                                        race_total_minutes = race_hour * 60 + race_minute
-                                    except:
-                                        race_total_minutes = 0
-                                    
-                                    # Ganyan değerini al (float veya None olabilir)
-                                    ganyan_value = bet.get('ganyan')
-                                    if ganyan_value is not None:
+                                try:
+                                    for bet in finished_winners:
+                                        # Timestamp hesapla
                                         try:
-                                            # String ise float'a çevir
-                                            if isinstance(ganyan_value, str):
-                                                ganyan_value = float(ganyan_value.replace(',', '.'))
-                                            elif isinstance(ganyan_value, (int, float)):
-                                                ganyan_value = float(ganyan_value)
-                                        except (ValueError, TypeError):
-                                            ganyan_value = None
+                                            race_hour, race_minute = map(int, bet['kosu_saat'].split(':'))
+                                            race_total_minutes = race_hour * 60 + race_minute
+                                        except:
+                                            race_total_minutes = 0
                                     
-                                    completed_races.append({
-                                        'hipodrom': bet.get('hipodrom', hipodrom),
-                                        'kosu_no': bet.get('kosu_no'),
-                                        'kosu_saat': bet.get('kosu_saat'),
-                                        'kosu_mesafe': bet.get('kosu_mesafe'),
-                                        'pist_tur': bet.get('pist_tur'),
-                                        'kosu_sinif': bet.get('kosu_sinif'),
-                                        'cins_detay': bet.get('cins_detay'),
-                                        'at_no': bet.get('at_no'),
-                                        'at_adi': bet.get('at_adi'),
-                                        'jokey_adi': bet.get('jokey_adi'),
-                                        'is_winner': True,
-                                        'derece_sonuc': 1,
-                                        'combined_score': bet.get('combined_score'),
-                                        'ganyan': ganyan_value,
-                                        'timestamp': race_total_minutes
-                                    })
-                    except Exception as e:
-                                        print(f"⚠️ {hipodrom} için completed_races eklenirken hata: {e}")
-                        import traceback
-                        traceback.print_exc()
-                        continue
-            except Exception as e:
-                print(f"❌ {hipodrom} tamamlanan koşular parse edilirken hata: {e}")
+                                        # Ganyan değerini al (float veya None olabilir)
+                                        ganyan_value = bet.get('ganyan')
+                                        if ganyan_value is not None:
+                                            try:
+                                                # String ise float'a çevir
+                                                if isinstance(ganyan_value, str):
+                                                    ganyan_value = float(ganyan_value.replace(',', '.'))
+                                                elif isinstance(ganyan_value, (int, float)):
+                                                    ganyan_value = float(ganyan_value)
+                                            except (ValueError, TypeError):
+                                                ganyan_value = None
+                                    
+                                        completed_races.append({
+                                            'hipodrom': bet.get('hipodrom', hipodrom),
+                                            'kosu_no': bet.get('kosu_no'),
+                                            'kosu_saat': bet.get('kosu_saat'),
+                                            'kosu_mesafe': bet.get('kosu_mesafe'),
+                                            'pist_tur': bet.get('pist_tur'),
+                                            'kosu_sinif': bet.get('kosu_sinif'),
+                                            'cins_detay': bet.get('cins_detay'),
+                                            'at_no': bet.get('at_no'),
+                                            'at_adi': bet.get('at_adi'),
+                                            'jokey_adi': bet.get('jokey_adi'),
+                                            'is_winner': True,
+                                            'derece_sonuc': 1,
+                                            'combined_score': bet.get('combined_score'),
+                                            'ganyan': ganyan_value,
+                                            'timestamp': race_total_minutes
+                                        })
+                                except Exception as e:
+                                    print(f"⚠️ {hipodrom} için completed_races eklenirken hata: {e}")
+                                    import traceback
+                                    traceback.print_exc()
+                                    continue
+                            except Exception as e:
+                                print(f"❌ {hipodrom} tamamlanan koşular parse edilirken hata: {e}")
                                 import traceback
                                 traceback.print_exc()
                                 continue
@@ -1656,85 +1781,112 @@ def tahminler(hipodrom):
     hipodrom = hipodrom.upper()
     return render_template('predictions.html', hipodrom=hipodrom)
 
+def get_odds_store(hipodrom):
+    """Hipodromun oran zaman serisi (data/{HIPODROM}_odds.sqlite, süreç içinde tek bağlantı)"""
+    with _odds_store_lock:
+        store = _odds_stores.get(hipodrom)
+        if store is None:
+            store = _odds_stores[hipodrom] = OddsHistoryStore.for_hipodrom(hipodrom, key=normalize_horse_name)
+        return store
+
 def update_ganyan_history(hipodrom):
-    """CSV'den bugünkü ganyan değerlerini al ve her at için son 10 ganyan geçmişini güncelle"""
-    ganyan_history_file = f'data/{hipodrom}_ganyan_history.json'
-    csv_path = f'data/{hipodrom}_races.csv'
-    
-    if not os.path.exists(csv_path):
-        return
-    
+    """CSV'den bugünkü ganyan/AGF değerlerini oran zaman serisine ekle (sadece değişen oranlar yazılır)"""
     try:
-        # Mevcut geçmişi yükle
-        ganyan_history = {}
-        if os.path.exists(ganyan_history_file):
-            try:
-                with open(ganyan_history_file, 'r', encoding='utf-8') as f:
-                    ganyan_history = json.load(f)
-            except:
-                ganyan_history = {}
-        
-        # CSV'den bugünkü verileri oku
-        df = pd.read_csv(csv_path, encoding='utf-8')
-        # Türkiye timezone'una göre tarih al
-        turkey_tz = pytz.timezone('Europe/Istanbul')
-        today = datetime.now(turkey_tz).strftime('%d/%m/%Y')
-        
-        if 'tarih' not in df.columns:
+        race_index = get_race_index(hipodrom)
+        if race_index is None or race_index['today_df'].empty:
             return
         
-        today_df = df[df['tarih'] == today].copy()
-        
-        if len(today_df) == 0:
-            return
-        
-        # Bugünkü her at için ganyan değerini al ve geçmişe ekle
-        for _, row in today_df.iterrows():
-            at_adi = str(row.get('at_adi', '')).strip().upper()
-            if not at_adi:
-                continue
-            
-            ganyan_val = row.get('ganyan', None)
-            if pd.notna(ganyan_val) and str(ganyan_val).strip() and str(ganyan_val) != '<nil>':
-                try:
-                    ganyan_str = str(ganyan_val).replace(',', '.')
-                    ganyan_float = float(ganyan_str)
-                    if ganyan_float > 0:  # Sadece geçerli ganyan değerleri
-                        # At için geçmiş yoksa oluştur
-                        if at_adi not in ganyan_history:
-                            ganyan_history[at_adi] = []
-                        
-                        # Bugünkü ganyan değerini ekle
-                        ganyan_history[at_adi].append(ganyan_float)
-                        
-                        # Son 10'u tut (en yeni değerler)
-                        if len(ganyan_history[at_adi]) > 10:
-                            ganyan_history[at_adi] = ganyan_history[at_adi][-10:]
-                except:
-                    pass
+        today_df = race_index['today_df']
+        odds = race_index['today_odds']
+        race_column = 'yaris_kosu_key' if 'yaris_kosu_key' in today_df.columns else 'kosu_kodu'
+        races = today_df[race_column].astype(str).tolist() if race_column in today_df.columns else [''] * len(today_df)
         
-        # Geçmişi dosyaya kaydet
-        with open(ganyan_history_file, 'w', encoding='utf-8') as f:
-            json.dump(ganyan_history, f, ensure_ascii=False, indent=2)
+        def optional(values):
+            return [None if np.isnan(v) else float(v) for v in values]
         
+        records = zip(races, today_df['at_key'].tolist(),
+                      optional(odds['ganyan']), optional(odds['agf1']), optional(odds['agf2']))
+        written = get_odds_store(hipodrom).append(records)
+        if written:
+            print(f"💹 {hipodrom}: {written} atın oranı değişti, geçmişe eklendi")
     except Exception as e:
         print(f"❌ {hipodrom} ganyan geçmişi güncelleme hatası: {e}")
 
+def get_ganyan_histories(hipodrom, at_adlari):
+    """Karttaki atlar için son 10 ganyan değişimi, tek sorguda (oran geçmişi değişene kadar cache'li)
+
+    Returns:
+        {at_key: [ganyan, ...]} (eskiden yeniye)
+    """
+    try:
+        store = get_odds_store(hipodrom)
+        at_keys = [normalize_horse_name(at_adi) for at_adi in at_adlari]
+        cache_entry = _ganyan_history_cache.get(hipodrom)
+        if cache_entry is None or cache_entry['version'] != store.version:
+            cache_entry = {'version': store.version, 'histories': {}, 'loaded': set()}
+            _ganyan_history_cache[hipodrom] = cache_entry
+        missing = [at_key for at_key in at_keys if at_key not in cache_entry['loaded']]
+        if missing:
+            cache_entry['histories'].update(store.histories(missing))
+            cache_entry['loaded'].update(missing)
+        return cache_entry['histories']
+    except Exception as e:
+        print(f"⚠️ {hipodrom} ganyan geçmişi okunamadı: {e}")
+        return {}
+
 def get_ganyan_history(hipodrom, at_adi):
     """Belirli bir at için son 10 ganyan geçmişini döndür"""
-    ganyan_history_file = f'data/{hipodrom}_ganyan_history.json'
-    
-    if not os.path.exists(ganyan_history_file):
-        return []
-    
+    return get_ganyan_histories(hipodrom, [at_adi]).get(normalize_horse_name(at_adi), [])
+
+def get_metrics_store(hipodrom):
+    """Hipodromun tahmin/sonuç metrikleri (data/{HIPODROM}_metrics.sqlite, süreç içinde tek bağlantı)"""
+    with _odds_store_lock:
+        store = _metrics_stores.get(hipodrom)
+        if store is None:
+            store = _metrics_stores[hipodrom] = PredictionMetricsStore.for_hipodrom(hipodrom)
+        return store
+
+def update_prediction_metrics(hipodrom):
+    """Yeni tahminleri sakla ve sonucu gelen koşuları metrik tablosuna işle
+
+    Tahminler (output/{HIPODROM}_predictions_all.csv) dosya değiştiğinde ve
+    sadece kazananı henüz belli olmayan bugünkü koşular için kaydedilir;
+    kesinleşen koşular saklanan tahminlerle birleştirilip bir kez işlenir.
+    """
     try:
-        with open(ganyan_history_file, 'r', encoding='utf-8') as f:
-            ganyan_history = json.load(f)
+        race_index = get_race_index(hipodrom)
+        if race_index is None or race_index['today_df'].empty or 'yaris_kosu_key' not in race_index['today_df'].columns:
+            return
         
-        at_key = at_adi.upper().strip()
-        return ganyan_history.get(at_key, [])
-    except:
-        return []
+        store = get_metrics_store(hipodrom)
+        today_df = race_index['today_df']
+        races = today_df['yaris_kosu_key'].astype(str).to_numpy()
+        sonuc = pd.to_numeric(today_df['sonuc'], errors='coerce').to_numpy(dtype=float) if 'sonuc' in today_df.columns else np.full(len(today_df), np.nan)
+        tarih = today_df['tarih'].iloc[0]
+        
+        predictions_path = f'output/{hipodrom}_predictions_all.csv'
+        if os.path.exists(predictions_path):
+            mtime = os.path.getmtime(predictions_path)
+            if _metrics_predictions_mtime.get(hipodrom) != mtime:
+                predictions = pd.read_csv(predictions_path)
+                predictions = predictions[predictions['yaris_kosu_key'].astype(str).isin(race_index['today_kosular'])]
+                recorded = store.record_predictions(
+                    predictions['yaris_kosu_key'].astype(str).to_numpy(),
+                    predictions['at_adi'].map(normalize_horse_name).to_numpy(),
+                    predictions['win_proba'].to_numpy(dtype=float),
+                    tarih=tarih,
+                    finalized=set(races[sonuc == 1]),
+                )
+                _metrics_predictions_mtime[hipodrom] = mtime
+                if recorded:
+                    print(f"🗂️ {hipodrom}: {recorded} koşunun tahmini kaydedildi")
+        
+        ingested = store.ingest_results(races, today_df['at_key'].to_numpy(), sonuc,
+                                        race_index['today_odds']['ganyan'].to_numpy(), tarih=tarih)
+        if ingested:
+            print(f"🎯 {hipodrom}: {ingested} koşunun sonucu işlendi ({store.rolling()})")
+    except Exception as e:
+        print(f"❌ {hipodrom} tahmin başarısı güncelleme hatası: {e}")
 
 def update_data_for_hipodrom(hipodrom):
     """Belirli bir hipodrom için CSV verilerini güncelle ve ganyan geçmişini güncelle"""
@@ -1764,8 +1916,12 @@ def update_data_for_hipodrom(hipodrom):
             print(f"❌ {hipodrom} CSV dosyası oluşturulamadı: {csv_path}")
             return False
         
-        # CSV güncellendikten sonra ganyan geçmişini güncelle
+        # CSV güncellendikten sonra ganyan geçmişini ve tahmin başarısını güncelle
         update_ganyan_history(hipodrom)
+        update_prediction_metrics(hipodrom)
+        
+        # Oranlar değişti: koşu kartının oran overlay'ini güncelle (sadece değişen atlar)
+        refresh_race_card(hipodrom)
         
         print(f"✅ {hipodrom} verisi güncellendi")
         return True
@@ -1780,13 +1936,16 @@ def update_predictions_for_hipodrom(hipodrom):
     try:
         print(f"🔄 {hipodrom} için model eğitiliyor ve tahminler oluşturuluyor...")
         result = subprocess.run(
-            ['python3', 'tahmin_yap.py', hipodrom],
+            ['python3', 'tahmin_yap.py', hipodrom, as_of_flag()],
             capture_output=True,
             text=True,
             timeout=300  # 5 dakika timeout
         )
         if result.returncode == 0:
             print(f"✅ {hipodrom} model eğitildi ve tahminler oluşturuldu")
+            # Yeni tahminlerle statik koşu kartını hazırla ve tahminleri sakla
+            refresh_race_card(hipodrom)
+            update_prediction_metrics(hipodrom)
             return True
         else:
             print(f"❌ {hipodrom} güncelleme hatası: {result.stderr}")
@@ -1798,7 +1957,7 @@ def update_predictions_for_hipodrom(hipodrom):
 def update_all_data():
     """Tüm hipodromlar için sadece CSV verilerini güncelle (tahminler güncellenmez)"""
     global last_update_time
-    print(f"🔄 CSV verileri güncelleniyor... ({datetime.now()})")
+    print(f"🔄 CSV verileri güncelleniyor... ({turkey_time()})")
     
     # Data ve output klasörlerinin var olduğundan emin ol
     for dir_name in ['data', 'output']:
@@ -1814,13 +1973,13 @@ def update_all_data():
             success_count += 1
     
     # Son güncelleme zamanını güncelle (site yenileme için)
-    last_update_time = datetime.now().isoformat()
+    last_update_time = turkey_time().isoformat()
     
-    print(f"✅ CSV güncellemeleri tamamlandı ({success_count}/{len(HIPODROMLAR)} başarılı) ({datetime.now()})")
+    print(f"✅ CSV güncellemeleri tamamlandı ({success_count}/{len(HIPODROMLAR)} başarılı) ({turkey_time()})")
 
 def update_all_data_and_predictions():
     """Tüm hipodromlar için önce verileri, sonra tahminleri güncelle (model her seferinde yeniden eğitilir)"""
-    print(f"🔄 Tüm veriler ve tahminler güncelleniyor... ({datetime.now()})")
+    print(f"🔄 Tüm veriler ve tahminler güncelleniyor... ({turkey_time()})")
     
     # Önce verileri güncelle
     print("📥 CSV verileri güncelleniyor...")
@@ -1832,29 +1991,32 @@ def update_all_data_and_predictions():
     for hipodrom in HIPODROMLAR:
         update_predictions_for_hipodrom(hipodrom)
     
-    print(f"✅ Tüm güncellemeler tamamlandı ({datetime.now()})")
+    print(f"✅ Tüm güncellemeler tamamlandı ({turkey_time()})")
 
 def run_daily_update():
     """Günlük otomatik güncelleme - bugün koşu olan şehirler için tahmin çalıştır"""
-    print(f"🔄 Günlük otomatik güncelleme başlatılıyor... ({datetime.now()})")
+    print(f"🔄 Günlük otomatik güncelleme başlatılıyor... ({turkey_time()})")
     try:
         result = subprocess.run(
-            ['python3', 'daily_update.py'],
+            ['python3', 'daily_update.py', as_of_flag()],
             cwd=os.path.dirname(os.path.abspath(__file__)),
             capture_output=True,
             text=True,
             timeout=3600  # 1 saat timeout
         )
         if result.returncode == 0:
-            print(f"✅ Günlük otomatik güncelleme tamamlandı ({datetime.now()})")
+            print(f"✅ Günlük otomatik güncelleme tamamlandı ({turkey_time()})")
             print(result.stdout)
+            # Yeni tahminlerle statik koşu kartlarını hazırla
+            for hipodrom in HIPODROMLAR:
+                refresh_race_card(hipodrom)
         else:
             print(f"❌ Günlük otomatik güncelleme hatası: {result.stderr}")
     except Exception as e:
         print(f"❌ Günlük otomatik güncelleme hatası: {e}")
 
 # İlk güncelleme zamanını ayarla (uygulama başlarken)
-last_update_time = datetime.now().isoformat()
+last_update_time = turkey_time().isoformat()
 
 def initial_data_update():
     """Uygulama başlarken ilk veri güncellemesini yap (background'da)"""
@@ -1865,7 +2027,7 @@ def initial_data_update():
         time.sleep(10)
         print("="*60)
         print("🔄 İlk veri güncellemesi başlatılıyor...")
-        print(f"📅 Zaman: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+        print(f"📅 Zaman: {turkey_time().strftime('%d/%m/%Y %H:%M:%S')}")
         print("="*60)
         try:
             # Önce CSV verilerini güncelle
@@ -1878,7 +2040,7 @@ def initial_data_update():
             run_daily_update()
             print("="*60)
             print("✅ İlk veri güncellemesi tamamlandı!")
-            print(f"📅 Zaman: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+            print(f"📅 Zaman: {turkey_time().strftime('%d/%m/%Y %H:%M:%S')}")
             print("="*60)
         except Exception as e:
             print("="*60)
@@ -1893,7 +2055,8 @@ def initial_data_update():
     print("✅ İlk güncelleme thread'i başlatıldı (10 saniye sonra başlayacak)")
 
 # Uygulama başlarken ilk güncellemeyi yap
-initial_data_update()
+if BACKGROUND_JOBS_ENABLED:
+    initial_data_update()
 
 # 5 dakikada bir sadece CSV verilerini güncelle (tahminler güncellenmez)
 # Render'da scheduler'ın çalıştığından emin olmak için hemen başlat
@@ -1910,7 +2073,7 @@ print(f"📋 Aktif job'lar: {[job.id for job in scheduler.get_jobs()]}")
 # Her gün gece 00:00'da bugün koşu olan şehirler için tahmin çalıştır
 scheduler.add_job(
     func=run_daily_update,
-    trigger=CronTrigger(hour=0, minute=0),
+    trigger=CronTrigger(hour=0, minute=0, timezone=TURKEY_TZ),
     id='daily_update',
     name='Daily update: Run predictions for cities with races today',
     replace_existing=True